@@ -13,10 +13,11 @@ from app.admin.models import Local
 from app.database.mongo import collection_locales
 from app.auth.routes import get_current_user
 from app.id_generator.generator import generar_id, validar_id
+from app.core.responses import BSONRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/admin/locales", tags=["Admin - Locales"])
+router = APIRouter(prefix="/admin/locales", tags=["Admin - Locales"], route_class=BSONRoute)
 
 
 # ================================================
@@ -1,4 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import logging
 from datetime import datetime
 from bson import ObjectId
 from typing import List, Optional
@@ -13,8 +15,12 @@ from app.database.mongo import (
 )
 from app.id_generator.generator import generar_id, validar_id  # ⭐ Generador de IDs
 from app.auth.controllers import pwd_context
+from app.core.responses import BSONRoute
+from app.core.dataloader import Cargadores, obtener_cargadores
 
-router = APIRouter(prefix="/admin/profesionales", tags=["Admin - Profesionales"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin/profesionales", tags=["Admin - Profesionales"], route_class=BSONRoute)
 
 # ===================================================
 # Helper: convertir ObjectId a string
@@ -84,7 +90,7 @@ async def obtener_servicios_presta(profesional: dict):
         return []
         
     except Exception as e:
-        print(f"Error calculando servicios presta: {str(e)}")
+        logger.error(f"Error calculando servicios presta: {str(e)}")
         return []
 
 # ===================================================
@@ -95,52 +101,38 @@ async def create_profesional(
     profesional: Profesional,
     current_user: dict = Depends(get_current_user)
 ):
-    print("\n========== CREAR PROFESIONAL ==========")
-    print("📥 Datos recibidos:", profesional.dict())
-    print("👤 Usuario actual:", current_user)
-
     # --- Permisos ---
     rol = current_user["rol"]
-    print("🔐 Rol del creador:", rol)
+    logger.debug(f"👤 Crear profesional: creador={current_user.get('email')} rol={rol}")
 
     if rol not in ["super_admin", "admin_sede"]:
-        print("❌ Usuario NO autorizado para crear profesionales")
+        logger.warning(f"❌ Usuario NO autorizado para crear profesionales: {current_user.get('email')}")
         raise HTTPException(status_code=403, detail="No autorizado")
 
     # --- Sede viene en el modelo ---
     sede_id = profesional.sede_id
-    print("🏢 Sede recibida:", sede_id)
-
     if not sede_id:
-        print("❌ No se envió sede_id")
+        logger.warning("❌ No se envió sede_id")
         raise HTTPException(status_code=400, detail="sede_id es obligatorio")
 
     sede = await collection_locales.find_one({"sede_id": sede_id})
-    print("🔎 ¿Sede encontrada?:", sede)
-
     if not sede:
-        print("❌ La sede NO existe:", sede_id)
+        logger.warning(f"❌ La sede NO existe: {sede_id}")
         raise HTTPException(status_code=404, detail=f"Sede no encontrada: {sede_id}")
 
     # --- Validar email ---
     email = profesional.email.lower()
-    print("📧 Email normalizado:", email)
-
     exists = await collection_estilista.find_one({"email": email})
-    print("🔎 ¿Email ya existe en estilistas?:", exists)
-
     if exists:
-        print("❌ Ya existe profesional con ese email")
+        logger.warning(f"❌ Ya existe profesional con ese email: {email}")
         raise HTTPException(status_code=400, detail="Ya existe un profesional con ese email")
 
     # --- Generar ID ---
-    print("⚙️ Generando ID profesional...")
     profesional_id = await generar_id(
         entidad="estilista",
         sede_id=sede_id,
         metadata={"email": email}
     )
-    print("🆔 ID generado:", profesional_id)
 
     # ===================================================
     # 1️⃣ GUARDAR EN STYLIST (SIN CONTRASEÑA)
@@ -158,16 +150,12 @@ async def create_profesional(
 
     data_estilista.pop("password", None)
 
-    print("📤 Datos que se guardarán en collection_estilista:")
-    print(data_estilista)
-
     result_estilista = await collection_estilista.insert_one(data_estilista)
-    print("✅ Estilista insertado en MongoDB ID:", result_estilista.inserted_id)
+    logger.info(f"✅ Estilista insertado en MongoDB ID: {result_estilista.inserted_id}")
 
     # ===================================================
     # 2️⃣ GUARDAR EN AUTH
     # ===================================================
-    print("🔐 Hasheando contraseña...")
     hashed_password = pwd_context.hash(profesional.password)
 
     data_auth = {
@@ -183,17 +171,13 @@ async def create_profesional(
         "user_type": "staff",
     }
 
-    print("📤 Datos que se guardarán en collection_auth:")
-    print(data_auth)
-
     result_auth = await collection_auth.insert_one(data_auth)
-    print("✅ Usuario auth insertado en MongoDB ID:", result_auth.inserted_id)
+    logger.info(f"✅ Usuario auth insertado en MongoDB ID: {result_auth.inserted_id}")
 
     # ===================================================
     # RESPUESTA
     # ===================================================
-    print("🎉 Profesional creado CORRECTAMENTE")
-    print("====================================\n")
+    logger.info(f"🎉 Profesional creado: {profesional_id} ({email}) en sede {sede_id}")
 
     return {
         "msg": "Profesional y usuario creados correctamente",
@@ -210,7 +194,8 @@ async def create_profesional(
 @router.get("/", response_model=list)
 async def list_professionals(
     activo: bool = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cargadores: Cargadores = Depends(obtener_cargadores)
 ):
     """
     Lista profesionales según permisos del usuario.
@@ -228,12 +213,16 @@ async def list_professionals(
 
     professionals = await collection_estilista.find(query).to_list(None)
 
-    for p in professionals:
+    # Sedes y servicios: una consulta $in por colección para toda la lista
+    sedes = cargadores.por(collection_locales, "sede_id")
+    servicios = cargadores.por(collection_servicios, "servicio_id", "unique_id")
+
+    async def enriquecer(p):
 
         # ===================================================
         # ⭐ Obtener nombre de la sede
         # ===================================================
-        sede = await collection_locales.find_one({"sede_id": p.get("sede_id")})
+        sede = await sedes.cargar(p.get("sede_id"))
         if sede:
             p["sede_nombre"] = sede.get("nombre", "Nombre no registrado")
         else:
@@ -244,13 +233,7 @@ async def list_professionals(
         # ===================================================
         if "especialidades" in p and isinstance(p["especialidades"], list):
             nombres_servicios = []
-            for servicio_id in p["especialidades"]:
-                servicio = await collection_servicios.find_one({
-                    "$or": [
-                        {"servicio_id": servicio_id},
-                        {"unique_id": servicio_id}
-                    ]
-                })
+            for servicio in await servicios.cargar_varios(p["especialidades"]):
                 if servicio:
                     nombres_servicios.append({
                         "id": servicio.get("servicio_id") or servicio.get("unique_id"),
@@ -260,6 +243,8 @@ async def list_professionals(
         
         profesional_to_dict(p)
 
+    await asyncio.gather(*(enriquecer(p) for p in professionals))
+
     return professionals
 
 # ===================================================
@@ -6,8 +6,9 @@ from app.admin.models import ServicioAdmin
 from app.auth.routes import get_current_user
 from app.database.mongo import collection_servicios
 from app.id_generator.generator import generar_id, validar_id
+from app.core.responses import BSONRoute
 
-router = APIRouter(prefix="/admin/servicios", tags=["Admin - Servicios"])
+router = APIRouter(prefix="/admin/servicios", tags=["Admin - Servicios"], route_class=BSONRoute)
 
 
 # ===================================================
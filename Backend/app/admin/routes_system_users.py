@@ -8,8 +8,9 @@ from pydantic import BaseModel, EmailStr, Field, field_validator
 from app.auth.controllers import pwd_context
 from app.auth.routes import get_current_user
 from app.database.mongo import collection_auth, collection_locales
+from app.core.responses import BSONRoute
 
-router = APIRouter(prefix="/superadmin/system-users", tags=["SuperAdmin - System Users"])
+router = APIRouter(prefix="/superadmin/system-users", tags=["SuperAdmin - System Users"], route_class=BSONRoute)
 
 ALLOWED_INPUT_ROLES = {"superadmin", "admin_sede"}
 SUPERADMIN_ROLES = {"super_admin", "superadmin"}
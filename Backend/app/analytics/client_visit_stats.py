@@ -0,0 +1,341 @@
+"""
+Proyección de visitas por cliente (client_visit_stats)
+======================================================
+
+Un documento pequeño por (cliente_id, sede_id) con:
+- primera_visita / ultima_visita ("YYYY-MM-DD")
+- total_visitas (citas no canceladas)
+- visitas_completadas
+
+Churn, KPIs, nuevos vs recurrentes y la ficha del cliente leen de aquí
+en lugar de re-escanear `appointments` completo.
+
+Mantenimiento:
+- registrar_visita(): al crear una cita ($min / $max / $inc, sin leer citas)
+- recalcular_visitas_cliente(): al cancelar, completar, editar, etc.
+  (re-agrega solo las citas de ESE cliente en ESA sede)
+- reconstruir_visit_stats(): reconstrucción completa desde el histórico
+
+Reconstrucción manual:
+    python -m app.analytics.client_visit_stats [sede_id]
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Iterable
+import logging
+
+from app.database.mongo import collection_citas, collection_client_visit_stats, para_analitica, tiempo_max
+from app.scheduling.submodules.quotes.archivo_citas import pipeline_citas
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_NO_VISITA = ["cancelada"]
+ESTADOS_COMPLETADOS = ["completada", "finalizado"]
+
+# La fecha viene casi siempre como "YYYY-MM-DD", pero hay citas antiguas con datetime
+FECHA_NORMALIZADA = {
+    "$cond": [
+        {"$eq": [{"$type": "$fecha"}, "date"]},
+        {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha"}},
+        {"$substrCP": [{"$toString": "$fecha"}, 0, 10]}
+    ]
+}
+
+
+def _fecha_a_str(fecha) -> Optional[str]:
+    if isinstance(fecha, datetime):
+        return fecha.strftime("%Y-%m-%d")
+    if fecha:
+        return str(fecha)[:10]
+    return None
+
+
+def _str_a_datetime(fecha_str: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(fecha_str) if fecha_str else None
+    except (ValueError, TypeError):
+        return None
+
+
+def fecha_corte_inactividad(fecha_referencia: datetime, dias_inactividad: int) -> str:
+    """
+    Fecha "YYYY-MM-DD" (exclusiva) tal que ultima_visita < corte equivale a
+    ultima_visita + dias_inactividad < fecha_referencia.
+    """
+    corte = fecha_referencia - timedelta(days=dias_inactividad)
+    if corte != corte.replace(hour=0, minute=0, second=0, microsecond=0):
+        corte += timedelta(days=1)
+    return corte.strftime("%Y-%m-%d")
+
+
+def _pipeline_stats(match_query: dict) -> List[dict]:
+    """Agrupa citas no canceladas por (cliente_id, sede_id)."""
+    return [
+        {"$match": {
+            **match_query,
+            "estado": {"$nin": ESTADOS_NO_VISITA},
+            "cliente_id": {"$exists": True, "$ne": None}
+        }},
+        {"$project": {
+            "cliente_id": 1,
+            "sede_id": 1,
+            "fecha": FECHA_NORMALIZADA,
+            "completada": {"$cond": [{"$in": ["$estado", ESTADOS_COMPLETADOS]}, 1, 0]}
+        }},
+        {"$group": {
+            "_id": {"cliente_id": "$cliente_id", "sede_id": "$sede_id"},
+            "primera_visita": {"$min": "$fecha"},
+            "ultima_visita": {"$max": "$fecha"},
+            "total_visitas": {"$sum": 1},
+            "visitas_completadas": {"$sum": "$completada"}
+        }}
+    ]
+
+
+# ============================================================
+# ÍNDICES
+# ============================================================
+
+async def crear_indices_visit_stats():
+    await collection_client_visit_stats.create_index(
+        [("cliente_id", 1), ("sede_id", 1)],
+        name="visit_stats_cliente_sede",
+        unique=True
+    )
+    await collection_client_visit_stats.create_index(
+        [("sede_id", 1), ("ultima_visita", 1)],
+        name="visit_stats_sede_ultima"
+    )
+    await collection_client_visit_stats.create_index(
+        [("sede_id", 1), ("primera_visita", 1)],
+        name="visit_stats_sede_primera"
+    )
+
+
+# ============================================================
+# MANTENIMIENTO INCREMENTAL
+# ============================================================
+
+async def registrar_visita(cita: dict):
+    """
+    Suma una cita recién creada a la proyección sin leer el histórico.
+    Nunca lanza excepción: un fallo aquí no debe romper el agendamiento.
+    """
+    try:
+        cliente_id = cita.get("cliente_id")
+        fecha = _fecha_a_str(cita.get("fecha"))
+        if not cliente_id or not fecha or cita.get("estado") in ESTADOS_NO_VISITA:
+            return
+
+        await collection_client_visit_stats.update_one(
+            {"cliente_id": cliente_id, "sede_id": cita.get("sede_id")},
+            {
+                "$min": {"primera_visita": fecha},
+                "$max": {"ultima_visita": fecha},
+                "$inc": {
+                    "total_visitas": 1,
+                    "visitas_completadas": 1 if cita.get("estado") in ESTADOS_COMPLETADOS else 0
+                },
+                "$set": {"ultima_actualizacion": datetime.now()}
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"❌ Error registrando visita de {cita.get('cliente_id')}: {e}", exc_info=True)
+
+
+async def recalcular_visitas_cliente(cliente_id: Optional[str], sede_id: Optional[str]):
+    """
+    Recalcula la proyección de un cliente en una sede a partir de SUS citas.
+    Se usa cuando una cita cambia de estado o de fecha (no se puede "restar" un $min/$max).
+    Nunca lanza excepción.
+    """
+    if not cliente_id:
+        return
+
+    try:
+        resultado = await collection_citas.aggregate(
+            await pipeline_citas(_pipeline_stats({"cliente_id": cliente_id, "sede_id": sede_id}))
+        ).to_list(1)
+
+        filtro = {"cliente_id": cliente_id, "sede_id": sede_id}
+
+        if not resultado:
+            await collection_client_visit_stats.delete_one(filtro)
+            return
+
+        stats = resultado[0]
+        await collection_client_visit_stats.update_one(
+            filtro,
+            {"$set": {
+                "primera_visita": stats["primera_visita"],
+                "ultima_visita": stats["ultima_visita"],
+                "total_visitas": stats["total_visitas"],
+                "visitas_completadas": stats["visitas_completadas"],
+                "ultima_actualizacion": datetime.now()
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"❌ Error recalculando visitas de {cliente_id}: {e}", exc_info=True)
+
+
+async def reconstruir_visit_stats(sede_id: Optional[str] = None) -> Dict:
+    """
+    Reconstruye la proyección completa (o de una sede) desde `appointments`.
+    Usa $merge, así que la colección sigue disponible mientras se reconstruye;
+    al final se eliminan los documentos que ya no tienen citas.
+    """
+    inicio = datetime.now()
+    await crear_indices_visit_stats()
+
+    match_query = {"sede_id": sede_id} if sede_id else {}
+    pipeline = _pipeline_stats(match_query) + [
+        {"$project": {
+            "_id": 0,
+            "cliente_id": "$_id.cliente_id",
+            "sede_id": "$_id.sede_id",
+            "primera_visita": 1,
+            "ultima_visita": 1,
+            "total_visitas": 1,
+            "visitas_completadas": 1,
+            "ultima_actualizacion": {"$literal": inicio}
+        }},
+        {"$merge": {
+            "into": collection_client_visit_stats.name,
+            "on": ["cliente_id", "sede_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+    await collection_citas.aggregate(
+        await pipeline_citas(pipeline), allowDiskUse=True, **tiempo_max("mantenimiento")
+    ).to_list(None)
+
+    obsoletos = {"ultima_actualizacion": {"$lt": inicio}}
+    if sede_id:
+        obsoletos["sede_id"] = sede_id
+    eliminados = await collection_client_visit_stats.delete_many(obsoletos)
+
+    filtro_total = {"sede_id": sede_id} if sede_id else {}
+    total = await collection_client_visit_stats.count_documents(filtro_total)
+    duracion = (datetime.now() - inicio).total_seconds()
+
+    logger.info(
+        f"✅ client_visit_stats reconstruida ({sede_id or 'TODAS'}): "
+        f"{total} documentos, {eliminados.deleted_count} obsoletos eliminados, {duracion:.1f}s"
+    )
+
+    return {
+        "sede_id": sede_id,
+        "documentos": total,
+        "obsoletos_eliminados": eliminados.deleted_count,
+        "duracion_segundos": round(duracion, 2)
+    }
+
+
+# ============================================================
+# LECTURAS
+# ============================================================
+
+async def get_visitas_clientes(
+    clientes_ids: Optional[Iterable[str]] = None,
+    sede_id: Optional[str] = None,
+    ultima_antes_de: Optional[str] = None
+) -> Dict[str, Dict]:
+    """
+    Devuelve {cliente_id: {primera_visita, ultima_visita, total_visitas}}.
+    Sin sede_id se consolidan todas las sedes del cliente.
+    ultima_antes_de ("YYYY-MM-DD") filtra clientes cuya última visita es anterior.
+    """
+    match_query = {}
+    if clientes_ids is not None:
+        match_query["cliente_id"] = {"$in": list(clientes_ids)}
+    if sede_id:
+        match_query["sede_id"] = sede_id
+
+    pipeline = [
+        {"$match": match_query},
+        {"$group": {
+            "_id": "$cliente_id",
+            "primera_visita": {"$min": "$primera_visita"},
+            "ultima_visita": {"$max": "$ultima_visita"},
+            "total_visitas": {"$sum": "$total_visitas"}
+        }}
+    ]
+    if ultima_antes_de:
+        pipeline.append({"$match": {"ultima_visita": {"$lt": ultima_antes_de}}})
+
+    resultado = await para_analitica(collection_client_visit_stats).aggregate(
+        pipeline, **tiempo_max("analitica")
+    ).to_list(None)
+    return {doc["_id"]: doc for doc in resultado if doc.get("_id")}
+
+
+async def get_ultimas_visitas(
+    clientes_ids: Optional[Iterable[str]] = None,
+    sede_id: Optional[str] = None,
+    ultima_antes_de: Optional[str] = None
+) -> Dict[str, datetime]:
+    """Última visita (datetime) por cliente."""
+    visitas = await get_visitas_clientes(clientes_ids, sede_id, ultima_antes_de)
+    ultimas = {}
+    for cliente_id, stats in visitas.items():
+        fecha_dt = _str_a_datetime(stats.get("ultima_visita"))
+        if fecha_dt:
+            ultimas[cliente_id] = fecha_dt
+    return ultimas
+
+
+async def get_primeras_visitas(
+    clientes_ids: Iterable[str],
+    sede_id: Optional[str] = None
+) -> Dict[str, datetime]:
+    """Primera visita (datetime) por cliente."""
+    visitas = await get_visitas_clientes(clientes_ids, sede_id)
+    primeras = {}
+    for cliente_id, stats in visitas.items():
+        fecha_dt = _str_a_datetime(stats.get("primera_visita"))
+        if fecha_dt:
+            primeras[cliente_id] = fecha_dt
+    return primeras
+
+
+async def contar_clientes_inactivos(
+    clientes_ids: Iterable[str],
+    fecha_referencia: datetime,
+    dias_inactividad: int,
+    sede_id: Optional[str] = None
+) -> int:
+    """
+    Cuántos de los clientes dados no tienen ninguna visita (pasada o futura)
+    en los últimos `dias_inactividad` días respecto a fecha_referencia.
+    """
+    inactivos = await get_visitas_clientes(
+        clientes_ids, sede_id, ultima_antes_de=fecha_corte_inactividad(fecha_referencia, dias_inactividad)
+    )
+    return len(inactivos)
+
+
+async def get_resumen_cliente(cliente_id: str, sede_id: Optional[str] = None) -> Optional[Dict]:
+    """Resumen de visitas de un cliente para la ficha/listado de clientes."""
+    visitas = await get_visitas_clientes([cliente_id], sede_id)
+    stats = visitas.get(cliente_id)
+    if not stats:
+        return None
+
+    ultima_dt = _str_a_datetime(stats.get("ultima_visita"))
+    return {
+        "primera_visita": stats.get("primera_visita"),
+        "ultima_visita": stats.get("ultima_visita"),
+        "total_visitas": stats.get("total_visitas", 0),
+        "dias_sin_visitar": max(0, (datetime.now() - ultima_dt).days) if ultima_dt else None
+    }
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(reconstruir_visit_stats(sys.argv[1] if len(sys.argv) > 1 else None)))
@@ -7,12 +7,18 @@ from datetime import datetime
 from typing import Optional
 import logging
 
+from pymongo.errors import ExecutionTimeout
+
 from app.analytics.services_analytics import get_kpi_overview
+from app.analytics.client_visit_stats import reconstruir_visit_stats
+from app.analytics.sales_daily import reconstruir_ventas_diarias
+from app.core.cache import analytics_cache
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/analytics", tags=["Analytics"])
+router = APIRouter(prefix="/analytics", tags=["Analytics"], route_class=BSONRoute)
 
 # ========= CONFIGURACIÓN =========
 MIN_PERIOD_DAYS = 7
@@ -222,7 +228,7 @@ async def analytics_overview(
         
         return response
     
-    except HTTPException:
+    except (HTTPException, ExecutionTimeout):
         raise
     
     except Exception as e:
@@ -234,4 +240,75 @@ async def analytics_overview(
             status_code=500,
             detail=f"Error interno al obtener KPIs. Por favor contacte al administrador."
         )
-    
\ No newline at end of file
+    
+
+
+@router.post("/client-visit-stats/rebuild")
+async def rebuild_client_visit_stats(
+    sede_id: Optional[str] = Query(None, description="Reconstruir solo una sede"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Reconstruye la proyección client_visit_stats desde el histórico de citas.
+    
+    Normalmente se mantiene sola al crear/editar/cancelar/completar citas;
+    usar tras migraciones o cargas masivas de datos.
+    
+    🔒 Solo super_admin
+    """
+    if current_user.get("rol") != "super_admin":
+        raise HTTPException(status_code=403, detail="Solo super_admin puede reconstruir estadísticas")
+    
+    try:
+        resultado = await reconstruir_visit_stats(sede_id)
+        return {"success": True, **resultado}
+    
+    except Exception as e:
+        logger.error(f"❌ Error reconstruyendo client_visit_stats: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Error al reconstruir estadísticas de visitas"
+        )
+
+
+@router.post("/sales-daily/rebuild")
+async def rebuild_sales_daily(
+    sede_id: Optional[str] = Query(None, description="Reconstruir solo una sede"),
+    desde: Optional[str] = Query(None, regex=r"^\d{4}-\d{2}-\d{2}$", description="Fecha inicio (YYYY-MM-DD)"),
+    hasta: Optional[str] = Query(None, regex=r"^\d{4}-\d{2}-\d{2}$", description="Fecha fin (YYYY-MM-DD)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Backfill del cubo diario de ventas (sales_daily) desde `sales`.
+    
+    Se mantiene solo al crear/pagar/facturar/cancelar ventas;
+    usar tras desplegar, migraciones o cargas masivas.
+    
+    🔒 Solo super_admin
+    """
+    if current_user.get("rol") != "super_admin":
+        raise HTTPException(status_code=403, detail="Solo super_admin puede reconstruir estadísticas")
+    
+    try:
+        resultado = await reconstruir_ventas_diarias(sede_id, desde, hasta)
+        return {"success": True, **resultado}
+    
+    except Exception as e:
+        logger.error(f"❌ Error reconstruyendo sales_daily: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Error al reconstruir el cubo diario de ventas"
+        )
+
+
+@router.get("/cache/stats")
+async def get_analytics_cache_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Métricas de la caché de analytics de ESTE worker (hits, misses, coalesced, evictions).
+    
+    🔒 Solo super_admin
+    """
+    if current_user.get("rol") != "super_admin":
+        raise HTTPException(status_code=403, detail="Solo super_admin puede ver métricas de caché")
+    
+    return analytics_cache.stats()
@@ -2,20 +2,29 @@
 VERSIÓN CORREGIDA de routes_churn.py
 ✅ FIX: TypeError al sumar string + timedelta (línea 270)
 """
-from fastapi import APIRouter, Response, Query, HTTPException
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Query, HTTPException
+from datetime import datetime
 from typing import Optional, Dict, List
-import pandas as pd
-from io import BytesIO
 import logging
 
-from app.database.mongo import collection_clients, collection_citas
+from pymongo.errors import ExecutionTimeout
+
+from app.database.mongo import collection_clients, collection_citas, para_analitica, tiempo_max
+from app.analytics.client_visit_stats import get_ultimas_visitas, fecha_corte_inactividad
+from app.core.cache import analytics_cache, make_cache_key
+from app.core.responses import BSONRoute
+from app.core.xlsx_export import LibroXlsx, generar_xlsx, respuesta_xlsx
+from app.scheduling.submodules.quotes.archivo_citas import pipeline_citas
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/analytics", tags=["Analytics"])
+router = APIRouter(prefix="/analytics", tags=["Analytics"], route_class=BSONRoute)
 
 CHURN_DAYS = 60
+CHURN_CACHE_TTL = 300
+
+# Encabezado del Excel cuando no hay clientes en churn
+COLUMNAS_CHURN = ["cliente_id", "nombre", "correo", "telefono", "sede_id", "ultima_visita", "dias_inactivo"]
 
 
 # === HELPER PARA CONVERSIÓN DE FECHAS ===
@@ -59,7 +68,8 @@ async def get_clientes_activos_periodo(
             {"$project": {"cliente_id": "$_id"}}
         ]
         
-        result = await collection_citas.aggregate(pipeline).to_list(None)
+        pipeline = await pipeline_citas(pipeline, start_date if start_date and end_date else None)
+        result = await para_analitica(collection_citas).aggregate(pipeline, **tiempo_max("analitica")).to_list(None)
         
         clientes_ids = []
         for doc in result:
@@ -69,55 +79,28 @@ async def get_clientes_activos_periodo(
         
         return clientes_ids
     
+    except ExecutionTimeout:
+        raise
     except Exception as e:
         logger.error(f"Error en get_clientes_activos_periodo: {e}")
         return []
 
 
 async def get_ultima_visita_clientes(
-    clientes_ids: List[str],
-    sede_id: Optional[str] = None
+    clientes_ids: Optional[List[str]],
+    sede_id: Optional[str] = None,
+    ultima_antes_de: Optional[str] = None
 ) -> Dict[str, datetime]:
     """
-    ✅ FIXED: Convierte fecha string a datetime en el resultado
-    🔧 CRÍTICO: Ahora retorna datetime, NO string
+    ✅ Lee la última visita desde client_visit_stats (no re-escanea appointments)
+    🔧 CRÍTICO: Retorna datetime, NO string
+    clientes_ids=None → todos los clientes (de la sede si se indica)
     """
     try:
-        match_query = {
-            "cliente_id": {"$in": clientes_ids},
-            "estado": {"$ne": "cancelada"}
-        }
-        if sede_id:
-            match_query["sede_id"] = sede_id
-        
-        pipeline = [
-            {"$match": match_query},
-            {"$sort": {"fecha": -1}},
-            {"$group": {
-                "_id": "$cliente_id",
-                "ultima_visita": {"$first": "$fecha"}
-            }}
-        ]
-        
-        result = await collection_citas.aggregate(pipeline).to_list(None)
-        
-        # 🔧 CRÍTICO: Convertir string a datetime
-        ultimas_visitas = {}
-        for doc in result:
-            cliente_id = doc["_id"]
-            fecha_str = doc["ultima_visita"]
-            
-            try:
-                # Convertir "2025-10-01" a datetime
-                fecha_dt = datetime.fromisoformat(fecha_str)
-                ultimas_visitas[cliente_id] = fecha_dt
-            except (ValueError, TypeError) as e:
-                logger.warning(
-                    f"⚠️ Fecha inválida para cliente {cliente_id}: {fecha_str} - {e}"
-                )
-                continue
+        ultimas_visitas = await get_ultimas_visitas(clientes_ids, sede_id, ultima_antes_de)
         
-        logger.info(f"📅 Últimas visitas obtenidas: {len(ultimas_visitas)}/{len(clientes_ids)}")
+        total = len(clientes_ids) if clientes_ids is not None else "todos"
+        logger.info(f"📅 Últimas visitas obtenidas: {len(ultimas_visitas)}/{total}")
         return ultimas_visitas
     
     except Exception as e:
@@ -151,12 +134,15 @@ async def verificar_visitas_futuras(
             {"$project": {"cliente_id": "$_id"}}
         ]
         
-        result = await collection_citas.aggregate(pipeline).to_list(None)
+        pipeline = await pipeline_citas(pipeline, fecha_corte_str)
+        result = await para_analitica(collection_citas).aggregate(pipeline, **tiempo_max("analitica")).to_list(None)
         
         clientes_con_visitas = set(doc["cliente_id"] for doc in result)
         
         return {cid: cid in clientes_con_visitas for cid in clientes_ids}
     
+    except ExecutionTimeout:
+        raise
     except Exception as e:
         logger.error(f"❌ Error en verificar_visitas_futuras: {e}")
         return {cid: False for cid in clientes_ids}
@@ -167,8 +153,8 @@ async def get_datos_clientes_batch(clientes_ids: List[str]) -> Dict[str, Dict]:
     ✅ Busca por cliente_id (string) con fallback a _id
     """
     try:
-        clientes = await collection_clients.find(
-            {"cliente_id": {"$in": clientes_ids}}
+        clientes = await para_analitica(collection_clients).find(
+            {"cliente_id": {"$in": clientes_ids}}, **tiempo_max("analitica", cursor=True)
         ).to_list(None)
         
         return {c["cliente_id"]: c for c in clientes if c.get("cliente_id")}
@@ -206,48 +192,19 @@ async def get_datos_clientes_batch(clientes_ids: List[str]) -> Dict[str, Dict]:
         return {}
 
 
-# === ENDPOINT PRINCIPAL ===
+# === CÁLCULO DE CHURN (CACHEADO) ===
 
-@router.get("/churn-clientes")
-async def obtener_churn_clientes(
-    export: bool = False,
-    sede_id: Optional[str] = Query(None, description="Filtrar por sede específica"),
-    start_date: Optional[str] = Query(None, description="Fecha inicio para análisis (YYYY-MM-DD)"),
-    end_date: Optional[str] = Query(None, description="Fecha fin para análisis (YYYY-MM-DD)")
-):
-    """
-    ✅ FIXED: TypeError corregido - ahora suma datetime + timedelta correctamente
-    
-    Obtiene lista de clientes en riesgo de abandono (churn).
+async def _calcular_churn_clientes(
+    sede_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict:
+    """Análisis de churn (sin caché). Devuelve el mismo JSON que el endpoint."""
+    hoy = datetime.now()
     
-    Un cliente está en churn si:
-    - Su última visita fue hace más de CHURN_DAYS (60 días)
-    - No tiene citas programadas a futuro
-    """
-    
-    try:
-        hoy = datetime.now()
-        
-        start = None
-        end = None
-        
-        if start_date and end_date:
-            try:
-                start = datetime.fromisoformat(start_date)
-                end = datetime.fromisoformat(end_date)
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato de fecha inválido. Use YYYY-MM-DD"
-                )
-            
-            if start > end:
-                raise HTTPException(
-                    status_code=400,
-                    detail="La fecha de inicio debe ser menor o igual a la fecha fin"
-                )
-        
-        # ✅ PASO 1: Obtener clientes únicos del período
+    # ✅ PASO 1: Clientes del período (sin rango: todos los de client_visit_stats)
+    clientes_ids = None
+    if start and end:
         clientes_ids = await get_clientes_activos_periodo(start, end, sede_id)
         
         if not clientes_ids:
@@ -256,155 +213,194 @@ async def obtener_churn_clientes(
                 "clientes": [],
                 "parametros": {
                     "sede_id": sede_id,
-                    "rango_fechas": f"{start_date} a {end_date}" if start_date and end_date else "Todos los registros",
+                    "rango_fechas": f"{start.date()} a {end.date()}",
                     "dias_churn": CHURN_DAYS
                 },
                 "mensaje": "No hay clientes en el rango especificado"
             }
         
         logger.info(f"📊 Analizando churn de {len(clientes_ids)} clientes...")
+    
+    # ✅ PASO 2: Clientes cuya última visita (pasada o futura) superó CHURN_DAYS
+    # client_visit_stats.ultima_visita ya incluye citas futuras, así que no hace
+    # falta verificar visitas futuras cliente por cliente
+    ultimas_visitas = await get_ultima_visita_clientes(
+        clientes_ids,
+        sede_id,
+        ultima_antes_de=fecha_corte_inactividad(hoy, CHURN_DAYS)
+    )
+    clientes_en_churn = list(ultimas_visitas.keys())
+    
+    if not clientes_en_churn:
+        return {
+            "total_churn": 0,
+            "clientes": [],
+            "parametros": {
+                "sede_id": sede_id,
+                "rango_fechas": f"{start.date()} a {end.date()}" if start and end else "Todos los registros",
+                "dias_churn": CHURN_DAYS
+            },
+            "mensaje": "No hay clientes en churn"
+        }
+    
+    logger.info(f"🔴 {len(clientes_en_churn)} clientes en churn real")
+    
+    # ✅ PASO 3: Obtener datos de clientes en batch
+    clientes_data_map = await get_datos_clientes_batch(clientes_en_churn)
+    
+    # ✅ PASO 4: Construir resultado
+    clientes_perdidos = []
+    
+    for cliente_id in clientes_en_churn:
+        cliente_data = clientes_data_map.get(cliente_id)
         
-        # ✅ PASO 2: Obtener última visita de todos los clientes
-        # 🔧 CRÍTICO: Esta función ahora retorna datetime, NO string
-        ultimas_visitas = await get_ultima_visita_clientes(clientes_ids, sede_id)
-        
-        # ✅ PASO 3: Filtrar clientes que superaron el límite de churn
-        clientes_candidatos_churn = []
-        
-        for cliente_id, ultima_visita in ultimas_visitas.items():
-            # 🔧 FIX: Ahora ultima_visita es datetime, NO string
-            # Por lo tanto, esta suma funciona correctamente
-            fecha_limite = ultima_visita + timedelta(days=CHURN_DAYS)
-            
-            if fecha_limite >= hoy:
-                continue
-            
-            clientes_candidatos_churn.append(cliente_id)
-        
-        if not clientes_candidatos_churn:
-            return {
-                "total_churn": 0,
-                "clientes": [],
-                "parametros": {
-                    "sede_id": sede_id,
-                    "rango_fechas": f"{start_date} a {end_date}" if start_date and end_date else "Todos los registros",
-                    "dias_churn": CHURN_DAYS
-                },
-                "mensaje": "No hay clientes en churn"
-            }
-        
-        logger.info(f"⚠️ {len(clientes_candidatos_churn)} clientes candidatos a churn")
-        
-        # ✅ PASO 4: Verificar si tienen visitas futuras
-        tienen_visitas_futuras = {}
-        for cliente_id in clientes_candidatos_churn:
-            ultima = ultimas_visitas[cliente_id]  # Ahora es datetime
-            
-            # 🔧 Convertir datetime a string para la query
-            ultima_str = datetime_to_date_string(ultima)
-            
-            match_query = {
-                "cliente_id": cliente_id,
-                "fecha": {"$gt": ultima_str},
-                "estado": {"$ne": "cancelada"}
-            }
-            if sede_id:
-                match_query["sede_id"] = sede_id
-            
-            visita_futura = await collection_citas.find_one(match_query)
-            tienen_visitas_futuras[cliente_id] = visita_futura is not None
-        
-        clientes_en_churn = [
-            cid for cid in clientes_candidatos_churn 
-            if not tienen_visitas_futuras.get(cid, False)
-        ]
-        
-        if not clientes_en_churn:
-            return {
-                "total_churn": 0,
-                "clientes": [],
-                "parametros": {
-                    "sede_id": sede_id,
-                    "rango_fechas": f"{start_date} a {end_date}" if start_date and end_date else "Todos los registros",
-                    "dias_churn": CHURN_DAYS
-                },
-                "mensaje": "Todos los clientes tienen visitas futuras programadas"
-            }
-        
-        logger.info(f"🔴 {len(clientes_en_churn)} clientes en churn real")
-        
-        # ✅ PASO 5: Obtener datos de clientes en batch
-        clientes_data_map = await get_datos_clientes_batch(clientes_en_churn)
-        
-        # ✅ PASO 6: Construir resultado
-        clientes_perdidos = []
-        
-        for cliente_id in clientes_en_churn:
-            cliente_data = clientes_data_map.get(cliente_id)
-            
-            if not cliente_data:
-                logger.warning(f"⚠️ Cliente {cliente_id} no encontrado en BD de clientes")
-                clientes_perdidos.append({
-                    "cliente_id": cliente_id,
-                    "nombre": "Desconocido",
-                    "correo": "N/A",
-                    "telefono": "N/A",
-                    "sede_id": sede_id or "N/A",
-                    "ultima_visita": ultimas_visitas[cliente_id].strftime("%Y-%m-%d"),
-                    "dias_inactivo": (hoy - ultimas_visitas[cliente_id]).days,
-                    "nota": "Cliente no encontrado en base de datos"
-                })
-                continue
-            
-            ultima_visita = ultimas_visitas[cliente_id]  # datetime
-            dias_inactivo = (hoy - ultima_visita).days
-            
+        if not cliente_data:
+            logger.warning(f"⚠️ Cliente {cliente_id} no encontrado en BD de clientes")
             clientes_perdidos.append({
                 "cliente_id": cliente_id,
-                "nombre": cliente_data.get("nombre", "N/A"),
-                "correo": cliente_data.get("correo", "N/A"),
-                "telefono": cliente_data.get("telefono", "N/A"),
-                "sede_id": cliente_data.get("sede_id", "N/A"),
-                "ultima_visita": ultima_visita.strftime("%Y-%m-%d"),
-                "dias_inactivo": dias_inactivo
+                "nombre": "Desconocido",
+                "correo": "N/A",
+                "telefono": "N/A",
+                "sede_id": sede_id or "N/A",
+                "ultima_visita": ultimas_visitas[cliente_id].strftime("%Y-%m-%d"),
+                "dias_inactivo": (hoy - ultimas_visitas[cliente_id]).days,
+                "nota": "Cliente no encontrado en base de datos"
             })
+            continue
+        
+        ultima_visita = ultimas_visitas[cliente_id]  # datetime
+        dias_inactivo = (hoy - ultima_visita).days
+        
+        clientes_perdidos.append({
+            "cliente_id": cliente_id,
+            "nombre": cliente_data.get("nombre", "N/A"),
+            "correo": cliente_data.get("correo", "N/A"),
+            "telefono": cliente_data.get("telefono", "N/A"),
+            "sede_id": cliente_data.get("sede_id", "N/A"),
+            "ultima_visita": ultima_visita.strftime("%Y-%m-%d"),
+            "dias_inactivo": dias_inactivo
+        })
+    
+    clientes_perdidos.sort(key=lambda x: x["dias_inactivo"], reverse=True)
+    
+    logger.info(f"✅ Análisis de churn completado: {len(clientes_perdidos)} clientes en riesgo")
+    
+    return {
+        "total_churn": len(clientes_perdidos),
+        "parametros": {
+            "sede_id": sede_id,
+            "rango_fechas": f"{start.date()} a {end.date()}" if start and end else "Todos los registros",
+            "dias_churn": CHURN_DAYS
+        },
+        "clientes": clientes_perdidos
+    }
+
+
+async def calcular_churn_clientes(
+    sede_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict:
+    """
+    Churn cacheado por (sede, rango, día): varios admins abriendo el dashboard
+    a la vez disparan un solo análisis. ⚠️ El resultado es compartido: no mutarlo.
+    """
+    cache_key = make_cache_key(
+        "churn_clientes",
+        sede=sede_id,
+        start=start.date().isoformat() if start else None,
+        end=end.date().isoformat() if end else None,
+        dia=datetime.now().date().isoformat()
+    )
+    return await analytics_cache.get_or_compute(
+        cache_key,
+        lambda: _calcular_churn_clientes(sede_id, start, end),
+        ttl=CHURN_CACHE_TTL
+    )
+
+
+# === EXPORTACIÓN A EXCEL ===
+
+def escribir_excel_churn(destino: str, clientes: List[Dict]):
+    """
+    Una fila por cliente en modo write-only (se ejecuta en el pool de
+    exportación). Columnas: unión de claves en orden de aparición, igual
+    que hacía el DataFrame; sin clientes, COLUMNAS_CHURN.
+    """
+    columnas = list(dict.fromkeys(clave for cliente in clientes for clave in cliente)) or COLUMNAS_CHURN
+
+    libro = LibroXlsx()
+    hoja = libro.hoja("Clientes en Churn")
+    hoja.fila(*[hoja.celda(columna, "rf_encabezado_centro") for columna in columnas])
+    for cliente in clientes:
+        hoja.fila(*[cliente.get(columna) for columna in columnas])
+    libro.guardar(destino)
+
+
+async def generar_archivo_churn(
+    sede_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> str:
+    """Calcula el churn y escribe el Excel en un temporal (usado por app/exports)."""
+    resultado = await calcular_churn_clientes(sede_id, start, end)
+    return await generar_xlsx(escribir_excel_churn, resultado["clientes"])
+
+
+def parsear_rango_churn(start_date: Optional[str], end_date: Optional[str]):
+    """(start, end) como datetime, o (None, None) si no se envía el rango completo."""
+    if not (start_date and end_date):
+        return None, None
+
+    try:
+        start = datetime.fromisoformat(start_date)
+        end = datetime.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Formato de fecha inválido. Use YYYY-MM-DD"
+        )
+    
+    if start > end:
+        raise HTTPException(
+            status_code=400,
+            detail="La fecha de inicio debe ser menor o igual a la fecha fin"
+        )
+    return start, end
+
+
+# === ENDPOINT PRINCIPAL ===
+
+@router.get("/churn-clientes")
+async def obtener_churn_clientes(
+    export: bool = False,
+    sede_id: Optional[str] = Query(None, description="Filtrar por sede específica"),
+    start_date: Optional[str] = Query(None, description="Fecha inicio para análisis (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Fecha fin para análisis (YYYY-MM-DD)")
+):
+    """
+    ✅ FIXED: TypeError corregido - ahora suma datetime + timedelta correctamente
+    
+    Obtiene lista de clientes en riesgo de abandono (churn).
+    
+    Un cliente está en churn si:
+    - Su última visita fue hace más de CHURN_DAYS (60 días)
+    - No tiene citas programadas a futuro
+    """
+    
+    try:
+        start, end = parsear_rango_churn(start_date, end_date)
         
-        clientes_perdidos.sort(key=lambda x: x["dias_inactivo"], reverse=True)
-        
-        logger.info(f"✅ Análisis de churn completado: {len(clientes_perdidos)} clientes en riesgo")
+        resultado = await calcular_churn_clientes(sede_id, start, end)
+        clientes_perdidos = resultado["clientes"]
         
-        # ✅ PASO 7: Exportar a Excel si se solicita
+        # ✅ Exportar a Excel si se solicita
         if export:
-            if not clientes_perdidos:
-                df = pd.DataFrame(columns=[
-                    "cliente_id", "nombre", "correo", "telefono",
-                    "sede_id", "ultima_visita", "dias_inactivo"
-                ])
-            else:
-                df = pd.DataFrame(clientes_perdidos)
-            
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Clientes en Churn')
-            
-            output.seek(0)
-            
-            return Response(
-                content=output.read(),
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": "attachment; filename=clientes_churn.xlsx"}
-            )
+            ruta = await generar_xlsx(escribir_excel_churn, clientes_perdidos)
+            return respuesta_xlsx(ruta, "clientes_churn.xlsx")
         
         # ✅ Devolver JSON
-        return {
-            "total_churn": len(clientes_perdidos),
-            "parametros": {
-                "sede_id": sede_id,
-                "rango_fechas": f"{start_date} a {end_date}" if start_date and end_date else "Todos los registros",
-                "dias_churn": CHURN_DAYS
-            },
-            "clientes": clientes_perdidos
-        }
+        return resultado
     
     except HTTPException:
         raise
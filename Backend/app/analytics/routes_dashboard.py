@@ -7,13 +7,16 @@ from datetime import datetime, timedelta
 from typing import Tuple, Optional
 import logging
 
+from pymongo.errors import ExecutionTimeout
+
 from app.analytics.services_analytics import get_kpi_overview
-from app.analytics.routes_churn import obtener_churn_clientes
+from app.analytics.routes_churn import calcular_churn_clientes
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/analytics", tags=["Analytics Dashboard"])
+router = APIRouter(prefix="/analytics", tags=["Analytics Dashboard"], route_class=BSONRoute)
 
 
 def get_date_range(period: str) -> Tuple[datetime, datetime]:
@@ -112,7 +115,7 @@ async def analytics_dashboard(
     - calidad_datos: Indicador de confiabilidad (BUENA/MEDIA/BAJA/SIN_DATOS)
     - advertencias: Alertas sobre períodos cortos o datos insuficientes
     
-    OPTIMIZADO: Usa caché en services_analytics y queries optimizadas
+    OPTIMIZADO: KPIs y churn salen de la caché compartida de analytics (app.core.cache)
     """
     try:
         # ========= VALIDACIÓN DE PERMISOS =========
@@ -252,12 +255,7 @@ async def analytics_dashboard(
         
         # ========= OBTENER CHURN ACTUAL =========
         # Churn siempre se calcula sin filtro de fechas (todos los clientes históricos)
-        churn_response = await obtener_churn_clientes(
-            export=False,
-            sede_id=sede_id,
-            start_date=None,
-            end_date=None
-        )
+        churn_response = await calcular_churn_clientes(sede_id=sede_id)
         
         # ========= DETERMINAR CALIDAD DE DATOS =========
         severidades = [a["severidad"] for a in advertencias]
@@ -320,7 +318,7 @@ async def analytics_dashboard(
         
         return response
     
-    except HTTPException:
+    except (HTTPException, ExecutionTimeout):
         raise
     except Exception as e:
         logger.error(f"❌ Error en analytics_dashboard: {e}", exc_info=True)
@@ -0,0 +1,500 @@
+"""
+Cubo diario de ventas (sales_daily)
+===================================
+
+Un documento por (sede_id, fecha "YYYY-MM-DD", moneda) con:
+- ventas_totales / cantidad_ventas (desglose_pagos.total)
+- ventas_servicios / ventas_productos (items por tipo)
+- metodos_pago: desglose_pagos por método (solo valores > 0) → dashboard de ventas
+- pagos_caja: historial_pagos por método normalizado (o desglose_pagos en
+  ventas migradas sin historial) → cuadre de caja
+- profesionales: ventas por profesional del día
+
+Dashboards de 90 o 365 días leen 90–365 documentos pequeños por sede
+en lugar de escanear cada venta.
+
+Mantenimiento:
+- actualizar_ventas_dia(): al crear, pagar, facturar o cancelar una venta
+  (re-agrega SOLO las ventas de esa sede en ese día). Si la venta cambia
+  de día o de sede, se pasan fecha_anterior / sede_anterior y se
+  recalculan ambos días.
+- reconstruir_ventas_diarias(): backfill completo desde `sales`
+
+Cobertura (documento "sales_daily" en `migrations`):
+- completo: True tras un backfill completo (todas las sedes, sin rango).
+  Hasta entonces los lectores calculan desde `sales`.
+- pendientes: [{sede_id, fecha}] de actualizaciones fallidas. Esos días
+  se leen desde `sales` hasta que una actualización o un backfill que
+  los cubra termine bien.
+- dias_fuera_del_cubo() lo resume para los lectores (caché de
+  ESTADO_TTL segundos; el proceso que marca o limpia la invalida).
+
+Reconstrucción manual:
+    python -m app.analytics.sales_daily [sede_id]
+
+⚠️ Requiere el backfill una vez tras desplegar (o tras cargas masivas).
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List
+import logging
+import time
+
+from app.database.mongo import collection_sales, collection_sales_daily, collection_migraciones
+from app.cash.accounting_logic import MAPEO_METODOS_PAGO
+
+logger = logging.getLogger(__name__)
+
+# Métodos del dashboard de ventas (desglose_pagos), en el orden en que se muestran
+METODOS_PAGO = [
+    "efectivo", "transferencia", "tarjeta", "otros", "addi", "giftcard",
+    "link_de_pago", "tarjeta_credito", "tarjeta_debito"
+]
+
+# Métodos normalizados de caja (mismo mapeo que accounting_logic)
+METODOS_CAJA = sorted(set(MAPEO_METODOS_PAGO.values()) | {"otros"})
+
+CONTROL_ID = "sales_daily"
+ESTADO_TTL = 60
+
+_indices_listos = False
+_estado_cache: Dict = {"valor": None, "leido": 0.0}
+
+
+def _rango_dia(fecha: datetime):
+    inicio = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    return inicio, inicio + timedelta(days=1) - timedelta(microseconds=1)
+
+
+# ============================================================
+# PIPELINE
+# ============================================================
+
+def _suma_items(tipo: str) -> Dict:
+    """Suma de subtotales de los items de un tipo (sin tipo = servicio)."""
+    return {"$reduce": {
+        "input": {"$ifNull": ["$items", []]},
+        "initialValue": 0,
+        "in": {"$add": ["$$value", {"$cond": [
+            {"$eq": [{"$ifNull": ["$$this.tipo", "servicio"]}, tipo]},
+            {"$ifNull": ["$$this.subtotal", 0]},
+            0
+        ]}]}
+    }}
+
+
+def _normalizar_metodo_expr(valor: str) -> Dict:
+    """Equivalente en agregación de accounting_logic._normalizar_metodo."""
+    clave = {"$trim": {"input": {"$toLower": {"$ifNull": [valor, ""]}}}}
+    return {"$let": {
+        "vars": {"clave": clave},
+        "in": {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$$clave", origen]}, "then": destino}
+                for origen, destino in MAPEO_METODOS_PAGO.items()
+            ],
+            "default": "otros"
+        }}
+    }}
+
+
+# Pagos de caja por venta: historial_pagos si existe; ventas migradas usan desglose_pagos
+PAGOS_CAJA = {"$cond": [
+    {"$and": [
+        {"$isArray": "$historial_pagos"},
+        {"$gt": [{"$size": "$historial_pagos"}, 0]}
+    ]},
+    {"$map": {
+        "input": "$historial_pagos",
+        "as": "p",
+        "in": {"m": _normalizar_metodo_expr("$$p.metodo"), "v": {"$ifNull": ["$$p.monto", 0]}}
+    }},
+    {"$cond": [
+        {"$eq": [{"$type": "$historial_pagos"}, "missing"]},
+        {"$map": {
+            "input": {"$filter": {
+                "input": {"$objectToArray": {"$ifNull": ["$desglose_pagos", {}]}},
+                "as": "d",
+                "cond": {"$ne": ["$$d.k", "total"]}
+            }},
+            "as": "d",
+            "in": {"m": _normalizar_metodo_expr("$$d.k"), "v": {"$ifNull": ["$$d.v", 0]}}
+        }},
+        []
+    ]}
+]}
+
+
+def _suma_pagos_caja(metodo: str) -> Dict:
+    return {"$reduce": {
+        "input": "$pagos",
+        "initialValue": 0,
+        "in": {"$add": ["$$value", {"$cond": [{"$eq": ["$$this.m", metodo]}, "$$this.v", 0]}]}
+    }}
+
+
+def pipeline_filas_cubo(match_query: dict) -> List[dict]:
+    """
+    Agrupa ventas por (sede_id, fecha, moneda) con desglose por profesional.
+    Devuelve filas con la misma forma que `sales_daily`: los lectores lo usan
+    para los días que el cubo no cubre.
+    """
+    por_venta = {
+        "_id": 0,
+        "sede_id": 1,
+        "fecha": {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha_pago"}},
+        "moneda": {"$ifNull": ["$moneda", "COP"]},
+        "profesional_id": {"$ifNull": ["$profesional_id", None]},
+        "profesional_nombre": 1,
+        "total": {"$ifNull": ["$desglose_pagos.total", 0]},
+        "servicios": _suma_items("servicio"),
+        "productos": _suma_items("producto"),
+        "pagos": PAGOS_CAJA
+    }
+    for metodo in METODOS_PAGO:
+        campo = f"$desglose_pagos.{metodo}"
+        por_venta[f"mp_{metodo}"] = {"$cond": [{"$gt": [campo, 0]}, campo, 0]}
+
+    por_venta_caja = {campo: 1 for campo in por_venta if campo not in ("_id", "pagos")}
+    por_venta_caja["_id"] = 0
+    por_venta_caja.update({f"pc_{m}": _suma_pagos_caja(m) for m in METODOS_CAJA})
+
+    campos_suma = (
+        ["total", "servicios", "productos"]
+        + [f"mp_{m}" for m in METODOS_PAGO]
+        + [f"pc_{m}" for m in METODOS_CAJA]
+    )
+
+    por_profesional = {
+        "_id": {
+            "sede_id": "$sede_id",
+            "fecha": "$fecha",
+            "moneda": "$moneda",
+            "profesional_id": "$profesional_id"
+        },
+        "profesional_nombre": {"$first": "$profesional_nombre"},
+        "cantidad": {"$sum": 1},
+        **{campo: {"$sum": f"${campo}"} for campo in campos_suma}
+    }
+
+    por_dia = {
+        "_id": {"sede_id": "$_id.sede_id", "fecha": "$_id.fecha", "moneda": "$_id.moneda"},
+        "cantidad": {"$sum": "$cantidad"},
+        **{campo: {"$sum": f"${campo}"} for campo in campos_suma},
+        "profesionales": {"$push": {
+            "profesional_id": "$_id.profesional_id",
+            "profesional_nombre": "$profesional_nombre",
+            "ventas_totales": "$total",
+            "cantidad_ventas": "$cantidad"
+        }}
+    }
+
+    return [
+        {"$match": match_query},
+        {"$project": por_venta},
+        {"$project": por_venta_caja},
+        {"$group": por_profesional},
+        {"$group": por_dia},
+        {"$project": {
+            "_id": 0,
+            "sede_id": "$_id.sede_id",
+            "fecha": "$_id.fecha",
+            "moneda": "$_id.moneda",
+            "ventas_totales": "$total",
+            "cantidad_ventas": "$cantidad",
+            "ventas_servicios": "$servicios",
+            "ventas_productos": "$productos",
+            "metodos_pago": {m: f"$mp_{m}" for m in METODOS_PAGO},
+            "pagos_caja": {m: f"$pc_{m}" for m in METODOS_CAJA},
+            "profesionales": {"$filter": {
+                "input": "$profesionales",
+                "as": "p",
+                "cond": {"$ne": ["$$p.profesional_id", None]}
+            }}
+        }}
+    ]
+
+
+def _pipeline_cubo(match_query: dict, marca: datetime) -> List[dict]:
+    return pipeline_filas_cubo(match_query) + [
+        {"$addFields": {"ultima_actualizacion": {"$literal": marca}}},
+        {"$merge": {
+            "into": collection_sales_daily.name,
+            "on": ["sede_id", "fecha", "moneda"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+# ============================================================
+# ÍNDICES
+# ============================================================
+
+async def crear_indices_ventas_diarias():
+    global _indices_listos
+
+    await collection_sales_daily.create_index(
+        [("sede_id", 1), ("fecha", 1), ("moneda", 1)],
+        name="sales_daily_sede_fecha_moneda",
+        unique=True
+    )
+    await collection_sales_daily.create_index(
+        [("fecha", 1)],
+        name="sales_daily_fecha"
+    )
+    # La re-agregación de un día filtra sales por sede + fecha_pago;
+    # el mismo índice sirve a la paginación por cursor (fecha_pago, _id)
+    await collection_sales.create_index(
+        [("sede_id", 1), ("fecha_pago", -1), ("_id", -1)],
+        name="sales_sede_fecha_pago_id"
+    )
+    _indices_listos = True
+
+
+# ============================================================
+# MANTENIMIENTO
+# ============================================================
+
+async def _reagregar(match_query: dict, obsoletos: dict) -> int:
+    """Ejecuta el $merge y elimina los documentos del rango que ya no tienen ventas."""
+    if not _indices_listos:
+        await crear_indices_ventas_diarias()
+
+    marca = datetime.now()
+    await collection_sales.aggregate(
+        _pipeline_cubo(match_query, marca), allowDiskUse=True
+    ).to_list(None)
+
+    eliminados = await collection_sales_daily.delete_many({
+        **obsoletos,
+        "ultima_actualizacion": {"$lt": marca}
+    })
+    return eliminados.deleted_count
+
+
+async def _marcar_pendiente(sede_id: str, fecha: str):
+    """Anota un día que el cubo no refleja; los lectores lo leerán de `sales`."""
+    try:
+        await collection_migraciones.update_one(
+            {"_id": CONTROL_ID},
+            {"$push": {"pendientes": {"sede_id": sede_id, "fecha": fecha, "marcado": datetime.now()}}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"❌ No se pudo marcar sales_daily pendiente ({sede_id}, {fecha}): {e}")
+    _estado_cache["leido"] = 0.0
+
+
+async def _recalcular_dia(sede_id: Optional[str], fecha_pago) -> None:
+    if not sede_id or not isinstance(fecha_pago, datetime):
+        return
+
+    inicio, fin = _rango_dia(fecha_pago)
+    fecha = inicio.strftime("%Y-%m-%d")
+    try:
+        await _reagregar(
+            {"sede_id": sede_id, "fecha_pago": {"$gte": inicio, "$lte": fin}},
+            {"sede_id": sede_id, "fecha": fecha}
+        )
+    except Exception as e:
+        logger.error(f"❌ Error actualizando sales_daily ({sede_id}, {fecha_pago}): {e}", exc_info=True)
+        await _marcar_pendiente(sede_id, fecha)
+        return
+
+    # Solo escribe si el día estaba pendiente (según la caché de este proceso)
+    estado = await _estado_cubo()
+    if any(p["sede_id"] == sede_id and p["fecha"] == fecha for p in estado["pendientes"]):
+        try:
+            await collection_migraciones.update_one(
+                {"_id": CONTROL_ID},
+                {"$pull": {"pendientes": {"sede_id": sede_id, "fecha": fecha}}}
+            )
+            _estado_cache["leido"] = 0.0
+        except Exception as e:
+            logger.error(f"❌ No se pudo limpiar sales_daily pendiente ({sede_id}, {fecha}): {e}")
+
+
+async def actualizar_ventas_dia(
+    sede_id: Optional[str],
+    fecha_pago,
+    sede_anterior: Optional[str] = None,
+    fecha_anterior=None
+) -> None:
+    """
+    Recalcula el cubo de UNA sede en UN día a partir de sus ventas.
+    Si la venta cambió de día o de sede (sede_anterior / fecha_anterior),
+    recalcula también el día anterior para que no conserve la venta.
+    Nunca lanza excepción: un fallo aquí no debe romper la facturación;
+    el día queda pendiente y se lee desde `sales`.
+    """
+    await _recalcular_dia(sede_id, fecha_pago)
+
+    if sede_anterior is None and fecha_anterior is None:
+        return
+    sede_anterior = sede_anterior or sede_id
+    fecha_anterior = fecha_anterior or fecha_pago
+    if not isinstance(fecha_anterior, datetime):
+        return
+    mismo_dia = isinstance(fecha_pago, datetime) and _rango_dia(fecha_pago)[0] == _rango_dia(fecha_anterior)[0]
+    if sede_anterior != sede_id or not mismo_dia:
+        await _recalcular_dia(sede_anterior, fecha_anterior)
+
+
+async def reconstruir_ventas_diarias(
+    sede_id: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None
+) -> Dict:
+    """
+    Backfill del cubo desde `sales` (todas las sedes o una, opcionalmente
+    acotado a un rango "YYYY-MM-DD"). La colección sigue disponible durante
+    la reconstrucción gracias a $merge. Limpia los días pendientes que
+    cubre; el backfill completo marca además el cubo como completo.
+    """
+    inicio_proceso = datetime.now()
+
+    match_query = {"fecha_pago": {"$type": "date"}}
+    obsoletos = {}
+    if sede_id:
+        match_query["sede_id"] = sede_id
+        obsoletos["sede_id"] = sede_id
+    if desde or hasta:
+        rango = {"$type": "date"}
+        rango_fecha = {}
+        if desde:
+            rango["$gte"] = datetime.strptime(desde, "%Y-%m-%d")
+            rango_fecha["$gte"] = desde
+        if hasta:
+            rango["$lte"] = _rango_dia(datetime.strptime(hasta, "%Y-%m-%d"))[1]
+            rango_fecha["$lte"] = hasta
+        match_query["fecha_pago"] = rango
+        obsoletos["fecha"] = rango_fecha
+
+    eliminados = await _reagregar(match_query, obsoletos)
+
+    # Los pendientes marcados durante el backfill pueden no estar reflejados: se conservan
+    cambios = {"$pull": {"pendientes": {**obsoletos, "marcado": {"$lt": inicio_proceso}}}}
+    if not obsoletos:
+        cambios["$set"] = {"completo": True, "reconstruido_en": datetime.now()}
+    await collection_migraciones.update_one({"_id": CONTROL_ID}, cambios, upsert=True)
+    _estado_cache["leido"] = 0.0
+
+    total = await collection_sales_daily.count_documents(obsoletos)
+    duracion = (datetime.now() - inicio_proceso).total_seconds()
+
+    logger.info(
+        f"✅ sales_daily reconstruida ({sede_id or 'TODAS'}, {desde or '...'} → {hasta or '...'}): "
+        f"{total} documentos, {eliminados} obsoletos eliminados, {duracion:.1f}s"
+    )
+
+    return {
+        "sede_id": sede_id,
+        "desde": desde,
+        "hasta": hasta,
+        "documentos": total,
+        "obsoletos_eliminados": eliminados,
+        "duracion_segundos": round(duracion, 2)
+    }
+
+
+# ============================================================
+# LECTURAS
+# ============================================================
+
+async def _estado_cubo() -> Dict:
+    ahora = time.monotonic()
+    if _estado_cache["valor"] is None or ahora - _estado_cache["leido"] > ESTADO_TTL:
+        control = await collection_migraciones.find_one({"_id": CONTROL_ID}) or {}
+        _estado_cache["valor"] = {
+            "completo": bool(control.get("completo")),
+            "pendientes": [
+                {"sede_id": p.get("sede_id"), "fecha": p.get("fecha")}
+                for p in control.get("pendientes") or []
+            ]
+        }
+        _estado_cache["leido"] = ahora
+    return _estado_cache["valor"]
+
+
+async def dias_fuera_del_cubo(sede_id: Optional[str], desde: str, hasta: str) -> Optional[List[Dict]]:
+    """
+    Días del rango [desde, hasta] que el cubo no refleja y deben leerse de `sales`.
+    None: el cubo nunca se reconstruyó completo (todo el rango sale de `sales`).
+    Lista (sin duplicados) de {sede_id, fecha} con actualizaciones fallidas.
+    """
+    estado = await _estado_cubo()
+    if not estado["completo"]:
+        return None
+
+    dias = []
+    for p in estado["pendientes"]:
+        if sede_id and p["sede_id"] != sede_id:
+            continue
+        if desde <= (p["fecha"] or "") <= hasta and p not in dias:
+            dias.append(p)
+    return dias
+
+
+def filtro_ventas_de_dias(dias: List[Dict]) -> Dict:
+    """Filtro de `sales` para los días (sede, fecha) indicados."""
+    condiciones = []
+    for dia in dias:
+        inicio, fin = _rango_dia(datetime.strptime(dia["fecha"], "%Y-%m-%d"))
+        condiciones.append({"sede_id": dia["sede_id"], "fecha_pago": {"$gte": inicio, "$lte": fin}})
+    return {"$or": condiciones}
+
+
+async def get_ventas_diarias(
+    sede_id: Optional[str],
+    desde: str,
+    hasta: str
+) -> List[Dict]:
+    """Documentos del cubo en el rango [desde, hasta] ("YYYY-MM-DD")."""
+    query = {"fecha": {"$gte": desde, "$lte": hasta}}
+    if sede_id:
+        query["sede_id"] = sede_id
+
+    return await collection_sales_daily.find(query, {"_id": 0}).to_list(None)
+
+
+async def get_pagos_caja_dia(sede_id: str, fecha: str) -> Optional[Dict[str, float]]:
+    """
+    Pagos de caja de las ventas de un día, por método normalizado.
+    None si el cubo no tiene datos de ese día o no los refleja (el llamador
+    debe leer `sales`).
+    """
+    if await dias_fuera_del_cubo(sede_id, fecha, fecha) != []:
+        return None
+
+    docs = await collection_sales_daily.find(
+        {"sede_id": sede_id, "fecha": fecha},
+        {"_id": 0, "pagos_caja": 1}
+    ).to_list(None)
+
+    if not docs:
+        return None
+
+    pagos = {}
+    for doc in docs:
+        for metodo, monto in (doc.get("pagos_caja") or {}).items():
+            pagos[metodo] = pagos.get(metodo, 0) + monto
+    return pagos
+
+
+async def contar_ventas_rango(sede_id: str, desde: str, hasta: str) -> int:
+    """Número de ventas de una sede entre dos días (ambos incluidos). 0 si el cubo no cubre el rango."""
+    if await dias_fuera_del_cubo(sede_id, desde, hasta) != []:
+        return 0
+    resultado = await collection_sales_daily.aggregate([
+        {"$match": {"sede_id": sede_id, "fecha": {"$gte": desde, "$lte": hasta}}},
+        {"$group": {"_id": None, "total": {"$sum": "$cantidad_ventas"}}}
+    ]).to_list(1)
+    return resultado[0]["total"] if resultado else 0
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(reconstruir_ventas_diarias(sys.argv[1] if len(sys.argv) > 1 else None)))
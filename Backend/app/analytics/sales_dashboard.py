@@ -6,14 +6,25 @@ Routes para Dashboard de Ventas (Financiero)
 from fastapi import APIRouter, Query, HTTPException, Depends
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
+import asyncio
 import logging
 
-from app.database.mongo import collection_sales 
+from app.database.mongo import collection_sales, collection_sales_daily, para_analitica, tiempo_max
+from app.analytics.sales_daily import (
+    METODOS_PAGO,
+    dias_fuera_del_cubo,
+    filtro_ventas_de_dias,
+    pipeline_filas_cubo,
+)
 from app.auth.routes import get_current_user
+from app.core.cache import analytics_cache, make_cache_key
+from app.core.responses import BSONRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/ventas", tags=["Dashboard de Ventas"])
+SALES_CACHE_TTL = 120
+
+router = APIRouter(prefix="/ventas", tags=["Dashboard de Ventas"], route_class=BSONRoute)
 
 
 def get_date_range(
@@ -87,49 +98,88 @@ def get_date_range(
     )
 
 
-async def get_ventas_periodo(
+def _etapas_metricas(start_str: str, incluir_serie: bool) -> List[Dict]:
+    """Agrupa filas con forma de `sales_daily` por (periodo, moneda) y, si se pide, por día."""
+    agrupacion = {
+        "_id": {
+            "periodo": {"$cond": [{"$gte": ["$fecha", start_str]}, "actual", "anterior"]},
+            "moneda": "$moneda"
+        },
+        "ventas_totales": {"$sum": "$ventas_totales"},
+        "cantidad_ventas": {"$sum": "$cantidad_ventas"},
+        "ventas_servicios": {"$sum": "$ventas_servicios"},
+        "ventas_productos": {"$sum": "$ventas_productos"},
+        **{metodo: {"$sum": f"$metodos_pago.{metodo}"} for metodo in METODOS_PAGO}
+    }
+    
+    if not incluir_serie:
+        return [{"$group": agrupacion}]
+    
+    return [{"$facet": {
+        "resumen": [{"$group": agrupacion}],
+        "serie": [
+            {"$match": {"fecha": {"$gte": start_str}}},
+            {"$group": {
+                "_id": {"moneda": "$moneda", "fecha": "$fecha"},
+                "ventas_totales": {"$sum": "$ventas_totales"},
+                "cantidad_ventas": {"$sum": "$cantidad_ventas"}
+            }},
+            {"$sort": {"_id.fecha": 1}}
+        ]
+    }}]
+
+
+def _pipeline_metricas_ventas(
     start_date: datetime,
     end_date: datetime,
-    sede_id: Optional[str] = None
+    start_anterior: datetime,
+    sede_id: Optional[str] = None,
+    incluir_serie: bool = False,
+    excluir: Optional[List[Dict]] = None
 ) -> List[Dict]:
     """
-    Obtiene ventas del período desde collection_sales.
-    
-    🎯 CRÍTICO: 
-    - Usa desglose_pagos.total (no suma de items)
-    - Items separados por tipo para análisis
+    Agrega ambos períodos desde el cubo diario `sales_daily`
+    (un documento por sede/día/moneda, ver app.analytics.sales_daily).
+    Devuelve unas pocas filas por (periodo, moneda), sin importar cuántas ventas haya.
+    `excluir`: días {sede_id, fecha} que se leen desde `sales`.
     """
-    try:
-        query = {
-            "fecha_pago": {
-                "$gte": start_date,
-                "$lte": end_date
-            }
-        }
-        
-        if sede_id:
-            query["sede_id"] = sede_id
-        
-        ventas = await collection_sales.find(query).to_list(None)
-        
-        logger.info(f"💰 Ventas encontradas: {len(ventas)} (sede: {sede_id or 'TODAS'})")
-        return ventas
+    query = {"fecha": {"$gte": start_anterior.strftime("%Y-%m-%d"), "$lte": end_date.strftime("%Y-%m-%d")}}
+    if sede_id:
+        query["sede_id"] = sede_id
+    if excluir:
+        query["$nor"] = [{"sede_id": d["sede_id"], "fecha": d["fecha"]} for d in excluir]
     
-    except Exception as e:
-        logger.error(f"❌ Error en get_ventas_periodo: {e}", exc_info=True)
-        return []
+    return [{"$match": query}] + _etapas_metricas(start_date.strftime("%Y-%m-%d"), incluir_serie)
+
+
+def _pipeline_metricas_desde_ventas(
+    match_query: Dict,
+    start_date: datetime,
+    incluir_serie: bool = False
+) -> List[Dict]:
+    """Mismas métricas calculadas desde `sales` (días que el cubo no cubre)."""
+    return pipeline_filas_cubo(match_query) + _etapas_metricas(start_date.strftime("%Y-%m-%d"), incluir_serie)
+
+
+def _combinar_filas(*grupos: List[Dict]) -> List[Dict]:
+    """Suma filas agregadas de varias fuentes con el mismo _id."""
+    combinadas: Dict[tuple, Dict] = {}
+    for filas in grupos:
+        for fila in filas:
+            clave = tuple(sorted(fila["_id"].items()))
+            acumulada = combinadas.get(clave)
+            if acumulada is None:
+                combinadas[clave] = dict(fila)
+                continue
+            for campo, valor in fila.items():
+                if campo != "_id":
+                    acumulada[campo] = acumulada.get(campo, 0) + valor
+    return list(combinadas.values())
 
 
-def calcular_metricas_financieras(ventas: List[Dict]) -> Dict:
+def _formatear_metricas(filas: List[Dict], periodo: str) -> Dict:
     """
-    Calcula métricas financieras correctas por moneda.
-    
-    💱 MULTI-MONEDA: 
-    - Detecta automáticamente COP, USD, MXN
-    - Solo muestra monedas con datos
-    
-    🎯 FUENTES:
-    - ventas → Total vendido, servicios vs productos, métodos de pago
+    Convierte las filas agregadas de un período en métricas por moneda.
     
     Métricas:
     - ventas_totales: Sum de desglose_pagos.total
@@ -141,81 +191,97 @@ def calcular_metricas_financieras(ventas: List[Dict]) -> Dict:
     """
     metricas_por_moneda = {}
     
-    # ========= PROCESAR VENTAS =========
-    for venta in ventas:
-        moneda = venta.get("moneda", "COP")
-        
-        # Inicializar moneda si no existe
-        if moneda not in metricas_por_moneda:
-            metricas_por_moneda[moneda] = {
-                "ventas_totales": 0,
-                "cantidad_ventas": 0,
-                "ventas_servicios": 0,
-                "ventas_productos": 0,
-                "metodos_pago": {
-                    "efectivo": 0,
-                    "transferencia": 0,
-                    "tarjeta": 0,
-                    "sin_pago": 0,
-                    "otros": 0,
-                    "addi": 0,
-                    "giftcard": 0,
-                    "link_de_pago": 0,
-                    "tarjeta_credito": 0,
-                    "tarjeta_debito": 0,
-                }
-            }
-        
-        # Total de la venta (desde desglose_pagos)
-        desglose_pagos = venta.get("desglose_pagos", {})
-        total_venta = desglose_pagos.get("total", 0)
-        
-        metricas_por_moneda[moneda]["ventas_totales"] += total_venta
-        metricas_por_moneda[moneda]["cantidad_ventas"] += 1
-        
-        # Separar servicios vs productos (desde items)
-        items = venta.get("items", [])
-        for item in items:
-            tipo = item.get("tipo", "servicio")
-            subtotal = item.get("subtotal", 0)
-            
-            if tipo == "servicio":
-                metricas_por_moneda[moneda]["ventas_servicios"] += subtotal
-            elif tipo == "producto":
-                metricas_por_moneda[moneda]["ventas_productos"] += subtotal
-        
-        # Métodos de pago desde desglose_pagos
-        for metodo in ["efectivo", "transferencia","tarjeta", "tarjeta_credito", "tarjeta_debito", "link_de_pago", "giftcard", "addi", "otros"]:
-            valor = desglose_pagos.get(metodo, 0)
-            if valor > 0:
-                metricas_por_moneda[moneda]["metodos_pago"][metodo] += valor
-    
-    # ========= CALCULAR PROMEDIOS Y REDONDEAR =========
-    for moneda, datos in metricas_por_moneda.items():
-        cantidad = datos["cantidad_ventas"]
-        
-        # Ticket promedio
-        if cantidad > 0:
-            datos["ticket_promedio"] = round(datos["ventas_totales"] / cantidad, 2)
-        else:
-            datos["ticket_promedio"] = 0
-        
-        # Redondear totales
-        datos["ventas_totales"] = round(datos["ventas_totales"], 2)
-        datos["ventas_servicios"] = round(datos["ventas_servicios"], 2)
-        datos["ventas_productos"] = round(datos["ventas_productos"], 2)
-        
-        # Redondear métodos de pago
-        for metodo in datos["metodos_pago"]:
-            datos["metodos_pago"][metodo] = round(datos["metodos_pago"][metodo], 2)
-        
-        # Limpiar sin_pago si no se usa
-        if datos["metodos_pago"]["sin_pago"] == 0:
-            del datos["metodos_pago"]["sin_pago"]
+    for fila in filas:
+        if fila["_id"]["periodo"] != periodo:
+            continue
+        
+        cantidad = fila["cantidad_ventas"]
+        metricas_por_moneda[fila["_id"]["moneda"]] = {
+            "ventas_totales": round(fila["ventas_totales"], 2),
+            "cantidad_ventas": cantidad,
+            "ventas_servicios": round(fila["ventas_servicios"], 2),
+            "ventas_productos": round(fila["ventas_productos"], 2),
+            "metodos_pago": {metodo: round(fila[metodo], 2) for metodo in METODOS_PAGO},
+            "ticket_promedio": round(fila["ventas_totales"] / cantidad, 2) if cantidad > 0 else 0
+        }
     
     return metricas_por_moneda
 
 
+def _formatear_serie(filas: List[Dict]) -> Dict[str, List[Dict]]:
+    """Serie diaria por moneda: {moneda: [{fecha, ventas_totales, cantidad_ventas}]}"""
+    serie = {}
+    for fila in filas:
+        serie.setdefault(fila["_id"]["moneda"], []).append({
+            "fecha": fila["_id"]["fecha"],
+            "ventas_totales": round(fila["ventas_totales"], 2),
+            "cantidad_ventas": fila["cantidad_ventas"]
+        })
+    return serie
+
+
+async def get_metricas_ventas(
+    start_date: datetime,
+    end_date: datetime,
+    start_anterior: datetime,
+    end_anterior: datetime,
+    sede_id: Optional[str] = None,
+    incluir_serie: bool = False
+) -> Dict:
+    """
+    Métricas financieras de ambos períodos desde el cubo diario.
+    Los días que el cubo no refleja (sin backfill completo, o con una
+    actualización fallida) se agregan desde `sales` en paralelo y se suman.
+    💱 MULTI-MONEDA: solo aparecen monedas con ventas.
+    """
+    faltantes = await dias_fuera_del_cubo(
+        sede_id, start_anterior.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    )
+    
+    consultas = []
+    if faltantes is None:
+        match_ventas = {"fecha_pago": {"$gte": start_anterior, "$lte": end_date}}
+        if sede_id:
+            match_ventas["sede_id"] = sede_id
+        consultas.append((collection_sales, _pipeline_metricas_desde_ventas(match_ventas, start_date, incluir_serie)))
+    else:
+        consultas.append((
+            collection_sales_daily,
+            _pipeline_metricas_ventas(start_date, end_date, start_anterior, sede_id, incluir_serie, faltantes)
+        ))
+        if faltantes:
+            consultas.append((
+                collection_sales,
+                _pipeline_metricas_desde_ventas(filtro_ventas_de_dias(faltantes), start_date, incluir_serie)
+            ))
+    
+    resultados = await asyncio.gather(*(
+        para_analitica(coleccion).aggregate(pipeline, **tiempo_max("analitica")).to_list(None)
+        for coleccion, pipeline in consultas
+    ))
+    
+    if incluir_serie:
+        facetas = [r[0] if r else {"resumen": [], "serie": []} for r in resultados]
+        filas = _combinar_filas(*(f["resumen"] for f in facetas))
+        serie = sorted(_combinar_filas(*(f["serie"] for f in facetas)), key=lambda fila: fila["_id"]["fecha"])
+    else:
+        filas = _combinar_filas(*resultados)
+    
+    resultado = {
+        "actual": _formatear_metricas(filas, "actual"),
+        "anterior": _formatear_metricas(filas, "anterior")
+    }
+    if incluir_serie:
+        resultado["serie"] = _formatear_serie(serie)
+    
+    logger.info(
+        f"💰 Ventas agregadas: "
+        f"{sum(m['cantidad_ventas'] for m in resultado['actual'].values())} "
+        f"(sede: {sede_id or 'TODAS'})"
+    )
+    return resultado
+
+
 def calcular_crecimiento(
     metricas_actuales: Dict,
     metricas_anteriores: Dict
@@ -304,6 +370,66 @@ def obtener_info_monedas(monedas_detectadas: List[str], metricas: Dict) -> List[
     return monedas_info
 
 
+async def _calcular_metricas_dashboard(
+    start_date: datetime,
+    end_date: datetime,
+    start_anterior: datetime,
+    end_anterior: datetime,
+    sede_id: Optional[str] = None,
+    incluir_serie: bool = False
+) -> Dict:
+    """Métricas del período + crecimiento vs período anterior (sin caché)."""
+    metricas = await get_metricas_ventas(
+        start_date, end_date, start_anterior, end_anterior, sede_id, incluir_serie
+    )
+    metricas_actuales = metricas["actual"]
+    
+    crecimientos = calcular_crecimiento(metricas_actuales, metricas["anterior"])
+    
+    for moneda, datos in metricas_actuales.items():
+        crecimiento_info = crecimientos.get(moneda, {"ventas": 0, "prefijo": ""})
+        datos["crecimiento_ventas"] = (
+            f"{crecimiento_info['prefijo']}{crecimiento_info['ventas']}%"
+        )
+    
+    resultado = {
+        "metricas_por_moneda": metricas_actuales,
+        "ventas_registradas": sum(d["cantidad_ventas"] for d in metricas_actuales.values())
+    }
+    if incluir_serie:
+        resultado["serie_diaria"] = metricas["serie"]
+    
+    return resultado
+
+
+async def get_metricas_dashboard(
+    start_date: datetime,
+    end_date: datetime,
+    start_anterior: datetime,
+    end_anterior: datetime,
+    sede_id: Optional[str] = None,
+    incluir_serie: bool = False
+) -> Dict:
+    """
+    Métricas del dashboard compartidas entre usuarios (caché + single-flight).
+    ⚠️ El resultado es compartido: no mutarlo.
+    """
+    cache_key = make_cache_key(
+        "ventas_dashboard",
+        start=start_date.isoformat(),
+        end=end_date.isoformat(),
+        sede=sede_id,
+        serie=incluir_serie or None
+    )
+    return await analytics_cache.get_or_compute(
+        cache_key,
+        lambda: _calcular_metricas_dashboard(
+            start_date, end_date, start_anterior, end_anterior, sede_id, incluir_serie
+        ),
+        ttl=SALES_CACHE_TTL
+    )
+
+
 @router.get("/dashboard")
 async def ventas_dashboard(
     period: str = Query(
@@ -322,6 +448,7 @@ async def ventas_dashboard(
         regex="^\\d{4}-\\d{2}-\\d{2}$"
     ),
     sede_id: Optional[str] = Query(None, description="Filtrar por sede"),
+    serie_diaria: bool = Query(False, description="Incluir serie diaria de ventas por moneda"),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -335,7 +462,8 @@ async def ventas_dashboard(
     - Métricas independientes por moneda
     
     🎯 FUENTE DE DATOS:
-    - collection_sales → Total vendido (desglose_pagos.total)
+    - sales_daily (cubo diario de collection_sales) → Total vendido (desglose_pagos.total)
+    - collection_sales para los días que el cubo aún no refleja
     
     Períodos disponibles:
     - last_7_days: Tendencia confiable (DEFAULT) ✅
@@ -355,6 +483,9 @@ async def ventas_dashboard(
     - ventas_productos: Total de productos (suma items tipo producto)
     - metodos_pago: Efectivo, transferencia, tarjeta (desde desglose_pagos)
     - crecimiento_ventas: % vs período anterior
+    
+    Con serie_diaria=true se añade {moneda: [{fecha, ventas_totales, cantidad_ventas}]}
+    del período actual (para gráficas).
     """
     try:
         # ========= VALIDACIÓN DE PERMISOS =========
@@ -402,31 +533,18 @@ async def ventas_dashboard(
             f"Range: {start_date_dt.date()} to {end_date_dt.date()}"
         )
         
-        # ========= OBTENER DATOS =========
-        # Período actual
-        ventas_actuales = await get_ventas_periodo(start_date_dt, end_date_dt, sede_id)
-        
-        # Período anterior
-        ventas_anteriores = await get_ventas_periodo(start_anterior, end_anterior, sede_id)
-        
-        # ========= CALCULAR MÉTRICAS =========
-        metricas_actuales = calcular_metricas_financieras(ventas_actuales)
-        metricas_anteriores = calcular_metricas_financieras(ventas_anteriores)
-        
-        crecimientos = calcular_crecimiento(metricas_actuales, metricas_anteriores)
-        
-        # ========= AGREGAR CRECIMIENTOS =========
-        for moneda, datos in metricas_actuales.items():
-            crecimiento_info = crecimientos.get(moneda, {"ventas": 0, "prefijo": ""})
-            datos["crecimiento_ventas"] = (
-                f"{crecimiento_info['prefijo']}{crecimiento_info['ventas']}%"
-            )
+        # ========= OBTENER DATOS (cacheado) =========
+        datos_periodo = await get_metricas_dashboard(
+            start_date_dt, end_date_dt, start_anterior, end_anterior, sede_id, serie_diaria
+        )
+        metricas_actuales = datos_periodo["metricas_por_moneda"]
+        ventas_registradas = datos_periodo["ventas_registradas"]
         
         # ========= VALIDACIONES =========
         advertencias = []
         
         # Sin ventas
-        if not ventas_actuales:
+        if not ventas_registradas:
             advertencias.append({
                 "tipo": "SIN_VENTAS",
                 "severidad": "CRÍTICA",
@@ -435,11 +553,11 @@ async def ventas_dashboard(
             })
         
         # Pocas ventas
-        elif len(ventas_actuales) < 5:
+        elif ventas_registradas < 5:
             advertencias.append({
                 "tipo": "POCAS_VENTAS",
                 "severidad": "ALTA",
-                "mensaje": f"Solo {len(ventas_actuales)} ventas en el período",
+                "mensaje": f"Solo {ventas_registradas} ventas en el período",
                 "recomendacion": "Amplíe el período para análisis más estable"
             })
         
@@ -483,7 +601,7 @@ async def ventas_dashboard(
             "tipo_dashboard": "financiero_multimoneda",
             "descripcion": "Métricas basadas únicamente en ventas pagadas, separadas por moneda",
             "fuentes": {
-                "ventas": "collection_sales (desglose_pagos.total)"
+                "ventas": "sales_daily (desglose_pagos.total por día)"
             },
             "usuario": {
                 "username": current_user.get("username"),
@@ -505,19 +623,22 @@ async def ventas_dashboard(
             },
             "metricas_por_moneda": metricas_actuales,
             "debug_info": {
-                "ventas_registradas": len(ventas_actuales),
+                "ventas_registradas": ventas_registradas,
                 "monedas_en_ventas": monedas_detectadas
             },
             "calidad_datos": calidad_datos
         }
         
+        if serie_diaria:
+            response["serie_diaria"] = datos_periodo["serie_diaria"]
+        
         if advertencias:
             response["advertencias"] = advertencias
         
         logger.info(
             f"✅ Dashboard ventas generado - "
             f"Período: {dias_periodo} días, "
-            f"Ventas: {len(ventas_actuales)}, "
+            f"Ventas: {ventas_registradas}, "
             f"Monedas: {', '.join(monedas_detectadas)}, "
             f"Calidad: {calidad_datos}"
         )
@@ -1,4 +1,5 @@
 from passlib.context import CryptContext
+import logging
 from datetime import timedelta, datetime, timezone
 from typing import Optional
 import jwt
@@ -7,6 +8,8 @@ import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -15,25 +18,18 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 300))
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    print("🔑 Verifying password...")
-    result = pwd_context.verify(plain_password, hashed_password)
-    print(f"✅ Password verification result: {result}")
-    return result
+    return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    print("🔒 Hashing password...")
-    hashed = pwd_context.hash(password)
-    print(f"🔑 Hashed password: {hashed}")
-    return hashed
+    return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    print("🪙 Creating access token...")
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    print(f"📅 Token expiration set to: {expire}")
     token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    print(f"🔐 Generated token: {token}")
+    # Nunca el token: solo sujeto y vencimiento
+    logger.debug(f"🪙 Access token emitido para {data.get('sub')} (vence {expire:%Y-%m-%d %H:%M} UTC)")
     return token
 
 def create_refresh_token(data: dict, expires_delta: timedelta = None):
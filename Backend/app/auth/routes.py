@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Form, Depends, status
+import logging
 from datetime import datetime, timedelta
 from fastapi import Cookie, Response
 from jose import jwt, JWTError
@@ -20,14 +21,19 @@ from app.database.mongo import (
     collection_admin_sede,
     collection_admin_franquicia
 )
+from app.core.responses import BSONRoute
+from app.core.tiempos_peticion import medir_fase
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 
 # ==============================================================
 # ✅ Obtener usuario autenticado (con sede_id y franquicia_id)
 # ==============================================================
+@medir_fase("auth")
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -141,31 +147,31 @@ async def login(
 ):
     # Normaliza el correo
     email = username.strip().lower()
-    print("📧 Intentando login con:", email)
+    logger.debug(f"📧 Intentando login con: {email}")
 
     # ✅ BUSCAR SOLO EN collection_auth (donde están TODOS los usuarios)
     user = await collection_auth.find_one({"correo_electronico": email})
     
     if not user:
-        print("❌ Usuario no encontrado en collection_auth:", email)
+        logger.warning(f"❌ Usuario no encontrado en collection_auth: {email}")
         raise HTTPException(status_code=400, detail="Usuario no encontrado")
 
     # Verificar contraseña
     try:
         if not pwd_context.verify(password, user["hashed_password"]):
-            print("❌ Contraseña incorrecta para:", email)
+            logger.warning(f"❌ Contraseña incorrecta para: {email}")
             raise HTTPException(status_code=400, detail="Contraseña incorrecta")
     except Exception as e:
-        print(f"⚠️ Error al verificar contraseña: {e}")
+        logger.error(f"⚠️ Error al verificar contraseña: {e}")
         raise HTTPException(status_code=500, detail="Error verificando contraseña")
 
     # ✅ OBTENER EL ROL REAL DEL USUARIO desde la base de datos
     rol_real = user.get("rol")
     if not rol_real:
-        print("❌ Usuario no tiene rol asignado:", email)
+        logger.error(f"❌ Usuario no tiene rol asignado: {email}")
         raise HTTPException(status_code=500, detail="Usuario sin rol asignado")
 
-    print(f"✅ Login correcto para {email} con rol {rol_real}")
+    logger.info(f"✅ Login correcto para {email} con rol {rol_real}")
 
     # Crear tokens con el rol REAL de la base de datos
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -181,7 +187,7 @@ async def login(
             expires_delta=refresh_token_expires,
         )
     except Exception as e:
-        print("⚠️ Error creando tokens:", e)
+        logger.error(f"⚠️ Error creando tokens: {e}")
         raise HTTPException(status_code=500, detail="Error generando tokens")
 
     # Guardar refresh token en cookie HttpOnly
@@ -195,8 +201,6 @@ async def login(
         path="/",
     )
 
-    print("✅ Tokens generados y cookie configurada")
-
     return TokenResponse(
         access_token=access_token,
         token_type="bearer",
@@ -304,29 +308,23 @@ async def change_password(
 # =========================================================
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token_endpoint(response: Response, refresh_token: str = Cookie(None)):
-    print("Refresh token recibido:", refresh_token)  # Debugging
-
     if not refresh_token:
-        print("Error: No se encontró refresh token")  # Debugging
+        logger.debug("Refresh sin cookie refresh_token")
         raise HTTPException(status_code=401, detail="No se encontró refresh token")
 
     try:
         payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
-        print("Payload decodificado:", payload)  # Debugging
-
         email: str = payload.get("sub")
         rol: str = payload.get("rol")
 
         if not email or not rol:
-            print("Error: Token inválido, falta email o rol")  # Debugging
+            logger.warning("Refresh token sin email o rol")
             raise HTTPException(status_code=401, detail="Token inválido")
 
         # ✅ VERIFICAR EN collection_auth
         user = await collection_auth.find_one({"correo_electronico": email})
-        print("Usuario encontrado:", user)  # Debugging
-
         if not user or not user.get("activo", True):
-            print("Error: Usuario no autorizado o inactivo")  # Debugging
+            logger.warning(f"Refresh rechazado: usuario no autorizado o inactivo ({email})")
             raise HTTPException(status_code=401, detail="Usuario no autorizado o inactivo")
 
         # 🔄 Renovar access token
@@ -334,14 +332,12 @@ async def refresh_token_endpoint(response: Response, refresh_token: str = Cookie
             data={"sub": email, "rol": rol},
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         )
-        print("Nuevo access token generado")  # Debugging
 
         # (Opcional) rotar refresh token
         new_refresh_token = create_refresh_token(
             data={"sub": email, "rol": rol},
             expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
         )
-        print("Nuevo refresh token generado")  # Debugging
 
         response.set_cookie(
             key="refresh_token",
@@ -351,7 +347,7 @@ async def refresh_token_endpoint(response: Response, refresh_token: str = Cookie
             samesite="None",
             max_age=int(timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS).total_seconds())
         )
-        print("Refresh token actualizado en la cookie")  # Debugging
+        logger.debug(f"🔄 Tokens renovados para {email}")
 
         return TokenResponse(
             access_token=new_access_token,
@@ -362,7 +358,7 @@ async def refresh_token_endpoint(response: Response, refresh_token: str = Cookie
         )
 
     except JWTError as e:
-        print("Error al decodificar el refresh token:", str(e))  # Debugging
+        logger.warning(f"Refresh token inválido o expirado: {e}")
         raise HTTPException(status_code=401, detail="Refresh token inválido o expirado")
 
 
@@ -0,0 +1,345 @@
+"""
+Numeración de comprobantes por sede y serie (sin huecos)
+========================================================
+
+Antes: random.randint(10000000, 99999999), sin control de duplicados ni
+secuencia fiscal. Ahora cada (sede_id, serie) tiene un contador en
+`invoice_counters`:
+
+    {
+      "_id": "<sede_id>:<serie>", "sede_id", "serie",
+      "siguiente": 124,                # primer número nunca entregado
+      "libres": [87, 102],             # devueltos (facturas no emitidas, bloques sin usar)
+      "arriendos": {                   # bloques entregados a procesos
+        "<arriendo_id>": {"numeros": [118, ..., 123], "en": datetime}
+      },
+      "version": 57
+    }
+
+- Un proceso arrienda un BLOQUE de números (primero los `libres`, de
+  menor a mayor, luego desde `siguiente`) y los entrega desde memoria: una escritura en Mongo
+  cada TAMANO_BLOQUE facturas, no una por factura.
+- Todo cambio del contador es una escritura condicionada a `version`
+  (compare-and-swap sobre un solo documento): sin transacciones y sin
+  carreras entre procesos.
+- Invariante: todo número < siguiente está facturado, libre o arrendado.
+  · liberar(): la factura no llegó a guardarse → el número pasa al bloque
+    en uso del proceso y es el próximo en entregarse (o vuelve a libres si
+    no hay bloque). Una factura ya emitida conserva su número: si la
+    facturación falla después, se anula (bills/routes.py).
+  · devolver_bloques(): al apagar, lo no usado vuelve a libres.
+  · Si un proceso muere, su arriendo vence (ARRIENDO_VENCE) y el siguiente
+    arriendo de esa sede/serie devuelve a libres los números que no
+    aparezcan en `invoices`.
+- Un proceso deja de usar su bloque a los BLOQUE_USO_MAX (muy por debajo
+  de ARRIENDO_VENCE) para que nunca se recupere un bloque en uso.
+- Índice único (sede_id, serie, numero) en invoices como última barrera.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app.database.mongo import collection_invoice_counters, collection_invoices
+
+logger = logging.getLogger(__name__)
+
+TAMANO_BLOQUE = int(os.getenv("FACTURACION_BLOQUE", "10"))
+SERIE_DEFECTO = os.getenv("FACTURACION_SERIE", "FV")
+DIGITOS_NUMERO = 8
+
+BLOQUE_USO_MAX = timedelta(minutes=5)
+ARRIENDO_VENCE = timedelta(minutes=15)
+MAX_REINTENTOS_CAS = 50
+
+Clave = Tuple[str, str]
+
+_indice_creado = False
+
+
+def formatear_comprobante(serie: str, numero: int) -> str:
+    """("FV", 123) → "FV-00000123"."""
+    return f"{serie}-{str(numero).zfill(DIGITOS_NUMERO)}"
+
+
+def _id_contador(sede_id: str, serie: str) -> str:
+    return f"{sede_id}:{serie}"
+
+
+def _insertar_ordenado(libres: List[int], numeros) -> List[int]:
+    return sorted(set(libres).union(numeros))
+
+
+class _Bloque:
+    def __init__(self, arriendo_id: str, numeros: List[int], en: datetime):
+        self.arriendo_id = arriendo_id
+        self.numeros: Deque[int] = deque(numeros)
+        self.en = en
+        # Entregados cuya factura aún no se confirmó
+        self.pendientes: Set[int] = set()
+
+
+class Numerador:
+    """Un numerador por proceso (ver `numerador` al final del módulo)."""
+
+    def __init__(self, collection=None, collection_facturas=None, tamano_bloque: int = TAMANO_BLOQUE,
+                 reloj: Callable[[], datetime] = datetime.utcnow):
+        self.collection = collection if collection is not None else collection_invoice_counters
+        self.collection_facturas = collection_facturas if collection_facturas is not None else collection_invoices
+        self.tamano_bloque = tamano_bloque
+        self.reloj = reloj
+        self.proceso = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._bloques: Dict[Clave, _Bloque] = {}
+        # Bloques agotados con números aún en vuelo (se podan en el próximo arriendo)
+        self._anteriores: Dict[Clave, List[_Bloque]] = {}
+        self._locks: Dict[Clave, asyncio.Lock] = {}
+        self._secuencia_arriendos = 0
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+
+    async def siguiente(self, sede_id: str, serie: str = SERIE_DEFECTO) -> int:
+        clave = (sede_id, serie)
+        lock = self._locks.setdefault(clave, asyncio.Lock())
+        async with lock:
+            bloque = self._bloques.get(clave)
+            if bloque and bloque.numeros and self.reloj() - bloque.en > BLOQUE_USO_MAX:
+                await self._devolver(clave, bloque)
+                bloque = None
+            if not bloque or not bloque.numeros:
+                if bloque:
+                    self._anteriores.setdefault(clave, []).append(bloque)
+                bloque = await self._arrendar(clave)
+                self._bloques[clave] = bloque
+            numero = bloque.numeros.popleft()
+            bloque.pendientes.add(numero)
+            return numero
+
+    def confirmar(self, sede_id: str, numero: int, serie: str = SERIE_DEFECTO):
+        """La factura con ese número ya está guardada (sin ir a Mongo)."""
+        for bloque in self._bloques_de((sede_id, serie)):
+            bloque.pendientes.discard(numero)
+
+    async def liberar(self, sede_id: str, numero: int, serie: str = SERIE_DEFECTO):
+        """El número se entregó pero la factura no se guardó: se vuelve a entregar antes que los siguientes."""
+        clave = (sede_id, serie)
+        lock = self._locks.setdefault(clave, asyncio.Lock())
+        async with lock:
+            actual = self._bloques.get(clave)
+            if actual is not None and numero in actual.pendientes:
+                # Sigue en el arriendo del bloque en uso: basta con devolverlo a la cola
+                actual.pendientes.discard(numero)
+                self._reencolar(actual, numero)
+                logger.info(f"↩️ Número {formatear_comprobante(serie, numero)} liberado ({sede_id})")
+                return
+
+            conservado = False
+
+            def devolver(doc: Dict) -> Dict:
+                nonlocal conservado
+                conservado = False
+                destino = doc["arriendos"].get(actual.arriendo_id) if actual is not None else None
+                # Si el arriendo ya se recuperó por vencido, el número ya está en libres
+                for arriendo_id, arriendo in list(doc["arriendos"].items()):
+                    if numero not in arriendo["numeros"]:
+                        continue
+                    arriendo["numeros"].remove(numero)
+                    if destino is not None:
+                        destino["numeros"].append(numero)
+                        conservado = True
+                    else:
+                        doc["libres"] = _insertar_ordenado(doc["libres"], [numero])
+                    if not arriendo["numeros"] and arriendo is not destino:
+                        del doc["arriendos"][arriendo_id]
+                return doc
+
+            await self._modificar(clave, devolver)
+            for bloque in self._bloques_de(clave):
+                bloque.pendientes.discard(numero)
+            if conservado:
+                self._reencolar(actual, numero)
+        logger.info(f"↩️ Número {formatear_comprobante(serie, numero)} liberado ({sede_id})")
+
+    @staticmethod
+    def _reencolar(bloque: _Bloque, numero: int):
+        bloque.numeros = deque(sorted([*bloque.numeros, numero]))
+
+    async def devolver_bloques(self):
+        """Al apagar el proceso: los números no usados vuelven a libres."""
+        for clave in list(self._bloques):
+            for bloque in self._bloques_de(clave):
+                try:
+                    await self._devolver(clave, bloque)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo devolver el bloque de {clave}: {e}")
+        self._bloques.clear()
+        self._anteriores.clear()
+
+    def _bloques_de(self, clave: Clave) -> List[_Bloque]:
+        actual = self._bloques.get(clave)
+        return self._anteriores.get(clave, []) + ([actual] if actual else [])
+
+    # ------------------------------------------------------------
+    # Contador (compare-and-swap sobre un documento)
+    # ------------------------------------------------------------
+
+    async def _leer(self, clave: Clave) -> Dict:
+        sede_id, serie = clave
+        doc = await self.collection.find_one({"_id": _id_contador(sede_id, serie)})
+        if doc is not None:
+            return doc
+        inicial = {
+            "_id": _id_contador(sede_id, serie),
+            "sede_id": sede_id,
+            "serie": serie,
+            "siguiente": 1,
+            "libres": [],
+            "arriendos": {},
+            "version": 0,
+            "creado_en": self.reloj(),
+        }
+        try:
+            await self.collection.insert_one(inicial)
+            return inicial
+        except DuplicateKeyError:
+            return await self.collection.find_one({"_id": inicial["_id"]})
+
+    async def _modificar(self, clave: Clave, cambio: Callable[[Dict], Dict], doc: Optional[Dict] = None) -> Dict:
+        for intento in range(MAX_REINTENTOS_CAS):
+            if doc is None:
+                doc = await self._leer(clave)
+            version = doc.get("version", 0)
+            nuevo = cambio({
+                "siguiente": doc["siguiente"],
+                "libres": list(doc.get("libres", [])),
+                "arriendos": {k: {**v, "numeros": list(v["numeros"])} for k, v in doc.get("arriendos", {}).items()},
+            })
+            resultado = await self.collection.update_one(
+                {"_id": doc["_id"], "version": version},
+                {
+                    "$set": {
+                        "siguiente": nuevo["siguiente"],
+                        "libres": nuevo["libres"],
+                        "arriendos": nuevo["arriendos"],
+                        "actualizado_en": self.reloj(),
+                    },
+                    "$inc": {"version": 1},
+                }
+            )
+            if resultado.modified_count == 1:
+                return nuevo
+            doc = None
+            await asyncio.sleep(0.002 * min(intento + 1, 10))
+        raise RuntimeError(f"Contador de comprobantes {clave} con demasiada contención")
+
+    async def _arrendar(self, clave: Clave) -> _Bloque:
+        await asegurar_indice_numeracion()
+        doc = await self._leer(clave)
+        await self._recuperar_vencidos(clave, doc)
+
+        self._secuencia_arriendos += 1
+        arriendo_id = f"{self.proceso}-{self._secuencia_arriendos}"
+        en = self.reloj()
+        tomados: List[int] = []
+        anteriores = self._anteriores.get(clave, [])
+
+        def arrendar(doc: Dict) -> Dict:
+            # Poda de bloques propios agotados: solo quedan los números en vuelo
+            for bloque in anteriores:
+                arriendo = doc["arriendos"].get(bloque.arriendo_id)
+                if arriendo is None:
+                    continue
+                arriendo["numeros"] = [n for n in arriendo["numeros"] if n in bloque.pendientes]
+                if not arriendo["numeros"]:
+                    del doc["arriendos"][bloque.arriendo_id]
+
+            tomados.clear()
+            tomados.extend(doc["libres"][:self.tamano_bloque])
+            doc["libres"] = doc["libres"][len(tomados):]
+            faltan = self.tamano_bloque - len(tomados)
+            tomados.extend(range(doc["siguiente"], doc["siguiente"] + faltan))
+            doc["siguiente"] += faltan
+            doc["arriendos"][arriendo_id] = {"numeros": list(tomados), "en": en}
+            return doc
+
+        nuevo = await self._modificar(clave, arrendar)
+        self._anteriores[clave] = [b for b in anteriores if b.arriendo_id in nuevo["arriendos"]]
+        return _Bloque(arriendo_id, tomados, en)
+
+    async def _devolver(self, clave: Clave, bloque: _Bloque):
+        restantes = set(bloque.numeros)
+
+        def devolver(doc: Dict) -> Dict:
+            arriendo = doc["arriendos"].get(bloque.arriendo_id)
+            if arriendo is None:
+                # Ya recuperado por vencido: sus números ya volvieron a libres
+                return doc
+            doc["libres"] = _insertar_ordenado(
+                doc["libres"], [n for n in arriendo["numeros"] if n in restantes]
+            )
+            arriendo["numeros"] = [n for n in arriendo["numeros"] if n in bloque.pendientes]
+            if not arriendo["numeros"]:
+                del doc["arriendos"][bloque.arriendo_id]
+            return doc
+
+        await self._modificar(clave, devolver)
+        bloque.numeros.clear()
+
+    async def _recuperar_vencidos(self, clave: Clave, doc: Dict):
+        """Arriendos de procesos que murieron: lo no facturado vuelve a libres."""
+        limite = self.reloj() - ARRIENDO_VENCE
+        vencidos = {
+            arriendo_id: arriendo for arriendo_id, arriendo in (doc.get("arriendos") or {}).items()
+            if arriendo["en"] < limite
+        }
+        if not vencidos:
+            return
+
+        sede_id, serie = clave
+        candidatos = [n for a in vencidos.values() for n in a["numeros"]]
+        usados = set()
+        if candidatos:
+            facturas = await self.collection_facturas.find(
+                {"sede_id": sede_id, "serie": serie, "numero": {"$in": candidatos}},
+                {"_id": 0, "numero": 1}
+            ).to_list(None)
+            usados = {f["numero"] for f in facturas}
+
+        def recuperar(doc: Dict) -> Dict:
+            for arriendo_id in vencidos:
+                arriendo = doc["arriendos"].pop(arriendo_id, None)
+                if arriendo:
+                    doc["libres"] = _insertar_ordenado(
+                        doc["libres"], [n for n in arriendo["numeros"] if n not in usados]
+                    )
+            return doc
+
+        await self._modificar(clave, recuperar)
+        logger.warning(f"♻️ Recuperados {len(vencidos)} arriendos vencidos de numeración en {clave}")
+
+
+numerador = Numerador()
+
+
+async def asegurar_indice_numeracion():
+    """Índice único (sede_id, serie, numero) en invoices (solo facturas numeradas), una vez por proceso."""
+    global _indice_creado
+    if _indice_creado:
+        return
+    try:
+        await collection_invoices.create_index(
+            [("sede_id", 1), ("serie", 1), ("numero", 1)],
+            name="invoices_sede_serie_numero",
+            unique=True,
+            partialFilterExpression={"numero": {"$exists": True}}
+        )
+        _indice_creado = True
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo crear el índice único de numeración: {e}")
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+import logging
 from datetime import datetime
 from typing import Optional, List
 from bson import ObjectId
-import random
 import asyncio
 from datetime import timedelta
 
@@ -14,25 +14,42 @@ from app.database.mongo import (
     collection_locales,
     collection_invoices,
     collection_sales,
-    collection_inventarios,           # 🆕
     collection_inventory_motions,
     collection_productos            # 🆕
 )
 from app.auth.routes import get_current_user
+from app.analytics.client_visit_stats import recalcular_visitas_cliente
+from app.analytics.sales_daily import actualizar_ventas_dia, contar_ventas_rango
+from app.core.pagination import paginar_keyset, asegurar_indice
+from app.bills.numeracion import SERIE_DEFECTO, formatear_comprobante, numerador
+from app.core.responses import BSONRoute
+from app.inventary.submodulos.inventarios.stock import ajustar_stock
+from app.scheduling.submodules.quotes.delta_sync import marca_actualizacion
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-def generar_numero_comprobante() -> str:
+router = APIRouter(route_class=BSONRoute)
+
+def serie_facturacion(sede: dict) -> str:
     """
-    Genera un número de comprobante único de 8 dígitos
+    Serie de numeración de la sede (campo opcional `serie_facturacion`)
     """
-    return str(random.randint(10000000, 99999999))
+    return (sede or {}).get("serie_facturacion") or SERIE_DEFECTO
+
 
-def generar_identificador() -> str:
+async def anular_factura(identificador: str, motivo: str):
     """
-    Genera un identificador único de 8 dígitos
+    Anula una factura ya numerada (conserva el número: no se reutiliza).
+    Nunca lanza excepción: se llama mientras se propaga otro error.
     """
-    return str(random.randint(10000000, 99999999))
+    try:
+        await collection_invoices.update_one(
+            {"identificador": identificador},
+            {"$set": {"estado": "anulada", "motivo_anulacion": motivo, "fecha_anulacion": datetime.now()}}
+        )
+        logger.warning(f"🚫 Factura {identificador} anulada: {motivo}")
+    except Exception as e:
+        logger.error(f"❌ No se pudo anular la factura {identificador}: {e}", exc_info=True)
 
 
 # ============================================================
@@ -50,8 +67,8 @@ async def facturar_cita_o_venta(
     ✅ Maneja precios personalizados
     ✅ Estructura correcta de items
     """
-    print(f"🔍 Facturar invocada por {current_user.get('email')} (rol={current_user.get('rol')})")
-    print(f"📋 ID: {id}, Tipo: {tipo}")
+    logger.debug(f"🔍 Facturar invocada por {current_user.get('email')} (rol={current_user.get('rol')})")
+    logger.debug(f"📋 ID: {id}, Tipo: {tipo}")
 
     # Solo admin sede / superadmin
     if current_user["rol"] not in ["admin_sede", "super_admin"]:
@@ -68,7 +85,7 @@ async def facturar_cita_o_venta(
         if documento.get("estado_factura") == "facturado":
             raise HTTPException(status_code=400, detail="La cita ya está facturada")
 
-        print("✅ Cita lista para facturar")
+        logger.debug("✅ Cita lista para facturar")
         
     else:  # tipo == "venta"
         documento = await collection_sales.find_one({"_id": ObjectId(id)})
@@ -78,7 +95,7 @@ async def facturar_cita_o_venta(
         if documento.get("estado_factura") == "facturado":
             raise HTTPException(status_code=400, detail="Esta venta ya fue facturada")
 
-        print("✅ Venta lista para facturar")
+        logger.debug("✅ Venta lista para facturar")
 
     # ====================================
     # 2️⃣ OBTENER DATOS BÁSICOS
@@ -97,7 +114,7 @@ async def facturar_cita_o_venta(
     reglas_comision = sede.get("reglas_comision", {"tipo": "servicios"})
     tipo_comision = reglas_comision.get("tipo", "servicios")
     
-    print(f"💰 Moneda: {moneda_sede}, Tipo comisión: {tipo_comision}")
+    logger.debug(f"💰 Moneda: {moneda_sede}, Tipo comisión: {tipo_comision}")
 
     # Obtener cliente
     cliente = await collection_clients.find_one({"cliente_id": cliente_id})
@@ -118,7 +135,7 @@ async def facturar_cita_o_venta(
         # ====================================
         # NUEVA ESTRUCTURA (precio ya calculado en la cita)
         # ====================================
-        print(f"📋 Procesando {len(servicios_cita)} servicios (nueva estructura)")
+        logger.debug(f"📋 Procesando {len(servicios_cita)} servicios (nueva estructura)")
         
         for servicio_item in servicios_cita:
             servicio_id = servicio_item.get("servicio_id")
@@ -146,11 +163,11 @@ async def facturar_cita_o_venta(
                 "comision": comision_servicio
             })
             
-            print(f"  ✅ {nombre}: ${precio} (comisión: ${comision_servicio})")
+            logger.debug(f"  ✅ {nombre}: ${precio} (comisión: ${comision_servicio})")
     
     elif documento.get("servicio_id"):
         # Estructura muy antigua (un solo servicio)
-        print(f"📋 Procesando servicio único (estructura muy antigua)")
+        logger.debug("📋 Procesando servicio único (estructura muy antigua)")
         servicio_id = documento["servicio_id"]
         servicio_nombre = documento.get("servicio_nombre", "")
         
@@ -239,7 +256,7 @@ async def facturar_cita_o_venta(
             "comision": comision_producto
         })
         
-        print(f"  🛍️ {producto.get('nombre')}: ${subtotal_producto} (comisión: ${comision_producto})")
+        logger.debug(f"  🛍️ {producto.get('nombre')}: ${subtotal_producto} (comisión: ${comision_producto})")
 
     # ====================================
     # 5️⃣ CALCULAR TOTALES
@@ -247,18 +264,13 @@ async def facturar_cita_o_venta(
     total_final = round(sum(item["subtotal"] for item in items), 2)
     valor_comision_total = round(total_comision_servicios + total_comision_productos, 2)
     
-    print(f"💰 Total: ${total_final} {moneda_sede}")
-    print(f"💵 Comisión total: ${valor_comision_total} {moneda_sede}")
+    logger.debug(f"💰 Total: ${total_final} {moneda_sede}")
+    logger.debug(f"💵 Comisión total: ${valor_comision_total} {moneda_sede}")
 
-    # ====================================
-    # 6️⃣ GENERAR NÚMEROS ÚNICOS
-    # ====================================
-    numero_comprobante = generar_numero_comprobante()
-    identificador = generar_identificador()
     fecha_actual = datetime.now()
 
     # ====================================
-    # 7️⃣ PREPARAR HISTORIAL Y DESGLOSE DE PAGOS
+    # 6️⃣ PREPARAR HISTORIAL Y DESGLOSE DE PAGOS
     # ====================================
     # 1️⃣ Tomar el historial REAL (fuente de verdad)
     historial_pagos = documento.get("historial_pagos", [])
@@ -291,78 +303,15 @@ async def facturar_cita_o_venta(
     )
 
     # ====================================
-    # 8️⃣ CREAR/ACTUALIZAR VENTA EN SALES
+    # 7️⃣ ASIGNAR NÚMERO DE COMPROBANTE (por sede y serie, sin huecos)
     # ====================================
-    if tipo == "cita":
-        # Crear nuevo documento en sales
-        venta = {
-            "identificador": identificador,
-            "tipo_origen": "cita",
-            "origen_id": id,
-            "fecha_pago": fecha_actual,
-            "local": sede.get("nombre"),
-            "sede_id": sede_id,
-            "moneda": moneda_sede,
-            "tipo_comision": tipo_comision,
-            "cliente_id": cliente_id,
-            "nombre_cliente": cliente.get("nombre", "") + " " + cliente.get("apellido", ""),
-            "cedula_cliente": cliente.get("cedula", ""),
-            "email_cliente": cliente.get("correo", ""),
-            "telefono_cliente": cliente.get("telefono", ""),
-            "items": items,
-            "historial_pagos": historial_pagos,
-            "desglose_pagos": desglose_pagos,
-            "profesional_id": profesional_id,
-            "profesional_nombre": profesional_nombre,
-            "numero_comprobante": numero_comprobante,
-            "facturado_por": current_user.get("email")
-        }
-        
-        result_sale = await collection_sales.insert_one(venta)
-        venta_id = str(result_sale.inserted_id)
-        print(f"✅ Venta creada en sales: {venta_id}")
-        
-    else:  # venta directa
-        # Actualizar documento existente
-        await collection_sales.update_one(
-            {"_id": ObjectId(id)},
-            {
-                "$set": {
-                    "numero_comprobante": numero_comprobante,
-                    "identificador": identificador,
-                    "facturado_por": current_user.get("email"),
-                    "fecha_facturacion": fecha_actual,
-                    "items": items,
-                    "estado_factura": "facturado"
-                }
-            }
-        )
-        venta_id = id
-        print(f"✅ Venta actualizada en sales: {venta_id}")
+    serie = serie_facturacion(sede)
+    numero = await numerador.siguiente(sede_id, serie)
+    numero_comprobante = formatear_comprobante(serie, numero)
+    identificador = f"{sede_id}-{numero_comprobante}"
 
     # ====================================
-    # 9️⃣ ACTUALIZAR DOCUMENTO ORIGINAL
-    # ====================================
-    if tipo == "cita":
-        await collection_citas.update_one(
-            {"_id": ObjectId(id)},
-            {
-                "$set": {
-                    "estado": "completada",
-                    "estado_pago": "pagado",
-                    "saldo_pendiente": 0,
-                    "abono": total_final,
-                    "fecha_facturacion": fecha_actual,
-                    "numero_comprobante": numero_comprobante,
-                    "facturado_por": current_user.get("email"),
-                    "estado_factura": "facturado"
-                }
-            }
-        )
-        print("✅ Cita actualizada")
-
-    # ====================================
-    # 🔟 CREAR FACTURA EN INVOICES
+    # 8️⃣ CREAR FACTURA EN INVOICES (reclama el número)
     # ====================================
     factura = {
         "identificador": identificador,
@@ -380,6 +329,8 @@ async def facturar_cita_o_venta(
         "telefono_cliente": cliente.get("telefono", ""),
         "total": total_final,
         "comprobante_de_pago": "Factura",
+        "serie": serie,
+        "numero": numero,
         "numero_comprobante": numero_comprobante,
         "fecha_comprobante": fecha_actual,
         "monto": total_final,
@@ -391,8 +342,107 @@ async def facturar_cita_o_venta(
         "estado": "pagado"
     }
 
-    await collection_invoices.insert_one(factura)
-    print("✅ Factura creada")
+    try:
+        await collection_invoices.insert_one(factura)
+    except Exception:
+        # La factura no se guardó: el número vuelve a estar disponible
+        await numerador.liberar(sede_id, numero, serie)
+        raise
+    numerador.confirmar(sede_id, numero, serie)
+    logger.info(f"✅ Factura creada: {numero_comprobante}")
+
+    # ====================================
+    # 9️⃣ y 🔟 VENTA EN SALES + DOCUMENTO ORIGINAL
+    # ====================================
+    # Si algo falla aquí la factura se anula (conserva su número: la
+    # numeración no tiene huecos ni reutiliza) y la venta creada se borra.
+    # Marcar el origen como facturado es condicional: dos facturaciones
+    # simultáneas del mismo documento dejan una sola factura válida.
+    venta_creada = None
+    try:
+        if tipo == "cita":
+            # Crear nuevo documento en sales
+            venta = {
+                "identificador": identificador,
+                "tipo_origen": "cita",
+                "origen_id": id,
+                "fecha_pago": fecha_actual,
+                "local": sede.get("nombre"),
+                "sede_id": sede_id,
+                "moneda": moneda_sede,
+                "tipo_comision": tipo_comision,
+                "cliente_id": cliente_id,
+                "nombre_cliente": cliente.get("nombre", "") + " " + cliente.get("apellido", ""),
+                "cedula_cliente": cliente.get("cedula", ""),
+                "email_cliente": cliente.get("correo", ""),
+                "telefono_cliente": cliente.get("telefono", ""),
+                "items": items,
+                "historial_pagos": historial_pagos,
+                "desglose_pagos": desglose_pagos,
+                "profesional_id": profesional_id,
+                "profesional_nombre": profesional_nombre,
+                "numero_comprobante": numero_comprobante,
+                "facturado_por": current_user.get("email")
+            }
+
+            result_sale = await collection_sales.insert_one(venta)
+            venta_creada = result_sale.inserted_id
+            venta_id = str(venta_creada)
+            logger.info(f"✅ Venta creada en sales: {venta_id}")
+
+            result_cita = await collection_citas.update_one(
+                {"_id": ObjectId(id), "estado_factura": {"$ne": "facturado"}},
+                {
+                    "$set": {
+                        "estado": "completada",
+                        "estado_pago": "pagado",
+                        "saldo_pendiente": 0,
+                        "abono": total_final,
+                        "fecha_facturacion": fecha_actual,
+                        "numero_comprobante": numero_comprobante,
+                        "facturado_por": current_user.get("email"),
+                        "estado_factura": "facturado",
+                        "ultima_actualizacion": marca_actualizacion()
+                    }
+                }
+            )
+            if result_cita.matched_count == 0:
+                raise HTTPException(status_code=400, detail="La cita ya está facturada")
+            logger.debug("✅ Cita actualizada")
+
+        else:  # venta directa
+            # Actualizar documento existente
+            result_venta = await collection_sales.update_one(
+                {"_id": ObjectId(id), "estado_factura": {"$ne": "facturado"}},
+                {
+                    "$set": {
+                        "numero_comprobante": numero_comprobante,
+                        "identificador": identificador,
+                        "facturado_por": current_user.get("email"),
+                        "fecha_facturacion": fecha_actual,
+                        "items": items,
+                        "estado_factura": "facturado"
+                    }
+                }
+            )
+            if result_venta.matched_count == 0:
+                raise HTTPException(status_code=400, detail="Esta venta ya fue facturada")
+            venta_id = id
+            logger.info(f"✅ Venta actualizada en sales: {venta_id}")
+    except BaseException as e:
+        await anular_factura(identificador, f"Facturación incompleta ({type(e).__name__}): {e}")
+        if venta_creada is not None:
+            try:
+                await collection_sales.delete_one({"_id": venta_creada})
+            except Exception as e_venta:
+                logger.error(f"❌ No se pudo borrar la venta {venta_creada} de la factura anulada: {e_venta}")
+        raise
+
+    if tipo == "cita":
+        await actualizar_ventas_dia(sede_id, fecha_actual)
+        await recalcular_visitas_cliente(cliente_id, sede_id)
+    else:
+        await actualizar_ventas_dia(sede_id, documento.get("fecha_pago"))
 
     # ====================================
     # 1️⃣1️⃣ REGISTRAR MOVIMIENTOS DE INVENTARIO
@@ -404,27 +454,19 @@ async def facturar_cita_o_venta(
             producto_id = item["producto_id"]
             cantidad = item["cantidad"]
         
-            inventario = await collection_inventarios.find_one({
-                "producto_id": producto_id,
-                "sede_id": sede_id
-            })
+            # Descuento atómico + bandera stock_bajo
+            inventario = await ajustar_stock(
+                {"producto_id": producto_id, "sede_id": sede_id},
+                -cantidad,
+                fecha_actual
+            )
         
             if not inventario:
-                print(f"⚠️ No existe inventario para {item['nombre']}")
+                logger.warning(f"⚠️ No existe inventario para {item['nombre']}")
                 continue
         
-            stock_anterior = inventario["stock_actual"]
-            nuevo_stock = stock_anterior - cantidad
-        
-            await collection_inventarios.update_one(
-                {"_id": inventario["_id"]},
-                {
-                    "$set": {
-                        "stock_actual": nuevo_stock,
-                        "fecha_ultima_actualizacion": fecha_actual
-                    }
-                }
-            )
+            nuevo_stock = inventario["stock_actual"]
+            stock_anterior = nuevo_stock + cantidad
         
             movimientos_inventario.append({
                 "producto_id": producto_id,
@@ -441,7 +483,7 @@ async def facturar_cita_o_venta(
                 "usuario": current_user.get("email")
             })
         
-            print(f"📉 Inventario: {item['nombre']} ({stock_anterior} → {nuevo_stock})")
+            logger.debug(f"📉 Inventario: {item['nombre']} ({stock_anterior} → {nuevo_stock})")
 
     if movimientos_inventario:
         motion_doc = {
@@ -452,7 +494,7 @@ async def facturar_cita_o_venta(
         }
         
         await collection_inventory_motions.insert_one(motion_doc)
-        print(f"✅ Movimientos registrados: {len(movimientos_inventario)} productos")
+        logger.info(f"✅ Movimientos registrados: {len(movimientos_inventario)} productos")
 
     # ====================================
     # 1️⃣2️⃣ ACUMULAR COMISIONES DEL ESTILISTA (SI APLICA)
@@ -460,7 +502,7 @@ async def facturar_cita_o_venta(
     comision_msg = "No aplica comisión para esta sede"
 
     if valor_comision_total > 0 and profesional_id:
-        print(f"👤 Profesional ID: {profesional_id}")
+        logger.debug(f"👤 Profesional ID: {profesional_id}")
 
         # 🔍 Buscar documento de comisión PENDIENTE
         comision_document = await collection_commissions.find_one({
@@ -468,7 +510,7 @@ async def facturar_cita_o_venta(
             "sede_id": sede_id,
             "estado": "pendiente"
         })
-        print(f"📂 Documento de comisión encontrado: {comision_document is not None}")
+        logger.debug(f"📂 Documento de comisión encontrado: {comision_document is not None}")
 
         # Preparar detalle de comisión CON MÚLTIPLES SERVICIOS
         servicios_comision = []
@@ -511,7 +553,7 @@ async def facturar_cita_o_venta(
             
             # ⭐ MIGRAR DOCUMENTOS ANTIGUOS SIN periodo_inicio
             if servicios_existentes and "periodo_inicio" not in comision_document:
-                print("⚠️ Documento sin periodo_inicio detectado. Migrando...")
+                logger.warning("⚠️ Documento sin periodo_inicio detectado. Migrando...")
                 fechas_migracion = []
                 for s in servicios_existentes:
                     try:
@@ -553,10 +595,10 @@ async def facturar_cita_o_venta(
                     fecha_fin_rango = max(fecha_mas_reciente, fecha_actual)
                     dias_totales = (fecha_fin_rango - fecha_inicio_rango).days + 1
                     
-                    print(f"📅 Rango actual: {dias_totales} días")
+                    logger.debug(f"📅 Rango actual: {dias_totales} días")
                     
                     if dias_totales > 15:
-                        print(f"⚠️ El rango superaría los 15 días. Cerrando documento actual.")
+                        logger.warning("⚠️ El rango superaría los 15 días. Cerrando documento actual.")
                         crear_nuevo_documento = True
                         
                         await collection_commissions.update_one(
@@ -569,7 +611,7 @@ async def facturar_cita_o_venta(
 
         # ⭐ Decidir: Actualizar o Crear
         if comision_document and not crear_nuevo_documento:
-            print("🔄 Actualizando documento de comisión existente...")
+            logger.debug("🔄 Actualizando documento de comisión existente...")
             
             update_operations = {
                 "$inc": {
@@ -617,9 +659,9 @@ async def facturar_cita_o_venta(
                 )
             
             comision_msg = f"Comisión actualizada (+{valor_comision_total} {moneda_sede})"
-            print(f"✅ {comision_msg}")
+            logger.info(f"✅ {comision_msg}")
         else:
-            print("🆕 Creando nuevo documento de comisión...")
+            logger.debug("🆕 Creando nuevo documento de comisión...")
             nuevo_doc = {
                 "profesional_id": profesional_id,
                 "profesional_nombre": profesional_nombre,
@@ -639,9 +681,9 @@ async def facturar_cita_o_venta(
             }
             await collection_commissions.insert_one(nuevo_doc)
             comision_msg = f"Comisión creada ({valor_comision_total} {moneda_sede})"
-            print(f"✅ {comision_msg}")
+            logger.info(f"✅ {comision_msg}")
     else:
-        print("⚠️ No se generó comisión")
+        logger.warning("⚠️ No se generó comisión")
 
     # ====================================
     # RESPUESTA FINAL
@@ -719,6 +761,10 @@ async def obtener_ventas_sede(
     # Ordenamiento
     sort_order: str = Query("desc", regex=r"^(asc|desc)$", description="Orden ascendente o descendente"),
     
+    # Paginación por cursor (keyset)
+    cursor: Optional[str] = Query(None, description="Vacío para la primera página; luego next_cursor / prev_cursor"),
+    include_total: bool = Query(False, description="Solo con cursor: incluir el total de ventas"),
+    
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -732,9 +778,12 @@ async def obtener_ventas_sede(
     - **fecha_hasta**: Filtro fecha fin (YYYY-MM-DD)
     - **profesional_id**: ID del profesional
     - **search**: Buscar en nombre, cédula o email del cliente
+    - **cursor**: Paginación por cursor sobre (fecha_pago, _id). Coste
+      constante en cualquier página y sin conteo (salvo include_total)
     
     Ejemplo de uso:
     /sales/SD-88809?page=1&limit=50&fecha_desde=2025-12-01&fecha_hasta=2025-12-31
+    /sales/SD-88809?cursor=&limit=50  →  /sales/SD-88809?cursor=<next_cursor>&limit=50
     """
     
     # Validar permisos
@@ -750,7 +799,7 @@ async def obtener_ventas_sede(
         filtros = {"sede_id": sede_id}
         
         # DEBUG: Log para ver qué estamos buscando
-        print(f"🔍 Buscando ventas para sede_id: {sede_id}")
+        logger.debug(f"🔍 Buscando ventas para sede_id: {sede_id}")
         
         # Filtro de fechas (usando ISODate para MongoDB)
         if fecha_desde or fecha_hasta:
@@ -760,14 +809,14 @@ async def obtener_ventas_sede(
                 # Convertir a inicio del día en UTC
                 fecha_inicio = datetime.strptime(fecha_desde, "%Y-%m-%d")
                 filtros["fecha_pago"]["$gte"] = fecha_inicio
-                print(f"📅 Filtro fecha_desde: {fecha_inicio}")
+                logger.debug(f"📅 Filtro fecha_desde: {fecha_inicio}")
             
             if fecha_hasta:
                 # Convertir a fin del día en UTC
                 fecha_fin = datetime.strptime(fecha_hasta, "%Y-%m-%d")
                 fecha_fin = fecha_fin.replace(hour=23, minute=59, second=59)
                 filtros["fecha_pago"]["$lte"] = fecha_fin
-                print(f"📅 Filtro fecha_hasta: {fecha_fin}")
+                logger.debug(f"📅 Filtro fecha_hasta: {fecha_fin}")
         else:
             # Si NO hay filtros de fecha, buscar últimos 7 días por defecto
             if not profesional_id and not search:
@@ -777,10 +826,10 @@ async def obtener_ventas_sede(
                     "$gte": fecha_inicio,
                     "$lte": fecha_fin
                 }
-                print(f"📅 Filtro automático (últimos 7 días): {fecha_inicio} a {fecha_fin}")
+                logger.debug(f"📅 Filtro automático (últimos 7 días): {fecha_inicio} a {fecha_fin}")
         
         # DEBUG: Imprimir filtros aplicados
-        print(f"🔎 Filtros aplicados: {filtros}")
+        logger.debug(f"🔎 Filtros aplicados: {filtros}")
         
         # ============================================================
         # 🔹 Filtros adicionales (manejo especial de $or)
@@ -830,25 +879,32 @@ async def obtener_ventas_sede(
                 ]
         
         # DEBUG: Imprimir filtros finales
-        print(f"🔎 Filtros finales completos: {filtros}")
+        logger.debug(f"🔎 Filtros finales completos: {filtros}")
         
         # ============================================================
         # 🔹 Contar total de registros (con timeout)
         # ============================================================
-        try:
-            total_ventas = await asyncio.wait_for(
-                collection_sales.count_documents(filtros),
-                timeout=10.0  # 10 segundos máximo
-            )
-        except asyncio.TimeoutError:
-            # Si tarda mucho, retornar -1 (frontend puede manejarlo)
-            total_ventas = -1
+        async def contar_total() -> int:
+            # Rango de días completos sin otros filtros → el cubo diario ya tiene el conteo
+            total = 0
+            if fecha_desde and fecha_hasta and not condiciones_or:
+                total = await contar_ventas_rango(sede_id, fecha_desde, fecha_hasta)
+            
+            if not total:
+                try:
+                    total = await asyncio.wait_for(
+                        collection_sales.count_documents(filtros),
+                        timeout=10.0  # 10 segundos máximo
+                    )
+                except asyncio.TimeoutError:
+                    # Si tarda mucho, retornar -1 (frontend puede manejarlo)
+                    total = -1
+            return total
         
         # ============================================================
         # 🔹 Calcular paginación
         # ============================================================
         skip = (page - 1) * limit
-        total_pages = (total_ventas + limit - 1) // limit if total_ventas > 0 else 0
         
         # ============================================================
         # 🔹 Ordenamiento (fijo por fecha descendente)
@@ -881,39 +937,61 @@ async def obtener_ventas_sede(
             "historial_pagos": 1
         }
         
+        filters_applied = {
+            "sede_id": sede_id,
+            "fecha_desde": fecha_desde,
+            "fecha_hasta": fecha_hasta,
+            "profesional_id": profesional_id,
+            "search": search
+        }
+        
+        # ============================================================
+        # 🔹 Modo cursor: keyset sobre (fecha_pago, _id) descendente
+        # ============================================================
+        if cursor is not None:
+            await asegurar_indice(
+                collection_sales,
+                [("sede_id", 1), ("fecha_pago", -1), ("_id", -1)],
+                "sales_sede_fecha_pago_id"
+            )
+            pagina_cursor = await paginar_keyset(
+                collection_sales,
+                filtros,
+                [(sort_by, sort_direction), ("_id", sort_direction)],
+                limite=limit,
+                cursor=cursor or None,
+                projection=projection
+            )
+            ventas = pagina_cursor["items"]
+            
+            return {
+                "success": True,
+                "pagination": {
+                    "limit": limit,
+                    "next_cursor": pagina_cursor["siguiente"],
+                    "prev_cursor": pagina_cursor["anterior"],
+                    "has_next": pagina_cursor["tiene_siguiente"],
+                    "has_prev": pagina_cursor["tiene_anterior"],
+                    "showing": len(ventas),
+                    "total": await contar_total() if include_total else None
+                },
+                "filters_applied": filters_applied,
+                "ventas": ventas
+            }
+        
         # ============================================================
-        # 🔹 Obtener ventas paginadas
+        # 🔹 Obtener ventas paginadas (modo página)
         # ============================================================
+        total_ventas = await contar_total()
+        total_pages = (total_ventas + limit - 1) // limit if total_ventas > 0 else 0
+        
         ventas = await collection_sales.find(filtros, projection)\
-            .sort(sort_by, sort_direction,)\
+            .sort([(sort_by, sort_direction), ("_id", sort_direction)])\
             .skip(skip)\
             .limit(limit)\
             .to_list(limit)
         
-        # ============================================================
-        # 🔹 Procesar datos y convertir ObjectIds RECURSIVAMENTE
-        # ============================================================
-        from bson import ObjectId
-        
-        def limpiar_objectids(obj):
-            """
-            Convierte recursivamente TODOS los ObjectId a string
-            Funciona con diccionarios, listas y valores anidados
-            """
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, dict):
-                return {key: limpiar_objectids(value) for key, value in obj.items()}
-            elif isinstance(obj, list):
-                return [limpiar_objectids(item) for item in obj]
-            elif isinstance(obj, datetime):
-                return obj.isoformat()
-            else:
-                return obj
-        
-        # Limpiar TODAS las ventas recursivamente
-        ventas = [limpiar_objectids(venta) for venta in ventas]
-
+        # ObjectId / datetime se serializan en la respuesta (BSONJSONResponse)
         
         # ============================================================
         # 🔹 Respuesta estructurada
@@ -931,16 +1009,12 @@ async def obtener_ventas_sede(
                 "from": skip + 1 if len(ventas) > 0 else 0,
                 "to": skip + len(ventas)
             },
-            "filters_applied": {
-                "sede_id": sede_id,
-                "fecha_desde": fecha_desde,
-                "fecha_hasta": fecha_hasta,
-                "profesional_id": profesional_id,
-                "search": search
-            },
+            "filters_applied": filters_applied,
             "ventas": ventas
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -965,22 +1039,6 @@ async def obtener_detalle_venta(
         raise HTTPException(status_code=403, detail="No autorizado")
     
     try:
-        from bson import ObjectId
-        
-        # Función reutilizable para limpiar ObjectIds
-        def limpiar_objectids(obj):
-            """Convierte recursivamente TODOS los ObjectId a string"""
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, dict):
-                return {key: limpiar_objectids(value) for key, value in obj.items()}
-            elif isinstance(obj, list):
-                return [limpiar_objectids(item) for item in obj]
-            elif isinstance(obj, datetime):
-                return obj.isoformat()
-            else:
-                return obj
-        
         venta = await collection_sales.find_one({
             "_id": ObjectId(venta_id),
             "sede_id": sede_id
@@ -989,9 +1047,6 @@ async def obtener_detalle_venta(
         if not venta:
             raise HTTPException(status_code=404, detail="Venta no encontrada")
         
-        # Limpiar todos los ObjectIds recursivamente
-        venta = limpiar_objectids(venta)
-        
         return {
             "success": True,
             "venta": venta
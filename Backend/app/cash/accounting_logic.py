@@ -17,7 +17,8 @@ from app.database.mongo import (
     collection_citas as appointments,
     collection_sales as sales,
     collection_locales as locales,
-    db
+    db,
+    tiempo_max
 )
 
 cash_expenses = db["cash_expenses"]
@@ -522,7 +523,7 @@ async def calcular_ingresos_efectivo_appointments(
     ]
 
     resultado = await appointments.aggregate(
-        pipeline, allowDiskUse=True
+        pipeline, allowDiskUse=True, **tiempo_max("reporte")
     ).to_list(None)
 
     if not resultado:
@@ -564,7 +565,7 @@ async def calcular_ingresos_efectivo_sales(
     ]
 
     resultado = await sales.aggregate(
-        pipeline, allowDiskUse=True
+        pipeline, allowDiskUse=True, **tiempo_max("reporte")
     ).to_list(None)
 
     ventas_migradas = await sales.find({
@@ -623,50 +624,62 @@ async def calcular_ingresos_por_metodo_pago(
         }
     ]
 
-    for item in await appointments.aggregate(pipeline_appointments, allowDiskUse=True).to_list(None):
+    for item in await appointments.aggregate(pipeline_appointments, allowDiskUse=True, **tiempo_max("reporte")).to_list(None):
         metodo_norm = _normalizar_metodo(item["_id"])
         if metodo_norm not in metodos:
             metodos[metodo_norm] = 0
         metodos[metodo_norm] += item["total"]
 
-    # 2. Sales con historial_pagos
-    pipeline_sales = [
-        {
-            "$match": {
-                "sede_id"  : sede_id,
-                "fecha_pago": {"$gte": fecha_inicio, "$lte": fecha_fin},
-                "historial_pagos": {"$exists": True, "$ne": []}
-            }
-        },
-        {"$unwind": "$historial_pagos"},
-        {
-            "$group": {
-                "_id"  : "$historial_pagos.metodo",
-                "total": {"$sum": "$historial_pagos.monto"}
-            }
-        }
-    ]
+    # 2. Sales: primero desde el cubo diario (sales_daily); si el día no está
+    #    en el cubo (histórico sin backfill) se lee `sales` directamente
+    from app.analytics.sales_daily import get_pagos_caja_dia
 
-    for item in await sales.aggregate(pipeline_sales, allowDiskUse=True).to_list(None):
-        metodo_norm = _normalizar_metodo(item["_id"])
-        if metodo_norm not in metodos:
-            metodos[metodo_norm] = 0
-        metodos[metodo_norm] += item["total"]
+    pagos_cubo = await get_pagos_caja_dia(sede_id, fecha)
 
-    # 3. Sales migradas (desglose_pagos)
-    for venta in await sales.find({
-        "sede_id"  : sede_id,
-        "fecha_pago": {"$gte": fecha_inicio, "$lte": fecha_fin},
-        "historial_pagos": {"$exists": False},
-        "desglose_pagos" : {"$exists": True}
-    }).to_list(None):
-        for metodo, monto in venta.get("desglose_pagos", {}).items():
-            if metodo == "total":
-                continue
-            metodo_norm = _normalizar_metodo(metodo)
+    if pagos_cubo is not None:
+        for metodo_norm, monto in pagos_cubo.items():
             if metodo_norm not in metodos:
                 metodos[metodo_norm] = 0
             metodos[metodo_norm] += monto
+    else:
+        # Sales con historial_pagos
+        pipeline_sales = [
+            {
+                "$match": {
+                    "sede_id"  : sede_id,
+                    "fecha_pago": {"$gte": fecha_inicio, "$lte": fecha_fin},
+                    "historial_pagos": {"$exists": True, "$ne": []}
+                }
+            },
+            {"$unwind": "$historial_pagos"},
+            {
+                "$group": {
+                    "_id"  : "$historial_pagos.metodo",
+                    "total": {"$sum": "$historial_pagos.monto"}
+                }
+            }
+        ]
+
+        for item in await sales.aggregate(pipeline_sales, allowDiskUse=True, **tiempo_max("reporte")).to_list(None):
+            metodo_norm = _normalizar_metodo(item["_id"])
+            if metodo_norm not in metodos:
+                metodos[metodo_norm] = 0
+            metodos[metodo_norm] += item["total"]
+
+        # Sales migradas (desglose_pagos)
+        for venta in await sales.find({
+            "sede_id"  : sede_id,
+            "fecha_pago": {"$gte": fecha_inicio, "$lte": fecha_fin},
+            "historial_pagos": {"$exists": False},
+            "desglose_pagos" : {"$exists": True}
+        }).to_list(None):
+            for metodo, monto in venta.get("desglose_pagos", {}).items():
+                if metodo == "total":
+                    continue
+                metodo_norm = _normalizar_metodo(metodo)
+                if metodo_norm not in metodos:
+                    metodos[metodo_norm] = 0
+                metodos[metodo_norm] += monto
 
     metodos["total_general"] = sum(
         monto for key, monto in metodos.items() if key != "total_general"
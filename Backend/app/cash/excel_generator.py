@@ -2,13 +2,13 @@
 # excel_generator.py - ACTUALIZADO CON 3 HOJAS ADICIONALES
 # ============================================================
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils import get_column_letter
-from io import BytesIO
-from datetime import datetime
 from typing import Dict, List
 
+from app.core.xlsx_export import LibroXlsx, HojaXlsx
+
+# Todas las hojas usan los estilos con nombre de app/core/xlsx_export.py
+# (rf_titulo, rf_moneda...) y se escriben fila a fila en modo write-only.
+
 # ============================================================
 # FUNCIÓN PRINCIPAL ACTUALIZADA
 # ============================================================
@@ -19,270 +19,139 @@ def _obtener_periodo(resumen: Dict) -> tuple[str, str]:
     fecha_fin = str(resumen.get("fecha_fin") or resumen.get("fecha") or fecha_inicio)
     return fecha_inicio, fecha_fin
 
-def generar_reporte_excel_caja_completo(
+def escribir_reporte_excel_caja(
+    destino: str,
     resumen: Dict,
     sede_info: Dict,
     facturas: List[Dict],
     egresos: List[Dict],
     movimientos_efectivo: Dict
-) -> BytesIO:
+):
     """
-    Genera Excel con 4 hojas:
+    Escribe en `destino` el Excel con 4 hojas:
     1. Resumen de Caja (existente)
     2. Resumen Flujo de Ingresos (nueva)
     3. Resumen Flujo de Egresos (nueva)
     4. Movimientos Efectivo (nueva)
+
+    Síncrona y sin estado compartido: se ejecuta en el pool de exportación
+    (ver generar_xlsx), nunca en el event loop.
     """
     
-    wb = Workbook()
+    libro = LibroXlsx()
     fecha_inicio, fecha_fin = _obtener_periodo(resumen)
     
     # Hoja 1: Resumen de Caja (la que ya teníamos)
-    ws_resumen = wb.active
-    ws_resumen.title = "Resumen de Caja"
-    _crear_hoja_resumen_caja(ws_resumen, resumen, sede_info)
+    _crear_hoja_resumen_caja(libro, resumen, sede_info)
     
     # Hoja 2: Flujo de Ingresos
-    ws_ingresos = wb.create_sheet("Flujo de Ingresos")
-    _crear_hoja_flujo_ingresos(ws_ingresos, sede_info, fecha_inicio, fecha_fin, facturas)
+    _crear_hoja_flujo_ingresos(libro, sede_info, fecha_inicio, fecha_fin, facturas)
     
     # Hoja 3: Flujo de Egresos
-    ws_egresos = wb.create_sheet("Flujo de Egresos")
-    _crear_hoja_flujo_egresos(ws_egresos, sede_info, fecha_inicio, fecha_fin, egresos)
+    _crear_hoja_flujo_egresos(libro, sede_info, fecha_inicio, fecha_fin, egresos)
     
     # Hoja 4: Movimientos Efectivo
-    ws_movimientos = wb.create_sheet("Movimientos Efectivo")
-    _crear_hoja_movimientos_efectivo(ws_movimientos, sede_info, fecha_inicio, fecha_fin, movimientos_efectivo)
-    
-    # Guardar en memoria
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
+    _crear_hoja_movimientos_efectivo(libro, sede_info, fecha_inicio, fecha_fin, movimientos_efectivo)
     
-    return excel_file
+    libro.guardar(destino)
+
+# ============================================================
+# ENCABEZADO COMÚN (título, empresa, dirección y período)
+# ============================================================
+
+def _encabezado(hoja: HojaXlsx, titulo: str, columnas: int, sede_info: Dict,
+                fecha_inicio: str, fecha_fin: str, estilo_empresa: str, estilo_periodo=None):
+    hoja.fila_combinada(titulo, columnas, "rf_titulo")
+    hoja.fila_combinada(sede_info.get("razon_social", "SALÓN RIZOS FELICES CL SAS"), columnas, estilo_empresa)
+    direccion = f"{sede_info.get('direccion', '')}, {sede_info.get('ciudad', '')}, {sede_info.get('pais', '')}"
+    hoja.fila_combinada(direccion, columnas, "rf_normal_centro" if estilo_empresa == "rf_subtitulo" else "rf_centro")
+    hoja.vacia()
+
+    hoja.fila(hoja.celda("Inicio" + (":" if estilo_periodo else ""), estilo_periodo), f"{fecha_inicio} 00:00")
+    hoja.fila(hoja.celda("Fin" + (":" if estilo_periodo else ""), estilo_periodo), f"{fecha_fin} 23:59")
+    hoja.vacia()
+
+
+def _fila_encabezados(hoja: HojaXlsx, headers: List[str]):
+    hoja.fila(*[hoja.celda(h, "rf_encabezado_centro") for h in headers])
+
+
+def _fecha_hora(valor) -> str:
+    return valor.strftime("%d/%m/%Y %H:%M") if valor else ""
 
 # ============================================================
 # HOJA 1: RESUMEN DE CAJA (YA EXISTENTE)
 # ============================================================
 
-def _crear_hoja_resumen_caja(ws, resumen: Dict, sede_info: Dict):
-    """Crea la hoja de resumen de caja (código anterior)"""
-    
-    # Estilos
-    titulo_font = Font(name='Arial', size=14, bold=True)
-    subtitulo_font = Font(name='Arial', size=12, bold=True)
-    header_font = Font(name='Arial', size=10, bold=True)
-    normal_font = Font(name='Arial', size=10)
-    total_font = Font(name='Arial', size=11, bold=True)
-    
-    centro = Alignment(horizontal='center', vertical='center')
-    derecha = Alignment(horizontal='right', vertical='center')
-    
-    borde_grueso_abajo = Border(bottom=Side(style='medium'))
-    
-    relleno_gris = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-    relleno_verde = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    relleno_rojo = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+def _crear_hoja_resumen_caja(libro: LibroXlsx, resumen: Dict, sede_info: Dict):
+    """Crea la hoja de resumen de caja (etiqueta en A, importe en D)"""
     
-    fila = 1
-    
-    # Título
-    ws.merge_cells(f'A{fila}:D{fila}')
-    ws[f'A{fila}'] = "RESUMEN DE CAJA DE VENTAS"
-    ws[f'A{fila}'].font = titulo_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Empresa
-    ws.merge_cells(f'A{fila}:D{fila}')
-    ws[f'A{fila}'] = sede_info.get("razon_social", "SALÓN RIZOS FELICES CL SAS")
-    ws[f'A{fila}'].font = subtitulo_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Dirección
-    ws.merge_cells(f'A{fila}:D{fila}')
-    direccion_completa = f"{sede_info.get('direccion', '')}, {sede_info.get('ciudad', '')}, {sede_info.get('pais', '')}"
-    ws[f'A{fila}'] = direccion_completa
-    ws[f'A{fila}'].font = normal_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 2
-    
-    # Periodo
+    hoja = libro.hoja("Resumen de Caja", anchos=[30, 15, 15, 20])
     fecha_inicio, fecha_fin = _obtener_periodo(resumen)
-    ws[f'A{fila}'] = "Inicio:"
-    ws[f'B{fila}'] = f"{fecha_inicio} 00:00"
-    ws[f'A{fila}'].font = header_font
-    fila += 1
-    
-    ws[f'A{fila}'] = "Fin:"
-    ws[f'B{fila}'] = f"{fecha_fin} 23:59"
-    ws[f'A{fila}'].font = header_font
-    fila += 2
-    
-    # Línea
-    ws.merge_cells(f'A{fila}:D{fila}')
-    ws[f'A{fila}'].border = borde_grueso_abajo
-    fila += 1
-    
-    # Saldo inicial
-    ws[f'A{fila}'] = "SALDO INICIAL EN EFECTIVO"
-    ws[f'A{fila}'].font = header_font
-    ws[f'D{fila}'] = resumen["efectivo_inicial"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 2
-    
-    # Ingresos
-    ws[f'A{fila}'] = "INGRESOS"
-    ws[f'A{fila}'].font = header_font
-    ws[f'A{fila}'].fill = relleno_gris
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Efectivo"
-    ws[f'D{fila}'] = resumen["ingresos_efectivo"]["total"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Abonos a Reservas"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["abonos"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-
-    ws[f'A{fila}'] = "- Tarjeta Crédito"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["tarjeta_credito"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Tarjeta Débito"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["tarjeta_debito"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
 
-    ws[f'A{fila}'] = "- POS"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["pos"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
+    def importe(etiqueta, valor, estilo_etiqueta=None, estilo_valor="rf_moneda"):
+        hoja.fila(hoja.celda(etiqueta, estilo_etiqueta), None, None, hoja.celda(valor, estilo_valor))
 
-    ws[f'A{fila}'] = "- Link de Pago"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["link_de_pago"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
+    def suma():
+        hoja.fila(None, None, None, hoja.celda(None, "rf_linea_suma"))
 
-    ws[f'A{fila}'] = "- Giftcard"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["giftcard"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
+    def semaforo(valor) -> str:
+        return "rf_moneda_total_verde" if valor >= 0 else "rf_moneda_total_rojo"
 
-    ws[f'A{fila}'] = "- Addi"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["addi"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
+    _encabezado(hoja, "RESUMEN DE CAJA DE VENTAS", 4, sede_info, fecha_inicio, fecha_fin,
+                "rf_subtitulo", "rf_encabezado")
     
-    ws[f'A{fila}'] = "- Transferencias"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["transferencia"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Otros"
-    ws[f'D{fila}'] = resumen["ingresos_otros_metodos"]["otros"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
+    # Línea
+    hoja.fila_combinada(None, 4, "rf_linea")
     
-    ws[f'D{fila}'].border = Border(top=Side(style='thin'))
-    fila += 1
+    # Saldo inicial
+    importe("SALDO INICIAL EN EFECTIVO", resumen["efectivo_inicial"], "rf_encabezado")
+    hoja.vacia()
     
-    ws[f'A{fila}'] = "Total Ingresos (+)"
-    ws[f'A{fila}'].font = total_font
-    ws[f'D{fila}'] = resumen["total_vendido"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    ws[f'D{fila}'].font = total_font
-    fila += 2
+    # Ingresos
+    hoja.fila(hoja.celda("INGRESOS", "rf_seccion"))
+    otros = resumen["ingresos_otros_metodos"]
+    importe("- Efectivo", resumen["ingresos_efectivo"]["total"])
+    importe("- Abonos a Reservas", otros["abonos"])
+    importe("- Tarjeta Crédito", otros["tarjeta_credito"])
+    importe("- Tarjeta Débito", otros["tarjeta_debito"])
+    importe("- POS", otros["pos"])
+    importe("- Link de Pago", otros["link_de_pago"])
+    importe("- Giftcard", otros["giftcard"])
+    importe("- Addi", otros["addi"])
+    importe("- Transferencias", otros["transferencia"])
+    importe("- Otros", otros["otros"])
+    suma()
+    importe("Total Ingresos (+)", resumen["total_vendido"], "rf_total", "rf_moneda_total")
+    hoja.vacia()
     
     # Egresos
-    ws[f'A{fila}'] = "EGRESOS"
-    ws[f'A{fila}'].font = header_font
-    ws[f'A{fila}'].fill = relleno_gris
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Compras Internas"
-    ws[f'D{fila}'] = resumen["egresos"]["compras_internas"]["total"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Gastos Operativos"
-    ws[f'D{fila}'] = resumen["egresos"]["gastos_operativos"]["total"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'A{fila}'] = "- Retiros"
-    ws[f'D{fila}'] = resumen["egresos"]["retiros_caja"]["total"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    fila += 1
-    
-    ws[f'D{fila}'].border = Border(top=Side(style='thin'))
-    fila += 1
-    
-    ws[f'A{fila}'] = "Total Egresos (-)"
-    ws[f'A{fila}'].font = total_font
-    ws[f'D{fila}'] = resumen["egresos"]["total"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    ws[f'D{fila}'].font = total_font
-    fila += 2
+    hoja.fila(hoja.celda("EGRESOS", "rf_seccion"))
+    importe("- Compras Internas", resumen["egresos"]["compras_internas"]["total"])
+    importe("- Gastos Operativos", resumen["egresos"]["gastos_operativos"]["total"])
+    importe("- Retiros", resumen["egresos"]["retiros_caja"]["total"])
+    suma()
+    importe("Total Egresos (-)", resumen["egresos"]["total"], "rf_total", "rf_moneda_total")
+    hoja.vacia()
     
     # Línea
-    ws.merge_cells(f'A{fila}:D{fila}')
-    ws[f'A{fila}'].border = borde_grueso_abajo
-    fila += 1
+    hoja.fila_combinada(None, 4, "rf_linea")
     
     # Resultado
     resultado = resumen["total_vendido"] - resumen["egresos"]["total"]
-    
-    ws[f'A{fila}'] = "RESULTADO DEL PERÍODO (=)"
-    ws[f'A{fila}'].font = total_font
-    ws[f'D{fila}'] = resultado
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    ws[f'D{fila}'].font = total_font
-    ws[f'D{fila}'].fill = relleno_verde if resultado >= 0 else relleno_rojo
-    fila += 2
+    importe("RESULTADO DEL PERÍODO (=)", resultado, "rf_total", semaforo(resultado))
+    hoja.vacia()
     
     # Saldo final
-    ws[f'A{fila}'] = "SALDO FINAL EN EFECTIVO"
-    ws[f'A{fila}'].font = header_font
-    ws[f'D{fila}'] = resumen["efectivo_esperado"]
-    ws[f'D{fila}'].number_format = '#,##0.00'
-    ws[f'D{fila}'].alignment = derecha
-    ws[f'D{fila}'].font = total_font
-    ws[f'D{fila}'].fill = relleno_verde if resumen["efectivo_esperado"] >= 0 else relleno_rojo
-    
-    # Anchos
-    ws.column_dimensions['A'].width = 30
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 20
+    importe("SALDO FINAL EN EFECTIVO", resumen["efectivo_esperado"], "rf_encabezado",
+            semaforo(resumen["efectivo_esperado"]))
 
 # ============================================================
 # HOJA 2: FLUJO DE INGRESOS
 # ============================================================
 
 def _crear_hoja_flujo_ingresos(
-    ws,
+    libro: LibroXlsx,
     sede_info: Dict,
     fecha_inicio: str,
     fecha_fin: str,
@@ -290,89 +159,41 @@ def _crear_hoja_flujo_ingresos(
 ):
     """Crea la hoja de flujo de ingresos"""
     
-    # Estilos
-    titulo_font = Font(name='Arial', size=14, bold=True)
-    header_font = Font(name='Arial', size=10, bold=True)
-    normal_font = Font(name='Arial', size=9)
-    centro = Alignment(horizontal='center', vertical='center')
-    
-    fila = 1
-    
-    # Título
-    ws.merge_cells(f'A{fila}:N{fila}')
-    ws[f'A{fila}'] = "Resumen Flujo de Ingresos"
-    ws[f'A{fila}'].font = titulo_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Empresa
-    ws.merge_cells(f'A{fila}:N{fila}')
-    ws[f'A{fila}'] = sede_info.get("razon_social", "SALÓN RIZOS FELICES CL SAS")
-    ws[f'A{fila}'].font = header_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
+    hoja = libro.hoja(
+        "Flujo de Ingresos",
+        anchos=[18, 30, 15, 30, 15, 25, 20, 15, 15, 15, 15, 30, 25, 20]
+    )
+    _encabezado(hoja, "Resumen Flujo de Ingresos", 14, sede_info, fecha_inicio, fecha_fin, "rf_encabezado_centro")
     
-    # Dirección
-    ws.merge_cells(f'A{fila}:N{fila}')
-    direccion = f"{sede_info.get('direccion', '')}, {sede_info.get('ciudad', '')}, {sede_info.get('pais', '')}"
-    ws[f'A{fila}'] = direccion
-    ws[f'A{fila}'].alignment = centro
-    fila += 2
-    
-    # Periodo
-    ws[f'A{fila}'] = "Inicio"
-    ws[f'B{fila}'] = f"{fecha_inicio} 00:00"
-    fila += 1
-    ws[f'A{fila}'] = "Fin"
-    ws[f'B{fila}'] = f"{fecha_fin} 23:59"
-    fila += 2
-    
-    # Headers
-    headers = [
+    _fila_encabezados(hoja, [
         "Fecha", "Nombre cliente", "C.I. cliente", "Email cliente", "Teléfono cliente",
         "Medio de Pago", "Tipo de Movimiento", "ID Movimiento",
         "Nro Comprobante", "Flujo del periodo",
         "Usuario última modificación"
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        celda = ws.cell(row=fila, column=col)
-        celda.value = header
-        celda.font = header_font
-        celda.alignment = centro
-    
-    fila += 1
+    ])
     
     # Datos
     for factura in facturas:
-        fecha_hora = factura["fecha"].strftime("%d/%m/%Y %H:%M") if factura["fecha"] else ""
-        
-        ws.cell(row=fila, column=1).value = fecha_hora
-        ws.cell(row=fila, column=2).value = factura["nombre_cliente"]
-        ws.cell(row=fila, column=3).value = factura["cedula_cliente"]
-        ws.cell(row=fila, column=4).value = factura["email_cliente"]
-        ws.cell(row=fila, column=5).value = factura["telefono_cliente"]
-        ws.cell(row=fila, column=6).value = factura["medio_pago"]
-        ws.cell(row=fila, column=7).value = factura["tipo_movimiento"]
-        ws.cell(row=fila, column=8).value = factura["id_movimiento"]
-        ws.cell(row=fila, column=9).value = factura["nro_comprobante"]
-        ws.cell(row=fila, column=10).value = factura["flujo_periodo"]
-        ws.cell(row=fila, column=10).number_format = '#,##0'
-        ws.cell(row=fila, column=11).value = factura["usuario_modificacion"]
-        
-        fila += 1
-    
-    # Anchos de columna
-    anchos = [18, 30, 15, 30, 15, 25, 20, 15, 15, 15, 15, 30, 25, 20]
-    for col, ancho in enumerate(anchos, start=1):
-        ws.column_dimensions[get_column_letter(col)].width = ancho
+        hoja.fila(
+            _fecha_hora(factura["fecha"]),
+            factura["nombre_cliente"],
+            factura["cedula_cliente"],
+            factura["email_cliente"],
+            factura["telefono_cliente"],
+            factura["medio_pago"],
+            factura["tipo_movimiento"],
+            factura["id_movimiento"],
+            factura["nro_comprobante"],
+            hoja.celda(factura["flujo_periodo"], "rf_entero"),
+            factura["usuario_modificacion"],
+        )
 
 # ============================================================
 # HOJA 3: FLUJO DE EGRESOS
 # ============================================================
 
 def _crear_hoja_flujo_egresos(
-    ws,
+    libro: LibroXlsx,
     sede_info: Dict,
     fecha_inicio: str,
     fecha_fin: str,
@@ -380,82 +201,33 @@ def _crear_hoja_flujo_egresos(
 ):
     """Crea la hoja de flujo de egresos"""
     
-    titulo_font = Font(name='Arial', size=14, bold=True)
-    header_font = Font(name='Arial', size=10, bold=True)
-    centro = Alignment(horizontal='center', vertical='center')
-    
-    fila = 1
-    
-    # Título
-    ws.merge_cells(f'A{fila}:H{fila}')
-    ws[f'A{fila}'] = "Resumen Flujo de Egresos"
-    ws[f'A{fila}'].font = titulo_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Empresa
-    ws.merge_cells(f'A{fila}:H{fila}')
-    ws[f'A{fila}'] = sede_info.get("razon_social", "SALÓN RIZOS FELICES CL SAS")
-    ws[f'A{fila}'].font = header_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
+    hoja = libro.hoja("Flujo de Egresos", anchos=[18, 20, 20, 20, 25, 20, 18, 50])
+    _encabezado(hoja, "Resumen Flujo de Egresos", 8, sede_info, fecha_inicio, fecha_fin, "rf_encabezado_centro")
     
-    # Dirección
-    ws.merge_cells(f'A{fila}:H{fila}')
-    direccion = f"{sede_info.get('direccion', '')}, {sede_info.get('ciudad', '')}, {sede_info.get('pais', '')}"
-    ws[f'A{fila}'] = direccion
-    ws[f'A{fila}'].alignment = centro
-    fila += 2
-    
-    # Periodo
-    ws[f'A{fila}'] = "Inicio"
-    ws[f'B{fila}'] = f"{fecha_inicio} 00:00"
-    fila += 1
-    ws[f'A{fila}'] = "Fin"
-    ws[f'B{fila}'] = f"{fecha_fin} 23:59"
-    fila += 2
-    
-    # Headers
-    headers = [
+    _fila_encabezados(hoja, [
         "Fecha", "Concepto", "Medio de Pago", "Tipo de Movimiento", "ID Egreso",
         "Nro Comprobante", "Flujo del periodo (-)", "Notas"
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        celda = ws.cell(row=fila, column=col)
-        celda.value = header
-        celda.font = header_font
-        celda.alignment = centro
-    
-    fila += 1
+    ])
     
     # Datos
     for egreso in egresos:
-        fecha_hora = egreso["fecha"].strftime("%d/%m/%Y %H:%M") if egreso["fecha"] else ""
-        
-        ws.cell(row=fila, column=1).value = fecha_hora
-        ws.cell(row=fila, column=2).value= egreso["concepto"]
-        ws.cell(row=fila, column=3).value = egreso["medio_pago"]
-        ws.cell(row=fila, column=4).value = egreso["tipo_movimiento"]
-        ws.cell(row=fila, column=5).value = egreso["id_egreso"]
-        ws.cell(row=fila, column=6).value = egreso["nro_comprobante"]
-        ws.cell(row=fila, column=7).value = egreso["flujo_periodo"]
-        ws.cell(row=fila, column=7).number_format = '#,##0'
-        ws.cell(row=fila, column=8).value = egreso["notas"]
-        
-        fila += 1
-    
-    # Anchos
-    anchos = [18, 20, 20, 20, 25, 20, 18, 50]
-    for col, ancho in enumerate(anchos, start=1):
-        ws.column_dimensions[get_column_letter(col)].width = ancho
+        hoja.fila(
+            _fecha_hora(egreso["fecha"]),
+            egreso["concepto"],
+            egreso["medio_pago"],
+            egreso["tipo_movimiento"],
+            egreso["id_egreso"],
+            egreso["nro_comprobante"],
+            hoja.celda(egreso["flujo_periodo"], "rf_entero"),
+            egreso["notas"],
+        )
 
 # ============================================================
 # HOJA 4: MOVIMIENTOS EFECTIVO
 # ============================================================
 
 def _crear_hoja_movimientos_efectivo(
-    ws,
+    libro: LibroXlsx,
     sede_info: Dict,
     fecha_inicio: str,
     fecha_fin: str,
@@ -463,102 +235,37 @@ def _crear_hoja_movimientos_efectivo(
 ):
     """Crea la hoja de movimientos en efectivo con saldo corrido"""
     
-    titulo_font = Font(name='Arial', size=14, bold=True)
-    header_font = Font(name='Arial', size=10, bold=True)
-    total_font = Font(name='Arial', size=11, bold=True)
-    centro = Alignment(horizontal='center', vertical='center')
-    derecha = Alignment(horizontal='right', vertical='center')
-    
-    relleno_verde = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    
-    fila = 1
-    
-    # Título
-    ws.merge_cells(f'A{fila}:G{fila}')
-    ws[f'A{fila}'] = "Movimientos en Efectivo"
-    ws[f'A{fila}'].font = titulo_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Empresa
-    ws.merge_cells(f'A{fila}:G{fila}')
-    ws[f'A{fila}'] = sede_info.get("razon_social", "SALÓN RIZOS FELICES CL SAS")
-    ws[f'A{fila}'].font = header_font
-    ws[f'A{fila}'].alignment = centro
-    fila += 1
-    
-    # Dirección
-    ws.merge_cells(f'A{fila}:G{fila}')
-    direccion = f"{sede_info.get('direccion', '')}, {sede_info.get('ciudad', '')}, {sede_info.get('pais', '')}"
-    ws[f'A{fila}'] = direccion
-    ws[f'A{fila}'].alignment = centro
-    fila += 2
-    
-    # Periodo
-    ws[f'A{fila}'] = "Inicio"
-    ws[f'B{fila}'] = f"{fecha_inicio} 00:00"
-    fila += 1
-    ws[f'A{fila}'] = "Fin"
-    ws[f'B{fila}'] = f"{fecha_fin} 23:59"
-    fila += 2
+    hoja = libro.hoja("Movimientos Efectivo", anchos=[18, 15, 40, 15, 15, 15, 15])
+    _encabezado(hoja, "Movimientos en Efectivo", 7, sede_info, fecha_inicio, fecha_fin, "rf_encabezado_centro")
+
+    def saldo(etiqueta, valor):
+        hoja.fila(hoja.celda(etiqueta, "rf_total"), *([None] * 5), hoja.celda(valor, "rf_moneda_total_verde"))
     
     # Saldo inicial
-    ws[f'A{fila}'] = "SALDO INICIAL"
-    ws[f'A{fila}'].font = total_font
-    ws[f'G{fila}'] = movimientos["saldo_inicial"]
-    ws[f'G{fila}'].number_format = '#,##0.00'
-    ws[f'G{fila}'].alignment = derecha
-    ws[f'G{fila}'].font = total_font
-    ws[f'G{fila}'].fill = relleno_verde
-    fila += 2
+    saldo("SALDO INICIAL", movimientos["saldo_inicial"])
+    hoja.vacia()
     
-    # Headers
-    headers = [
+    _fila_encabezados(hoja, [
         "Fecha", "Tipo", "Descripción", "Comprobante",
         "Ingreso (+)", "Egreso (-)", "Saldo"
-    ]
-    
-    for col, header in enumerate(headers, start=1):
-        celda = ws.cell(row=fila, column=col)
-        celda.value = header
-        celda.font = header_font
-        celda.alignment = centro
-    
-    fila += 1
+    ])
     
     # Movimientos
     for mov in movimientos["movimientos"]:
-        fecha_hora = mov["fecha"].strftime("%d/%m/%Y %H:%M") if mov["fecha"] else ""
-        
-        ws.cell(row=fila, column=1).value = fecha_hora
-        ws.cell(row=fila, column=2).value = mov["tipo"]
-        ws.cell(row=fila, column=3).value = mov["descripcion"]
-        ws.cell(row=fila, column=4).value = mov["comprobante"]
-        ws.cell(row=fila, column=5).value = mov["ingreso"]
-        ws.cell(row=fila, column=5).number_format = '#,##0.00'
-        ws.cell(row=fila, column=6).value = mov["egreso"]
-        ws.cell(row=fila, column=6).number_format = '#,##0.00'
-        ws.cell(row=fila, column=7).value = mov["saldo"]
-        ws.cell(row=fila, column=7).number_format = '#,##0.00'
-        ws.cell(row=fila, column=7).alignment = derecha
-        
-        fila += 1
-    
-    fila += 1
+        hoja.fila(
+            _fecha_hora(mov["fecha"]),
+            mov["tipo"],
+            mov["descripcion"],
+            mov["comprobante"],
+            hoja.celda(mov["ingreso"], "rf_moneda_simple"),
+            hoja.celda(mov["egreso"], "rf_moneda_simple"),
+            hoja.celda(mov["saldo"], "rf_moneda"),
+        )
+    
+    hoja.vacia()
     
     # Saldo final
-    ws[f'A{fila}'] = "SALDO FINAL"
-    ws[f'A{fila}'].font = total_font
-    ws[f'G{fila}'] = movimientos["saldo_final"]
-    ws[f'G{fila}'].number_format = '#,##0.00'
-    ws[f'G{fila}'].alignment = derecha
-    ws[f'G{fila}'].font = total_font
-    ws[f'G{fila}'].fill = relleno_verde
-    
-    # Anchos
-    anchos = [18, 15, 40, 15, 15, 15, 15]
-    for col, ancho in enumerate(anchos, start=1):
-        ws.column_dimensions[get_column_letter(col)].width = ancho
+    saldo("SALDO FINAL", movimientos["saldo_final"])
 
 # ============================================================
 # FUNCIÓN HELPER PARA NOMBRES DE ARCHIVO
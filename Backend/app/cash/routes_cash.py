@@ -4,7 +4,6 @@
 # ============================================================
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import StreamingResponse
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import logging
@@ -18,7 +17,8 @@ from .accounting_logic import (
 )
 
 # Importar generador de Excel
-from .excel_generator import generar_reporte_excel_caja_completo, generar_nombre_archivo_excel
+from .excel_generator import escribir_reporte_excel_caja, generar_nombre_archivo_excel
+from app.core.xlsx_export import generar_xlsx, respuesta_xlsx
 
 # Importar modelos y utilidades
 from .models_cash import (
@@ -28,7 +28,7 @@ from .models_cash import (
 from .utils_cash import (
     generar_cierre_id, generar_egreso_id, generar_ingreso_id, generar_apertura_id,
     calcular_diferencia, validar_diferencia_aceptable,
-    construir_filtro_fecha, convertir_mongo_a_json
+    construir_filtro_fecha
 )
 
 # Importar autenticación
@@ -39,8 +39,9 @@ from app.database.mongo import (
     db,
     collection_locales as locales
 )
+from app.core.responses import BSONRoute
 
-router = APIRouter(prefix="/cash", tags=["Cash Management"])
+router = APIRouter(prefix="/cash", tags=["Cash Management"], route_class=BSONRoute)
 logger = logging.getLogger(__name__)
 
 # Colecciones
@@ -598,8 +599,6 @@ async def obtener_cierre(
             detail=f"Cierre {cierre_id} no encontrado"
         )
     
-    cierre = convertir_mongo_a_json(cierre)
-    
     return cierre
 
 # ============================================================
@@ -649,6 +648,11 @@ async def reporte_periodo(
     current_user: dict = Depends(get_current_user)
 ):
     """Genera un reporte consolidado para un periodo de fechas."""
+    return await construir_reporte_periodo(sede_id, fecha_inicio, fecha_fin)
+
+
+async def construir_reporte_periodo(sede_id: str, fecha_inicio: str, fecha_fin: str) -> Dict[str, Any]:
+    """Reporte consolidado del periodo (endpoint y exportaciones en segundo plano)."""
     inicio, fin = _normalize_range(fecha_inicio, fecha_fin)
     reporte = await _build_period_report_data(sede_id, inicio, fin)
     resumen = reporte["resumen"]
@@ -658,7 +662,6 @@ async def reporte_periodo(
         "fecha": {"$gte": inicio, "$lte": fin},
         "tipo": "cierre"
     }).sort("fecha", 1).to_list(None)
-    cierres_list = [convertir_mongo_a_json(c) for c in cierres_list]
 
     total_ingresos = float(resumen.get("total_vendido", 0) or 0)
     total_egresos = float(resumen.get("egresos", {}).get("total", 0) or 0)
@@ -887,6 +890,18 @@ async def descargar_reporte_excel(
     ✅ Archivo descargable
     """
     
+    ruta, filename = await generar_archivo_reporte_excel(
+        sede_id, fecha, fecha_inicio, fecha_fin, generado_por=current_user.get("email")
+    )
+    return respuesta_xlsx(ruta, filename)
+
+
+def validar_parametros_reporte_excel(
+    fecha: Optional[str],
+    fecha_inicio: Optional[str],
+    fecha_fin: Optional[str]
+) -> bool:
+    """Valida día único o rango. Devuelve True si es un rango."""
     usar_rango = bool(fecha_inicio or fecha_fin)
 
     if usar_rango and (not fecha_inicio or not fecha_fin):
@@ -901,6 +916,27 @@ async def descargar_reporte_excel(
             detail="Debes enviar 'fecha' o 'fecha_inicio' y 'fecha_fin'"
         )
 
+    if usar_rango:
+        _build_date_list(fecha_inicio, fecha_fin)
+    else:
+        _parse_date_yyyy_mm_dd(fecha, "fecha")
+    return usar_rango
+
+
+async def generar_archivo_reporte_excel(
+    sede_id: str,
+    fecha: Optional[str] = None,
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    generado_por: Optional[str] = None
+) -> tuple[str, str]:
+    """
+    Reúne los datos y escribe el Excel de caja en un temporal.
+    Devuelve (ruta, nombre de archivo). La usan /reporte-excel y los
+    trabajos de exportación (app/exports).
+    """
+    usar_rango = validar_parametros_reporte_excel(fecha, fecha_inicio, fecha_fin)
+
     if usar_rango:
         reporte_periodo = await _build_period_report_data(sede_id, fecha_inicio, fecha_fin)
         resumen = reporte_periodo["resumen"]
@@ -911,8 +947,6 @@ async def descargar_reporte_excel(
         periodo_fin = reporte_periodo["fecha_fin"]
         fecha_para_nombre = f"{periodo_inicio}_a_{periodo_fin}"
     else:
-        _parse_date_yyyy_mm_dd(fecha, "fecha")
-
         # 1. Obtener resumen del día
         resumen = await calcular_resumen_dia(sede_id, fecha)
         
@@ -948,10 +982,11 @@ async def descargar_reporte_excel(
     }
     
     # 6. Agregar quien genera el reporte
-    resumen["generado_por"] = current_user.get("email")
+    resumen["generado_por"] = generado_por
     
-    # 7. Generar Excel con 4 hojas
-    excel_file = generar_reporte_excel_caja_completo(
+    # 7. Generar Excel con 4 hojas (write-only, fuera del event loop)
+    ruta = await generar_xlsx(
+        escribir_reporte_excel_caja,
         resumen=resumen,
         sede_info=sede_info,
         facturas=ventas,  # ← Ahora son ventas de sales, no facturas de invoices
@@ -963,11 +998,4 @@ async def descargar_reporte_excel(
     nombre_sede = sede.get("nombre", sede_id).replace(" ", "_")
     filename = generar_nombre_archivo_excel(nombre_sede, fecha_para_nombre)
     
-    # 9. Retornar como descarga
-    return StreamingResponse(
-        excel_file,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+    return ruta, filename
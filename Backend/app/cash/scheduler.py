@@ -11,6 +11,8 @@ import logging
 
 from app.database.mongo import collection_locales as locales, db
 from .accounting_logic import calcular_resumen_dia
+from app.inventary.submodulos.inventarios.pronostico import registrar_job_pronostico
+from app.scheduling.submodules.quotes.archivo_citas import registrar_job_archivo
 
 logger = logging.getLogger(__name__)
 
@@ -181,6 +183,8 @@ async def iniciar_scheduler():
         if not scheduler.running:
             # Registrar tareas
             await registrar_cierres_automaticos()
+            registrar_job_pronostico(scheduler)
+            registrar_job_archivo(scheduler)
             
             # Iniciar scheduler
             scheduler.start()
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+import logging
 from fastapi.responses import StreamingResponse, JSONResponse
 from bson import ObjectId
 from datetime import datetime
@@ -7,8 +8,13 @@ from app.database.mongo import collection_clients, collection_citas, collection_
 from app.auth.routes import get_current_user
 from app.scheduling.submodules.quotes.controllers import ( generar_pdf_ficha, 
     crear_html_correo_ficha, enviar_correo_con_pdf)
+from app.core.responses import BSONRoute
+from app.scheduling.submodules.quotes.delta_sync import marca_actualizacion
+from app.scheduling.submodules.quotes.archivo_citas import buscar_cita
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
 
 # ============================================
 # ✅ Endpoint para generar PDF específico - CORREGIDO
@@ -24,8 +30,7 @@ async def generar_pdf_especifico(
     Solo necesita cliente_id (como "CL-XXXXX") y cita_id (como ObjectId string).
     """
     try:
-        print(f"🔍 [PDF ENDPOINT] Buscando cliente: {cliente_id}")
-        print(f"🔍 [PDF ENDPOINT] Buscando cita: {cita_id}")
+        logger.debug(f"🔍 [PDF ENDPOINT] Buscando cliente {cliente_id} y cita {cita_id}")
         
         # Verificar permisos
         if current_user["rol"] not in ["admin_sede", "estilista", "admin"]:
@@ -44,13 +49,11 @@ async def generar_pdf_especifico(
                 detail=f"Cliente no encontrado con ID: {cliente_id}"
             )
         
-        print(f"✅ Cliente encontrado: {cliente.get('nombre')} {cliente.get('apellido', '')}")
-        print(f"📊 Cliente DB ID: {cliente.get('_id')}")
-        print(f"📊 Cliente ID: {cliente.get('cliente_id')}")
+        logger.debug(f"✅ Cliente encontrado: _id={cliente.get('_id')}, cliente_id={cliente.get('cliente_id')}")
         
         # Buscar la cita por ObjectId (cita_id sí es un ObjectId string)
         try:
-            cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+            cita = await buscar_cita({"_id": ObjectId(cita_id)})
         except:
             raise HTTPException(
                 status_code=404,
@@ -63,8 +66,7 @@ async def generar_pdf_especifico(
                 detail=f"Cita no encontrada: {cita_id}"
             )
         
-        print(f"✅ Cita encontrada: {cita_id}")
-        print(f"📊 Cita datos: servicio={cita.get('servicio_nombre')}, cliente_id={cita.get('cliente_id')}")
+        logger.debug(f"📊 Cita datos: servicio={cita.get('servicio_nombre')}, cliente_id={cita.get('cliente_id')}")
         
         # 🔥 IMPORTANTE: Verificar compatibilidad de IDs
         # El cliente en la colección clients tiene campo "cliente_id" = "CL-34933"
@@ -77,10 +79,10 @@ async def generar_pdf_especifico(
         cliente_db_id = cliente.get('cliente_id')  # "CL-34933"
         cliente_object_id = str(cliente.get('_id'))  # ObjectId como string
         
-        print(f"📊 IDs para comparar:")
-        print(f"  - Cliente DB ID (cliente_id): {cliente_db_id}")
-        print(f"  - Cliente ObjectId: {cliente_object_id}")
-        print(f"  - Cita cliente_id: {cita_cliente_id}")
+        logger.debug(
+            f"📊 IDs para comparar: cliente_id={cliente_db_id}, ObjectId={cliente_object_id}, "
+            f"cita.cliente_id={cita_cliente_id}"
+        )
         
         # Verificar si la cita pertenece al cliente
         ids_coinciden = (
@@ -90,9 +92,10 @@ async def generar_pdf_especifico(
         )
         
         if not ids_coinciden:
-            print(f"⚠️ Advertencia: La cita podría no pertenecer al cliente")
-            print(f"   Cita cliente_id: {cita_cliente_id}")
-            print(f"   Cliente IDs: {cliente_db_id}, {cliente_object_id}")
+            logger.warning(
+                f"⚠️ Advertencia: La cita podría no pertenecer al cliente "
+                f"(cita.cliente_id={cita_cliente_id}, cliente={cliente_db_id}, {cliente_object_id})"
+            )
             # Continuamos de todas formas, ya que la ficha puede tener otra referencia
         
         # 🔥 Buscar la ficha técnica asociada
@@ -100,12 +103,12 @@ async def generar_pdf_especifico(
         ficha = await collection_card.find_one({"datos_especificos.cita_id": cita_id})
         
         if not ficha:
-            print("⚠️ Ficha no encontrada por cita_id, buscando por cliente...")
+            logger.warning("⚠️ Ficha no encontrada por cita_id, buscando por cliente...")
             # Segundo: buscar por cliente (usando ObjectId del cliente)
             ficha = await collection_card.find_one({"cliente_id": ObjectId(cliente.get('_id'))})
         
         if not ficha:
-            print("⚠️ Ficha no encontrada por cliente_id, buscando por servicio...")
+            logger.warning("⚠️ Ficha no encontrada por cliente_id, buscando por servicio...")
             # Tercero: buscar por servicio
             if cita.get('servicio_id'):
                 ficha = await collection_card.find_one({
@@ -119,12 +122,10 @@ async def generar_pdf_especifico(
                 detail="No se encontró ficha técnica asociada"
             )
         
-        print(f"✅ Ficha encontrada: ID {ficha.get('_id')}")
-        print(f"📊 Ficha datos:")
-        print(f"  - Servicio: {ficha.get('servicio_nombre')}")
-        print(f"  - Profesional: {ficha.get('profesional_nombre')}")
-        print(f"  - Cliente en ficha: {ficha.get('cliente_id')}")
-        print(f"  - Cita en ficha: {ficha.get('datos_especificos', {}).get('cita_id')}")
+        logger.debug(
+            f"📊 Ficha datos: servicio={ficha.get('servicio_nombre')}, profesional={ficha.get('profesional_nombre')}, "
+            f"cliente={ficha.get('cliente_id')}, cita={ficha.get('datos_especificos', {}).get('cita_id')}"
+        )
         
         # Preparar datos de la cita para el PDF
         cita_data_for_pdf = {
@@ -143,16 +144,15 @@ async def generar_pdf_especifico(
             "hora_fin": cita.get("hora_fin", "No especificado"),
         }
         
-        print("📄 Generando PDF...")
-        print(f"   - Cliente: {cliente.get('nombre')} {cliente.get('apellido', '')}")
-        print(f"   - Servicio: {ficha.get('servicio_nombre')}")
-        print(f"   - Profesional: {ficha.get('profesional_nombre')}")
-        print(f"   - Valor Total: ${cita.get('valor_total', 0):,.0f}")
+        logger.debug(
+            f"📄 Generando PDF: servicio={ficha.get('servicio_nombre')}, profesional={ficha.get('profesional_nombre')}, "
+            f"valor_total=${cita.get('valor_total', 0):,.0f}"
+        )
         
         # Generar el PDF usando tu función existente
         pdf_bytes = await generar_pdf_ficha(ficha, cita_data_for_pdf)
         
-        print(f"✅ PDF generado exitosamente ({len(pdf_bytes)} bytes)")
+        logger.info(f"✅ PDF generado exitosamente ({len(pdf_bytes)} bytes)")
         
         # Crear nombre del archivo
         nombre_cliente = f"{cliente.get('nombre', '').replace(' ', '_')}_{cliente.get('apellido', '').replace(' ', '_')}"
@@ -170,12 +170,10 @@ async def generar_pdf_especifico(
         )
         
     except HTTPException as he:
-        print(f"❌ HTTP Exception: {he.detail}")
+        logger.warning(f"❌ HTTP Exception: {he.detail}")
         raise he
     except Exception as e:
-        print(f"❌ Error generando PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error generando PDF: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error generando PDF: {str(e)}"
@@ -194,7 +192,7 @@ async def generar_pdf_info(
     Genera un PDF y devuelve información sobre él.
     """
     try:
-        print(f"🔍 [PDF INFO] Buscando datos: cliente={cliente_id}, cita={cita_id}")
+        logger.debug(f"🔍 [PDF INFO] Buscando datos: cliente={cliente_id}, cita={cita_id}")
         
         # Buscar cliente por cliente_id (no ObjectId)
         cliente = await collection_clients.find_one({"cliente_id": cliente_id})
@@ -203,7 +201,7 @@ async def generar_pdf_info(
         
         # Buscar cita por ObjectId
         try:
-            cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+            cita = await buscar_cita({"_id": ObjectId(cita_id)})
         except:
             raise HTTPException(status_code=404, detail="Cita ID no válido")
         
@@ -273,7 +271,7 @@ async def generar_pdf_info(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error en PDF info: {e}")
+        logger.error(f"❌ Error en PDF info: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
@@ -298,7 +296,7 @@ async def reenviar_pdf_correo(
         
         # Buscar cita
         try:
-            cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+            cita = await buscar_cita({"_id": ObjectId(cita_id)})
         except:
             raise HTTPException(status_code=404, detail="Cita ID no válido")
         
@@ -353,13 +351,14 @@ async def reenviar_pdf_correo(
         )
         
         if enviado:
-            # Registrar envío en la base de datos
+            # Registrar envío en la base de datos (una cita archivada es de solo lectura: no se marca)
             await collection_citas.update_one(
                 {"_id": ObjectId(cita_id)},
                 {"$set": {
                     "ultimo_envio_pdf": datetime.utcnow(),
                     "pdf_enviado_a": email_a_usar,
-                    "reenviado_por": current_user.get("email")
+                    "reenviado_por": current_user.get("email"),
+                    "ultima_actualizacion": marca_actualizacion()
                 }}
             )
             
@@ -379,5 +378,5 @@ async def reenviar_pdf_correo(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error reenviando PDF: {e}")
+        logger.error(f"❌ Error reenviando PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
\ No newline at end of file
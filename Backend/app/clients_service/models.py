@@ -23,10 +23,20 @@ class MetadataPaginacion(BaseModel):
     rango_inicio: int
     rango_fin: int
 
+# Modelo para paginación por cursor (keyset)
+class CursoresPaginacion(BaseModel):
+    limite: int
+    siguiente: Optional[str] = None
+    anterior: Optional[str] = None
+    tiene_siguiente: bool
+    tiene_anterior: bool
+    total: Optional[int] = None
+
 # Modelo para la respuesta completa
 class ClientesPaginados(BaseModel):
     clientes: List[dict]
-    metadata: MetadataPaginacion
+    metadata: Optional[MetadataPaginacion] = None
+    cursores: Optional[CursoresPaginacion] = None
 
 
 class Cliente(BaseModel):
@@ -1,17 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from app.clients_service.models import Cliente, NotaCliente,ClientesPaginados
+from app.core.pagination import paginar_keyset, contar_con_cache, asegurar_indice, ventana_keyset
+from app.core.streaming import BATCH_SIZE, parametro_formato, parametro_limite, respuesta_stream
 from app.database.mongo import collection_clients, collection_citas, collection_card,collection_servicios, collection_locales,collection_estilista, collection_sales
 from app.auth.routes import get_current_user
 from app.id_generator.generator import generar_id
+from app.analytics.client_visit_stats import get_visitas_clientes, get_resumen_cliente
+from app.clients_service.search_keys import (
+    CAMPO_CLAVES,
+    generar_claves_busqueda,
+    claves_para_actualizacion,
+    construir_filtro_busqueda,
+    actualizar_indice_trigramas,
+)
+from app.core.responses import BSONRoute
+from app.core.dataloader import Cargadores, obtener_cargadores
+from app.scheduling.submodules.quotes.delta_sync import FECHA_CITA_STR
+from app.scheduling.submodules.quotes.archivo_citas import con_archivo, necesita_archivo
 from datetime import datetime
 from typing import List, Optional
 from bson import ObjectId
+from pymongo.errors import ExecutionTimeout
+import asyncio
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 
 def cliente_to_dict(c: dict) -> dict:
@@ -93,9 +108,11 @@ async def crear_cliente(
         
         data["pais"] = sede_info.get("pais", "")
         data["notas_historial"] = []
+        data[CAMPO_CLAVES] = generar_claves_busqueda(data)
 
         result = await collection_clients.insert_one(data)
         data["_id"] = str(result.inserted_id)
+        actualizar_indice_trigramas(data)
 
         return {"success": True, "cliente": data}
 
@@ -127,12 +144,9 @@ async def listar_clientes(
             query["sede_id"] = current_user.get("sede_id")
 
         if filtro:
-            query["$or"] = [
-                {"nombre": {"$regex": filtro, "$options": "i"}},
-                {"correo": {"$regex": filtro, "$options": "i"}},
-                {"telefono": {"$regex": filtro, "$options": "i"}},
-                {"cliente_id": {"$regex": filtro, "$options": "i"}},
-            ]
+            condicion_busqueda = await construir_filtro_busqueda(filtro, dict(query))
+            if condicion_busqueda:
+                query = {"$and": [query, condicion_busqueda]} if query else condicion_busqueda
 
         clientes = await collection_clients.find(query).limit(limite).to_list(None)
 
@@ -152,6 +166,8 @@ async def listar_todos(
     filtro: Optional[str] = Query(None, description="Búsqueda por nombre, ID o teléfono"),
     limite: int = Query(30, ge=1, le=100),
     pagina: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página, luego cursores.siguiente / cursores.anterior"),
+    incluir_total: bool = Query(False, description="Solo con cursor: incluir el total (cacheado)"),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -167,10 +183,14 @@ async def listar_todos(
     - filtro: Texto para buscar (nombre, cedula, teléfono)
     - limite: Items por página (default: 30, max: 100)
     - pagina: Página actual (empieza en 1)
+    - cursor: Si se envía (aunque sea vacío) se pagina por cursor sobre
+      (nombre, _id): coste constante en cualquier página, sin skip ni conteo
+    - incluir_total: Con cursor, añade el total (conteo cacheado)
     
     RETORNA:
     - clientes: Lista de clientes de la página actual
-    - metadata: Info completa de paginación (total, páginas, etc.)
+    - metadata: Info completa de paginación (total, páginas, etc.) — modo página
+    - cursores: siguiente / anterior / total opcional — modo cursor
     """
     try:
         rol = current_user.get("rol")
@@ -212,67 +232,14 @@ async def listar_todos(
                 query["sede_id"] = sede_id  # Sede específica
 
         # ============================================================
-        # 🔍 BÚSQUEDA INTELIGENTE (SIN $text search)
+        # 🔍 BÚSQUEDA POR CLAVES NORMALIZADAS (SIN $regex NI $text)
         # ============================================================
+        # Sin tildes ni mayúsculas; cada palabra se busca como prefijo
+        # de `claves_busqueda` con un rango indexado (ver search_keys.py)
         if filtro:
-            filtro = re.escape(filtro.strip())
-            regex_inicio = {"$regex": f"^{filtro}", "$options": "i"}
-            regex_contiene = {"$regex": filtro, "$options": "i"}
-            
-            if not filtro:
-                # Filtro vacío después de strip -> ignorar
-                pass
-            else:
-                # ============================================================
-                # ESTRATEGIA DE BÚSQUEDA OPTIMIZADA:
-                # ============================================================
-                # 1. Búsquedas cortas (1-2 chars): Solo inicio (^)
-                # 2. Búsquedas largas (3+ chars): Inicio y contiene
-                # 3. Usa índices normales (más rápido que $text)
-                # ============================================================
-                
-                if len(filtro) <= 2:
-                    # Búsqueda corta: solo inicio de palabra (muy rápido)
-                    filtro_condiciones = [
-                        {"nombre": regex_inicio},
-                        {"cliente_id": regex_inicio},
-                        {"telefono": regex_inicio},
-                    ]
-                else:
-                    # Búsqueda larga: inicio + contiene (balance velocidad/resultados)
-                    filtro_condiciones = [
-                        # Prioridad 1: Empieza con el filtro (usa índice)
-                        {"nombre": regex_inicio},
-                        {"cliente_id": regex_inicio},
-                        {"telefono": regex_inicio},
-                        # Prioridad 2: Contiene el filtro (backup)
-                        {"nombre": regex_contiene},
-                        {"correo": regex_contiene},
-                    ]
-                
-                # Combinar con filtro de sede (si existe)
-                if query:
-                    query = {
-                        "$and": [
-                            query,  # Filtro de sede
-                            {"$or": filtro_condiciones}  # Búsqueda
-                        ]
-                    }
-                else:
-                    query = {"$or": filtro_condiciones}
-
-        # ============================================================
-        # 📊 CONTEO OPTIMIZADO
-        # ============================================================
-        # ESTRATEGIA: Usar estimated_document_count cuando sea posible
-        # (es 100x más rápido que count_documents)
-        
-        if not filtro and not query and rol == "super_admin":
-            # Super admin SIN filtros: usar estimación (ultra rápido)
-            total_clientes = await collection_clients.estimated_document_count()
-        else:
-            # Con filtros: usar count normal (usa índices)
-            total_clientes = await collection_clients.count_documents(query)
+            condicion_busqueda = await construir_filtro_busqueda(filtro, dict(query))
+            if condicion_busqueda:
+                query = {"$and": [query, condicion_busqueda]} if query else condicion_busqueda
 
         # ============================================================
         # 📄 PROYECCIÓN: Solo campos necesarios (reduce payload 70%)
@@ -288,6 +255,46 @@ async def listar_todos(
             # ❌ EXCLUIDOS: historial_citas, preferencias, notas, etc.
         }
 
+        # ============================================================
+        # ⏩ MODO CURSOR (keyset sobre nombre, _id)
+        # ============================================================
+        if cursor is not None:
+            await asegurar_indice(
+                collection_clients,
+                [("sede_id", 1), ("nombre", 1), ("_id", 1)],
+                "clients_sede_nombre_id"
+            )
+            pagina_cursor = await paginar_keyset(
+                collection_clients,
+                query,
+                [("nombre", 1), ("_id", 1)],
+                limite=limite,
+                cursor=cursor or None,
+                projection=projection
+            )
+            clientes = pagina_cursor["items"]
+            visitas = await get_visitas_clientes(
+                [c["cliente_id"] for c in clientes if c.get("cliente_id")]
+            )
+            return {
+                "clientes": [cliente_to_dict_ligero(c, visitas.get(c.get("cliente_id"))) for c in clientes],
+                "cursores": {
+                    "limite": limite,
+                    "siguiente": pagina_cursor["siguiente"],
+                    "anterior": pagina_cursor["anterior"],
+                    "tiene_siguiente": pagina_cursor["tiene_siguiente"],
+                    "tiene_anterior": pagina_cursor["tiene_anterior"],
+                    "total": await contar_con_cache(collection_clients, query) if incluir_total else None
+                }
+            }
+
+        # ============================================================
+        # 📊 CONTEO OPTIMIZADO
+        # ============================================================
+        # Sin filtros: estimated_document_count (metadatos)
+        # Con filtros: count_documents cacheado (no se repite en cada página)
+        total_clientes = await contar_con_cache(collection_clients, query)
+
         # ============================================================
         # 🎯 PAGINACIÓN CALCULADA
         # ============================================================
@@ -304,22 +311,29 @@ async def listar_todos(
         # ============================================================
         # 🚀 QUERY FINAL OPTIMIZADO
         # ============================================================
-        cursor = collection_clients.find(query, projection)
+        # ⚠️ skip recorre todas las páginas anteriores: para listados
+        # profundos usar el modo cursor
+        cursor_mongo = collection_clients.find(query, projection)
         
-        # Ordenar alfabéticamente (usa índice de nombre)
-        cursor = cursor.sort("nombre", 1)
+        # Ordenar alfabéticamente (_id como desempate estable entre páginas)
+        cursor_mongo = cursor_mongo.sort([("nombre", 1), ("_id", 1)])
         
-        # Aplicar paginación (lazy loading: solo la página actual)
-        cursor = cursor.skip(skip).limit(limite)
+        # Aplicar paginación (lazy loading: solo la página solicitada)
+        cursor_mongo = cursor_mongo.skip(skip).limit(limite)
         
         # Ejecutar query
-        clientes = await cursor.to_list(limite)
+        clientes = await cursor_mongo.to_list(limite)
+
+        # Última visita de la página actual (una sola consulta a client_visit_stats)
+        visitas = await get_visitas_clientes(
+            [c["cliente_id"] for c in clientes if c.get("cliente_id")]
+        )
 
         # ============================================================
         # 📦 RESPUESTA CON METADATA COMPLETA
         # ============================================================
         return {
-            "clientes": [cliente_to_dict_ligero(c) for c in clientes],
+            "clientes": [cliente_to_dict_ligero(c, visitas.get(c.get("cliente_id"))) for c in clientes],
             "metadata": {
                 "total": total_clientes,
                 "pagina": pagina,
@@ -346,11 +360,12 @@ async def listar_todos(
 # 🪶 FUNCIÓN AUXILIAR: Convertir a dict ligero
 # ============================================================
 
-def cliente_to_dict_ligero(cliente: dict) -> dict:
+def cliente_to_dict_ligero(cliente: dict, visitas: Optional[dict] = None) -> dict:
     """
     Convierte documento MongoDB a dict ligero para API.
     Solo incluye campos esenciales (reduce payload).
     """
+    visitas = visitas or {}
     return {
         "id": str(cliente.get("_id", "")),
         "cliente_id": cliente.get("cliente_id", ""),
@@ -358,7 +373,9 @@ def cliente_to_dict_ligero(cliente: dict) -> dict:
         "correo": cliente.get("correo", ""),
         "telefono": cliente.get("telefono", ""),
         "sede_id": cliente.get("sede_id"),
-        "fecha_registro": cliente.get("fecha_registro")
+        "fecha_registro": cliente.get("fecha_registro"),
+        "ultima_visita": visitas.get("ultima_visita"),
+        "total_visitas": visitas.get("total_visitas", 0)
     }
 
 # ============================================================
@@ -368,8 +385,12 @@ def cliente_to_dict_ligero(cliente: dict) -> dict:
 @router.get("/filtrar/{id}", response_model=List[dict])
 async def listar_por_id(
     id: str,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(),
+    formato: str = parametro_formato(),
     current_user: dict = Depends(get_current_user)
 ):
+    """Clientes de la sede en streaming, por nombre (máx. `limit`, siguiente página en X-Next-Cursor)."""
     try:
         rol = current_user.get("rol")
 
@@ -380,9 +401,23 @@ async def listar_por_id(
             if id != current_user.get("sede_id"):
                 raise HTTPException(403, "No tiene permisos para ver esos clientes")
 
-        clientes = await collection_clients.find({"sede_id": id}).to_list(None)
-        return [cliente_to_dict(c) for c in clientes]
+        await asegurar_indice(
+            collection_clients,
+            [("sede_id", 1), ("nombre", 1), ("_id", 1)],
+            "clients_sede_nombre_id"
+        )
+        ventana = await ventana_keyset(
+            collection_clients, {"sede_id": id}, [("nombre", 1), ("_id", 1)], limit, cursor
+        )
+        return await respuesta_stream(
+            collection_clients.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+            formato,
+            siguiente=ventana["siguiente"],
+            transformar=cliente_to_dict
+        )
 
+    except (HTTPException, ExecutionTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error filtrando clientes: {e}", exc_info=True)
         raise HTTPException(500, "Error al filtrar clientes")
@@ -416,6 +451,11 @@ async def obtener_cliente(
         if not cliente:
             raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+        # Resumen de visitas (primera/última visita, total) desde client_visit_stats
+        resumen_visitas = await get_resumen_cliente(cliente.get("cliente_id") or str(cliente["_id"]))
+        if resumen_visitas:
+            cliente.update(resumen_visitas)
+
         # 2️⃣ Reglas de acceso SOLO para admin_sede / estilista
         if rol in ["admin_sede", "estilista"]:
             cliente_sede_id = cliente.get("sede_id")
@@ -495,10 +535,15 @@ async def editar_cliente(
         update_data["fecha_modificacion"] = datetime.now()
         update_data.pop("cliente_id", None)
 
+        claves = claves_para_actualizacion(cliente, update_data)
+        if claves is not None:
+            update_data[CAMPO_CLAVES] = claves
+
         await collection_clients.update_one(
             {"_id": cliente["_id"]},
             {"$set": update_data}
         )
+        actualizar_indice_trigramas({**cliente, **update_data})
 
         return {"success": True, "msg": "Cliente actualizado"}
 
@@ -552,16 +597,41 @@ async def agregar_nota(
 @router.get("/{id}/historial", response_model=List[dict])
 async def historial_cliente(
     id: str,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(200),
+    formato: str = parametro_formato(),
     current_user: dict = Depends(get_current_user)
 ):
+    """
+    Citas del cliente en streaming, de la más reciente a la más antigua (máx. `limit`).
+    Incluye las archivadas (appointments_archive) si hay corte de archivo.
+    """
     try:
         rol = current_user.get("rol")
         if rol not in ["admin_sede", "admin_franquicia", "super_admin", "estilista"]:
             raise HTTPException(403, "No autorizado")
 
-        citas = await collection_citas.find({"cliente_id": id}).sort("fecha", -1).to_list(None)
-        return [cita_to_dict(c) for c in citas]
+        await asegurar_indice(collection_citas, [("cliente_id", 1), ("fecha", -1)], "citas_cliente_fecha")
+        # `fecha` se normaliza a texto ANTES de ordenar: las citas antiguas la
+        # guardan como datetime y el keyset no puede comparar tipos distintos
+        ventana = await ventana_keyset(
+            collection_citas,
+            {"cliente_id": id},
+            [("fecha", -1), ("_id", -1)],
+            limit,
+            cursor,
+            etapas_previas=[{"$set": {"fecha": FECHA_CITA_STR}}],
+            ampliar=con_archivo if await necesita_archivo() else None
+        )
+        return await respuesta_stream(
+            collection_citas.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+            formato,
+            siguiente=ventana["siguiente"],
+            transformar=cita_to_dict
+        )
 
+    except (HTTPException, ExecutionTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error historial cliente: {e}")
         raise HTTPException(500, "Error al obtener historial")
@@ -572,7 +642,8 @@ async def historial_cliente(
 @router.get("/fichas/{cliente_id}", response_model=List[dict])
 async def obtener_fichas_cliente(
     cliente_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cargadores: Cargadores = Depends(obtener_cargadores)
 ):
     try:
         rol = current_user.get("rol")
@@ -594,9 +665,20 @@ async def obtener_fichas_cliente(
             sede_usuario = current_user.get("sede_id")
             fichas = [f for f in fichas if f.get("sede_id") == sede_usuario]
 
-        resultado_final = []
+        # Servicio, sede y estilista: una consulta $in por colección para
+        # todas las fichas (en lugar de 3-4 find_one por ficha)
+        servicios = cargadores.por(collection_servicios, "servicio_id")
+        sedes = cargadores.por(collection_locales, "sede_id")
+        estilistas = cargadores.por(collection_estilista, "profesional_id")
+
+        def nombre_sede(sede):
+            return (
+                sede.get("nombre_sede")
+                or sede.get("nombre")
+                or sede.get("local")
+            )
 
-        for ficha in fichas:
+        async def enriquecer(ficha):
             ficha["_id"] = str(ficha["_id"])
 
             # Normalizar fechas
@@ -604,71 +686,46 @@ async def obtener_fichas_cliente(
                 if isinstance(ficha.get(campo), datetime):
                     ficha[campo] = ficha[campo].strftime("%Y-%m-%d")
 
-            # ======================================================
-            # 1️⃣ Obtener servicio
-            # ======================================================
-            servicio_nombre = None
-            servicio = await collection_servicios.find_one(
-                {"servicio_id": ficha.get("servicio_id")}
+            profesional_id = ficha.get("profesional_id")
+            servicio, sede, estilista = await asyncio.gather(
+                servicios.cargar(ficha.get("servicio_id")),
+                sedes.cargar(ficha.get("sede_id")),
+                estilistas.cargar(profesional_id),
             )
-            if servicio:
-                servicio_nombre = servicio.get("nombre")
 
             # ======================================================
-            # 2️⃣ Obtener sede
+            # 1️⃣ Servicio y 2️⃣ sede
             # ======================================================
-            sede_nombre = None
-            sede = await collection_locales.find_one(
-                {"sede_id": ficha.get("sede_id")}
-            )
-            if sede:
-                sede_nombre = (
-                    sede.get("nombre_sede")
-                    or sede.get("nombre")
-                    or sede.get("local")
-                )
+            servicio_nombre = servicio.get("nombre") if servicio else None
+            sede_nombre = nombre_sede(sede) if sede else None
 
             # ======================================================
-            # 3️⃣ Obtener estilista por profesional_id
+            # 3️⃣ Estilista por profesional_id y su sede
             # ======================================================
-            profesional_id = ficha.get("profesional_id")  # <── AQUÍ!
-
             estilista_nombre = "Desconocido"
             sede_estilista_nombre = "Desconocida"
 
-            if profesional_id:
-                estilista = await collection_estilista.find_one(
-                    {"profesional_id": profesional_id}  # <── AQUÍ FUNCIONA
-                )
+            if profesional_id and estilista:
+                estilista_nombre = estilista.get("nombre")
 
-                if estilista:
-                    estilista_nombre = estilista.get("nombre")
-
-                    # buscar sede del estilista
-                    est_sede_id = estilista.get("sede_id")
-                    if est_sede_id:
-                        sede_est = await collection_locales.find_one(
-                            {"sede_id": est_sede_id}
-                        )
-                        if sede_est:
-                            sede_estilista_nombre = (
-                                sede_est.get("nombre_sede")
-                                or sede_est.get("nombre")
-                                or sede_est.get("local")
-                            )
+                sede_est = await sedes.cargar(estilista.get("sede_id"))
+                if sede_est:
+                    sede_estilista_nombre = nombre_sede(sede_est)
 
             # ======================================================
             # 4️⃣ Construir respuesta final
             # ======================================================
-            resultado_final.append({
+            return {
                 **ficha,
                 "servicio": servicio_nombre,
                 "sede": sede_nombre,
                 "estilista": estilista_nombre,
                 "sede_estilista": sede_estilista_nombre,
-            })
+            }
+
+        resultado_final = await asyncio.gather(*(enriquecer(f) for f in fichas))
 
-        return resultado_final
+        return list(resultado_final)
 
     except Exception as e:
         logger.error(f"Error obteniendo fichas del cliente: {e}", exc_info=True)
@@ -679,6 +736,9 @@ async def obtener_fichas_cliente(
 # ============================================================
 @router.get("/clientes/mi-sede", response_model=List[dict])
 async def get_clientes_mi_sede(
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(),
+    formato: str = parametro_formato(),
     current_user: dict = Depends(get_current_user)
 ):
     # 1️⃣ Verifica que el usuario tenga sede
@@ -689,13 +749,24 @@ async def get_clientes_mi_sede(
             detail="El usuario autenticado no tiene una sede asignada"
         )
 
-    # 2️⃣ Obtener clientes de la sede
-    clientes_cursor = collection_clients.find(
-        {"sede_id": sede_usuario},
-        {"_id": 0}  # opcional
+    # 2️⃣ Clientes de la sede en streaming (por nombre, máx. `limit`)
+    await asegurar_indice(
+        collection_clients,
+        [("sede_id", 1), ("nombre", 1), ("_id", 1)],
+        "clients_sede_nombre_id"
+    )
+    ventana = await ventana_keyset(
+        collection_clients, {"sede_id": sede_usuario}, [("nombre", 1), ("_id", 1)], limit, cursor
     )
 
-    # Motor necesita to_list()
-    clientes = await clientes_cursor.to_list(length=None)
+    # El _id solo hace falta para el keyset: la respuesta sigue sin él
+    def sin_id(cliente: dict) -> dict:
+        cliente.pop("_id", None)
+        return cliente
 
-    return clientes  # Devuelve directamente el array
+    return await respuesta_stream(
+        collection_clients.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+        formato,
+        siguiente=ventana["siguiente"],
+        transformar=sin_id
+    )
@@ -0,0 +1,335 @@
+"""
+Claves de búsqueda normalizadas para clientes
+=============================================
+
+Cada cliente guarda `claves_busqueda`: un array de claves en minúsculas,
+sin tildes y sin signos, que se busca por PREFIJO con rangos indexados
+($gte / $lt) en lugar de $regex sin ancla sobre nombre/correo/teléfono.
+
+Claves generadas:
+- Tokens del nombre / apellido ("María José" → "maria", "jose")
+- Teléfono solo dígitos (+ los últimos 10 si trae indicativo de país)
+- Parte local del correo (tokens y compacta: "juan.perez" → "juan", "perez", "juanperez")
+- cliente_id y cédula normalizados
+
+Búsqueda: cada palabra de la consulta debe ser prefijo de alguna clave
+("jose mar" encuentra "María José"). Índices: (sede_id, claves_busqueda)
+y (claves_busqueda) para super_admin.
+
+Búsqueda por subcadena ("contiene") opcional con un índice de trigramas
+en memoria por sede: CLIENT_SEARCH_TRIGRAMS=1.
+
+Backfill de clientes existentes:
+    python -m app.clients_service.search_keys
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from app.database.mongo import collection_clients
+
+logger = logging.getLogger(__name__)
+
+CAMPO_CLAVES = "claves_busqueda"
+CAMPOS_FUENTE = ("nombre", "apellido", "correo", "telefono", "cliente_id", "cedula")
+
+# Límite superior de un rango de prefijo: todo lo que empieza por p está en [p, p + "\uffff")
+_FIN_PREFIJO = "\uffff"
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+TRIGRAMAS_HABILITADOS = os.getenv("CLIENT_SEARCH_TRIGRAMS", "0") == "1"
+TRIGRAMAS_TTL = int(os.getenv("CLIENT_SEARCH_TRIGRAMS_TTL", "600"))
+TRIGRAMAS_MAX_RESULTADOS = 500
+
+BACKFILL_LOTE = 1000
+
+
+# ============================================================
+# NORMALIZACIÓN
+# ============================================================
+
+def normalizar_texto(texto) -> str:
+    """Minúsculas, sin tildes y con cualquier signo convertido en espacio."""
+    if texto is None:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto).lower())
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", sin_tildes).strip()
+
+
+def _tokens(texto) -> List[str]:
+    return normalizar_texto(texto).split()
+
+
+def _solo_digitos(texto) -> str:
+    return re.sub(r"\D", "", str(texto or ""))
+
+
+def generar_claves_busqueda(cliente: dict) -> List[str]:
+    """Claves de búsqueda de un cliente (ordenadas y sin duplicados)."""
+    claves: Set[str] = set()
+
+    claves.update(_tokens(cliente.get("nombre")))
+    claves.update(_tokens(cliente.get("apellido")))
+
+    telefono = _solo_digitos(cliente.get("telefono"))
+    if telefono:
+        claves.add(telefono)
+        if len(telefono) > 10:
+            claves.add(telefono[-10:])  # sin indicativo de país
+
+    correo = str(cliente.get("correo") or "")
+    local = correo.split("@", 1)[0]
+    tokens_correo = _tokens(local)
+    claves.update(tokens_correo)
+    if len(tokens_correo) > 1:
+        claves.add("".join(tokens_correo))
+
+    for campo in ("cliente_id", "cedula"):
+        tokens_campo = _tokens(cliente.get(campo))
+        claves.update(tokens_campo)
+        if len(tokens_campo) > 1:
+            claves.add("".join(tokens_campo))  # "CL-00123" → "cl00123"
+
+    return sorted(claves)
+
+
+def claves_para_actualizacion(cliente_actual: dict, cambios: dict) -> Optional[List[str]]:
+    """Claves recalculadas si el update toca algún campo buscable; None si no hace falta."""
+    if not any(campo in cambios for campo in CAMPOS_FUENTE):
+        return None
+    return generar_claves_busqueda({**cliente_actual, **cambios})
+
+
+# ============================================================
+# CONSULTA
+# ============================================================
+
+def filtro_prefijos(consulta: str) -> Optional[Dict]:
+    """
+    Condición Mongo: cada palabra de la consulta es prefijo de alguna clave.
+    $elemMatch obliga a que ambos extremos del rango caigan sobre la MISMA
+    clave, así el índice multikey usa límites [p, p\\uffff) ajustados.
+    """
+    tokens = list(dict.fromkeys(_tokens(consulta)))
+    if not tokens:
+        return None
+
+    condiciones = [
+        {CAMPO_CLAVES: {"$elemMatch": {"$gte": t, "$lt": t + _FIN_PREFIJO}}}
+        for t in tokens
+    ]
+    return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+
+async def construir_filtro_busqueda(consulta: Optional[str], filtro_sede: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Filtro completo de búsqueda: prefijos indexados y, si está habilitado
+    y la consulta tiene 3+ caracteres, coincidencias por subcadena del
+    índice de trigramas de la sede.
+    """
+    prefijos = filtro_prefijos(consulta or "")
+    if prefijos is None:
+        return None
+
+    if not TRIGRAMAS_HABILITADOS or len(normalizar_texto(consulta)) < 3:
+        return prefijos
+
+    try:
+        ids = await buscar_subcadena(consulta, filtro_sede or {})
+    except Exception as e:
+        logger.warning(f"⚠️ Índice de trigramas no disponible: {e}")
+        return prefijos
+
+    if not ids:
+        return prefijos
+    return {"$or": [prefijos, {"cliente_id": {"$in": ids}}]}
+
+
+# ============================================================
+# ÍNDICE DE TRIGRAMAS EN MEMORIA (OPCIONAL)
+# ============================================================
+
+def _trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _texto_trigramas(cliente: dict) -> str:
+    partes = [
+        normalizar_texto(cliente.get("nombre")),
+        normalizar_texto(cliente.get("apellido")),
+        normalizar_texto(cliente.get("correo")),
+        _solo_digitos(cliente.get("telefono")),
+        normalizar_texto(cliente.get("cliente_id")),
+    ]
+    return " ".join(p for p in partes if p)
+
+
+class TrigramIndex:
+    """Índice invertido trigrama → cliente_ids de una sede."""
+
+    def __init__(self):
+        self._textos: Dict[str, str] = {}
+        self._por_trigrama: Dict[str, Set[str]] = defaultdict(set)
+        self.construido_en = 0.0
+
+    def agregar(self, cliente_id: str, cliente: dict):
+        self.quitar(cliente_id)
+        texto = _texto_trigramas(cliente)
+        self._textos[cliente_id] = texto
+        for trigrama in _trigramas(texto):
+            self._por_trigrama[trigrama].add(cliente_id)
+
+    def quitar(self, cliente_id: str):
+        texto = self._textos.pop(cliente_id, None)
+        if texto is None:
+            return
+        for trigrama in _trigramas(texto):
+            ids = self._por_trigrama.get(trigrama)
+            if ids is not None:
+                ids.discard(cliente_id)
+                if not ids:
+                    del self._por_trigrama[trigrama]
+
+    def buscar(self, consulta: str, limite: int = TRIGRAMAS_MAX_RESULTADOS) -> List[str]:
+        consulta = normalizar_texto(consulta)
+        trigramas = _trigramas(consulta)
+        if not trigramas:
+            return []
+
+        # Intersección empezando por el trigrama más selectivo
+        conjuntos = sorted((self._por_trigrama.get(t, set()) for t in trigramas), key=len)
+        candidatos = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            candidatos &= conjunto
+            if not candidatos:
+                return []
+
+        # Los trigramas no garantizan contigüidad: verificar la subcadena
+        resultado = [cid for cid in candidatos if consulta in self._textos.get(cid, "")]
+        return resultado[:limite]
+
+    def __len__(self):
+        return len(self._textos)
+
+
+_indices_trigramas: Dict[str, TrigramIndex] = {}
+_locks_trigramas: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def _clave_sede(filtro_sede: Dict) -> str:
+    if "sede_id" not in filtro_sede:
+        return "*"
+    return filtro_sede["sede_id"] or "__global__"
+
+
+async def _obtener_indice(filtro_sede: Dict) -> TrigramIndex:
+    clave = _clave_sede(filtro_sede)
+    indice = _indices_trigramas.get(clave)
+    if indice is not None and time.monotonic() - indice.construido_en < TRIGRAMAS_TTL:
+        return indice
+
+    async with _locks_trigramas[clave]:
+        indice = _indices_trigramas.get(clave)
+        if indice is not None and time.monotonic() - indice.construido_en < TRIGRAMAS_TTL:
+            return indice
+
+        nuevo = TrigramIndex()
+        proyeccion = {campo: 1 for campo in CAMPOS_FUENTE}
+        proyeccion["_id"] = 1
+        async for cliente in collection_clients.find(filtro_sede, proyeccion):
+            nuevo.agregar(cliente.get("cliente_id") or str(cliente["_id"]), cliente)
+        nuevo.construido_en = time.monotonic()
+
+        _indices_trigramas[clave] = nuevo
+        logger.info(f"🔤 Índice de trigramas de clientes ({clave}): {len(nuevo)} clientes")
+        return nuevo
+
+
+async def buscar_subcadena(consulta: str, filtro_sede: Dict) -> List[str]:
+    indice = await _obtener_indice(filtro_sede)
+    return indice.buscar(consulta)
+
+
+def actualizar_indice_trigramas(cliente: dict):
+    """Refleja un alta/edición en los índices ya construidos (sin esperar al TTL)."""
+    if not _indices_trigramas:
+        return
+
+    cliente_id = cliente.get("cliente_id") or str(cliente.get("_id"))
+    sede = cliente.get("sede_id") or "__global__"
+    for clave, indice in _indices_trigramas.items():
+        if clave in ("*", sede):
+            indice.agregar(cliente_id, cliente)
+        else:
+            indice.quitar(cliente_id)
+
+
+# ============================================================
+# ÍNDICES Y BACKFILL
+# ============================================================
+
+async def crear_indices_busqueda_clientes():
+    await collection_clients.create_index(
+        [("sede_id", 1), (CAMPO_CLAVES, 1)],
+        name="clients_sede_claves_busqueda"
+    )
+    await collection_clients.create_index(
+        [(CAMPO_CLAVES, 1)],
+        name="clients_claves_busqueda"
+    )
+
+
+async def _aplicar_lote(operaciones: List[UpdateOne]) -> int:
+    if not operaciones:
+        return 0
+    resultado = await collection_clients.bulk_write(operaciones, ordered=False)
+    return resultado.modified_count
+
+
+async def backfill_claves_busqueda(solo_faltantes: bool = False) -> Dict:
+    """
+    Calcula `claves_busqueda` para los clientes existentes en lotes.
+    Con solo_faltantes=True procesa únicamente los que aún no las tienen.
+    """
+    inicio = time.monotonic()
+    await crear_indices_busqueda_clientes()
+
+    query = {CAMPO_CLAVES: {"$exists": False}} if solo_faltantes else {}
+    proyeccion = {campo: 1 for campo in CAMPOS_FUENTE}
+    proyeccion[CAMPO_CLAVES] = 1
+
+    procesados = 0
+    modificados = 0
+    lote: List[UpdateOne] = []
+
+    async for cliente in collection_clients.find(query, proyeccion):
+        procesados += 1
+        claves = generar_claves_busqueda(cliente)
+        if cliente.get(CAMPO_CLAVES) != claves:
+            lote.append(UpdateOne({"_id": cliente["_id"]}, {"$set": {CAMPO_CLAVES: claves}}))
+
+        if len(lote) >= BACKFILL_LOTE:
+            modificados += await _aplicar_lote(lote)
+            lote = []
+
+    modificados += await _aplicar_lote(lote)
+    _indices_trigramas.clear()
+
+    duracion = round(time.monotonic() - inicio, 2)
+    logger.info(f"✅ Claves de búsqueda: {procesados} clientes revisados, {modificados} actualizados en {duracion}s")
+    return {"clientes_procesados": procesados, "clientes_actualizados": modificados, "duracion_segundos": duracion}
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(backfill_claves_busqueda(solo_faltantes="--faltantes" in sys.argv)))
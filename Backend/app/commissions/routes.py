@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
 from app.auth.routes import get_current_user
 from app.database.mongo import collection_commissions
+from app.core.pagination import paginar_keyset, contar_con_cache, asegurar_indice
+from app.core.responses import BSONRoute
 from .models import (
     ComisionResponse, 
     ComisionDetalleResponse, 
@@ -13,7 +15,8 @@ from .models import (
 
 router = APIRouter(
     prefix="",
-    tags=["Comisiones"]
+    tags=["Comisiones"],
+    route_class=BSONRoute
 )
 
 # ==============================================================
@@ -179,18 +182,27 @@ def calcular_totales_por_tipo(servicios_detalle: list) -> dict:
 
 @router.get("/", response_model=List[ComisionResponse])
 async def obtener_comisiones(
+    response: Response,
     profesional_id: Optional[str] = Query(None),
     sede_id: Optional[str] = Query(None),
     estado: Optional[str] = Query(None),
     tipo_comision: Optional[str] = Query(None, description="servicios | productos | mixto"),  # ⭐ NUEVO
     fecha_inicio: Optional[str] = Query(None, description="Filtrar desde esta fecha (YYYY-MM-DD)"),
     fecha_fin: Optional[str] = Query(None, description="Filtrar hasta esta fecha (YYYY-MM-DD)"),
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página"),
+    limit: int = Query(100, ge=1, le=1000, description="Registros por página (solo con cursor)"),
+    include_total: bool = Query(False, description="Solo con cursor: total en X-Total-Count"),
     user: dict = Depends(get_current_user)
 ):
     """
     Obtiene el listado de comisiones según el rol:
     - superadmin: ve todas las comisiones
     - admin_sede: solo ve comisiones de su sede
+    
+    Sin `cursor` devuelve hasta 1000 comisiones (comportamiento original).
+    Con `cursor` pagina por (creado_en, _id) descendente y devuelve la
+    misma lista; los cursores van en las cabeceras X-Next-Cursor /
+    X-Prev-Cursor (y X-Total-Count si include_total=true).
     """
     try:
         filtros = {
@@ -203,10 +215,35 @@ async def obtener_comisiones(
         }
         
         query = construir_query_filtros(user, filtros)
-        comisiones = await collection_commissions.find(query).sort("creado_en", -1).to_list(1000)
         
-        return [formatear_comision_response(c) for c in comisiones]
+        if cursor is None:
+            comisiones = await collection_commissions.find(query).sort("creado_en", -1).to_list(1000)
+            return [formatear_comision_response(c) for c in comisiones]
+        
+        await asegurar_indice(
+            collection_commissions,
+            [("sede_id", 1), ("creado_en", -1), ("_id", -1)],
+            "commissions_sede_creado_id"
+        )
+        pagina = await paginar_keyset(
+            collection_commissions,
+            query,
+            [("creado_en", -1), ("_id", -1)],
+            limite=limit,
+            cursor=cursor or None
+        )
+        
+        if pagina["siguiente"]:
+            response.headers["X-Next-Cursor"] = pagina["siguiente"]
+        if pagina["anterior"]:
+            response.headers["X-Prev-Cursor"] = pagina["anterior"]
+        if include_total:
+            response.headers["X-Total-Count"] = str(await contar_con_cache(collection_commissions, query))
+        
+        return [formatear_comision_response(c) for c in pagina["items"]]
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
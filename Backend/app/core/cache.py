@@ -0,0 +1,345 @@
+"""
+Caché compartida para endpoints de analytics
+============================================
+
+- LRU en memoria con límite de entradas y TTL (purga activa de expirados)
+- Respaldo opcional en Redis (o compatible) para compartir entre workers:
+  ANALYTICS_CACHE_REDIS_URL=redis://localhost:6379/0
+- Single-flight: N peticiones simultáneas con la misma clave ejecutan UN cálculo.
+  Con Redis, además se coordina entre workers con un lock SET NX.
+  Si se cancela la petición que calcula (cliente desconectado), las que
+  esperaban no fallan: una de ellas toma el relevo y calcula.
+- En Redis los valores se guardan como BSON (mismos tipos que devuelve
+  Mongo: datetime, ObjectId...; datetime con precisión de milisegundos).
+  Un valor que no se puede codificar solo se guarda en memoria.
+- Métricas de hits/misses/coalesced/evictions por prefijo
+
+Uso:
+    from app.core.cache import analytics_cache, make_cache_key
+
+    key = make_cache_key("kpi_overview", start=..., sede=sede_id)
+    result = await analytics_cache.get_or_compute(key, lambda: calcular(...), ttl=300)
+
+⚠️ Los valores se comparten entre peticiones: no mutar el resultado devuelto.
+⚠️ Si el cálculo lanza excepción no se cachea nada.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "512"))
+CACHE_DEFAULT_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+CACHE_REDIS_URL = os.getenv("ANALYTICS_CACHE_REDIS_URL")
+CACHE_LOCK_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_LOCK_TIMEOUT", "60"))
+CACHE_LOCK_POLL = 0.1
+
+_MISSING = object()
+
+
+def make_cache_key(prefix: str, **kwargs) -> str:
+    """Clave estable: prefijo + parámetros ordenados (ignora None)."""
+    params = "_".join(f"{k}={v}" for k, v in sorted(kwargs.items()) if v is not None)
+    return f"{prefix}:{params}"
+
+
+def _prefijo(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+# ============================================================
+# MÉTRICAS
+# ============================================================
+
+class CacheMetrics:
+    CAMPOS = ("hits", "remote_hits", "misses", "coalesced", "computations", "evictions", "errors")
+
+    def __init__(self):
+        self._por_prefijo: Dict[str, Dict[str, int]] = {}
+
+    def incr(self, key: str, campo: str, n: int = 1):
+        contadores = self._por_prefijo.setdefault(_prefijo(key), dict.fromkeys(self.CAMPOS, 0))
+        contadores[campo] += n
+
+    def snapshot(self) -> Dict:
+        totales = dict.fromkeys(self.CAMPOS, 0)
+        for contadores in self._por_prefijo.values():
+            for campo, valor in contadores.items():
+                totales[campo] += valor
+
+        consultas = totales["hits"] + totales["remote_hits"] + totales["misses"] + totales["coalesced"]
+        aciertos = totales["hits"] + totales["remote_hits"] + totales["coalesced"]
+        return {
+            "totales": totales,
+            "hit_ratio": round(aciertos / consultas, 3) if consultas else 0.0,
+            "por_prefijo": {k: dict(v) for k, v in self._por_prefijo.items()}
+        }
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class LRUCacheBackend:
+    """LRU en memoria del proceso con TTL por entrada."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+
+        expira, valor = item
+        if expira <= time.monotonic():
+            del self._data[key]
+            return _MISSING
+
+        self._data.move_to_end(key)
+        return valor
+
+    def set(self, key: str, valor: Any, ttl: int) -> int:
+        """Guarda el valor y devuelve cuántas entradas se desalojaron."""
+        self._data[key] = (time.monotonic() + ttl, valor)
+        self._data.move_to_end(key)
+        return self._evict()
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self) -> int:
+        desalojadas = 0
+        ahora = time.monotonic()
+
+        # Primero los expirados (no esperar a que se vuelvan a leer)
+        for key in [k for k, (expira, _) in self._data.items() if expira <= ahora]:
+            del self._data[key]
+            desalojadas += 1
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            desalojadas += 1
+
+        return desalojadas
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _codificar(valor: Any) -> bytes:
+    # BSON exige un documento en la raíz: el valor va envuelto
+    return bson.encode({"v": valor})
+
+
+def _decodificar(raw: bytes) -> Any:
+    return bson.decode(raw)["v"]
+
+
+class RedisCacheBackend:
+    """Respaldo compartido entre workers (redis.asyncio, dependencia opcional)."""
+
+    def __init__(self, url: str, namespace: str = "appagenda:cache:"):
+        import redis.asyncio as redis  # opcional: solo si se configura la URL
+
+        self.namespace = namespace
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Any:
+        raw = await self._client.get(self.namespace + key)
+        return _MISSING if raw is None else _decodificar(raw)
+
+    async def set(self, key: str, valor: Any, ttl: int):
+        await self._client.set(self.namespace + key, _codificar(valor), ex=ttl)
+
+    async def delete(self, key: str):
+        await self._client.delete(self.namespace + key)
+
+    async def acquire_lock(self, key: str, timeout: int) -> bool:
+        return bool(await self._client.set(self.namespace + "lock:" + key, b"1", nx=True, ex=timeout))
+
+    async def release_lock(self, key: str):
+        await self._client.delete(self.namespace + "lock:" + key)
+
+
+# ============================================================
+# CACHÉ CON SINGLE-FLIGHT
+# ============================================================
+
+class AnalyticsCache:
+    def __init__(
+        self,
+        local: LRUCacheBackend,
+        remote: Optional[RedisCacheBackend] = None,
+        default_ttl: int = CACHE_DEFAULT_TTL
+    ):
+        self.local = local
+        self.remote = remote
+        self.default_ttl = default_ttl
+        self.metrics = CacheMetrics()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None
+    ) -> Any:
+        ttl = ttl or self.default_ttl
+
+        valor = self.local.get(key)
+        if valor is not _MISSING:
+            self.metrics.incr(key, "hits")
+            return valor
+
+        # Otro request de este worker ya está calculando la misma clave
+        pendiente = self._inflight.get(key)
+        if pendiente is not None:
+            self.metrics.incr(key, "coalesced")
+        while pendiente is not None:
+            try:
+                return await asyncio.shield(pendiente)
+            except asyncio.CancelledError:
+                # Cancelaron esta petición (no solo al que calculaba): propagar
+                if not pendiente.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # El que calculaba fue cancelado: otro que esperaba ya pudo tomar el relevo
+            valor = self.local.get(key)
+            if valor is not _MISSING:
+                return valor
+            pendiente = self._inflight.get(key)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._inflight[key] = futuro
+        try:
+            valor = await self._cargar(key, compute, ttl)
+            futuro.set_result(valor)
+            return valor
+        except asyncio.CancelledError:
+            # Los que esperan reintentan (ver arriba) en lugar de recibir la cancelación
+            futuro.cancel()
+            raise
+        except BaseException as e:
+            futuro.set_exception(e)
+            futuro.exception()  # marcar como recuperada si nadie más espera
+            raise
+        finally:
+            if self._inflight.get(key) is futuro:
+                del self._inflight[key]
+
+    async def _cargar(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        if self.remote is None:
+            self.metrics.incr(key, "misses")
+            return await self._calcular(key, compute, ttl)
+
+        valor = await self._remote_get(key)
+        if valor is not _MISSING:
+            self.metrics.incr(key, "remote_hits")
+            self._guardar_local(key, valor, ttl)
+            return valor
+
+        self.metrics.incr(key, "misses")
+
+        # Coordinación entre workers: solo uno calcula, el resto espera el resultado
+        tiene_lock = await self._remote_lock(key)
+        if not tiene_lock:
+            limite = time.monotonic() + CACHE_LOCK_TIMEOUT
+            while time.monotonic() < limite:
+                await asyncio.sleep(CACHE_LOCK_POLL)
+                valor = await self._remote_get(key)
+                if valor is not _MISSING:
+                    self._guardar_local(key, valor, ttl)
+                    return valor
+                # Lock liberado sin valor (el otro worker falló o fue cancelado): relevo
+                tiene_lock = await self._remote_lock(key)
+                if tiene_lock:
+                    break
+            else:
+                logger.warning(f"⚠️ Timeout esperando lock de caché para {key}, calculando localmente")
+
+        try:
+            return await self._calcular(key, compute, ttl)
+        finally:
+            if tiene_lock:
+                try:
+                    await self.remote.release_lock(key)
+                except Exception as e:
+                    self.metrics.incr(key, "errors")
+                    logger.warning(f"⚠️ Error liberando lock de caché {key}: {e}")
+
+    async def _calcular(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        self.metrics.incr(key, "computations")
+        valor = await compute()
+        self._guardar_local(key, valor, ttl)
+
+        if self.remote is not None:
+            try:
+                await self.remote.set(key, valor, ttl)
+            except Exception as e:
+                self.metrics.incr(key, "errors")
+                logger.warning(f"⚠️ Error guardando {key} en caché remota: {e}")
+
+        return valor
+
+    def _guardar_local(self, key: str, valor: Any, ttl: int):
+        desalojadas = self.local.set(key, valor, ttl)
+        if desalojadas:
+            self.metrics.incr(key, "evictions", desalojadas)
+
+    async def _remote_get(self, key: str) -> Any:
+        try:
+            return await self.remote.get(key)
+        except Exception as e:
+            self.metrics.incr(key, "errors")
+            logger.warning(f"⚠️ Caché remota no disponible ({key}): {e}")
+            return _MISSING
+
+    async def _remote_lock(self, key: str) -> bool:
+        try:
+            return await self.remote.acquire_lock(key, CACHE_LOCK_TIMEOUT)
+        except Exception as e:
+            self.metrics.incr(key, "errors")
+            logger.warning(f"⚠️ No se pudo obtener lock de caché ({key}): {e}")
+            return True  # sin Redis: calcular igualmente
+
+    async def invalidate(self, key: str):
+        self.local.delete(key)
+        if self.remote is not None:
+            try:
+                await self.remote.delete(key)
+            except Exception as e:
+                self.metrics.incr(key, "errors")
+                logger.warning(f"⚠️ Error invalidando {key} en caché remota: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "lru+redis" if self.remote is not None else "lru",
+            "entradas_locales": len(self.local),
+            "max_entradas": self.local.max_entries,
+            "ttl_default": self.default_ttl,
+            "en_vuelo": len(self._inflight),
+            **self.metrics.snapshot()
+        }
+
+
+def _crear_backend_remoto() -> Optional[RedisCacheBackend]:
+    if not CACHE_REDIS_URL:
+        return None
+    try:
+        return RedisCacheBackend(CACHE_REDIS_URL)
+    except Exception as e:
+        logger.warning(f"⚠️ Caché Redis deshabilitada ({e}); usando solo LRU en memoria")
+        return None
+
+
+analytics_cache = AnalyticsCache(LRUCacheBackend(CACHE_MAX_ENTRIES), _crear_backend_remoto())
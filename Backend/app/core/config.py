@@ -1,8 +1,20 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware  # Importa el middleware CORS
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from app.cash.scheduler import iniciar_scheduler, detener_scheduler
+from app.scheduling.submodules.live.calendar_stream import detener_watcher
+from app.core.xlsx_export import detener_executor
+from app.exports.jobs import detener_workers
+from app.bills.numeracion import numerador, asegurar_indice_numeracion
+from app.core.instrumentacion_mongo import middleware_consultas
+from app.core.logs import configurar_logs, middleware_request_id
+from app.core.tiempos_peticion import MiddlewareTiempos, router as perfiles_router
+from app.core.metricas import exposicion
 from dotenv import load_dotenv
+from pymongo.errors import ExecutionTimeout
 
 # Importar routers de cada módulo
 from app.auth.routes import router as auth_router
@@ -22,13 +34,35 @@ from app.analytics.sales_dashboard import router as sales_dashboard_router
 from app.clients_service.generate_pdf import router as generate_pdf_router
 from app.sales.routes import router as sales_router
 from app.cash.routes_cash import router as cash_router
+from app.exports.routes_exports import router as exports_router
+from app.core.responses import BSONJSONResponse
 # from app.database.indexes import create_indexes
-from app.database.mongo import db  
+from app.database.mongo import db, cerrar_clientes
 # from app.database.indexes import create_indexes  
 
 load_dotenv()
 
-app = FastAPI()
+# Logs JSON por cola (ver app/core/logs.py): los handlers nunca escriben en el event loop
+configurar_logs()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    await iniciar_scheduler()
+    await asegurar_indice_numeracion()  # (sede_id, serie, numero) único en invoices
+    yield
+    # Shutdown
+    detener_scheduler()
+    await detener_watcher()  # change stream del calendario (se abre con el primer suscriptor)
+    await detener_workers()  # trabajos de exportación en curso: se retoman en otro proceso
+    detener_executor()  # pool de exportaciones XLSX
+    await numerador.devolver_bloques()  # números arrendados sin usar vuelven a libres
+    cerrar_clientes()  # pools de Mongo (principal y analítica)
+
+
+# orjson + ObjectId/Decimal128/datetime nativos (ver app/core/responses.py)
+app = FastAPI(lifespan=lifespan, default_response_class=BSONJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,8 +79,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras legibles desde el frontend (ETag y cursores de paginación)
+    expose_headers=["ETag", "X-Next-Cursor", "X-Prev-Cursor", "X-Total-Count", "X-Request-ID", "Server-Timing"],
+)
+
+# Compresión de respuestas (calendario y listados: JSON grande y repetitivo).
+# Por debajo del umbral no compensa el coste de CPU.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "6")),
 )
 
+# Consultas a Mongo por petición: métricas, cabecera X-Mongo-Consultas y presupuestos
+app.middleware("http")(middleware_consultas)
+# El último registrado es el más externo: request_id disponible en todo lo demás
+app.middleware("http")(middleware_request_id)
+# Latencia por ruta, Server-Timing y perfilado bajo demanda (app/core/tiempos_peticion.py)
+app.add_middleware(MiddlewareTiempos)
+
+@app.exception_handler(ExecutionTimeout)
+async def consulta_fuera_de_presupuesto(request: Request, exc: ExecutionTimeout):
+    # maxTimeMS agotado (ver PRESUPUESTOS_MS en app/database/mongo.py)
+    return BSONJSONResponse(
+        status_code=503,
+        content={"detail": "La consulta tardó demasiado, intenta con un rango menor"},
+        headers={"Retry-After": "30"}
+    )
+
 @app.get("/")
 async def read_root():
     return {"message": "Bienvenido a la API de Agenda"}
@@ -55,14 +115,13 @@ async def read_root():
 async def health():
     return {"status": "healthy"}
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
-    await iniciar_scheduler()
-    yield
-    # Shutdown
-    detener_scheduler()
-
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Formato Prometheus; METRICS_TOKEN (opcional) exige "Authorization: Bearer <token>"
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        return PlainTextResponse("No autorizado", status_code=401)
+    return PlainTextResponse(exposicion(), media_type="text/plain; version=0.0.4")
 
 
 # @app.on_event("startup")
@@ -88,3 +147,5 @@ app.include_router(sales_dashboard_router, prefix="/api/sales-dashboard")
 app.include_router(generate_pdf_router, prefix="/api/pdf", tags=["Generación de PDF"])
 app.include_router(sales_router)
 app.include_router(cash_router)
+app.include_router(exports_router)
+app.include_router(perfiles_router)
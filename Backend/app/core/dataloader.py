@@ -0,0 +1,145 @@
+"""
+Carga por lotes con alcance de petición (estilo DataLoader)
+===========================================================
+
+Los listados que enriquecen cada fila con un find_one (sede del
+profesional, producto del inventario, servicio de la ficha...) hacen
+1 + N consultas. Con un Cargador:
+
+- todas las llamadas a cargar(clave) hechas en el mismo ciclo del event
+  loop se agrupan en UNA consulta {campo: {"$in": [...]}};
+- cada clave se consulta una sola vez por petición (memo): la sede
+  repetida en 200 filas es un único documento.
+
+El número de consultas depende de cuántas colecciones se tocan, no de
+cuántas filas hay.
+
+Uso (las filas se enriquecen en paralelo para que sus cargas coincidan
+en el mismo ciclo):
+
+    @router.get("/")
+    async def listar(cargadores: Cargadores = Depends(obtener_cargadores)):
+        sedes = cargadores.por(collection_locales, "sede_id")
+
+        async def enriquecer(p):
+            sede = await sedes.cargar(p.get("sede_id"))
+            ...
+
+        await asyncio.gather(*(enriquecer(p) for p in profesionales))
+
+También sirve precargar: await sedes.cargar_varios(ids) y después
+cargar(id) ya no consulta Mongo.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Claves por consulta: $in muy grandes degradan el plan y el tamaño del comando
+MAX_CLAVES_POR_CONSULTA = 1000
+
+
+class Cargador:
+    """
+    Documentos de `collection` por `campo` (o por cualquiera de `campos`:
+    p. ej. servicios por servicio_id o unique_id). Devuelve None si no existe.
+    """
+
+    def __init__(self, collection, campos: Sequence[str], projection: Optional[Dict] = None):
+        self.collection = collection
+        self.campos = tuple(campos)
+        self.projection = projection
+        self._memo: Dict[Hashable, asyncio.Future] = {}
+        self._pendientes: List[Hashable] = []
+        self._despacho_programado = False
+        self.consultas = 0
+
+    async def cargar(self, clave: Hashable) -> Optional[dict]:
+        if clave is None:
+            return None
+        futuro = self._memo.get(clave)
+        if futuro is None:
+            futuro = asyncio.get_running_loop().create_future()
+            self._memo[clave] = futuro
+            self._pendientes.append(clave)
+            self._programar_despacho()
+        return await futuro
+
+    async def cargar_varios(self, claves: Iterable[Hashable]) -> List[Optional[dict]]:
+        return list(await asyncio.gather(*(self.cargar(c) for c in claves)))
+
+    def _programar_despacho(self):
+        if self._despacho_programado:
+            return
+        self._despacho_programado = True
+        # call_soon: corre después de que el resto de tareas listas del
+        # ciclo hayan encolado sus claves
+        asyncio.get_running_loop().call_soon(self._despachar)
+
+    def _despachar(self):
+        self._despacho_programado = False
+        claves, self._pendientes = self._pendientes, []
+        for inicio in range(0, len(claves), MAX_CLAVES_POR_CONSULTA):
+            asyncio.ensure_future(self._consultar(claves[inicio:inicio + MAX_CLAVES_POR_CONSULTA]))
+
+    def _filtro(self, claves: List[Hashable]) -> Dict:
+        condiciones = [{campo: {"$in": claves}} for campo in self.campos]
+        return condiciones[0] if len(condiciones) == 1 else {"$or": condiciones}
+
+    async def _consultar(self, claves: List[Hashable]):
+        self.consultas += 1
+        try:
+            documentos = await self.collection.find(self._filtro(claves), self.projection).to_list(None)
+        except Exception as e:
+            for clave in claves:
+                futuro = self._memo.pop(clave, None)
+                if futuro is not None and not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        encontrados: Dict[Hashable, dict] = {}
+        for doc in documentos:
+            for campo in self.campos:
+                valor = doc.get(campo)
+                if valor is None:
+                    continue
+                try:
+                    encontrados.setdefault(valor, doc)  # primer documento por clave, como find_one
+                except TypeError:  # valor no hashable (lista, dict)
+                    pass
+
+        for clave in claves:
+            futuro = self._memo[clave]
+            if not futuro.done():
+                futuro.set_result(encontrados.get(clave))
+
+
+class Cargadores:
+    """Registro de cargadores de UNA petición (ver obtener_cargadores)."""
+
+    def __init__(self):
+        self._cargadores: Dict[Tuple[str, Tuple[str, ...], Any], Cargador] = {}
+
+    def por(self, collection, *campos: str, projection: Optional[Dict] = None) -> Cargador:
+        if not campos:
+            raise ValueError("Se requiere al menos un campo de búsqueda")
+        llave = (collection.name, campos, repr(projection))
+        cargador = self._cargadores.get(llave)
+        if cargador is None:
+            cargador = Cargador(collection, campos, projection)
+            self._cargadores[llave] = cargador
+        return cargador
+
+    @property
+    def consultas(self) -> int:
+        """Consultas a Mongo hechas por todos los cargadores de la petición."""
+        return sum(c.consultas for c in self._cargadores.values())
+
+
+def obtener_cargadores() -> Cargadores:
+    """
+    Dependencia FastAPI: una instancia nueva por petición (FastAPI la
+    reutiliza entre dependencias de la misma petición).
+    """
+    return Cargadores()
@@ -0,0 +1,88 @@
+"""
+ETag / If-None-Match para listados que el frontend consulta en bucle
+===================================================================
+
+El ETag se calcula SIN leer los documentos completos: una agregación
+$match + $group con el máximo de `ultima_actualizacion` y el número de
+documentos del filtro (cubierta por índice si existe). Si el cliente manda
+el mismo ETag en If-None-Match se responde 304 sin cuerpo.
+
+- Altas → cambia el conteo
+- Ediciones / cambios de estado → cambia el máximo de ultima_actualizacion
+  (todas las escrituras de citas deben actualizar ese campo)
+
+Es un ETag débil (W/): datos enriquecidos con $lookup (nombre del servicio,
+del cliente...) no forman parte de la huella.
+
+Uso:
+    etag = await calcular_etag(collection_citas, filtro, "citas_sede")
+    no_modificado = respuesta_no_modificada(request, etag)
+    if no_modificado:
+        return no_modificado
+    ...
+    return respuesta_con_etag(contenido, etag)
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from bson import json_util
+from fastapi import Request
+from starlette.responses import Response
+
+from app.core.responses import BSONJSONResponse
+
+logger = logging.getLogger(__name__)
+
+CAMPO_VERSION = "ultima_actualizacion"
+
+# El cliente siempre revalida; el 304 hace barata la revalidación
+CACHE_CONTROL = "private, no-cache"
+
+
+async def calcular_etag(collection, filtro: Dict, ambito: str, extra: Any = None) -> str:
+    """
+    Huella del resultado de `filtro`: (máx ultima_actualizacion, conteo).
+    `ambito` y `extra` distinguen endpoints / parámetros que cambian la forma
+    de la respuesta sin cambiar el filtro.
+    """
+    resumen = await collection.aggregate([
+        {"$match": filtro},
+        {"$group": {
+            "_id": None,
+            "version": {"$max": f"${CAMPO_VERSION}"},
+            "total": {"$sum": 1}
+        }}
+    ]).to_list(1)
+
+    version = resumen[0]["version"] if resumen else None
+    total = resumen[0]["total"] if resumen else 0
+
+    huella = json_util.dumps([ambito, filtro, extra, version, total], sort_keys=True)
+    return f'W/"{hashlib.md5(huella.encode()).hexdigest()}"'
+
+
+def _etags_solicitados(valor: str):
+    for etag in valor.split(","):
+        etag = etag.strip()
+        yield etag[2:] if etag.startswith("W/") else etag
+
+
+def respuesta_no_modificada(request: Request, etag: str) -> Optional[Response]:
+    """304 si If-None-Match coincide (comparación débil), None si hay que responder."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+
+    propio = etag[2:] if etag.startswith("W/") else etag
+    if any(e == "*" or e == propio for e in _etags_solicitados(if_none_match)):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def respuesta_con_etag(contenido: Any, etag: str, status_code: int = 200) -> BSONJSONResponse:
+    return BSONJSONResponse(
+        contenido,
+        status_code=status_code,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
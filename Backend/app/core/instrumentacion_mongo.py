@@ -0,0 +1,301 @@
+"""
+Instrumentación de comandos de Mongo por endpoint
+=================================================
+
+Un CommandListener de pymongo (registrado en app/database/mongo.py) anota
+cada comando en la medición de la petición en curso. La medición viaja en
+un ContextVar: Motor ejecuta pymongo en su executor con copy_context(),
+así que los eventos llegan con el contexto de la petición que los lanzó.
+
+Al terminar la petición (middleware_consultas, después de enviar el
+cuerpo: incluye los getMore de los listados en streaming) se publica por
+ruta (plantilla de FastAPI, p. ej. "/scheduling/quotes/{cita_id}"):
+
+    mongo_comandos_total{ruta, comando, coleccion}
+    mongo_comando_segundos{ruta, comando}             (histograma)
+    mongo_documentos_total{ruta, comando, coleccion}
+    mongo_consultas_por_peticion{ruta}                (histograma)
+    mongo_presupuesto_excedido_total{ruta}
+
+Comandos fuera de una petición (scheduler, workers) → ruta "(fondo)".
+
+- Log de consultas lentas (logger app.core.instrumentacion_mongo):
+  comandos de más de MONGO_SLOW_MS ms con ruta, colección y forma del
+  filtro (solo claves, nunca valores).
+- Presupuesto de consultas por endpoint: MONGO_PRESUPUESTO_CONSULTAS
+  (por defecto para todas las rutas) y MONGO_PRESUPUESTOS_RUTA (JSON
+  {"/ruta": n}). Excederlo registra un warning y la métrica; con
+  MONGO_PRESUPUESTO_ESTRICTO=1 (CI / desarrollo) la petición responde 500.
+- Cabecera X-Mongo-Consultas con el total de la petición (en streaming,
+  lo ejecutado hasta enviar las cabeceras).
+
+Para scripts o pruebas:
+    with medir_consultas() as medicion:
+        await listar_inventario(...)
+    assert medicion.consultas <= 4, medicion.resumen()
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.core.metricas import BUCKETS_DOCUMENTOS, contador, histograma
+from app.core.tiempos_peticion import sumar_fase
+
+logger = logging.getLogger(__name__)
+
+MONGO_SLOW_MS = float(os.getenv("MONGO_SLOW_MS", "200"))
+PRESUPUESTO_DEFECTO = int(os.getenv("MONGO_PRESUPUESTO_CONSULTAS", "0"))
+PRESUPUESTOS_RUTA: Dict[str, int] = json.loads(os.getenv("MONGO_PRESUPUESTOS_RUTA", "{}") or "{}")
+PRESUPUESTO_ESTRICTO = os.getenv("MONGO_PRESUPUESTO_ESTRICTO", "0") == "1"
+
+RUTA_FONDO = "(fondo)"
+
+# Comandos de handshake / monitoreo que no son consultas de la app
+COMANDOS_IGNORADOS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue",
+                      "buildInfo", "endSessions", "killCursors"}
+
+COMANDOS = contador("mongo_comandos_total", "Comandos de Mongo por ruta", ("ruta", "comando", "coleccion"))
+DURACION = histograma("mongo_comando_segundos", "Duración de comandos de Mongo", ("ruta", "comando"))
+DOCUMENTOS = contador("mongo_documentos_total", "Documentos devueltos o afectados", ("ruta", "comando", "coleccion"))
+FALLOS = contador("mongo_comandos_fallidos_total", "Comandos de Mongo con error", ("ruta", "comando"))
+CONSULTAS_PETICION = histograma(
+    "mongo_consultas_por_peticion", "Comandos de Mongo por petición", ("ruta",), BUCKETS_DOCUMENTOS
+)
+PRESUPUESTO_EXCEDIDO = contador(
+    "mongo_presupuesto_excedido_total", "Peticiones que superaron su presupuesto de consultas", ("ruta",)
+)
+
+
+class Medicion:
+    """Comandos de una petición, agrupados por (comando, colección)."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.duracion_ms = 0.0
+        self.documentos = 0
+        self.fallidas = 0
+        self.por_comando: Dict[Tuple[str, str], Dict] = {}
+        self._duraciones: list = []
+        self._lock = threading.Lock()
+
+    def anotar(self, comando: str, coleccion: str, duracion_ms: float, documentos: int, fallo: bool = False):
+        with self._lock:
+            self.consultas += 1
+            self.duracion_ms += duracion_ms
+            self.documentos += documentos
+            self.fallidas += int(fallo)
+            fila = self.por_comando.setdefault((comando, coleccion), {"consultas": 0, "duracion_ms": 0.0, "documentos": 0})
+            fila["consultas"] += 1
+            fila["duracion_ms"] += duracion_ms
+            fila["documentos"] += documentos
+            self._duraciones.append((comando, duracion_ms / 1000, fallo))
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            return {
+                "consultas": self.consultas,
+                "duracion_ms": round(self.duracion_ms, 2),
+                "documentos": self.documentos,
+                "por_comando": {f"{c}:{col}": dict(v) for (c, col), v in self.por_comando.items()},
+            }
+
+    def publicar(self, ruta: str):
+        with self._lock:
+            filas = list(self.por_comando.items())
+            duraciones = list(self._duraciones)
+        for (comando, coleccion), fila in filas:
+            COMANDOS.inc((ruta, comando, coleccion), fila["consultas"])
+            DOCUMENTOS.inc((ruta, comando, coleccion), fila["documentos"])
+        for comando, segundos, fallo in duraciones:
+            DURACION.observar((ruta, comando), segundos)
+            if fallo:
+                FALLOS.inc((ruta, comando))
+
+
+_medicion: ContextVar[Optional[Medicion]] = ContextVar("medicion_mongo", default=None)
+_ruta: ContextVar[str] = ContextVar("ruta_mongo", default=RUTA_FONDO)
+
+
+# ============================================================
+# LISTENER
+# ============================================================
+
+def _forma(valor, profundidad: int = 0):
+    """Estructura del filtro sin valores: {"sede_id": "?", "fecha": {"$gte": "?"}}."""
+    if profundidad > 3:
+        return "…"
+    if isinstance(valor, dict):
+        return {k: _forma(v, profundidad + 1) for k, v in list(valor.items())[:12]}
+    if isinstance(valor, list):
+        return [_forma(valor[0], profundidad + 1)] if valor else []
+    return "?"
+
+
+def _documentos(comando: str, respuesta: Dict) -> int:
+    cursor = respuesta.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if comando in ("count", "insert", "update", "delete", "findAndModify"):
+        return int(respuesta.get("n", 0) or 0)
+    return 0
+
+
+class ListenerComandos(monitoring.CommandListener):
+    """Se registra con event_listeners=[listener_comandos] en el cliente."""
+
+    def __init__(self):
+        self._en_curso: Dict[Tuple, Tuple[str, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        comando = event.command
+        coleccion = comando.get(event.command_name)
+        if event.command_name == "getMore":
+            coleccion = comando.get("collection")
+        resumen = {"filtro": comando.get("filter") or comando.get("q") or comando.get("query")}
+        if event.command_name == "aggregate":
+            resumen = {"pipeline": [next(iter(etapa), "?") for etapa in comando.get("pipeline", [])][:15]}
+        with self._lock:
+            self._en_curso[(event.connection_id, event.request_id)] = (
+                coleccion if isinstance(coleccion, str) else "", resumen
+            )
+
+    def _terminar(self, event, respuesta: Optional[Dict], fallo: bool):
+        with self._lock:
+            coleccion, resumen = self._en_curso.pop((event.connection_id, event.request_id), (None, None))
+        if coleccion is None:
+            return
+        duracion_ms = event.duration_micros / 1000
+        documentos = _documentos(event.command_name, respuesta) if respuesta else 0
+
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.anotar(event.command_name, coleccion, duracion_ms, documentos, fallo)
+        else:
+            COMANDOS.inc((RUTA_FONDO, event.command_name, coleccion))
+            DOCUMENTOS.inc((RUTA_FONDO, event.command_name, coleccion), documentos)
+            DURACION.observar((RUTA_FONDO, event.command_name), duracion_ms / 1000)
+            if fallo:
+                FALLOS.inc((RUTA_FONDO, event.command_name))
+
+        if duracion_ms >= MONGO_SLOW_MS:
+            if resumen and resumen.get("filtro") is not None:
+                resumen = {"filtro": _forma(resumen["filtro"])}
+            logger.warning(
+                f"🐢 Mongo lento {duracion_ms:.0f} ms | ruta={_ruta.get()} | "
+                f"{event.command_name} {coleccion} | docs={documentos} | {resumen}"
+            )
+
+    def succeeded(self, event):
+        self._terminar(event, event.reply, False)
+
+    def failed(self, event):
+        self._terminar(event, None, True)
+
+
+listener_comandos = ListenerComandos()
+
+
+# ============================================================
+# PETICIONES
+# ============================================================
+
+def presupuesto_ruta(ruta: str) -> int:
+    return PRESUPUESTOS_RUTA.get(ruta, PRESUPUESTO_DEFECTO)
+
+
+@contextmanager
+def medir_consultas(ruta: str = "(medicion)"):
+    """Mide los comandos lanzados dentro del bloque (mismo contexto async)."""
+    medicion = Medicion()
+    token = _medicion.set(medicion)
+    token_ruta = _ruta.set(ruta)
+    try:
+        yield medicion
+    finally:
+        _medicion.reset(token)
+        _ruta.reset(token_ruta)
+
+
+def _plantilla_ruta(request) -> str:
+    ruta = request.scope.get("route")
+    return getattr(ruta, "path", None) or "(sin ruta)"
+
+
+def _revisar_presupuesto(request, ruta: str, medicion: Medicion) -> bool:
+    """True si la petición superó su presupuesto (registra el warning y la métrica)."""
+    presupuesto = presupuesto_ruta(ruta)
+    if not presupuesto or medicion.consultas <= presupuesto:
+        return False
+    PRESUPUESTO_EXCEDIDO.inc((ruta,))
+    logger.warning(
+        f"⚠️ {request.method} {ruta}: {medicion.consultas} consultas a Mongo "
+        f"(presupuesto {presupuesto}) | {medicion.resumen()['por_comando']}"
+    )
+    return True
+
+
+def _publicar(ruta: str, medicion: Medicion):
+    medicion.publicar(ruta)
+    CONSULTAS_PETICION.observar((ruta,), medicion.consultas)
+
+
+async def _cuerpo_medido(cuerpo, request, ruta: str, medicion: Medicion):
+    """
+    Reenvía el cuerpo y publica la medición cuando termina (o se corta).
+    En un StreamingResponse el cursor se sigue leyendo aquí (getMore), en la
+    tarea de la ruta que conserva el ContextVar, así que esos comandos
+    también se anotan en `medicion`.
+    """
+    duracion_cabeceras = medicion.duracion_ms
+    try:
+        async for trozo in cuerpo:
+            yield trozo
+    finally:
+        sumar_fase("db", (medicion.duracion_ms - duracion_cabeceras) / 1000)
+        _publicar(ruta, medicion)
+        _revisar_presupuesto(request, ruta, medicion)
+
+
+async def middleware_consultas(request, call_next):
+    """
+    Registrar con app.middleware("http")(middleware_consultas).
+
+    call_next devuelve en cuanto salen las cabeceras (con GZip, junto al
+    primer trozo del cuerpo); en un listado en streaming (core/streaming.py)
+    el cursor se sigue leyendo después. Por eso:
+    - X-Mongo-Consultas y el 500 del presupuesto estricto solo ven lo
+      ejecutado hasta ese momento;
+    - las métricas y el warning de presupuesto se publican al terminar el
+      cuerpo, con todas las consultas de la petición.
+    """
+    with medir_consultas(request.url.path) as medicion:
+        respuesta = await call_next(request)
+
+    sumar_fase("db", medicion.duracion_ms / 1000)  # Server-Timing (app/core/tiempos_peticion.py)
+    ruta = _plantilla_ruta(request)
+    respuesta.headers["X-Mongo-Consultas"] = str(medicion.consultas)
+
+    presupuesto = presupuesto_ruta(ruta)
+    if PRESUPUESTO_ESTRICTO and _revisar_presupuesto(request, ruta, medicion):
+        _publicar(ruta, medicion)
+        from fastapi.responses import JSONResponse
+
+        return JSONResponse(
+            status_code=500,
+            content={
+                "detail": f"Presupuesto de consultas excedido: {medicion.consultas} > {presupuesto}",
+                "consultas": medicion.resumen(),
+            },
+        )
+
+    respuesta.body_iterator = _cuerpo_medido(respuesta.body_iterator, request, ruta, medicion)
+    return respuesta
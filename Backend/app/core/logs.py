@@ -0,0 +1,189 @@
+"""
+Logs estructurados sin bloquear el event loop
+=============================================
+
+Los módulos siguen usando `logger = logging.getLogger(__name__)`. Aquí se
+configura el logger raíz una sola vez (configurar_logs(), llamado desde
+core/config.py):
+
+- El handler del raíz es una cola en memoria (QueueHandler): logger.info()
+  solo encola. Un hilo (QueueListener) formatea y escribe en stdout.
+  Si la cola se llena (LOG_QUEUE_SIZE) el registro se descarta y se
+  cuenta en logs_descartados_total (/metrics); nunca se espera al sink.
+- Cada registro es una línea JSON: ts, nivel, logger, mensaje,
+  request_id, campos de extra={...} y excepción si la hay.
+  LOG_FORMAT=texto para una línea legible en desarrollo.
+- request_id: cabecera X-Request-ID entrante (o una nueva) guardada en
+  un ContextVar por middleware_request_id; también llega a los eventos
+  de pymongo, que Motor ejecuta con el contexto de la petición.
+- Muestreo: los registros DEBUG se emiten con probabilidad
+  LOG_DEBUG_SAMPLE (por defecto 0.05) para poder activar LOG_LEVEL=DEBUG
+  en producción sin inundar el sink.
+- Secretos: JWT, hashes bcrypt y valores de password/token/secret/
+  authorization se reemplazan antes de escribir.
+
+Variables: LOG_LEVEL (INFO), LOG_FORMAT (json), LOG_DEBUG_SAMPLE (0.05),
+LOG_QUEUE_SIZE (10000).
+"""
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+
+from app.core.metricas import contador
+
+LOG_NIVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMAT", "json")
+LOG_MUESTREO_DEBUG = float(os.getenv("LOG_DEBUG_SAMPLE", "0.05"))
+LOG_COLA = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+DESCARTADOS = contador("logs_descartados_total", "Registros de log descartados por cola llena")
+
+request_id_actual: ContextVar[str] = ContextVar("request_id", default="-")
+
+_SECRETOS = [
+    (re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*"), "<jwt>"),
+    (re.compile(r"\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}"), "<hash>"),
+    (
+        re.compile(r"(?i)((?:password|contraseña|token|secret|authorization)[\"']?\s*[:=]\s*)(\"[^\"]*\"|'[^']*'|\S+)"),
+        r"\1<oculto>",
+    ),
+]
+
+# Atributos propios de LogRecord: lo demás viene de extra={...}
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+def ocultar_secretos(texto: str) -> str:
+    for patron, reemplazo in _SECRETOS:
+        texto = patron.sub(reemplazo, texto)
+    return texto
+
+
+# ============================================================
+# HANDLERS
+# ============================================================
+
+class FiltroContexto(logging.Filter):
+    """En el hilo que registra: request_id del contexto y muestreo de DEBUG."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and random.random() >= LOG_MUESTREO_DEBUG:
+            return False
+        record.request_id = request_id_actual.get()
+        return True
+
+
+class ColaSinEspera(QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de fallar con la cola llena."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Solo se fija el mensaje: el formateo (y el traceback) se hace en el hilo escritor
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DESCARTADOS.inc()
+
+
+class FormateadorJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        registro = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": ocultar_secretos(record.getMessage()),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD:
+                registro[clave] = valor
+        if record.exc_info:
+            registro["excepcion"] = ocultar_secretos(self.formatException(record.exc_info))
+        elif record.exc_text:
+            registro["excepcion"] = ocultar_secretos(record.exc_text)
+        return orjson.dumps(registro, default=str).decode()
+
+
+class FormateadorTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        return ocultar_secretos(super().format(record))
+
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+
+def configurar_logs():
+    """Instala la cola en el logger raíz (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormateadorJSON() if LOG_FORMATO == "json" else FormateadorTexto())
+
+    cola: queue.Queue = queue.Queue(maxsize=LOG_COLA)
+    handler = ColaSinEspera(cola)
+    handler.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for anterior in list(raiz.handlers):
+        raiz.removeHandler(anterior)
+    raiz.addHandler(handler)
+    raiz.setLevel(LOG_NIVEL)
+
+    _listener = QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(detener_logs)
+
+
+def detener_logs():
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# ============================================================
+# REQUEST ID
+# ============================================================
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+async def middleware_request_id(request, call_next):
+    """Registrar con app.middleware("http")(middleware_request_id), el más externo."""
+    entrante = request.headers.get("x-request-id", "")
+    request_id = entrante if _ID_VALIDO.match(entrante) else uuid.uuid4().hex[:16]
+    token = request_id_actual.set(request_id)
+    try:
+        respuesta = await call_next(request)
+    finally:
+        request_id_actual.reset(token)
+    respuesta.headers["X-Request-ID"] = request_id
+    return respuesta
@@ -0,0 +1,168 @@
+"""
+Métricas en formato Prometheus (sin dependencias)
+=================================================
+
+Contadores, indicadores (gauges) e histogramas con etiquetas, seguros
+entre hilos (los eventos de pymongo llegan desde el executor de Motor).
+GET /metrics devuelve exposicion() en el formato de texto 0.0.4 de
+Prometheus.
+
+Uso:
+    from app.core.metricas import contador, histograma
+
+    PETICIONES = contador("app_peticiones_total", "Peticiones", ("ruta",))
+    PETICIONES.inc(("/health",))
+
+    DURACION = histograma("app_duracion_segundos", "Duración", ("ruta",))
+    DURACION.observar(("/health",), 0.012)
+"""
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_DOCUMENTOS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+_LE_INF = 'le="+Inf"'
+
+_registro: Dict[str, "_Metrica"] = {}
+_lock_registro = threading.Lock()
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...]):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._lock = threading.Lock()
+
+    def lineas(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, valores: Tuple = (), cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return super().lineas() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}" for clave, v in valores
+        ]
+
+
+class Indicador(_Metrica):
+    """Gauge: valor que sube y baja (peticiones en curso, tamaño de colas)."""
+    tipo = "gauge"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, valores: Tuple = (), cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def dec(self, valores: Tuple = (), cantidad: float = 1):
+        self.inc(valores, -cantidad)
+
+    def fijar(self, valores: Tuple, valor: float):
+        with self._lock:
+            self._valores[valores] = valor
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return super().lineas() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}" for clave, v in valores
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # clave → [conteos por bucket..., +Inf, suma]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observar(self, valores: Tuple, valor: float):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = [0] * (len(self.buckets) + 2)
+                self._series[valores] = serie
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += 1
+            serie[-1] += valor
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            series = [(clave, list(serie)) for clave, serie in self._series.items()]
+        lineas = super().lineas()
+        for clave, serie in series:
+            for i, limite in enumerate(self.buckets):
+                le = _etiquetas(self.etiquetas, clave, f'le="{_numero(limite)}"')
+                lineas.append(f"{self.nombre}_bucket{le} {_numero(serie[i])}")
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, _LE_INF)} {_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-1])}")
+        return lineas
+
+
+def _registrar(metrica: _Metrica) -> _Metrica:
+    with _lock_registro:
+        existente = _registro.get(metrica.nombre)
+        if existente is not None:
+            return existente
+        _registro[metrica.nombre] = metrica
+        return metrica
+
+
+def contador(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def indicador(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Indicador:
+    return _registrar(Indicador(nombre, ayuda, etiquetas))
+
+
+def histograma(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+               buckets: Sequence[float] = BUCKETS_SEGUNDOS) -> Histograma:
+    return _registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+
+def exposicion() -> str:
+    with _lock_registro:
+        metricas = list(_registro.values())
+    lineas: List[str] = []
+    for metrica in metricas:
+        lineas.extend(metrica.lineas())
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,276 @@
+"""
+Paginación por cursor (keyset) para listados grandes
+====================================================
+
+En lugar de skip((pagina - 1) * limite) —que recorre y descarta todos los
+documentos anteriores— se continúa desde la última clave vista:
+
+    sort (nombre, _id)  →  nombre > último  OR  (nombre == último AND _id > último_id)
+
+Con un índice que cubra (filtro de igualdad..., campos de orden..., _id) la
+página 1 y la página 1000 cuestan lo mismo.
+
+- El orden SIEMPRE debe terminar en _id (desempate único y estable).
+- Campos de orden nulos o ausentes: Mongo los ordena antes que cualquier
+  valor, pero $gt/$lt nunca los devuelven. La condición los incluye
+  explícitamente (igualdad con null + desempate por _id), así que no se
+  pierden documentos al paginar en ninguna dirección.
+- Los cursores son opacos (base64 de JSON extendido BSON): el cliente solo
+  los devuelve tal cual en `cursor=`.
+- Cada respuesta trae cursor `siguiente` y `anterior` (hacia atrás).
+- El total es opcional: contar_con_cache() lo cachea unos segundos y
+  usa estimated_document_count() cuando no hay filtro.
+
+Uso:
+    from app.core.pagination import paginar_keyset
+
+    pagina = await paginar_keyset(
+        collection_clients, query, [("nombre", 1), ("_id", 1)],
+        limite=30, cursor=cursor, projection=projection
+    )
+    pagina["items"], pagina["siguiente"], pagina["anterior"]
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+
+from app.core.cache import analytics_cache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+CONTEO_CACHE_TTL = 60
+CONTEO_TIMEOUT = 10.0
+
+DIRECCION_SIGUIENTE = "sig"
+DIRECCION_ANTERIOR = "ant"
+
+Orden = Sequence[Tuple[str, int]]
+
+_indices_asegurados: Set[str] = set()
+
+
+# ============================================================
+# CURSORES
+# ============================================================
+
+def _firma_orden(orden: Orden) -> str:
+    return ",".join(f"{campo}:{direccion}" for campo, direccion in orden)
+
+
+def _valor_campo(doc: dict, campo: str) -> Any:
+    valor = doc
+    for parte in campo.split("."):
+        valor = valor.get(parte) if isinstance(valor, dict) else None
+    return valor
+
+
+def codificar_cursor(doc: dict, orden: Orden, direccion: str) -> str:
+    payload = {
+        "v": [_valor_campo(doc, campo) for campo, _ in orden],
+        "d": direccion,
+        "o": _firma_orden(orden),
+    }
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, orden: Orden) -> Tuple[List[Any], str]:
+    """Devuelve (valores, dirección). HTTP 400 si el cursor no es válido para este listado."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor + relleno).decode())
+        valores, direccion = payload["v"], payload["d"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+    if (
+        payload.get("o") != _firma_orden(orden)
+        or direccion not in (DIRECCION_SIGUIENTE, DIRECCION_ANTERIOR)
+        or len(valores) != len(orden)
+    ):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+    return valores, direccion
+
+
+# ============================================================
+# CONSULTA
+# ============================================================
+
+def _despues_de(campo: str, valor: Any, ascendente: bool) -> Optional[Dict]:
+    """
+    Valores de `campo` estrictamente posteriores a `valor` en el recorrido.
+    null/ausente va antes que todo: tras null (ascendente) viene cualquier
+    no nulo; hacia abajo tras un valor vienen los menores y luego los nulos.
+    None si no hay nada después (null recorriendo hacia abajo).
+    """
+    if valor is None:
+        return {campo: {"$ne": None}} if ascendente else None
+    if ascendente:
+        return {campo: {"$gt": valor}}
+    return {"$or": [{campo: {"$lt": valor}}, {campo: None}]}
+
+
+def _condicion_keyset(orden: Orden, valores: List[Any], hacia_adelante: bool) -> Dict:
+    """(a, b, _id) > (va, vb, vid) expandido en un $or que el planner resuelve con el índice."""
+    condiciones = []
+    for i, (campo, direccion) in enumerate(orden):
+        despues = _despues_de(campo, valores[i], (direccion == 1) == hacia_adelante)
+        if despues is None:
+            continue
+        condicion = {c: v for (c, _), v in zip(orden[:i], valores[:i])}
+        condicion.update(despues)
+        condiciones.append(condicion)
+    return condiciones[0] if len(condiciones) == 1 else {"$or": condiciones}
+
+
+async def paginar_keyset(
+    collection,
+    query: Dict,
+    orden: Orden,
+    limite: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict] = None
+) -> Dict:
+    """
+    Una página de `limite` documentos a partir del cursor (o la primera si no hay).
+    Lee limite + 1 para saber si hay más sin contar.
+    """
+    if not orden or orden[-1][0] != "_id":
+        raise ValueError("El orden de paginación debe terminar en _id")
+
+    hacia_adelante = True
+    filtro = query
+    if cursor:
+        valores, direccion = decodificar_cursor(cursor, orden)
+        hacia_adelante = direccion == DIRECCION_SIGUIENTE
+        condicion = _condicion_keyset(orden, valores, hacia_adelante)
+        filtro = {"$and": [query, condicion]} if query else condicion
+
+    orden_consulta = [(c, d if hacia_adelante else -d) for c, d in orden]
+    docs = await collection.find(filtro, projection)\
+        .sort(orden_consulta)\
+        .limit(limite + 1)\
+        .to_list(limite + 1)
+
+    hay_mas = len(docs) > limite
+    docs = docs[:limite]
+
+    if hacia_adelante:
+        tiene_siguiente, tiene_anterior = hay_mas, bool(cursor)
+    else:
+        docs.reverse()
+        tiene_siguiente, tiene_anterior = True, hay_mas
+
+    return {
+        "items": docs,
+        "siguiente": codificar_cursor(docs[-1], orden, DIRECCION_SIGUIENTE) if docs and tiene_siguiente else None,
+        "anterior": codificar_cursor(docs[0], orden, DIRECCION_ANTERIOR) if docs and tiene_anterior else None,
+        "tiene_siguiente": tiene_siguiente and bool(docs),
+        "tiene_anterior": tiene_anterior and bool(docs),
+    }
+
+
+async def ventana_keyset(
+    collection,
+    query: Dict,
+    orden: Orden,
+    limite: int,
+    cursor: Optional[str] = None,
+    etapas_previas: Optional[List[Dict]] = None,
+    ampliar: Optional[Callable[[List[Dict]], List[Dict]]] = None
+) -> Dict:
+    """
+    Prepara una página para recorrerla en streaming SIN cargarla en memoria.
+
+    El cursor siguiente se conoce antes de enviar el primer byte: se leen
+    solo las claves de orden de los documentos limite y limite + 1. La
+    página queda acotada hasta ese documento (inclusive), así una alta
+    concurrente no abre huecos entre páginas.
+
+    `etapas_previas` van tras el $match (p. ej. un $set que normaliza el
+    campo de orden). `ampliar` recibe cada pipeline (empieza con el $match
+    del filtro) y puede añadir otras fuentes, p. ej. con_archivo() para
+    incluir el archivo de citas. Solo hacia adelante.
+
+    Devuelve {"pipeline": [...], "siguiente": str | None}.
+    """
+    if not orden or orden[-1][0] != "_id":
+        raise ValueError("El orden de paginación debe terminar en _id")
+
+    condiciones = []
+    if cursor:
+        valores, direccion = decodificar_cursor(cursor, orden)
+        if direccion != DIRECCION_SIGUIENTE:
+            raise HTTPException(status_code=400, detail="Este listado solo admite cursores hacia adelante")
+        condiciones.append(_condicion_keyset(orden, valores, True))
+
+    base = [{"$match": query}, *(etapas_previas or [])]
+    sort = {"$sort": dict(orden)}
+    ampliar = ampliar or (lambda pipeline: pipeline)
+
+    def con_condiciones(extra: List[Dict]) -> List[Dict]:
+        todas = condiciones + extra
+        if not todas:
+            return []
+        return [{"$match": todas[0] if len(todas) == 1 else {"$and": todas}}]
+
+    claves = await collection.aggregate(ampliar(base + con_condiciones([]) + [
+        sort,
+        {"$skip": limite - 1},
+        {"$limit": 2},
+        {"$project": {campo: 1 for campo, _ in orden}},
+    ])).to_list(2)
+
+    if len(claves) < 2:
+        return {"pipeline": ampliar(base + con_condiciones([]) + [sort, {"$limit": limite}]), "siguiente": None}
+
+    ultimo = claves[0]
+    valores_ultimo = [_valor_campo(ultimo, campo) for campo, _ in orden]
+    hasta_ultimo = {"$or": [_condicion_keyset(orden, valores_ultimo, False), {"_id": ultimo["_id"]}]}
+
+    return {
+        "pipeline": ampliar(base + con_condiciones([hasta_ultimo]) + [sort]),
+        "siguiente": codificar_cursor(ultimo, orden, DIRECCION_SIGUIENTE),
+    }
+
+
+# ============================================================
+# CONTEO Y ÍNDICES
+# ============================================================
+
+async def contar_con_cache(collection, query: Dict, ttl: int = CONTEO_CACHE_TTL) -> int:
+    """
+    Total de documentos del filtro, cacheado `ttl` segundos (compartido entre
+    páginas y usuarios). Sin filtro usa la estimación de metadatos.
+    Devuelve -1 si el conteo supera CONTEO_TIMEOUT.
+    """
+    if not query:
+        return await collection.estimated_document_count()
+
+    huella = hashlib.md5(json_util.dumps(query, sort_keys=True).encode()).hexdigest()
+    key = make_cache_key("conteo", col=collection.name, q=huella)
+
+    async def contar():
+        return await asyncio.wait_for(collection.count_documents(query), timeout=CONTEO_TIMEOUT)
+
+    try:
+        return await analytics_cache.get_or_compute(key, contar, ttl=ttl)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Conteo de {collection.name} superó {CONTEO_TIMEOUT}s")
+        return -1
+
+
+async def asegurar_indice(collection, claves: List[Tuple[str, int]], nombre: str):
+    """create_index una sola vez por proceso (idempotente en Mongo)."""
+    if nombre in _indices_asegurados:
+        return
+    try:
+        await collection.create_index(claves, name=nombre)
+        _indices_asegurados.add(nombre)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo crear el índice {nombre}: {e}")
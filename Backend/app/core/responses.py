@@ -0,0 +1,132 @@
+"""
+Respuestas JSON con orjson conscientes de BSON
+==============================================
+
+- BSONJSONResponse: serializa con orjson en UNA pasada; ObjectId, Decimal128,
+  Decimal, date/datetime, sets y modelos pydantic sin conversores previos.
+  Es la default_response_class de la app (ver core/config.py).
+- BSONRoute: route_class de los routers. FastAPI, antes de llegar a la
+  respuesta, recorre el resultado con jsonable_encoder (o lo valida y
+  re-serializa con pydantic si hay response_model). Para endpoints que
+  devuelven dict/list "sueltos" (sin response_model o con response_model=dict
+  / List[dict]) ese recorrido no aporta nada y además falla con ObjectId,
+  así que el resultado va directo a BSONJSONResponse.
+
+Los endpoints con response_model tipado (modelos pydantic) siguen el flujo
+normal de FastAPI (validación y filtrado de campos) y se serializan igualmente
+con orjson.
+
+Uso:
+    router = APIRouter(prefix="/x", route_class=BSONRoute)
+"""
+import inspect
+from decimal import Decimal
+from typing import Any, Dict, List, get_args, get_origin
+
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from app.core.tiempos_peticion import fase
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Estados sin cuerpo: FastAPI los gestiona de forma especial
+_ESTADOS_SIN_CUERPO = {204, 304}
+
+
+# ============================================================
+# ENCODER
+# ============================================================
+
+def bson_default(obj: Any) -> Any:
+    """
+    Tipos que orjson no conoce. orjson ya serializa datetime/date/UUID/Enum
+    de forma nativa (mismo formato que isoformat()).
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    raise TypeError(f"Tipo no serializable a JSON: {type(obj).__name__}")
+
+
+def dumps_bson(contenido: Any) -> bytes:
+    return orjson.dumps(contenido, default=bson_default, option=ORJSON_OPTIONS)
+
+
+class BSONJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        with fase("render"):
+            return dumps_bson(content)
+
+
+# ============================================================
+# ROUTE CLASS
+# ============================================================
+
+def _es_modelo_generico(modelo: Any) -> bool:
+    """None, dict, list, Any, Dict[...] o List[dict]: nada que validar."""
+    if modelo is None or modelo is Any or modelo in (dict, list, Dict, List):
+        return True
+    origen = get_origin(modelo)
+    if origen is dict:
+        return True
+    if origen is list:
+        argumentos = get_args(modelo)
+        return not argumentos or _es_modelo_generico(argumentos[0])
+    return False
+
+
+def _recibe_response(endpoint) -> bool:
+    """El endpoint modifica la sub-respuesta (cookies/cabeceras) que FastAPI fusiona."""
+    try:
+        parametros = inspect.signature(endpoint).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(
+        inspect.isclass(p.annotation) and issubclass(p.annotation, Response)
+        for p in parametros
+    )
+
+
+class BSONRoute(APIRoute):
+    def get_route_handler(self):
+        clase = self.response_class
+        if isinstance(clase, DefaultPlaceholder):
+            clase = clase.value
+
+        if (
+            inspect.isclass(clase)
+            and issubclass(clase, BSONJSONResponse)
+            and inspect.iscoroutinefunction(self.dependant.call)
+            and _es_modelo_generico(self.response_model)
+            and (self.status_code or 200) not in _ESTADOS_SIN_CUERPO
+            and not _recibe_response(self.endpoint)
+        ):
+            self.dependant.call = _envolver_endpoint(self.dependant.call, clase, self.status_code or 200)
+
+        return super().get_route_handler()
+
+
+def _envolver_endpoint(endpoint, clase, status_code: int):
+    async def endpoint_bson(*args, **kwargs):
+        contenido = await endpoint(*args, **kwargs)
+        if isinstance(contenido, Response):
+            return contenido
+        return clase(contenido, status_code=status_code)
+
+    return endpoint_bson
@@ -0,0 +1,172 @@
+"""
+Listados en streaming (JSON por trozos / NDJSON)
+================================================
+
+Para listados que pueden crecer sin límite (todas las citas de una sede,
+todos sus clientes...). En lugar de to_list(None) + serializar todo:
+
+- el cursor de Motor se recorre con batch_size y cada documento se
+  serializa y se envía al vuelo (memoria del worker ≈ un lote);
+- cada petición devuelve como máximo `limit` documentos (LIMITE_MAX) y la
+  siguiente página se pide con el cursor de X-Next-Cursor (keyset, ver
+  core/pagination.ventana_keyset);
+- formato=json (por defecto) mantiene la forma de la respuesta de siempre
+  (array u objeto); formato=ndjson envía un documento por línea.
+
+Errores: el primer lote se pide ANTES de crear la StreamingResponse, así que
+un fallo al abrir el cursor o en el primer lote llega a la ruta como
+excepción normal (500, o 503 si es ExecutionTimeout). Si el cursor falla a
+mitad del cuerpo las cabeceras ya salieron: se registra y se relanza para
+que la conexión se corte en lugar de cerrarse como una respuesta completa.
+
+Uso:
+    ventana = await ventana_keyset(collection, query, orden, limit, cursor)
+    return await respuesta_stream(
+        collection.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+        formato, siguiente=ventana["siguiente"], transformar=cita_to_dict
+    )
+"""
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+
+from app.core.responses import dumps_bson
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+LIMITE_DEFECTO = 1000
+LIMITE_MAX = 5000
+
+# Se acumulan documentos hasta ~64 KB por trozo (menos escrituras al socket)
+TAMANO_TROZO = 64 * 1024
+
+FORMATO_JSON = "json"
+FORMATO_NDJSON = "ndjson"
+
+TIPOS_CONTENIDO = {
+    FORMATO_JSON: "application/json",
+    FORMATO_NDJSON: "application/x-ndjson",
+}
+
+
+def parametro_limite(defecto: int = LIMITE_DEFECTO):
+    return Query(defecto, ge=1, le=LIMITE_MAX, description=f"Máximo {LIMITE_MAX} por página")
+
+
+def parametro_formato():
+    return Query(FORMATO_JSON, pattern="^(json|ndjson)$", description="json (por defecto) o ndjson")
+
+
+async def _primer_lote(cursor) -> List[dict]:
+    """
+    Primer documento del cursor (Motor trae con él el primer lote completo).
+    Los errores se propagan a la ruta, antes de enviar las cabeceras.
+    """
+    try:
+        return [await cursor.__anext__()]
+    except StopAsyncIteration:
+        return []
+
+
+async def _documentos(
+    primeros: List[dict],
+    cursor,
+    transformar: Optional[Callable[[dict], Any]]
+) -> AsyncIterator[Any]:
+    for doc in primeros:
+        yield transformar(doc) if transformar else doc
+    if not primeros:
+        return
+    async for doc in cursor:
+        yield transformar(doc) if transformar else doc
+
+
+async def _cuerpo_json(
+    documentos: AsyncIterator[Any],
+    envoltura: Optional[Dict],
+    clave_items: str,
+    siguiente: Optional[str]
+) -> AsyncIterator[bytes]:
+    """
+    Sin envoltura: [doc, doc, ...]
+    Con envoltura: {...envoltura, "<clave_items>": [...], "total": n, "siguiente": cursor}
+    """
+    if envoltura is None:
+        trozo = bytearray(b"[")
+    else:
+        cabecera = dumps_bson(envoltura)
+        trozo = bytearray(cabecera[:-1])  # sin la llave de cierre
+        if len(envoltura):
+            trozo += b","
+        trozo += dumps_bson(clave_items) + b":["
+
+    total = 0
+    try:
+        async for doc in documentos:
+            if total:
+                trozo += b","
+            trozo += dumps_bson(doc)
+            total += 1
+            if len(trozo) >= TAMANO_TROZO:
+                yield bytes(trozo)
+                trozo.clear()
+    except Exception as e:
+        # Las cabeceras ya salieron: se relanza para abortar la conexión
+        logger.error(f"❌ Error en listado en streaming tras {total} documentos: {e}", exc_info=True)
+        raise
+
+    if envoltura is None:
+        trozo += b"]"
+    else:
+        trozo += b'],"total":' + dumps_bson(total) + b',"siguiente":' + dumps_bson(siguiente) + b"}"
+    yield bytes(trozo)
+
+
+async def _cuerpo_ndjson(documentos: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    trozo = bytearray()
+    total = 0
+    try:
+        async for doc in documentos:
+            trozo += dumps_bson(doc) + b"\n"
+            total += 1
+            if len(trozo) >= TAMANO_TROZO:
+                yield bytes(trozo)
+                trozo.clear()
+    except Exception as e:
+        logger.error(f"❌ Error en listado NDJSON tras {total} documentos: {e}", exc_info=True)
+        raise
+    yield bytes(trozo)
+
+
+async def respuesta_stream(
+    cursor,
+    formato: str = FORMATO_JSON,
+    siguiente: Optional[str] = None,
+    transformar: Optional[Callable[[dict], Any]] = None,
+    envoltura: Optional[Dict] = None,
+    clave_items: str = "items",
+    total: Optional[int] = None,
+    cabeceras: Optional[Dict[str, str]] = None
+) -> StreamingResponse:
+    """
+    StreamingResponse sobre un cursor de Motor (find / aggregate).
+    El cursor siguiente y el total (si se pidió) van en cabeceras para
+    ambos formatos; en JSON con envoltura también al final del cuerpo.
+    Se espera al primer lote: sus errores los maneja la ruta.
+    """
+    headers = dict(cabeceras or {})
+    if siguiente:
+        headers["X-Next-Cursor"] = siguiente
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+
+    documentos = _documentos(await _primer_lote(cursor), cursor, transformar)
+    if formato == FORMATO_NDJSON:
+        cuerpo = _cuerpo_ndjson(documentos)
+    else:
+        cuerpo = _cuerpo_json(documentos, envoltura, clave_items, siguiente)
+
+    return StreamingResponse(cuerpo, media_type=TIPOS_CONTENIDO.get(formato, TIPOS_CONTENIDO[FORMATO_JSON]), headers=headers)
@@ -0,0 +1,250 @@
+"""
+Tiempos por petición: latencia por ruta, Server-Timing y perfilado
+==================================================================
+
+MiddlewareTiempos (ASGI puro, el más externo; ver core/config.py) mide
+cada petición HTTP y publica en /metrics:
+
+    http_peticion_segundos{ruta, metodo}          (histograma)
+    http_peticiones_en_curso{metodo}               (gauge)
+    http_respuestas_total{ruta, metodo, estado}
+    http_fase_segundos{ruta, fase}                 (histograma)
+
+`ruta` es la plantilla de FastAPI ("/scheduling/quotes/{cita_id}"), no la
+URL: la cardinalidad queda acotada al número de endpoints.
+
+Fases: cada respuesta lleva
+    Server-Timing: auth;dur=3.1, db;dur=18.4, render;dur=0.9, total;dur=31.0
+con las fases que la petición usó:
+    auth    get_current_user (JWT + usuario)
+    db      tiempo de comandos de Mongo (app/core/instrumentacion_mongo.py)
+    render  serialización de la respuesta (BSONJSONResponse.render)
+    email   envío SMTP
+Se anotan con @medir_fase("x") o `with fase("x"):`. Si varias corren en
+paralelo (asyncio.gather) sus tiempos se suman y pueden superar el total.
+
+Perfilado bajo demanda (pyinstrument, opcional):
+- Solo si PERFIL_TOKEN está definido y pyinstrument instalado. Sin la
+  cabecera el middleware no hace nada más que medir.
+- Petición con `X-Perfil: <PERFIL_TOKEN>` → se perfila esa petición
+  (muestreo cada PERFIL_INTERVALO_S) y la respuesta trae X-Perfil-Id.
+- Un solo perfil a la vez; si hay otro en curso la petición sigue sin
+  perfilar. Se guardan los últimos PERFILES_MAX en memoria.
+- GET /perfiles y GET /perfiles/{perfil_id} (misma cabecera) devuelven
+  el listado y el informe HTML:
+      curl -H "X-Perfil: $PERFIL_TOKEN" https://.../perfiles/<id> > perfil.html
+"""
+import asyncio
+import functools
+import hmac
+import importlib.util
+import inspect
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import HTMLResponse
+from starlette.datastructures import MutableHeaders
+
+from app.core.metricas import contador, histograma, indicador
+
+logger = logging.getLogger(__name__)
+
+FASES = ("auth", "db", "render", "email")
+
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_INTERVALO_S = float(os.getenv("PERFIL_INTERVALO_S", "0.001"))
+PERFILES_MAX = 20
+PYINSTRUMENT_DISPONIBLE = importlib.util.find_spec("pyinstrument") is not None
+
+LATENCIA = histograma("http_peticion_segundos", "Latencia de peticiones HTTP", ("ruta", "metodo"))
+EN_CURSO = indicador("http_peticiones_en_curso", "Peticiones HTTP en curso", ("metodo",))
+RESPUESTAS = contador("http_respuestas_total", "Respuestas HTTP por estado", ("ruta", "metodo", "estado"))
+FASE = histograma("http_fase_segundos", "Tiempo por fase de la petición", ("ruta", "fase"))
+
+_fases: ContextVar[Optional[Dict[str, float]]] = ContextVar("fases_peticion", default=None)
+
+_perfiles: "OrderedDict[str, Dict]" = OrderedDict()
+_perfil_en_curso = False
+
+
+# ============================================================
+# FASES
+# ============================================================
+
+def sumar_fase(nombre: str, segundos: float):
+    """Suma tiempo a una fase de la petición en curso (sin petición: no hace nada)."""
+    fases = _fases.get()
+    if fases is not None:
+        fases[nombre] = fases.get(nombre, 0.0) + segundos
+
+
+@contextmanager
+def fase(nombre: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        sumar_fase(nombre, time.perf_counter() - inicio)
+
+
+def medir_fase(nombre: str):
+    """Decorador para funciones sync o async; conserva la firma (dependencias de FastAPI)."""
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                with fase(nombre):
+                    return await funcion(*args, **kwargs)
+        else:
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with fase(nombre):
+                    return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def server_timing(fases: Dict[str, float], total: float) -> str:
+    partes = [f"{nombre};dur={fases[nombre] * 1000:.1f}" for nombre in FASES if nombre in fases]
+    partes.extend(f"{nombre};dur={s * 1000:.1f}" for nombre, s in fases.items() if nombre not in FASES)
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+def _plantilla_ruta(scope) -> str:
+    ruta = scope.get("route")
+    return getattr(ruta, "path", None) or "(sin ruta)"
+
+
+# ============================================================
+# PERFILADO
+# ============================================================
+
+def _token_valido(valor: Optional[str]) -> bool:
+    return bool(PERFIL_TOKEN) and bool(valor) and hmac.compare_digest(valor, PERFIL_TOKEN)
+
+
+def _iniciar_perfil(scope) -> Optional[Dict]:
+    global _perfil_en_curso
+    if not PERFIL_TOKEN or not PYINSTRUMENT_DISPONIBLE:
+        return None
+    cabecera = dict(scope.get("headers") or []).get(b"x-perfil")
+    if not _token_valido(cabecera.decode("latin-1") if cabecera else None):
+        return None
+    if _perfil_en_curso:
+        logger.info("⏭️ Perfil pedido con otro en curso: la petición sigue sin perfilar")
+        return None
+
+    from pyinstrument import Profiler
+
+    profiler = Profiler(interval=PERFIL_INTERVALO_S, async_mode="enabled")
+    profiler.start()
+    _perfil_en_curso = True
+    return {"id": uuid.uuid4().hex[:12], "profiler": profiler}
+
+
+async def _guardar_perfil(perfil: Dict, ruta: str, metodo: str, duracion: float):
+    global _perfil_en_curso
+    try:
+        perfil["profiler"].stop()
+    finally:
+        _perfil_en_curso = False
+    try:
+        # El informe HTML se genera fuera del event loop
+        html = await asyncio.to_thread(perfil["profiler"].output_html)
+    except Exception as e:
+        logger.error(f"❌ Error generando el perfil {perfil['id']}: {e}")
+        return
+    _perfiles[perfil["id"]] = {
+        "perfil_id": perfil["id"],
+        "ruta": ruta,
+        "metodo": metodo,
+        "duracion_ms": round(duracion * 1000, 1),
+        "creado": datetime.utcnow(),
+        "html": html,
+    }
+    while len(_perfiles) > PERFILES_MAX:
+        _perfiles.popitem(last=False)
+    logger.info(f"🔬 Perfil {perfil['id']} guardado: {metodo} {ruta} ({duracion * 1000:.0f} ms)")
+
+
+router = APIRouter(tags=["Diagnóstico"])
+
+
+def _exigir_token(request: Request):
+    if not _token_valido(request.headers.get("x-perfil")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/perfiles", include_in_schema=False)
+async def listar_perfiles(request: Request):
+    _exigir_token(request)
+    return {
+        "pyinstrument": PYINSTRUMENT_DISPONIBLE,
+        "perfiles": [{k: v for k, v in p.items() if k != "html"} for p in reversed(_perfiles.values())],
+    }
+
+
+@router.get("/perfiles/{perfil_id}", include_in_schema=False)
+async def ver_perfil(perfil_id: str, request: Request):
+    _exigir_token(request)
+    perfil = _perfiles.get(perfil_id)
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return HTMLResponse(perfil["html"])
+
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+
+class MiddlewareTiempos:
+    """Registrar con app.add_middleware(MiddlewareTiempos) después de los demás (queda por fuera)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        fases: Dict[str, float] = {}
+        token = _fases.set(fases)
+        estado = 500
+        perfil = _iniciar_perfil(scope)
+        inicio = time.perf_counter()
+        EN_CURSO.inc((metodo,))
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                cabeceras = MutableHeaders(scope=mensaje)
+                cabeceras.append("Server-Timing", server_timing(fases, time.perf_counter() - inicio))
+                if perfil:
+                    cabeceras.append("X-Perfil-Id", perfil["id"])
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracion = time.perf_counter() - inicio
+            EN_CURSO.dec((metodo,))
+            _fases.reset(token)
+            ruta = _plantilla_ruta(scope)
+            LATENCIA.observar((ruta, metodo), duracion)
+            RESPUESTAS.inc((ruta, metodo, str(estado)))
+            for nombre, segundos in fases.items():
+                FASE.observar((ruta, nombre), segundos)
+            if perfil:
+                await _guardar_perfil(perfil, ruta, metodo, duracion)
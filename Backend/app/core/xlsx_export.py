@@ -0,0 +1,216 @@
+"""
+Exportación XLSX en streaming
+=============================
+
+openpyxl en modo write-only: cada fila se escribe al XML de la hoja en
+cuanto se añade (no existe la rejilla de celdas en memoria) y los estilos
+son NamedStyle compartidos, registrados una vez por libro, en lugar de
+objetos Font / Fill / Border por celda.
+
+- La generación corre en un pool acotado (EXPORT_WORKERS) de hilos, o de
+  procesos con EXPORT_EN_PROCESO=1, nunca en el event loop.
+- El archivo se escribe en disco (EXPORT_TMP_DIR) y se envía por trozos
+  con FileResponse; se borra al terminar la descarga.
+
+Memoria: los datos de entrada + una fila. El tamaño del libro no cuenta.
+
+Uso:
+    def escribir(destino: str, filas: list):
+        libro = LibroXlsx()
+        hoja = libro.hoja("Datos", anchos=[20, 30])
+        hoja.fila(hoja.celda("Título", "rf_titulo"))
+        for f in filas:
+            hoja.fila(f["a"], hoja.celda(f["b"], "rf_moneda"))
+        libro.guardar(destino)
+
+    ruta = await generar_xlsx(escribir, filas)
+    return respuesta_xlsx(ruta, "reporte.xlsx")
+"""
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_EN_PROCESO = os.getenv("EXPORT_EN_PROCESO", "0") == "1"
+EXPORT_TMP_DIR = os.getenv("EXPORT_TMP_DIR") or None
+
+FORMATO_MONEDA = "#,##0.00"
+FORMATO_ENTERO = "#,##0"
+
+
+# ============================================================
+# ESTILOS COMPARTIDOS
+# ============================================================
+
+def _estilo(nombre: str, font: Optional[Font] = None, alineacion: Optional[Alignment] = None,
+            formato: Optional[str] = None, relleno: Optional[PatternFill] = None,
+            borde: Optional[Border] = None) -> NamedStyle:
+    estilo = NamedStyle(name=nombre)
+    # Sin fuente explícita: la de una celda sin estilo (NamedStyle no trae tamaño)
+    estilo.font = font if font is not None else _FUENTE_DEFECTO
+    if alineacion is not None:
+        estilo.alignment = alineacion
+    if formato is not None:
+        estilo.number_format = formato
+    if relleno is not None:
+        estilo.fill = relleno
+    if borde is not None:
+        estilo.border = borde
+    return estilo
+
+
+def _relleno(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+_FUENTE_DEFECTO = Font(name="Calibri", size=11)
+_CENTRO = Alignment(horizontal="center", vertical="center")
+_DERECHA = Alignment(horizontal="right", vertical="center")
+
+
+def _estilos_base() -> List[NamedStyle]:
+    return [
+        _estilo("rf_titulo", Font(name="Arial", size=14, bold=True), _CENTRO),
+        _estilo("rf_subtitulo", Font(name="Arial", size=12, bold=True), _CENTRO),
+        _estilo("rf_encabezado", Font(name="Arial", size=10, bold=True)),
+        _estilo("rf_encabezado_centro", Font(name="Arial", size=10, bold=True), _CENTRO),
+        _estilo("rf_seccion", Font(name="Arial", size=10, bold=True), relleno=_relleno("E0E0E0")),
+        _estilo("rf_normal", Font(name="Arial", size=10)),
+        _estilo("rf_normal_centro", Font(name="Arial", size=10), _CENTRO),
+        _estilo("rf_centro", alineacion=_CENTRO),
+        _estilo("rf_total", Font(name="Arial", size=11, bold=True)),
+        _estilo("rf_moneda", alineacion=_DERECHA, formato=FORMATO_MONEDA),
+        _estilo("rf_moneda_simple", formato=FORMATO_MONEDA),
+        _estilo("rf_entero", formato=FORMATO_ENTERO),
+        _estilo("rf_moneda_total", Font(name="Arial", size=11, bold=True), _DERECHA, FORMATO_MONEDA),
+        _estilo("rf_moneda_total_verde", Font(name="Arial", size=11, bold=True), _DERECHA, FORMATO_MONEDA,
+                _relleno("C6EFCE")),
+        _estilo("rf_moneda_total_rojo", Font(name="Arial", size=11, bold=True), _DERECHA, FORMATO_MONEDA,
+                _relleno("FFC7CE")),
+        _estilo("rf_linea", borde=Border(bottom=Side(style="medium"))),
+        _estilo("rf_linea_suma", borde=Border(top=Side(style="thin"))),
+    ]
+
+
+# ============================================================
+# LIBRO / HOJA
+# ============================================================
+
+class HojaXlsx:
+    """Hoja write-only: solo se puede añadir filas, de arriba hacia abajo."""
+
+    def __init__(self, ws, anchos: Optional[Sequence[float]] = None):
+        self.ws = ws
+        self.filas = 0
+        # Los anchos de columna deben fijarse ANTES de escribir la primera fila
+        for col, ancho in enumerate(anchos or [], start=1):
+            ws.column_dimensions[get_column_letter(col)].width = ancho
+
+    def celda(self, valor: Any, estilo: Optional[str] = None) -> WriteOnlyCell:
+        celda = WriteOnlyCell(self.ws, value=valor)
+        if estilo:
+            celda.style = estilo
+        return celda
+
+    def fila(self, *valores: Any):
+        self.ws.append(list(valores))
+        self.filas += 1
+
+    def vacia(self, cantidad: int = 1):
+        for _ in range(cantidad):
+            self.fila()
+
+    def fila_combinada(self, valor: Any, columnas: int, estilo: Optional[str] = None):
+        """Texto en A combinado hasta la columna `columnas` (títulos, líneas)."""
+        self.fila(self.celda(valor, estilo))
+        self.ws.merged_cells.add(f"A{self.filas}:{get_column_letter(columnas)}{self.filas}")
+
+
+class LibroXlsx:
+    def __init__(self, estilos: Optional[List[NamedStyle]] = None):
+        self.wb = Workbook(write_only=True)
+        for estilo in estilos or _estilos_base():
+            self.wb.add_named_style(estilo)
+
+    def hoja(self, titulo: str, anchos: Optional[Sequence[float]] = None) -> HojaXlsx:
+        return HojaXlsx(self.wb.create_sheet(title=titulo), anchos)
+
+    def guardar(self, destino: str):
+        self.wb.save(destino)
+
+
+# ============================================================
+# EJECUCIÓN FUERA DEL EVENT LOOP
+# ============================================================
+
+_executor: Optional[Executor] = None
+
+
+def _obtener_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if EXPORT_EN_PROCESO:
+            _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="xlsx")
+    return _executor
+
+
+def _borrar(ruta: str):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo borrar el temporal {ruta}: {e}")
+
+
+async def generar_xlsx(escribir: Callable[..., None], *args: Any, **kwargs: Any) -> str:
+    """
+    Ejecuta escribir(destino, *args, **kwargs) en el pool y devuelve la ruta
+    del archivo temporal. Con EXPORT_EN_PROCESO=1, `escribir` debe ser una
+    función de módulo y los argumentos serializables (pickle).
+    """
+    fd, ruta = tempfile.mkstemp(prefix="export_", suffix=".xlsx", dir=EXPORT_TMP_DIR)
+    os.close(fd)
+
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_obtener_executor(), functools.partial(escribir, ruta, *args, **kwargs))
+    except Exception:
+        _borrar(ruta)
+        raise
+    return ruta
+
+
+def respuesta_xlsx(ruta: str, nombre_archivo: str, cabeceras: Optional[Dict[str, str]] = None) -> FileResponse:
+    """Descarga por trozos del archivo generado; se borra al terminar."""
+    return FileResponse(
+        ruta,
+        media_type=MEDIA_TYPE_XLSX,
+        filename=nombre_archivo,
+        headers=cabeceras,
+        background=BackgroundTask(_borrar, ruta),
+    )
+
+
+def detener_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,7 +1,10 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+import importlib.util
 import os
 from dotenv import load_dotenv
 
+from app.core.instrumentacion_mongo import listener_comandos
+
 load_dotenv()
 
 uri = os.getenv("MONGODB_URI")
@@ -10,8 +13,96 @@ db_name = os.getenv("MONGODB_NAME", "DataAgenda")
 if not uri:
     raise RuntimeError("MONGODB_URI no está definida en .env")
 
-client = AsyncIOMotorClient(uri)
+# ============================================================
+# CLIENTES
+# ============================================================
+# Dos clientes con pools separados: las reservas (primario) nunca esperan
+# conexiones ocupadas por dashboards o reportes, que leen de secundarios.
+
+APP_NAME = os.getenv("MONGODB_APP_NAME", "appagenda")
+
+# Módulo que necesita pymongo para cada compresor (zlib viene con Python)
+_MODULOS_COMPRESION = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _compresores() -> list:
+    """Compresores pedidos en MONGODB_COMPRESSORS que están instalados."""
+    pedidos = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib").split(",")
+    return [
+        c.strip() for c in pedidos
+        if c.strip() in _MODULOS_COMPRESION and importlib.util.find_spec(_MODULOS_COMPRESION[c.strip()])
+    ]
+
+
+OPCIONES_CLIENTE = {
+    "appname": APP_NAME,
+    "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL", "100")),
+    "minPoolSize": int(os.getenv("MONGODB_MIN_POOL", "5")),
+    "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_MS", "300000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGODB_CONNECT_MS", "5000")),
+    "retryWrites": True,
+    "retryReads": True,
+    # Comandos por ruta, consultas lentas y presupuestos (app/core/instrumentacion_mongo.py)
+    "event_listeners": [listener_comandos],
+}
+if _compresores():
+    OPCIONES_CLIENTE["compressors"] = ",".join(_compresores())
+
+OPCIONES_ANALITICA = {
+    **OPCIONES_CLIENTE,
+    "appname": f"{APP_NAME}-analytics",
+    "maxPoolSize": int(os.getenv("MONGODB_ANALYTICS_MAX_POOL", "20")),
+    "minPoolSize": 0,
+    "readPreference": "secondaryPreferred",
+    # Mínimo permitido por el driver: 90 s
+    "maxStalenessSeconds": max(90, int(os.getenv("MONGODB_ANALYTICS_MAX_STALENESS", "120"))),
+}
+
+client = AsyncIOMotorClient(uri, **OPCIONES_CLIENTE)
 db = client[db_name]
+
+client_analitica = AsyncIOMotorClient(os.getenv("MONGODB_ANALYTICS_URI", uri), **OPCIONES_ANALITICA)
+db_analitica = client_analitica[db_name]
+
+
+def para_analitica(collection):
+    """Misma colección leída con el cliente de analítica (secundarios, pool propio). Solo lectura."""
+    return db_analitica.get_collection(collection.name)
+
+
+# ============================================================
+# PRESUPUESTOS DE TIEMPO (maxTimeMS) POR CLASE DE CONSULTA
+# ============================================================
+# El servidor corta la consulta al agotar el presupuesto (ExecutionTimeout
+# → 503 en core/config.py). 0 = sin límite.
+
+PRESUPUESTOS_MS = {
+    "reserva": int(os.getenv("MONGODB_BUDGET_RESERVA_MS", "2000")),
+    "lectura": int(os.getenv("MONGODB_BUDGET_LECTURA_MS", "5000")),
+    "analitica": int(os.getenv("MONGODB_BUDGET_ANALITICA_MS", "20000")),
+    "reporte": int(os.getenv("MONGODB_BUDGET_REPORTE_MS", "120000")),
+    "mantenimiento": int(os.getenv("MONGODB_BUDGET_MANTENIMIENTO_MS", "0")),
+}
+
+
+def tiempo_max(clase: str, cursor: bool = False) -> dict:
+    """
+    kwargs con el presupuesto de la clase:
+        aggregate(p, **tiempo_max("analitica")) / count_documents(f, **tiempo_max(...))
+        find(f, **tiempo_max("reserva", cursor=True)) / find_one(...)
+    """
+    limite = PRESUPUESTOS_MS[clase]
+    if not limite:
+        return {}
+    return {"max_time_ms": limite} if cursor else {"maxTimeMS": limite}
+
+
+def cerrar_clientes():
+    client.close()
+    client_analitica.close()
+
 collection_auth = db["users_auth"]
 collection_estilista = db["stylist"]
 collection_admin_sede = db["users_auth"]
@@ -35,5 +126,13 @@ collection_inventory_motions = db["inventory_motions"]  # Nueva colección
 collection_cash_expenses = db["cash_expenses"]
 collection_cash_ingresos = db["cash_ingresos"]
 collection_cash_closures = db["cash_closures"]
+collection_client_visit_stats = db["client_visit_stats"]  # Proyección de visitas por cliente
+collection_sales_daily = db["sales_daily"]  # Cubo diario de ventas por sede/moneda
+collection_citas_eliminadas = db["appointments_tombstones"]  # Tombstones para delta-sync del calendario
+collection_citas_archivo = db["appointments_archive"]  # Citas cerradas antiguas (quotes/archivo_citas.py)
+collection_export_jobs = db["export_jobs"]  # Exportaciones en segundo plano (app/exports)
+collection_inventory_forecast = db["inventory_forecast"]  # Pronóstico nocturno de consumo por sede/producto
+collection_invoice_counters = db["invoice_counters"]  # Numeración de comprobantes por sede/serie (app/bills/numeracion)
+collection_migraciones = db["migrations"]  # Checkpoints de migraciones por lotes
 def connect_to_mongo():
     pass
@@ -0,0 +1,400 @@
+"""
+Trabajos de exportación en segundo plano
+========================================
+
+Los reportes pesados (Excel de caja de un trimestre, churn de toda la
+cadena...) no se generan dentro de la petición HTTP:
+
+    POST /exports            → 202 {job_id, estado}
+    GET  /exports/{job_id}   → estado + progreso
+    GET  /exports/{job_id}/descarga
+
+- Cada trabajo es un documento en `export_jobs`; cualquier proceso de la
+  API puede consultarlo o ejecutarlo.
+- Deduplicación: huella = sha256(tipo + parámetros normalizados). Un
+  índice único parcial ({activo: true}) impide dos trabajos idénticos en
+  curso; la segunda petición recibe el job_id del primero.
+- Cada proceso corre EXPORT_JOB_WORKERS bucles que reclaman el trabajo
+  pendiente más antiguo (find_one_and_update atómico). Mientras ejecutan
+  renuevan `latido`; si un proceso muere, otro reclama el trabajo cuando
+  el latido vence (hasta MAX_INTENTOS).
+- El artefacto va a disco local o S3 (exports/storage.py) y caduca a las
+  EXPORT_TTL_HORAS; el documento se borra por TTL días después.
+
+Tipos de exportación: exports/tipos.py (registrar_tipo).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.database.mongo import collection_export_jobs
+from app.exports.storage import borrar_archivo, guardar_archivo
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+EXPORT_TTL_HORAS = int(os.getenv("EXPORT_TTL_HORAS", "24"))
+EXPORT_JOB_TIMEOUT = int(os.getenv("EXPORT_JOB_TIMEOUT", "900"))
+
+INTERVALO_SONDEO = 2.0  # segundos entre búsquedas de trabajo cuando la cola está vacía
+INTERVALO_LATIDO = 15
+LATIDO_VENCIDO = timedelta(seconds=INTERVALO_LATIDO * 4)
+INTERVALO_LIMPIEZA = 300
+MAX_INTENTOS = 3
+RETENCION_DOCUMENTO = timedelta(days=7)
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+EXPIRADO = "expirado"
+
+# (ruta_temporal, nombre_archivo, media_type)
+Resultado = Tuple[str, str, str]
+Progreso = Callable[[int, Optional[str]], Awaitable[None]]
+
+_tipos: Dict[str, Dict[str, Callable]] = {}
+_workers: List[asyncio.Task] = []
+_hay_trabajo = asyncio.Event()
+_indices_listos = False
+_ultima_limpieza: Optional[datetime] = None
+
+
+# ============================================================
+# REGISTRO DE TIPOS
+# ============================================================
+
+def registrar_tipo(
+    nombre: str,
+    preparar: Callable[[Dict, Dict], Dict],
+    ejecutar: Callable[[Dict, Progreso], Awaitable[Resultado]]
+):
+    """
+    preparar(parametros, usuario) → parámetros normalizados (valida y lanza
+        HTTPException; corre en la petición, antes de crear el trabajo).
+    ejecutar(parametros, progreso) → (ruta_temporal, nombre, media_type).
+    """
+    _tipos[nombre] = {"preparar": preparar, "ejecutar": ejecutar}
+
+
+def tipos_disponibles() -> List[str]:
+    return sorted(_tipos)
+
+
+# ============================================================
+# CREACIÓN / CONSULTA
+# ============================================================
+
+def calcular_huella(tipo: str, parametros: Dict) -> str:
+    contenido = json_util.dumps({"tipo": tipo, "parametros": parametros}, sort_keys=True)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+async def _asegurar_indices():
+    global _indices_listos
+    if _indices_listos:
+        return
+    try:
+        await collection_export_jobs.create_index("job_id", name="export_jobs_job_id", unique=True)
+        await collection_export_jobs.create_index(
+            "huella", name="export_jobs_huella_activo", unique=True,
+            partialFilterExpression={"activo": True}
+        )
+        await collection_export_jobs.create_index(
+            [("estado", ASCENDING), ("creado_en", ASCENDING)], name="export_jobs_estado_creado"
+        )
+        await collection_export_jobs.create_index(
+            [("solicitado_por", ASCENDING), ("creado_en", DESCENDING)], name="export_jobs_solicitante"
+        )
+        await collection_export_jobs.create_index(
+            "borrar_en", name="export_jobs_ttl", expireAfterSeconds=0
+        )
+        _indices_listos = True
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron crear los índices de export_jobs: {e}")
+
+
+async def crear_trabajo(tipo: str, parametros: Dict, usuario: Dict) -> Tuple[Dict, bool]:
+    """
+    Valida y encola la exportación. Devuelve (trabajo, deduplicado): si ya
+    hay uno idéntico en curso se devuelve ese y se añade al solicitante.
+    """
+    definicion = _tipos.get(tipo)
+    if not definicion:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de exportación desconocido. Disponibles: {', '.join(tipos_disponibles())}"
+        )
+
+    parametros = definicion["preparar"](dict(parametros or {}), usuario)
+    huella = calcular_huella(tipo, parametros)
+    solicitante = usuario.get("email")
+
+    await _asegurar_indices()
+    iniciar_workers()
+
+    # Dos intentos: el trabajo en curso puede terminar entre el insert y la búsqueda
+    for _ in range(2):
+        ahora = datetime.utcnow()
+        trabajo = {
+            "job_id": uuid.uuid4().hex,
+            "tipo": tipo,
+            "parametros": parametros,
+            "huella": huella,
+            "estado": PENDIENTE,
+            "activo": True,
+            "progreso": 0,
+            "mensaje": "En cola",
+            "solicitado_por": [solicitante],
+            "intentos": 0,
+            "creado_en": ahora,
+        }
+        try:
+            await collection_export_jobs.insert_one(trabajo)
+            _hay_trabajo.set()
+            logger.info(f"📤 Exportación {tipo} encolada: {trabajo['job_id']}")
+            return trabajo, False
+        except DuplicateKeyError:
+            existente = await collection_export_jobs.find_one_and_update(
+                {"huella": huella, "activo": True},
+                {"$addToSet": {"solicitado_por": solicitante}},
+                return_document=ReturnDocument.AFTER
+            )
+            if existente:
+                logger.info(f"♻️ Exportación {tipo} deduplicada: {existente['job_id']}")
+                return existente, True
+
+    raise HTTPException(status_code=503, detail="No se pudo encolar la exportación, intenta de nuevo")
+
+
+async def obtener_trabajo(job_id: str, usuario: Dict) -> Dict:
+    """El trabajo si existe y el usuario lo solicitó (super_admin ve todos). 404 si no."""
+    trabajo = await collection_export_jobs.find_one({"job_id": job_id})
+    if not trabajo or (
+        usuario.get("rol") != "super_admin"
+        and usuario.get("email") not in (trabajo.get("solicitado_por") or [])
+    ):
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return trabajo
+
+
+async def listar_trabajos(usuario: Dict, limite: int = 20) -> List[Dict]:
+    return await collection_export_jobs.find(
+        {"solicitado_por": usuario.get("email")}
+    ).sort("creado_en", DESCENDING).limit(limite).to_list(limite)
+
+
+def vista_trabajo(trabajo: Dict) -> Dict:
+    """Lo que ve el cliente: sin huella, ubicación del archivo ni datos internos."""
+    archivo = trabajo.get("archivo") or {}
+    vista = {
+        "job_id": trabajo["job_id"],
+        "tipo": trabajo["tipo"],
+        "parametros": trabajo.get("parametros"),
+        "estado": trabajo["estado"],
+        "progreso": trabajo.get("progreso", 0),
+        "mensaje": trabajo.get("mensaje"),
+        "creado_en": trabajo.get("creado_en"),
+        "iniciado_en": trabajo.get("iniciado_en"),
+        "terminado_en": trabajo.get("terminado_en"),
+        "expira_en": trabajo.get("expira_en"),
+        "error": trabajo.get("error"),
+        "descarga": None,
+    }
+    if trabajo["estado"] == COMPLETADO and archivo:
+        vista["archivo"] = {
+            "nombre": archivo.get("nombre"),
+            "tamano": archivo.get("tamano"),
+            "media_type": archivo.get("media_type"),
+        }
+        vista["descarga"] = f"/exports/{trabajo['job_id']}/descarga"
+    return vista
+
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+
+async def _reclamar_trabajo() -> Optional[Dict]:
+    ahora = datetime.utcnow()
+    return await collection_export_jobs.find_one_and_update(
+        {
+            "$or": [
+                {"estado": PENDIENTE},
+                {"estado": EN_PROCESO, "latido": {"$lt": ahora - LATIDO_VENCIDO}},
+            ],
+            "intentos": {"$lt": MAX_INTENTOS},
+        },
+        {
+            "$set": {
+                "estado": EN_PROCESO,
+                "iniciado_en": ahora,
+                "latido": ahora,
+                "mensaje": "Generando",
+            },
+            "$inc": {"intentos": 1},
+        },
+        sort=[("creado_en", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _latir(job_id: str):
+    while True:
+        await asyncio.sleep(INTERVALO_LATIDO)
+        await collection_export_jobs.update_one(
+            {"job_id": job_id, "estado": EN_PROCESO},
+            {"$set": {"latido": datetime.utcnow()}}
+        )
+
+
+async def _finalizar(job_id: str, cambios: Dict):
+    ahora = datetime.utcnow()
+    await collection_export_jobs.update_one(
+        {"job_id": job_id},
+        {
+            "$set": {**cambios, "terminado_en": ahora},
+            "$unset": {"activo": "", "latido": ""},
+        }
+    )
+
+
+async def _ejecutar(trabajo: Dict):
+    job_id = trabajo["job_id"]
+    definicion = _tipos.get(trabajo["tipo"])
+
+    async def progreso(porcentaje: int, mensaje: Optional[str] = None):
+        cambios: Dict[str, Any] = {"progreso": max(0, min(99, int(porcentaje))), "latido": datetime.utcnow()}
+        if mensaje:
+            cambios["mensaje"] = mensaje
+        await collection_export_jobs.update_one({"job_id": job_id, "estado": EN_PROCESO}, {"$set": cambios})
+
+    latido = asyncio.create_task(_latir(job_id))
+    inicio = datetime.utcnow()
+    try:
+        if definicion is None:
+            raise RuntimeError(f"Tipo de exportación no registrado: {trabajo['tipo']}")
+
+        ruta, nombre, media_type = await asyncio.wait_for(
+            definicion["ejecutar"](trabajo["parametros"], progreso),
+            timeout=EXPORT_JOB_TIMEOUT
+        )
+        await progreso(95, "Guardando archivo")
+        archivo = await guardar_archivo(ruta, job_id, nombre, media_type)
+
+        expira_en = datetime.utcnow() + timedelta(hours=EXPORT_TTL_HORAS)
+        await _finalizar(job_id, {
+            "estado": COMPLETADO,
+            "progreso": 100,
+            "mensaje": "Listo para descargar",
+            "archivo": archivo,
+            "expira_en": expira_en,
+            "borrar_en": expira_en + RETENCION_DOCUMENTO,
+        })
+        segundos = (datetime.utcnow() - inicio).total_seconds()
+        logger.info(f"✅ Exportación {trabajo['tipo']} {job_id} lista en {segundos:.1f}s ({archivo['tamano']} bytes)")
+
+    except asyncio.CancelledError:
+        # Apagado del proceso: el trabajo queda en_proceso y otro worker lo
+        # reclamará cuando venza el latido.
+        raise
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            detalle = str(e.detail)
+        elif isinstance(e, asyncio.TimeoutError):
+            detalle = f"La exportación superó {EXPORT_JOB_TIMEOUT}s"
+        else:
+            detalle = "Error interno al generar la exportación"
+            logger.error(f"❌ Error en exportación {trabajo['tipo']} {job_id}: {e}", exc_info=True)
+
+        await _finalizar(job_id, {
+            "estado": ERROR,
+            "mensaje": "Falló",
+            "error": detalle,
+            "borrar_en": datetime.utcnow() + RETENCION_DOCUMENTO,
+        })
+    finally:
+        latido.cancel()
+
+
+async def _limpiar_expirados():
+    """Borra artefactos caducados y cierra trabajos que agotaron sus intentos."""
+    global _ultima_limpieza
+    ahora = datetime.utcnow()
+    if _ultima_limpieza and (ahora - _ultima_limpieza).total_seconds() < INTERVALO_LIMPIEZA:
+        return
+    _ultima_limpieza = ahora
+
+    async for trabajo in collection_export_jobs.find(
+        {"estado": COMPLETADO, "expira_en": {"$lt": ahora}},
+        {"job_id": 1, "archivo": 1}
+    ):
+        await borrar_archivo(trabajo.get("archivo"))
+        await collection_export_jobs.update_one(
+            {"job_id": trabajo["job_id"], "estado": COMPLETADO},
+            {"$set": {"estado": EXPIRADO, "mensaje": "El archivo expiró"}, "$unset": {"archivo": ""}}
+        )
+
+    await collection_export_jobs.update_many(
+        {
+            "estado": EN_PROCESO,
+            "intentos": {"$gte": MAX_INTENTOS},
+            "latido": {"$lt": ahora - LATIDO_VENCIDO},
+        },
+        {
+            "$set": {
+                "estado": ERROR,
+                "error": "La exportación se interrumpió demasiadas veces",
+                "terminado_en": ahora,
+                "borrar_en": ahora + RETENCION_DOCUMENTO,
+            },
+            "$unset": {"activo": "", "latido": ""},
+        }
+    )
+
+
+async def _bucle_worker(numero: int):
+    logger.info(f"🧵 Worker de exportaciones #{numero} iniciado")
+    while True:
+        try:
+            await _limpiar_expirados()
+            trabajo = await _reclamar_trabajo()
+            if trabajo:
+                await _ejecutar(trabajo)
+                continue
+
+            _hay_trabajo.clear()
+            try:
+                await asyncio.wait_for(_hay_trabajo.wait(), timeout=INTERVALO_SONDEO)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"❌ Error en worker de exportaciones #{numero}: {e}", exc_info=True)
+            await asyncio.sleep(INTERVALO_SONDEO)
+
+
+def iniciar_workers():
+    """Arranca los workers del proceso (idempotente; se llama con el primer POST)."""
+    global _workers
+    _workers = [w for w in _workers if not w.done()]
+    for numero in range(len(_workers), EXPORT_JOB_WORKERS):
+        _workers.append(asyncio.create_task(_bucle_worker(numero + 1)))
+
+
+async def detener_workers():
+    for worker in _workers:
+        worker.cancel()
+    if _workers:
+        await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, RedirectResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict
+import os
+
+from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
+from app.exports import tipos  # noqa: F401 (registra los tipos de exportación)
+from app.exports.jobs import (
+    COMPLETADO,
+    EXPIRADO,
+    crear_trabajo,
+    iniciar_workers,
+    listar_trabajos,
+    obtener_trabajo,
+    tipos_disponibles,
+    vista_trabajo,
+)
+from app.exports.storage import url_descarga_s3
+
+router = APIRouter(prefix="/exports", tags=["Exportaciones"], route_class=BSONRoute)
+
+
+class SolicitudExportacion(BaseModel):
+    tipo: str = Field(..., description="caja_excel | caja_periodo | churn_excel")
+    parametros: Dict[str, Any] = Field(default_factory=dict)
+
+
+# =========================================================
+# 📤 Crear exportación
+# =========================================================
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def crear_exportacion(
+    solicitud: SolicitudExportacion,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Encola la exportación y responde de inmediato con su job_id.
+    Si ya hay una idéntica en curso (mismo tipo y parámetros) se devuelve
+    esa (`deduplicado: true`).
+    """
+    trabajo, deduplicado = await crear_trabajo(solicitud.tipo, solicitud.parametros, current_user)
+    return {**vista_trabajo(trabajo), "deduplicado": deduplicado}
+
+
+@router.get("/")
+async def mis_exportaciones(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    trabajos = await listar_trabajos(current_user, limit)
+    return {"tipos": tipos_disponibles(), "exportaciones": [vista_trabajo(t) for t in trabajos]}
+
+
+# =========================================================
+# 🔎 Estado y descarga
+# =========================================================
+@router.get("/{job_id}")
+async def estado_exportacion(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    trabajo = await obtener_trabajo(job_id, current_user)
+    iniciar_workers()  # tras un reinicio, retoma la cola sin esperar a un POST
+    return vista_trabajo(trabajo)
+
+
+@router.get("/{job_id}/descarga")
+async def descargar_exportacion(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    trabajo = await obtener_trabajo(job_id, current_user)
+
+    if trabajo["estado"] == EXPIRADO:
+        raise HTTPException(status_code=410, detail="El archivo expiró, solicita la exportación de nuevo")
+    if trabajo["estado"] != COMPLETADO:
+        raise HTTPException(status_code=409, detail=f"La exportación aún no está lista ({trabajo['estado']})")
+
+    archivo = trabajo["archivo"]
+    if archivo["almacen"] == "s3":
+        return RedirectResponse(await url_descarga_s3(archivo), status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    if not os.path.exists(archivo["ubicacion"]):
+        raise HTTPException(status_code=410, detail="El archivo ya no está disponible")
+    return FileResponse(archivo["ubicacion"], media_type=archivo["media_type"], filename=archivo["nombre"])
@@ -0,0 +1,98 @@
+"""
+Almacenamiento de archivos exportados
+=====================================
+
+EXPORT_STORAGE=local (por defecto): EXPORT_DIR en el disco del servidor.
+  Solo sirve si todos los workers comparten disco (un host).
+EXPORT_STORAGE=s3: bucket AWS_BUCKET_NAME bajo EXPORT_S3_PREFIX; la
+  descarga es una URL prefirmada de corta duración.
+
+Las operaciones de S3 (boto3, bloqueante) se ejecutan en un hilo.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ALMACEN = os.getenv("EXPORT_STORAGE", "local")
+EXPORT_DIR = os.getenv("EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "appagenda_exports")
+S3_BUCKET = os.getenv("AWS_BUCKET_NAME")
+S3_PREFIX = os.getenv("EXPORT_S3_PREFIX", "exports")
+URL_PREFIRMADA_SEGUNDOS = 300
+
+_s3_client = None
+
+
+def _s3():
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+
+        _s3_client = boto3.client(
+            "s3",
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            region_name=os.getenv("AWS_REGION", "us-west-2")
+        )
+    return _s3_client
+
+
+async def guardar_archivo(ruta_temporal: str, job_id: str, nombre: str, media_type: str) -> Dict:
+    """
+    Mueve el temporal al almacén y devuelve la referencia que se guarda en
+    el trabajo: {almacen, ubicacion, nombre, media_type, tamano}.
+    """
+    tamano = os.path.getsize(ruta_temporal)
+
+    if ALMACEN == "s3":
+        clave = f"{S3_PREFIX}/{job_id}/{nombre}"
+        try:
+            await asyncio.to_thread(
+                _s3().upload_file, ruta_temporal, S3_BUCKET, clave,
+                ExtraArgs={"ContentType": media_type}
+            )
+        finally:
+            os.remove(ruta_temporal)
+        ubicacion = clave
+    else:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        ubicacion = os.path.join(EXPORT_DIR, f"{job_id}_{os.path.basename(nombre)}")
+        await asyncio.to_thread(shutil.move, ruta_temporal, ubicacion)
+
+    return {
+        "almacen": ALMACEN,
+        "ubicacion": ubicacion,
+        "nombre": nombre,
+        "media_type": media_type,
+        "tamano": tamano,
+    }
+
+
+async def url_descarga_s3(archivo: Dict) -> str:
+    return await asyncio.to_thread(
+        _s3().generate_presigned_url,
+        "get_object",
+        Params={
+            "Bucket": S3_BUCKET,
+            "Key": archivo["ubicacion"],
+            "ResponseContentDisposition": f'attachment; filename="{archivo["nombre"]}"'
+        },
+        ExpiresIn=URL_PREFIRMADA_SEGUNDOS
+    )
+
+
+async def borrar_archivo(archivo: Optional[Dict]):
+    """Elimina el artefacto de un trabajo expirado. Nunca lanza excepción."""
+    if not archivo:
+        return
+    try:
+        if archivo.get("almacen") == "s3":
+            await asyncio.to_thread(_s3().delete_object, Bucket=S3_BUCKET, Key=archivo["ubicacion"])
+        elif os.path.exists(archivo["ubicacion"]):
+            os.remove(archivo["ubicacion"])
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo borrar el archivo exportado {archivo.get('ubicacion')}: {e}")
@@ -0,0 +1,129 @@
+"""
+Tipos de exportación disponibles en /exports
+============================================
+
+Cada tipo reutiliza la misma lógica que su endpoint síncrono:
+
+- caja_excel    → /cash/reporte-excel   {sede_id, fecha | fecha_inicio + fecha_fin}
+- caja_periodo  → /cash/reporte-periodo {sede_id, fecha_inicio, fecha_fin} (JSON)
+- churn_excel   → /analytics/churn-clientes?export=true {sede_id?, start_date?, end_date?}
+"""
+import asyncio
+import os
+import tempfile
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.analytics.routes_churn import generar_archivo_churn, parsear_rango_churn
+from app.cash.routes_cash import (
+    construir_reporte_periodo,
+    generar_archivo_reporte_excel,
+    validar_parametros_reporte_excel,
+)
+from app.core.responses import dumps_bson
+from app.core.xlsx_export import EXPORT_TMP_DIR, MEDIA_TYPE_XLSX
+from app.exports.jobs import Progreso, Resultado, registrar_tipo
+
+
+def _texto(parametros: Dict, campo: str) -> Optional[str]:
+    valor = parametros.get(campo)
+    if valor is None or valor == "":
+        return None
+    if not isinstance(valor, str):
+        raise HTTPException(status_code=422, detail=f"'{campo}' debe ser texto")
+    return valor.strip()
+
+
+def _sede_permitida(sede_id: Optional[str], usuario: Dict, obligatoria: bool) -> Optional[str]:
+    """admin_sede solo exporta su propia sede (por defecto, la suya)."""
+    if usuario.get("rol") == "admin_sede":
+        propia = usuario.get("sede_id")
+        if sede_id and sede_id != propia:
+            raise HTTPException(status_code=403, detail="No tienes permisos para exportar otra sede")
+        return propia
+    if obligatoria and not sede_id:
+        raise HTTPException(status_code=422, detail="'sede_id' es obligatorio")
+    return sede_id
+
+
+# ============================================================
+# CAJA
+# ============================================================
+
+def _preparar_caja_excel(parametros: Dict, usuario: Dict) -> Dict:
+    sede_id = _sede_permitida(_texto(parametros, "sede_id"), usuario, obligatoria=True)
+    fecha = _texto(parametros, "fecha")
+    fecha_inicio = _texto(parametros, "fecha_inicio")
+    fecha_fin = _texto(parametros, "fecha_fin")
+
+    if validar_parametros_reporte_excel(fecha, fecha_inicio, fecha_fin):
+        return {"sede_id": sede_id, "fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin}
+    return {"sede_id": sede_id, "fecha": fecha}
+
+
+async def _ejecutar_caja_excel(parametros: Dict, progreso: Progreso) -> Resultado:
+    await progreso(10, "Consultando ventas y egresos")
+    ruta, nombre = await generar_archivo_reporte_excel(
+        parametros["sede_id"],
+        parametros.get("fecha"),
+        parametros.get("fecha_inicio"),
+        parametros.get("fecha_fin"),
+    )
+    return ruta, nombre, MEDIA_TYPE_XLSX
+
+
+def _preparar_caja_periodo(parametros: Dict, usuario: Dict) -> Dict:
+    sede_id = _sede_permitida(_texto(parametros, "sede_id"), usuario, obligatoria=True)
+    fecha_inicio = _texto(parametros, "fecha_inicio")
+    fecha_fin = _texto(parametros, "fecha_fin")
+    if not (fecha_inicio and fecha_fin):
+        raise HTTPException(status_code=422, detail="Debes enviar 'fecha_inicio' y 'fecha_fin'")
+
+    validar_parametros_reporte_excel(None, fecha_inicio, fecha_fin)
+    return {"sede_id": sede_id, "fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin}
+
+
+def _escribir_json(contenido: bytes) -> str:
+    fd, ruta = tempfile.mkstemp(prefix="export_", suffix=".json", dir=EXPORT_TMP_DIR)
+    with os.fdopen(fd, "wb") as archivo:
+        archivo.write(contenido)
+    return ruta
+
+
+async def _ejecutar_caja_periodo(parametros: Dict, progreso: Progreso) -> Resultado:
+    await progreso(10, "Calculando el periodo")
+    reporte = await construir_reporte_periodo(
+        parametros["sede_id"], parametros["fecha_inicio"], parametros["fecha_fin"]
+    )
+    await progreso(85, "Escribiendo archivo")
+    ruta = await asyncio.to_thread(_escribir_json, dumps_bson(reporte))
+    nombre = f"reporte_periodo_{parametros['sede_id']}_{parametros['fecha_inicio']}_a_{parametros['fecha_fin']}.json"
+    return ruta, nombre, "application/json"
+
+
+# ============================================================
+# CHURN
+# ============================================================
+
+def _preparar_churn_excel(parametros: Dict, usuario: Dict) -> Dict:
+    sede_id = _sede_permitida(_texto(parametros, "sede_id"), usuario, obligatoria=False)
+    start_date = _texto(parametros, "start_date")
+    end_date = _texto(parametros, "end_date")
+
+    start, end = parsear_rango_churn(start_date, end_date)
+    if start is None:
+        start_date = end_date = None
+    return {"sede_id": sede_id, "start_date": start_date, "end_date": end_date}
+
+
+async def _ejecutar_churn_excel(parametros: Dict, progreso: Progreso) -> Resultado:
+    await progreso(10, "Calculando clientes perdidos")
+    start, end = parsear_rango_churn(parametros.get("start_date"), parametros.get("end_date"))
+    ruta = await generar_archivo_churn(parametros.get("sede_id"), start, end)
+    return ruta, "clientes_churn.xlsx", MEDIA_TYPE_XLSX
+
+
+registrar_tipo("caja_excel", _preparar_caja_excel, _ejecutar_caja_excel)
+registrar_tipo("caja_periodo", _preparar_caja_periodo, _ejecutar_caja_periodo)
+registrar_tipo("churn_excel", _preparar_churn_excel, _ejecutar_churn_excel)
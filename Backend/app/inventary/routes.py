@@ -5,9 +5,10 @@ from app.inventary.submodulos.products.routes_products import router as product_
 from app.inventary.submodulos.exits.routes_exit import router as exits_router
 from app.inventary.submodulos.orders.routes_orders import router as orders_router
 from app.inventary.submodulos.inventarios.routes_inventarios import router as inventarios_router
+from app.core.responses import BSONRoute
 
 # Crea el router principal del módulo scheduling
-app_router = APIRouter()
+app_router = APIRouter(route_class=BSONRoute)
 
 # Incluye cada submódulo con su propio prefijo
 app_router.include_router(product_router, prefix="/product", tags=["Products"])
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+import logging
 from app.inventary.submodulos.exits.models import Salida
 from app.database.mongo import collection_salidas, collection_productos, collection_inventarios
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
+from app.inventary.submodulos.inventarios.stock import ajustar_stock
+from app.core.pagination import asegurar_indice, ventana_keyset
+from app.core.streaming import BATCH_SIZE, parametro_formato, parametro_limite, respuesta_stream
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
 
-router = APIRouter(prefix="/salidas")
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/salidas", route_class=BSONRoute)
 
 
 # =========================================================
@@ -72,30 +79,28 @@ async def crear_salida(
                 detail=f"No existe inventario para {producto['nombre']} en esta sede. Debe crear un pedido primero."
             )
 
-        nuevo_stock = inventario["stock_actual"] - item.cantidad
-        if nuevo_stock < 0:
+        if inventario["stock_actual"] - item.cantidad < 0:
             raise HTTPException(
                 status_code=400, 
                 detail=f"Stock insuficiente para {producto['nombre']} en esta sede (disponible: {inventario['stock_actual']})"
             )
 
-        # Actualizar inventario
-        await collection_inventarios.update_one(
-            {"_id": inventario["_id"]},
-            {
-                "$set": {
-                    "stock_actual": nuevo_stock,
-                    "fecha_ultima_actualizacion": datetime.now()
-                }
-            }
+        # Actualizar inventario: descuento atómico, solo si aún alcanza el stock
+        actualizado = await ajustar_stock(
+            {"_id": inventario["_id"]}, -item.cantidad, stock_minimo_requerido=item.cantidad
         )
+        if not actualizado:
+            raise HTTPException(
+                status_code=409,
+                detail=f"El stock de {producto['nombre']} cambió mientras se registraba la salida, intenta de nuevo"
+            )
 
-        print(f"📉 Stock actualizado en inventario -> {data['sede_id']} - {producto['nombre']}: -{item.cantidad} unidades")
+        logger.debug(f"📉 Stock actualizado en inventario -> {data['sede_id']} - {producto['nombre']}: -{item.cantidad} unidades")
 
     result = await collection_salidas.insert_one(data)
     data["_id"] = str(result.inserted_id)
 
-    print(f"🔴 EVENTO: salida.created -> {data['_id']} (motivo: {data['motivo']}, sede: {data['sede_id']})")
+    logger.info(f"🔴 EVENTO: salida.created -> {data['_id']} (motivo: {data['motivo']}, sede: {data['sede_id']})")
 
     return {"msg": "Salida registrada exitosamente", "salida": data}
 
@@ -107,6 +112,9 @@ async def crear_salida(
 async def listar_salidas(
     sede_id: str = None,
     franquicia_id: str = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(),
+    formato: str = parametro_formato(),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -134,8 +142,15 @@ async def listar_salidas(
         if franquicia_id:
             query["franquicia_id"] = franquicia_id
 
-    salidas = await collection_salidas.find(query).to_list(None)
-    return [salida_to_dict(s) for s in salidas]
+    # Streaming, más recientes primero (máx. `limit`, siguiente página en X-Next-Cursor)
+    await asegurar_indice(collection_salidas, [("sede_id", 1), ("_id", -1)], "exits_sede_id")
+    ventana = await ventana_keyset(collection_salidas, query, [("_id", -1)], limit, cursor)
+    return await respuesta_stream(
+        collection_salidas.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+        formato,
+        siguiente=ventana["siguiente"],
+        transformar=salida_to_dict
+    )
 
 
 # =========================================================
@@ -187,6 +202,6 @@ async def eliminar_salida(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Salida no encontrada")
 
-    print(f"🗑️ Salida eliminada -> {salida_id}")
+    logger.info(f"🗑️ Salida eliminada -> {salida_id}")
 
     return {"msg": "Salida eliminada correctamente (stock NO revertido automáticamente)"}
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Pronóstico de consumo y punto de reorden (job nocturno)
+=======================================================
+
+Una vez por noche (PRONOSTICO_HORA, UTC) se lee el consumo diario de los
+últimos HISTORIAL_DIAS días —ventas (inventory_motions) y salidas
+(exits)— y se calcula, vectorizado con pandas/NumPy sobre la matriz
+(sede, producto) × día:
+
+    tasa_diaria      media exponencial (span PRONOSTICO_SPAN) del consumo diario
+    desviacion       desviación estándar del consumo diario
+    stock_seguridad  Z * desviacion * sqrt(plazo)
+    punto_reorden    tasa_diaria * plazo + stock_seguridad
+    dias_restantes   stock_actual / tasa_diaria (None sin consumo)
+    cantidad_sugerida
+        max(stock_minimo, tasa_diaria * (plazo + cobertura) + stock_seguridad) - stock_actual
+
+plazo = PLAZO_REPOSICION_DIAS (tiempo de entrega del proveedor) y
+cobertura = DIAS_COBERTURA_PEDIDO.
+
+El resultado es un documento pequeño por (sede, producto) en
+`inventory_forecast`; la API y crear_pedido solo lo leen.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from app.core.pagination import asegurar_indice
+from app.database.mongo import (
+    collection_inventarios,
+    collection_inventory_forecast,
+    collection_inventory_motions,
+    collection_salidas,
+)
+
+logger = logging.getLogger(__name__)
+
+HISTORIAL_DIAS = int(os.getenv("PRONOSTICO_HISTORIAL_DIAS", "90"))
+PRONOSTICO_SPAN = int(os.getenv("PRONOSTICO_SPAN", "14"))
+PLAZO_REPOSICION_DIAS = int(os.getenv("PLAZO_REPOSICION_DIAS", "7"))
+DIAS_COBERTURA_PEDIDO = int(os.getenv("DIAS_COBERTURA_PEDIDO", "14"))
+NIVEL_SERVICIO_Z = float(os.getenv("PRONOSTICO_Z", "1.65"))  # ~95 %
+PRONOSTICO_HORA = int(os.getenv("PRONOSTICO_HORA", "3"))
+
+# Documento de control: evita que varios procesos calculen la misma noche
+ID_CONTROL = "_control"
+INTERVALO_MINIMO = timedelta(hours=20)
+LOTE_ESCRITURA = 1000
+
+COLUMNAS_CONSUMO = ["sede_id", "producto_id", "dia", "unidades"]
+
+
+# ============================================================
+# LECTURA (agregaciones compactas: un registro por día)
+# ============================================================
+
+def _pipeline_consumo_diario(campo_fecha: str, campo_items: str, solo_negativos: bool, desde: datetime) -> List[Dict]:
+    cantidad = {"$abs": f"${campo_items}.cantidad"} if solo_negativos else f"${campo_items}.cantidad"
+    etapas = [
+        {"$match": {campo_fecha: {"$gte": desde}}},
+        {"$unwind": f"${campo_items}"},
+    ]
+    if solo_negativos:
+        etapas.append({"$match": {f"{campo_items}.cantidad": {"$lt": 0}}})
+    etapas += [
+        {"$group": {
+            "_id": {
+                "sede_id": "$sede_id",
+                "producto_id": f"${campo_items}.producto_id",
+                "dia": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${campo_fecha}"}},
+            },
+            "unidades": {"$sum": cantidad},
+        }},
+        {"$project": {
+            "_id": 0,
+            "sede_id": "$_id.sede_id",
+            "producto_id": "$_id.producto_id",
+            "dia": "$_id.dia",
+            "unidades": 1,
+        }},
+    ]
+    return etapas
+
+
+async def _leer_consumo(desde: datetime) -> pd.DataFrame:
+    ventas, salidas = await asyncio.gather(
+        collection_inventory_motions.aggregate(
+            _pipeline_consumo_diario("fecha", "movimientos", True, desde), allowDiskUse=True
+        ).to_list(None),
+        collection_salidas.aggregate(
+            _pipeline_consumo_diario("fecha_creacion", "items", False, desde), allowDiskUse=True
+        ).to_list(None),
+    )
+    return pd.DataFrame(ventas + salidas, columns=COLUMNAS_CONSUMO)
+
+
+async def _leer_inventarios() -> pd.DataFrame:
+    inventarios = await collection_inventarios.find(
+        {}, {"_id": 0, "sede_id": 1, "producto_id": 1, "nombre": 1, "stock_actual": 1, "stock_minimo": 1}
+    ).to_list(None)
+    return pd.DataFrame(inventarios, columns=["sede_id", "producto_id", "nombre", "stock_actual", "stock_minimo"])
+
+
+# ============================================================
+# CÁLCULO (CPU, en un hilo)
+# ============================================================
+
+def calcular_pronostico(
+    consumo: pd.DataFrame,
+    inventarios: pd.DataFrame,
+    hoy: datetime,
+    historial_dias: int = HISTORIAL_DIAS,
+    plazo: int = PLAZO_REPOSICION_DIAS,
+    cobertura: int = DIAS_COBERTURA_PEDIDO,
+    z: float = NIVEL_SERVICIO_Z,
+    span: int = PRONOSTICO_SPAN
+) -> pd.DataFrame:
+    """
+    consumo: sede_id, producto_id, dia (YYYY-MM-DD), unidades
+    inventarios: sede_id, producto_id, nombre, stock_actual, stock_minimo
+    Devuelve una fila por inventario con las métricas del pronóstico.
+    """
+    dias = pd.date_range(end=pd.Timestamp(hoy).normalize() - pd.Timedelta(days=1), periods=historial_dias, freq="D")
+
+    if consumo.empty:
+        vacio = pd.MultiIndex.from_arrays([[], []], names=["sede_id", "producto_id"])
+        matriz = pd.DataFrame(index=vacio, columns=dias, dtype="float64")
+    else:
+        consumo = consumo.assign(dia=pd.to_datetime(consumo["dia"]), unidades=consumo["unidades"].astype("float64"))
+        matriz = consumo.pivot_table(
+            index=["sede_id", "producto_id"], columns="dia", values="unidades", aggfunc="sum", fill_value=0.0
+        ).reindex(columns=dias, fill_value=0.0)
+
+    valores = matriz.to_numpy(dtype="float64")
+    if valores.size:
+        # Media exponencial sobre el eje de días (el último día pesa más)
+        tasa = matriz.T.ewm(span=span, adjust=True).mean().iloc[-1].to_numpy()
+        desviacion = valores.std(axis=1, ddof=1) if valores.shape[1] > 1 else np.zeros(len(matriz))
+        dias_con_consumo = (valores > 0).sum(axis=1)
+        total = valores.sum(axis=1)
+    else:
+        tasa = desviacion = total = np.zeros(0)
+        dias_con_consumo = np.zeros(0, dtype=int)
+
+    metricas = pd.DataFrame({
+        "tasa_diaria": tasa,
+        "desviacion": desviacion,
+        "consumo_historial": total,
+        "dias_con_consumo": dias_con_consumo,
+    }, index=matriz.index)
+
+    base = inventarios.copy()
+    base["stock_actual"] = pd.to_numeric(base["stock_actual"], errors="coerce").fillna(0.0)
+    base["stock_minimo"] = pd.to_numeric(base["stock_minimo"], errors="coerce").fillna(0.0)
+    resultado = base.merge(metricas, how="left", left_on=["sede_id", "producto_id"], right_index=True)
+    for columna in ("tasa_diaria", "desviacion", "consumo_historial"):
+        resultado[columna] = resultado[columna].fillna(0.0)
+    resultado["dias_con_consumo"] = resultado["dias_con_consumo"].fillna(0).astype(int)
+
+    tasa = resultado["tasa_diaria"].to_numpy()
+    stock = resultado["stock_actual"].to_numpy()
+    minimo = resultado["stock_minimo"].to_numpy()
+
+    seguridad = z * resultado["desviacion"].to_numpy() * np.sqrt(plazo)
+    punto_reorden = tasa * plazo + seguridad
+    objetivo = np.maximum(minimo, np.ceil(tasa * (plazo + cobertura) + seguridad))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dias_restantes = np.where(tasa > 0, np.maximum(stock, 0) / tasa, np.nan)
+
+    resultado["stock_seguridad"] = np.round(seguridad, 2)
+    resultado["punto_reorden"] = np.round(punto_reorden, 2)
+    resultado["dias_restantes"] = np.round(dias_restantes, 1)
+    resultado["cantidad_sugerida"] = np.maximum(0, objetivo - stock).astype(int)
+    resultado["reordenar"] = (stock <= punto_reorden) | (stock < minimo)
+    resultado["tasa_diaria"] = np.round(tasa, 3)
+    resultado["desviacion"] = np.round(resultado["desviacion"].to_numpy(), 3)
+    return resultado
+
+
+def _a_documentos(resultado: pd.DataFrame, calculado_en: datetime) -> List[Dict]:
+    documentos = []
+    for fila in resultado.itertuples(index=False):
+        documentos.append({
+            "_id": f"{fila.sede_id}:{fila.producto_id}",
+            "sede_id": fila.sede_id,
+            "producto_id": fila.producto_id,
+            "nombre": fila.nombre,
+            "tasa_diaria": float(fila.tasa_diaria),
+            "desviacion": float(fila.desviacion),
+            "stock_seguridad": float(fila.stock_seguridad),
+            "punto_reorden": float(fila.punto_reorden),
+            "dias_restantes": None if np.isnan(fila.dias_restantes) else float(fila.dias_restantes),
+            "cantidad_sugerida": int(fila.cantidad_sugerida),
+            "reordenar": bool(fila.reordenar),
+            "stock_actual": float(fila.stock_actual),
+            "stock_minimo": float(fila.stock_minimo),
+            "dias_con_consumo": int(fila.dias_con_consumo),
+            "calculado_en": calculado_en,
+        })
+    return documentos
+
+
+# ============================================================
+# JOB
+# ============================================================
+
+async def _reclamar_ejecucion(ahora: datetime, forzar: bool) -> bool:
+    filtro: Dict = {"_id": ID_CONTROL}
+    if not forzar:
+        filtro["$or"] = [
+            {"ultima_ejecucion": {"$lt": ahora - INTERVALO_MINIMO}},
+            {"ultima_ejecucion": {"$exists": False}},
+        ]
+    try:
+        await collection_inventory_forecast.update_one(
+            filtro, {"$set": {"ultima_ejecucion": ahora}}, upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Otro proceso ya lo ejecutó (el upsert chocó con el _id existente)
+        return False
+
+
+async def ejecutar_pronostico(forzar: bool = False) -> Dict:
+    """Calcula y guarda el pronóstico de todas las sedes. Devuelve un resumen."""
+    ahora = datetime.utcnow()
+    if not await _reclamar_ejecucion(ahora, forzar):
+        logger.info("⏭️ Pronóstico de consumo ya calculado recientemente por otro proceso")
+        return {"omitido": True}
+
+    inicio = datetime.now()
+    try:
+        desde = datetime.now() - timedelta(days=HISTORIAL_DIAS)
+        consumo, inventarios = await asyncio.gather(_leer_consumo(desde), _leer_inventarios())
+
+        resultado = await asyncio.to_thread(calcular_pronostico, consumo, inventarios, datetime.now())
+        documentos = await asyncio.to_thread(_a_documentos, resultado, ahora)
+
+        for i in range(0, len(documentos), LOTE_ESCRITURA):
+            await collection_inventory_forecast.bulk_write(
+                [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documentos[i:i + LOTE_ESCRITURA]],
+                ordered=False
+            )
+        # Inventarios que ya no existen
+        await collection_inventory_forecast.delete_many(
+            {"_id": {"$ne": ID_CONTROL}, "calculado_en": {"$lt": ahora}}
+        )
+
+        segundos = (datetime.now() - inicio).total_seconds()
+        resumen = {
+            "omitido": False,
+            "inventarios": len(documentos),
+            "registros_consumo": len(consumo),
+            "reordenar": int(resultado["reordenar"].sum()) if len(resultado) else 0,
+            "segundos": round(segundos, 2),
+        }
+        await collection_inventory_forecast.update_one(
+            {"_id": ID_CONTROL}, {"$set": {"ultimo_resumen": resumen}}
+        )
+        logger.info(f"📈 Pronóstico de consumo: {resumen}")
+        return resumen
+
+    except Exception as e:
+        # Libera el control para que el próximo intento no espere 20 h
+        await collection_inventory_forecast.update_one(
+            {"_id": ID_CONTROL}, {"$unset": {"ultima_ejecucion": ""}}
+        )
+        logger.error(f"❌ Error calculando el pronóstico de consumo: {e}", exc_info=True)
+        raise
+
+
+async def _ejecutar_programado():
+    try:
+        await ejecutar_pronostico()
+    except Exception:
+        pass  # ya registrado
+
+
+def registrar_job_pronostico(scheduler):
+    """Registra el cálculo nocturno en el scheduler de la app (cash/scheduler.py)."""
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler.add_job(
+        _ejecutar_programado,
+        trigger=CronTrigger(hour=PRONOSTICO_HORA, minute=15, timezone="UTC"),
+        id="pronostico_consumo",
+        name="Pronóstico de consumo de inventario",
+        replace_existing=True
+    )
+    logger.info(f"✅ Job registrado: pronóstico de consumo a las {PRONOSTICO_HORA:02d}:15 UTC")
+
+
+# ============================================================
+# LECTURA PARA LA API
+# ============================================================
+
+async def obtener_pronostico(
+    sede_id: Optional[str] = None,
+    producto_ids: Optional[List[str]] = None,
+    solo_reordenar: bool = False
+) -> List[Dict]:
+    filtro: Dict = {"_id": {"$ne": ID_CONTROL}}
+    if sede_id:
+        filtro["sede_id"] = sede_id
+    if producto_ids:
+        filtro["producto_id"] = {"$in": producto_ids}
+    if solo_reordenar:
+        filtro["reordenar"] = True
+    await asegurar_indice(
+        collection_inventory_forecast, [("sede_id", 1), ("producto_id", 1)], "inventory_forecast_sede_producto"
+    )
+    return await collection_inventory_forecast.find(filtro)\
+        .sort([("sede_id", 1), ("reordenar", -1), ("dias_restantes", 1)])\
+        .to_list(None)
+
+
+async def cantidades_sugeridas(sede_id: str, producto_ids: List[str]) -> Dict[str, int]:
+    """producto_id → cantidad sugerida (solo los que tienen pronóstico)."""
+    pronostico = await obtener_pronostico(sede_id, producto_ids)
+    return {p["producto_id"]: p["cantidad_sugerida"] for p in pronostico}
@@ -1,12 +1,25 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+import logging
 from app.inventary.submodulos.inventarios.models import AjusteInventario, Inventario
 from app.database.mongo import collection_inventarios, collection_productos
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
+from app.core.dataloader import Cargadores, obtener_cargadores
+from app.inventary.submodulos.inventarios.stock import (
+    ajustar_stock,
+    es_stock_bajo,
+    filtro_stock_bajo,
+    inventarios_stock_bajo,
+    reposicion_sugerida,
+)
+from app.inventary.submodulos.inventarios.pronostico import ejecutar_pronostico, obtener_pronostico
 from datetime import datetime
 from typing import List, Optional
 from bson import ObjectId
 
-router = APIRouter(prefix="/inventarios")
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/inventarios", route_class=BSONRoute)
 
 
 # =========================================================
@@ -24,7 +37,8 @@ def inventario_to_dict(inv):
 async def listar_inventario(
     sede_id: Optional[str] = Query(None, description="Filtrar por sede específica"),
     stock_bajo: Optional[bool] = Query(None, description="Solo productos con stock bajo"),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cargadores: Cargadores = Depends(obtener_cargadores)
 ):
     """
     Lista el inventario según el rol:
@@ -46,20 +60,19 @@ async def listar_inventario(
     elif sede_id:  # super_admin puede filtrar por sede
         query["sede_id"] = sede_id
     
-    # Filtro de stock bajo
+    # Filtro de stock bajo (bandera indexada, resuelto en Mongo)
     if stock_bajo:
-        inventarios = await collection_inventarios.find(query).to_list(None)
-        inventarios = [inv for inv in inventarios if inv["stock_actual"] < inv["stock_minimo"]]
-    else:
-        inventarios = await collection_inventarios.find(query).to_list(None)
+        query = await filtro_stock_bajo(query)
+    inventarios = await collection_inventarios.find(query).to_list(None)
     
-    # Enriquecer con info del producto
+    # Enriquecer con info del producto (una sola consulta $in usando 'id')
+    productos = await cargadores.por(collection_productos, "id").cargar_varios(
+        inv["producto_id"] for inv in inventarios
+    )
     resultado = []
-    for inv in inventarios:
+    for inv, producto in zip(inventarios, productos):
         inv_dict = inventario_to_dict(inv)
         
-        # Buscar info del producto usando 'id'
-        producto = await collection_productos.find_one({"id": inv["producto_id"]})
         if producto:
             inv_dict["producto_nombre"] = producto.get("nombre")
             inv_dict["producto_codigo"] = producto.get("tipo_codigo")
@@ -75,7 +88,8 @@ async def listar_inventario(
 # =========================================================
 @router.get("/consolidado", response_model=List[dict])
 async def inventario_consolidado(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cargadores: Cargadores = Depends(obtener_cargadores)
 ):
     """
     Muestra el stock total de cada producto sumando todas las sedes.
@@ -100,10 +114,12 @@ async def inventario_consolidado(
     
     resultado = await collection_inventarios.aggregate(pipeline).to_list(None)
     
-    # Enriquecer con info del producto
+    # Enriquecer con info del producto (una sola consulta $in)
+    productos = await cargadores.por(collection_productos, "id").cargar_varios(
+        item["_id"] for item in resultado
+    )
     consolidado = []
-    for item in resultado:
-        producto = await collection_productos.find_one({"id": item["_id"]})
+    for item, producto in zip(resultado, productos):
         if producto:
             consolidado.append({
                 "producto_id": item["_id"],
@@ -171,6 +187,7 @@ async def crear_inventario(
         "sede_id": data["sede_id"],
         "stock_actual": data["stock_actual"],
         "stock_minimo": data["stock_minimo"],
+        "stock_bajo": es_stock_bajo(data["stock_actual"], data["stock_minimo"]),
         "fecha_creacion": datetime.now(),
         "fecha_ultima_actualizacion": datetime.now(),
         "creado_por": current_user["email"]
@@ -180,7 +197,7 @@ async def crear_inventario(
     result = await collection_inventarios.insert_one(documento)
     documento["_id"] = str(result.inserted_id)
     
-    print(f"✅ Inventario creado: {producto['nombre']} - Sede {documento['sede_id']} - Stock inicial: {documento['stock_actual']}")
+    logger.info(f"✅ Inventario creado: {producto['nombre']} - Sede {documento['sede_id']} - Stock inicial: {documento['stock_actual']}")
     
     return {
         "msg": "Inventario creado exitosamente",
@@ -235,24 +252,27 @@ async def ajustar_inventario(
             detail=f"El ajuste resultaría en stock negativo ({nuevo_stock})"
         )
     
-    # Actualizar
-    await collection_inventarios.update_one(
+    # Actualizar: suma atómica + bandera stock_bajo (sin bajar de 0 si otro
+    # movimiento descontó entretanto)
+    actualizado = await ajustar_stock(
         {"_id": ObjectId(inventario_id)},
-        {
-            "$set": {
-                "stock_actual": nuevo_stock,
-                "fecha_ultima_actualizacion": datetime.now()
-            }
-        }
+        ajuste.cantidad_ajuste,
+        stock_minimo_requerido=-ajuste.cantidad_ajuste if ajuste.cantidad_ajuste < 0 else None
     )
+    if not actualizado:
+        raise HTTPException(
+            status_code=409,
+            detail="El stock cambió mientras se aplicaba el ajuste, intenta de nuevo"
+        )
+    nuevo_stock = actualizado["stock_actual"]
     
     operacion = "agregó" if ajuste.cantidad_ajuste > 0 else "restó"
-    print(f"🔧 AJUSTE MANUAL: {inventario['sede_id']} - {inventario.get('nombre', 'N/A')} - Se {operacion} {abs(ajuste.cantidad_ajuste)} unidades (Usuario: {current_user['email']})")
+    logger.info(f"🔧 AJUSTE MANUAL: {inventario['sede_id']} - {inventario.get('nombre', 'N/A')} - Se {operacion} {abs(ajuste.cantidad_ajuste)} unidades (Usuario: {current_user['email']})")
     
     return {
         "msg": "Ajuste aplicado correctamente",
         "producto_nombre": inventario.get("nombre"),
-        "stock_anterior": inventario["stock_actual"],
+        "stock_anterior": nuevo_stock - ajuste.cantidad_ajuste,
         "stock_nuevo": nuevo_stock,
         "ajuste_realizado": ajuste.cantidad_ajuste
     }
@@ -263,7 +283,8 @@ async def ajustar_inventario(
 # =========================================================
 @router.get("/alertas/stock-bajo", response_model=List[dict])
 async def alertas_stock_bajo(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    cargadores: Cargadores = Depends(obtener_cargadores)
 ):
     """
     Lista productos con stock bajo en la sede del usuario.
@@ -283,27 +304,60 @@ async def alertas_stock_bajo(
             raise HTTPException(status_code=403, detail="Usuario sin sede asignada")
         query["sede_id"] = user_sede_id
     
-    # Buscar productos con stock bajo
-    inventarios = await collection_inventarios.find(query).to_list(None)
+    # Buscar productos con stock bajo (solo índice: bandera stock_bajo)
+    bajos = await inventarios_stock_bajo(query)
+
+    # Enriquecer con info del producto usando 'id' (una sola consulta $in)
+    productos = await cargadores.por(collection_productos, "id").cargar_varios(
+        inv["producto_id"] for inv in bajos
+    )
     alertas = []
     
-    for inv in inventarios:
-        if inv["stock_actual"] < inv["stock_minimo"]:
-            inv_dict = inventario_to_dict(inv)
-            
-            # Enriquecer con info del producto usando 'id'
-            producto = await collection_productos.find_one({"id": inv["producto_id"]})
-            if producto:
-                inv_dict["producto_nombre"] = producto.get("nombre")
-                inv_dict["producto_codigo"] = producto.get("tipo_codigo")
-                inv_dict["diferencia"] = inv["stock_minimo"] - inv["stock_actual"]
-            
-            alertas.append(inv_dict)
-            print(f"⚠️ ALERTA STOCK BAJO: {inv['sede_id']} - {producto.get('nombre', 'N/A')} ({inv['stock_actual']}/{inv['stock_minimo']})")
+    for inv, producto in zip(bajos, productos):
+        inv_dict = inventario_to_dict(inv)
+        
+        if producto:
+            inv_dict["producto_nombre"] = producto.get("nombre")
+            inv_dict["producto_codigo"] = producto.get("tipo_codigo")
+            inv_dict["diferencia"] = inv["stock_minimo"] - inv["stock_actual"]
+        
+        alertas.append(inv_dict)
+        logger.debug(f"⚠️ ALERTA STOCK BAJO: {inv['sede_id']} - {(producto or {}).get('nombre', 'N/A')} ({inv['stock_actual']}/{inv['stock_minimo']})")
     
     return alertas
 
 
+# =========================================================
+# 🛒 Reposición sugerida (stock bajo + consumo)
+# =========================================================
+@router.get("/alertas/reposicion", response_model=List[dict])
+async def alertas_reposicion(
+    sede_id: Optional[str] = Query(None, description="Filtrar por sede (super_admin)"),
+    dias_consumo: int = Query(30, ge=7, le=180, description="Días de historial para el consumo"),
+    dias_cobertura: int = Query(14, ge=1, le=90, description="Días que debe cubrir el pedido"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Inventarios con stock bajo de toda la franquicia (o de una sede) con
+    consumo diario según inventory_motions, días de cobertura restantes y
+    cantidad sugerida a pedir. Ordenado por urgencia.
+    admin_sede: Solo su sede
+    super_admin: Todas las sedes o filtra por sede_id
+    """
+    rol = current_user.get("rol")
+    
+    if rol not in ["admin_sede", "super_admin"]:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    if rol == "admin_sede":
+        sede_id = current_user.get("sede_id")
+        if not sede_id:
+            raise HTTPException(status_code=403, detail="Usuario sin sede asignada")
+    
+    sugerencias = await reposicion_sugerida(sede_id, dias_consumo, dias_cobertura)
+    return [inventario_to_dict(s) for s in sugerencias]
+
+
 # =========================================================
 # 📦 Obtener inventario específico por producto y sede
 # =========================================================
@@ -349,4 +403,43 @@ async def obtener_inventario_producto(
         inv_dict["producto_nombre"] = producto.get("nombre")
         inv_dict["producto_codigo"] = producto.get("tipo_codigo")
     
-    return inv_dict
\ No newline at end of file
+    return inv_dict
+
+
+# =========================================================
+# 📈 Pronóstico de consumo (calculado cada noche)
+# =========================================================
+@router.get("/pronostico", response_model=List[dict])
+async def pronostico_consumo(
+    sede_id: Optional[str] = Query(None, description="Filtrar por sede (super_admin)"),
+    solo_reordenar: bool = Query(False, description="Solo productos en o bajo el punto de reorden"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Consumo diario, punto de reorden, días de stock restantes y cantidad
+    sugerida por producto y sede. Solo lee el resultado del job nocturno.
+    admin_sede: Solo su sede
+    super_admin: Todas las sedes o filtra por sede_id
+    """
+    rol = current_user.get("rol")
+    
+    if rol not in ["admin_sede", "super_admin"]:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    if rol == "admin_sede":
+        sede_id = current_user.get("sede_id")
+        if not sede_id:
+            raise HTTPException(status_code=403, detail="Usuario sin sede asignada")
+    
+    return await obtener_pronostico(sede_id, solo_reordenar=solo_reordenar)
+
+
+@router.post("/pronostico/recalcular", response_model=dict)
+async def recalcular_pronostico(
+    current_user: dict = Depends(get_current_user)
+):
+    """Ejecuta ahora el cálculo nocturno (SOLO SUPER_ADMIN)."""
+    if current_user.get("rol") != "super_admin":
+        raise HTTPException(status_code=403, detail="Solo super_admin puede recalcular el pronóstico")
+    
+    return await ejecutar_pronostico(forzar=True)
@@ -0,0 +1,249 @@
+"""
+Stock por sede y bandera de stock bajo
+======================================
+
+Cada documento de `inventary` mantiene `stock_bajo` (stock_actual <
+stock_minimo). Todo cambio de stock pasa por ajustar_stock(): un update
+con pipeline que suma la cantidad y recalcula la bandera en la MISMA
+operación atómica (sin leer-modificar-escribir desde Python):
+
+    facturación (venta de productos)   → delta negativo
+    salidas                            → delta negativo, nunca por debajo de 0
+    pedidos recibidos                  → delta positivo
+    ajuste manual                      → delta del ajuste
+
+Las alertas consultan {stock_bajo: true} sobre un índice parcial que
+cubre los campos de la pantalla (consulta solo-índice). Documentos
+anteriores a la bandera se completan una vez por proceso
+(sincronizar_bandera_stock_bajo); si eso falla se usa $expr.
+
+reposicion_sugerida() es el feed de toda la franquicia: consumo diario
+(ventas en inventory_motions + salidas internas en exits) y cantidad
+sugerida en una sola agregación.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.core.pagination import asegurar_indice
+from app.database.mongo import (
+    collection_inventarios, collection_inventory_motions, collection_productos, collection_salidas
+)
+
+logger = logging.getLogger(__name__)
+
+CAMPO_STOCK_BAJO = "stock_bajo"
+INDICE_STOCK_BAJO = "inventary_stock_bajo_cubierto"
+
+# Campos de la pantalla de alertas: todos en el índice → consulta cubierta
+PROYECCION_ALERTA = {
+    "_id": 1,
+    "sede_id": 1,
+    "producto_id": 1,
+    "nombre": 1,
+    "stock_actual": 1,
+    "stock_minimo": 1,
+    "fecha_ultima_actualizacion": 1,
+}
+
+DIAS_CONSUMO = 30
+DIAS_COBERTURA = 14
+
+EXPRESION_STOCK_BAJO = {"$lt": ["$stock_actual", "$stock_minimo"]}
+
+_bandera_sincronizada = False
+_indice_creado = False
+
+
+def es_stock_bajo(stock_actual: float, stock_minimo: float) -> bool:
+    """Para documentos nuevos (insert), misma regla que EXPRESION_STOCK_BAJO."""
+    return (stock_actual or 0) < (stock_minimo or 0)
+
+
+async def ajustar_stock(
+    filtro: Dict,
+    cantidad: float,
+    fecha: Optional[datetime] = None,
+    stock_minimo_requerido: Optional[float] = None
+) -> Optional[Dict]:
+    """
+    Suma `cantidad` (negativa para descontar) al inventario del filtro y
+    recalcula stock_bajo atómicamente. Devuelve el documento YA
+    actualizado, o None si no existe.
+
+    stock_minimo_requerido: solo aplica si stock_actual >= ese valor (p. ej.
+    la cantidad de una salida); si no, None sin modificar nada.
+    """
+    if stock_minimo_requerido is not None:
+        filtro = {**filtro, "stock_actual": {"$gte": stock_minimo_requerido}}
+
+    return await collection_inventarios.find_one_and_update(
+        filtro,
+        [
+            {"$set": {
+                "stock_actual": {"$add": [{"$ifNull": ["$stock_actual", 0]}, cantidad]},
+                "fecha_ultima_actualizacion": fecha or datetime.now(),
+            }},
+            {"$set": {CAMPO_STOCK_BAJO: EXPRESION_STOCK_BAJO}},
+        ],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+# ============================================================
+# CONSULTAS DE STOCK BAJO
+# ============================================================
+
+async def _asegurar_indice_stock_bajo():
+    global _indice_creado
+    if _indice_creado:
+        return
+    try:
+        await collection_inventarios.create_index(
+            [(CAMPO_STOCK_BAJO, 1), ("sede_id", 1), ("producto_id", 1), ("nombre", 1),
+             ("stock_actual", 1), ("stock_minimo", 1), ("fecha_ultima_actualizacion", 1), ("_id", 1)],
+            name=INDICE_STOCK_BAJO,
+            partialFilterExpression={CAMPO_STOCK_BAJO: True}
+        )
+        _indice_creado = True
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo crear el índice {INDICE_STOCK_BAJO}: {e}")
+
+
+async def sincronizar_bandera_stock_bajo() -> bool:
+    """
+    Calcula stock_bajo en los documentos que aún no la tienen (una vez por
+    proceso). Devuelve False si no se pudo: las consultas usan $expr.
+    """
+    global _bandera_sincronizada
+    if _bandera_sincronizada:
+        return True
+    try:
+        resultado = await collection_inventarios.update_many(
+            {CAMPO_STOCK_BAJO: {"$exists": False}},
+            [{"$set": {CAMPO_STOCK_BAJO: EXPRESION_STOCK_BAJO}}]
+        )
+        if resultado.modified_count:
+            logger.info(f"🏷️ stock_bajo calculado en {resultado.modified_count} inventarios")
+        await _asegurar_indice_stock_bajo()
+        _bandera_sincronizada = True
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo sincronizar stock_bajo, se usa $expr: {e}")
+    return _bandera_sincronizada
+
+
+async def filtro_stock_bajo(query: Optional[Dict] = None) -> Dict:
+    """Filtro de inventarios con stock bajo: bandera indexada o $expr de respaldo."""
+    query = dict(query or {})
+    if await sincronizar_bandera_stock_bajo():
+        query[CAMPO_STOCK_BAJO] = True
+    else:
+        query["$expr"] = EXPRESION_STOCK_BAJO
+    return query
+
+
+async def inventarios_stock_bajo(query: Optional[Dict] = None) -> List[Dict]:
+    """Filas para la pantalla de alertas (consulta cubierta por el índice parcial)."""
+    filtro = await filtro_stock_bajo(query)
+    return await collection_inventarios.find(filtro, PROYECCION_ALERTA)\
+        .sort([("sede_id", 1), ("producto_id", 1)])\
+        .to_list(None)
+
+
+# ============================================================
+# REPOSICIÓN SUGERIDA
+# ============================================================
+
+async def reposicion_sugerida(
+    sede_id: Optional[str] = None,
+    dias_consumo: int = DIAS_CONSUMO,
+    dias_cobertura: int = DIAS_COBERTURA
+) -> List[Dict]:
+    """
+    Inventarios con stock bajo (de una sede o de toda la franquicia) con
+    consumo diario de los últimos `dias_consumo` días y cantidad sugerida
+    para cubrir `dias_cobertura` días sin bajar del mínimo. El consumo
+    suma, como pronostico._leer_consumo, las ventas (movimientos negativos
+    de inventory_motions) y las salidas internas (items de exits):
+
+        sugerido = max(stock_minimo, ceil(consumo_diario * dias_cobertura)) - stock_actual
+    """
+    await asegurar_indice(
+        collection_inventory_motions, [("sede_id", 1), ("fecha", 1)], "inventory_motions_sede_fecha"
+    )
+    await asegurar_indice(collection_salidas, [("sede_id", 1), ("fecha_creacion", 1)], "exits_sede_fecha")
+    desde = datetime.now() - timedelta(days=dias_consumo)
+    filtro = await filtro_stock_bajo({"sede_id": sede_id} if sede_id else None)
+
+    pipeline = [
+        {"$match": filtro},
+        {"$project": PROYECCION_ALERTA},
+        {"$lookup": {
+            "from": collection_inventory_motions.name,
+            "let": {"sede": "$sede_id", "producto": "$producto_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$sede_id", "$$sede"]}, "fecha": {"$gte": desde}}},
+                {"$unwind": "$movimientos"},
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$movimientos.producto_id", "$$producto"]},
+                    {"$lt": ["$movimientos.cantidad", 0]},
+                ]}}},
+                {"$group": {"_id": None, "unidades": {"$sum": {"$abs": "$movimientos.cantidad"}}}},
+            ],
+            "as": "consumo",
+        }},
+        {"$lookup": {
+            "from": collection_salidas.name,
+            "let": {"sede": "$sede_id", "producto": "$producto_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$sede_id", "$$sede"]}, "fecha_creacion": {"$gte": desde}}},
+                {"$unwind": "$items"},
+                {"$match": {"$expr": {"$eq": ["$items.producto_id", "$$producto"]}}},
+                {"$group": {"_id": None, "unidades": {"$sum": "$items.cantidad"}}},
+            ],
+            "as": "salidas",
+        }},
+        {"$set": {
+            "consumo_periodo": {"$add": [
+                {"$ifNull": [{"$arrayElemAt": ["$consumo.unidades", 0]}, 0]},
+                {"$ifNull": [{"$arrayElemAt": ["$salidas.unidades", 0]}, 0]},
+            ]},
+        }},
+        {"$set": {
+            "consumo_diario": {"$round": [{"$divide": ["$consumo_periodo", dias_consumo]}, 2]},
+        }},
+        {"$set": {
+            "dias_cobertura": {"$cond": [
+                {"$gt": ["$consumo_diario", 0]},
+                {"$round": [{"$divide": [{"$max": ["$stock_actual", 0]}, "$consumo_diario"]}, 1]},
+                None,
+            ]},
+            "cantidad_sugerida": {"$max": [0, {"$subtract": [
+                {"$max": ["$stock_minimo", {"$ceil": {"$multiply": ["$consumo_diario", dias_cobertura]}}]},
+                "$stock_actual",
+            ]}]},
+        }},
+        {"$lookup": {
+            "from": collection_productos.name,
+            "let": {"producto": "$producto_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$id", "$$producto"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "nombre": 1, "tipo_codigo": 1, "categoria": 1}},
+            ],
+            "as": "producto",
+        }},
+        {"$set": {
+            "producto_nombre": {"$ifNull": [{"$arrayElemAt": ["$producto.nombre", 0]}, "$nombre"]},
+            "producto_codigo": {"$arrayElemAt": ["$producto.tipo_codigo", 0]},
+            "categoria": {"$arrayElemAt": ["$producto.categoria", 0]},
+            "diferencia": {"$subtract": ["$stock_minimo", "$stock_actual"]},
+            # Sin consumo registrado van al final
+            "_orden": {"$ifNull": ["$dias_cobertura", 1e9]},
+        }},
+        {"$sort": {"_orden": 1, "diferencia": -1}},
+        {"$project": {"consumo": 0, "salidas": 0, "producto": 0, "_orden": 0}},
+    ]
+    return await collection_inventarios.aggregate(pipeline).to_list(None)
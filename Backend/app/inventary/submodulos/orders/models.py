@@ -6,7 +6,7 @@ from datetime import datetime
 class ItemPedido(BaseModel):
     nombre: str
     producto_id: str
-    cantidad: int
+    cantidad: Optional[int] = None  # None o 0: se usa la cantidad sugerida del pronóstico
 
 class Pedido(BaseModel):
     proveedor: Optional[str] = None
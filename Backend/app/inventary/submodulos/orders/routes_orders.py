@@ -1,12 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+import logging
 from app.inventary.submodulos.orders.models import Pedido
 from app.database.mongo import collection_pedidos, collection_productos, collection_inventarios
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
+from app.inventary.submodulos.inventarios.stock import ajustar_stock, es_stock_bajo
+from app.inventary.submodulos.inventarios.pronostico import cantidades_sugeridas, obtener_pronostico
+from app.core.pagination import asegurar_indice, ventana_keyset
+from app.core.streaming import BATCH_SIZE, parametro_formato, parametro_limite, respuesta_stream
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
 
-router = APIRouter(prefix="/pedidos")
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/pedidos", route_class=BSONRoute)
 
 
 # =========================================================
@@ -38,17 +46,59 @@ async def asegurar_inventario(nombre: str,producto_id: str, sede_id: str, creado
             "sede_id": sede_id,
             "stock_actual": 0,
             "stock_minimo": 5,  # Default
+            "stock_bajo": es_stock_bajo(0, 5),
             "fecha_creacion": datetime.now(),
             "fecha_ultima_actualizacion": datetime.now(),
             "creado_por": creado_por
         }
         result = await collection_inventarios.insert_one(nuevo_inventario)
-        print(f"✅ Inventario auto-creado: {sede_id} - producto {producto_id}")
+        logger.info(f"✅ Inventario auto-creado: {sede_id} - producto {producto_id}")
         return str(result.inserted_id)
     
     return str(inventario_existente["_id"])
 
 
+# =========================================================
+# 📈 Borrador de pedido desde el pronóstico de consumo
+# =========================================================
+@router.get("/sugerido", response_model=dict)
+async def pedido_sugerido(
+    sede_id: Optional[str] = Query(None, description="Sede (super_admin)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ítems que el pronóstico nocturno marca para reordenar, con su cantidad
+    sugerida: el front los usa para prellenar el formulario de crear_pedido.
+    """
+    rol = current_user.get("rol")
+
+    if rol not in ["admin_sede", "admin_franquicia", "super_admin"]:
+        raise HTTPException(status_code=403, detail="No autorizado para crear pedidos")
+
+    if rol == "admin_sede":
+        sede_id = current_user.get("sede_id")
+    if not sede_id:
+        raise HTTPException(status_code=400, detail="Debe especificar sede_id")
+
+    pronostico = await obtener_pronostico(sede_id, solo_reordenar=True)
+    items = [
+        {
+            "nombre": p.get("nombre"),
+            "producto_id": p["producto_id"],
+            "cantidad": p["cantidad_sugerida"],
+            "stock_actual": p.get("stock_actual"),
+            "dias_restantes": p.get("dias_restantes"),
+            "punto_reorden": p.get("punto_reorden"),
+        }
+        for p in pronostico if p.get("cantidad_sugerida", 0) > 0
+    ]
+    return {
+        "sede_id": sede_id,
+        "items": items,
+        "calculado_en": pronostico[0]["calculado_en"] if pronostico else None,
+    }
+
+
 # =========================================================
 # 📦 Crear pedido (AUTO-CREA INVENTARIO)
 # =========================================================
@@ -61,6 +111,7 @@ async def crear_pedido(
     Crea un pedido y auto-crea registros en inventarios si no existen.
     admin_sede: Solo puede crear pedidos para SU sede (filtro automático)
     super_admin: Puede crear pedidos para cualquier sede
+    Ítems sin cantidad (o 0) toman la cantidad sugerida del pronóstico nocturno.
     """
     rol = current_user.get("rol")
 
@@ -81,6 +132,20 @@ async def crear_pedido(
     data["fecha_creacion"] = datetime.now()
     data["creado_por"] = current_user["email"]
 
+    # 📈 Cantidades sugeridas por el pronóstico para los ítems sin cantidad
+    sin_cantidad = [item for item in data["items"] if not item.get("cantidad")]
+    if sin_cantidad:
+        sugeridas = await cantidades_sugeridas(data["sede_id"], [item["producto_id"] for item in sin_cantidad])
+        for item in sin_cantidad:
+            cantidad = sugeridas.get(item["producto_id"])
+            if not cantidad:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Indica la cantidad de {item['nombre']}: no hay cantidad sugerida para este producto"
+                )
+            item["cantidad"] = cantidad
+            item["cantidad_sugerida"] = True
+
     # ✅ Auto-crear inventarios si no existen
     for item in pedido.items:
         # Validar que el producto existe usando el campo 'id' personalizado
@@ -102,7 +167,7 @@ async def crear_pedido(
     result = await collection_pedidos.insert_one(data)
     data["_id"] = str(result.inserted_id)
 
-    print(f"🟢 EVENTO: pedido.created -> {data['_id']} (sede: {data['sede_id']})")
+    logger.info(f"🟢 EVENTO: pedido.created -> {data['_id']} (sede: {data['sede_id']})")
 
     return {"msg": "Pedido creado exitosamente", "pedido": data}
 
@@ -115,6 +180,9 @@ async def listar_pedidos(
     sede_id: str = None,
     franquicia_id: str = None,
     estado: str = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(),
+    formato: str = parametro_formato(),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -145,8 +213,15 @@ async def listar_pedidos(
     if estado:
         query["estado"] = estado
 
-    pedidos = await collection_pedidos.find(query).to_list(None)
-    return [pedido_to_dict(p) for p in pedidos]
+    # Streaming, más recientes primero (máx. `limit`, siguiente página en X-Next-Cursor)
+    await asegurar_indice(collection_pedidos, [("sede_id", 1), ("_id", -1)], "orders_sede_id")
+    ventana = await ventana_keyset(collection_pedidos, query, [("_id", -1)], limit, cursor)
+    return await respuesta_stream(
+        collection_pedidos.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+        formato,
+        siguiente=ventana["siguiente"],
+        transformar=pedido_to_dict
+    )
 
 
 # =========================================================
@@ -216,32 +291,21 @@ async def actualizar_estado_pedido(
     if nuevo_estado == "recibido":
         for item in pedido["items"]:
             # Buscar inventario de la sede
-            inventario = await collection_inventarios.find_one({
-                "producto_id": item["producto_id"],
-                "sede_id": pedido["sede_id"]
-            })
+            inventario = await ajustar_stock(
+                {"producto_id": item["producto_id"], "sede_id": pedido["sede_id"]},
+                item["cantidad"]
+            )
             
             if inventario:
-                nuevo_stock = inventario["stock_actual"] + item["cantidad"]
-                await collection_inventarios.update_one(
-                    {"_id": inventario["_id"]},
-                    {
-                        "$set": {
-                            "stock_actual": nuevo_stock,
-                            "fecha_ultima_actualizacion": datetime.now()
-                        }
-                    }
-                )
-                
                 # Obtener nombre del producto para log usando 'id'
                 producto = await collection_productos.find_one({"id": item["producto_id"]})
                 producto_nombre = producto.get("nombre", "N/A") if producto else "N/A"
                 
-                print(f"📦 Stock actualizado en inventario -> {pedido['sede_id']} - {producto_nombre}: +{item['cantidad']} unidades")
+                logger.debug(f"📦 Stock actualizado en inventario -> {pedido['sede_id']} - {producto_nombre}: +{item['cantidad']} unidades")
             else:
-                print(f"⚠️ Inventario no encontrado para producto {item['producto_id']} en sede {pedido['sede_id']}")
+                logger.warning(f"⚠️ Inventario no encontrado para producto {item['producto_id']} en sede {pedido['sede_id']}")
         
-        print(f"🟡 EVENTO: pedido.received -> {pedido_id}")
+        logger.info(f"🟡 EVENTO: pedido.received -> {pedido_id}")
 
     return {"msg": f"Pedido actualizado a estado '{nuevo_estado}'"}
 
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+import logging
 from app.inventary.submodulos.products.models import Producto
 from app.database.mongo import collection_productos
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 from datetime import datetime
 from typing import List, Optional, Dict
 from bson import ObjectId
 
-router = APIRouter(prefix="/productos")
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/productos", route_class=BSONRoute)
 
 
 # =========================================================
@@ -257,7 +261,7 @@ async def productos_stock_bajo(
             p_dict["moneda_local"] = moneda
         
         # Emitir evento
-        print(f"⚠️ ALERTA: {p['nombre']} - Stock: {p['stock_actual']}/{p['stock_minimo']}")
+        logger.debug(f"⚠️ ALERTA: {p['nombre']} - Stock: {p['stock_actual']}/{p['stock_minimo']}")
         
         resultado.append(p_dict)
 
@@ -12,8 +12,10 @@ from app.database.mongo import (
     collection_sales,
     collection_inventarios
 )
+from app.analytics.sales_daily import actualizar_ventas_dia
+from app.core.responses import BSONRoute
 
-router = APIRouter(prefix="/sales", tags=["Ventas Directas"])
+router = APIRouter(prefix="/sales", tags=["Ventas Directas"], route_class=BSONRoute)
 
 
 # ============================================================
@@ -203,6 +205,7 @@ async def crear_venta_directa(
     # ⭐ Guardar en BD (solo la venta, SIN tocar inventario)
     result = await collection_sales.insert_one(venta_doc)
     venta_id = str(result.inserted_id)
+    await actualizar_ventas_dia(venta.sede_id, venta_doc["fecha_pago"])
 
     return {
         "success": True,
@@ -306,6 +309,7 @@ async def registrar_pago_venta(
             }
         }
     )
+    await actualizar_ventas_dia(venta.get("sede_id"), venta.get("fecha_pago"))
 
     return {
         "success": True,
@@ -410,6 +414,7 @@ async def eliminar_producto_de_venta(
             }
         }
     )
+    await actualizar_ventas_dia(venta.get("sede_id"), venta.get("fecha_pago"))
 
     return {
         "success": True,
@@ -487,6 +492,7 @@ async def eliminar_todos_productos_de_venta(
             }
         }
     )
+    await actualizar_ventas_dia(venta.get("sede_id"), venta.get("fecha_pago"))
 
     return {
         "success": True,
@@ -5,12 +5,15 @@ from app.scheduling.submodules.block.routes_block import router as block_router
 from app.scheduling.submodules.schedules.routes_schedule import router as schedule_router
 from app.scheduling.submodules.services.routes_services import router as services_router
 from app.scheduling.submodules.quotes.routes_quotes import router as quotes_router
+from app.scheduling.submodules.live.routes_live import router as live_router
+from app.core.responses import BSONRoute
 
 # Crea el router principal del módulo scheduling
-app_router = APIRouter()
+app_router = APIRouter(route_class=BSONRoute)
 
 # Incluye cada submódulo con su propio prefijo
 app_router.include_router(schedule_router, prefix="/schedule", tags=["schedule"])
 app_router.include_router(block_router, prefix="/block", tags=["block"])
 app_router.include_router(services_router, prefix="/services", tags=["services"])
 app_router.include_router(quotes_router, prefix="/quotes", tags=["quotes"])
+app_router.include_router(live_router, prefix="/live", tags=["live"])
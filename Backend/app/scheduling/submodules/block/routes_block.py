@@ -2,11 +2,12 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from app.scheduling.models import Bloqueo
 from app.database.mongo import collection_block
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 from datetime import datetime, time
 from typing import List
 from bson import ObjectId
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 
 # =========================================================
@@ -0,0 +1,359 @@
+"""
+Push en vivo del calendario (change streams → SSE / WebSocket)
+===============================================================
+
+Un ÚNICO change stream por proceso sobre appointments + block; cada cambio
+se reparte en memoria a los suscriptores de su sede (y, si lo pidieron, de
+su profesional). Nada de un watch() por conexión.
+
+    Mongo (replica set) ──watch()──▶ CalendarioWatcher ──▶ HubCalendario
+                                                          ├─ suscriptor sede A
+                                                          ├─ suscriptor sede A / prof 7
+                                                          └─ suscriptor sede B
+
+Eventos (JSON):
+    {"tipo": "cita" | "bloqueo", "operacion": "insert|update|replace|delete",
+     "id": "...", "sede_id": "...", "profesional_id": "...", "documento": {...}}
+    {"tipo": "resync"}   → el cliente perdió eventos: pedir /quotes/cambios
+    {"tipo": "ping"}     → latido
+
+Reconexión: cada evento lleva su resume token (`token`, y `id:` en SSE).
+El watcher guarda los últimos LIVE_BUFFER eventos; si el token con el que
+vuelve el cliente sigue en el buffer se reenvía lo que le faltó, si no se
+manda `resync` y el cliente se pone al día con delta-sync. El propio watcher
+usa su último token (resume_after) para reabrir el stream tras un error.
+
+Backpressure: cada suscriptor tiene una cola acotada (LIVE_QUEUE_MAX). Si
+un consumidor lento la llena, se vacía y se deja un único `resync`: el
+watcher nunca espera por nadie y la memoria por conexión está acotada.
+
+Archivo de citas: el archivador (quotes/archivo_citas.py) borra de
+appointments citas viejas ya copiadas a appointments_archive. Esos borrados
+no son cambios del calendario: el watcher lee la ráfaga de borrados ya
+disponible (hasta RAFAGA_BORRADOS), comprueba en UNA consulta cuáles están
+en el archivo y los descarta. Sin esto, sin pre-imágenes, cada borrado iría
+a todos los suscriptores y una noche de archivo desbordaría sus colas.
+
+Requisitos: MongoDB en replica set (los change streams no existen en un
+standalone). Con LIVE_PREIMAGES=1 (MongoDB 6+, changeStreamPreAndPostImages
+activado en las colecciones) los borrados llevan sede/profesional; sin
+pre-imágenes un borrado se envía a todos los suscriptores (solo el _id).
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.database.mongo import db, collection_block, collection_citas, collection_citas_archivo
+
+logger = logging.getLogger(__name__)
+
+COLA_MAX = int(os.getenv("LIVE_QUEUE_MAX", "256"))
+BUFFER_EVENTOS = int(os.getenv("LIVE_BUFFER", "1000"))
+PRE_IMAGENES = os.getenv("LIVE_PREIMAGES", "0") == "1"
+LATIDO_SEGUNDOS = 15
+RAFAGA_BORRADOS = 500
+REINTENTO_MAX_SEGUNDOS = 60
+
+TIPOS_POR_COLECCION = {
+    collection_citas.name: "cita",
+    collection_block.name: "bloqueo",
+}
+
+# Códigos de Mongo con los que el resume token ya no sirve
+_HISTORIAL_PERDIDO = {136, 280, 286}
+
+EVENTO_RESYNC = {"tipo": "resync"}
+EVENTO_PING = {"tipo": "ping"}
+
+
+# ============================================================
+# SUSCRIPTORES
+# ============================================================
+
+class Suscriptor:
+    """Una conexión SSE / WebSocket: filtro + cola acotada."""
+
+    def __init__(self, sede_id: str, profesional_id: Optional[str] = None, tamano_cola: int = COLA_MAX):
+        self.sede_id = sede_id
+        self.profesional_id = profesional_id
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=tamano_cola)
+        self.desbordes = 0
+
+    def acepta(self, evento: dict) -> bool:
+        sede = evento.get("sede_id")
+        if sede is None:
+            # Borrado sin pre-imagen (o resync): no se sabe de quién era y
+            # no lleva datos. Un documento sin sede no se reparte a nadie.
+            return evento.get("documento") is None
+        if sede != self.sede_id:
+            return False
+        return self.profesional_id is None or evento.get("profesional_id") == self.profesional_id
+
+    def entregar(self, evento: dict):
+        """Nunca bloquea: si la cola está llena se cambia todo lo pendiente por un resync."""
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordes += 1
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(EVENTO_RESYNC)
+            if self.desbordes == 1 or self.desbordes % 10 == 0:
+                logger.warning(
+                    f"⚠️ Suscriptor lento (sede {self.sede_id}): cola llena {self.desbordes} veces, se envía resync"
+                )
+
+
+class HubCalendario:
+    """Reparto en memoria de eventos por sede."""
+
+    def __init__(self, tamano_buffer: int = BUFFER_EVENTOS):
+        self._por_sede: Dict[str, Set[Suscriptor]] = {}
+        self._buffer: Deque[Tuple[str, dict]] = deque(maxlen=tamano_buffer)
+
+    def __len__(self):
+        return sum(len(s) for s in self._por_sede.values())
+
+    def registrar(self, suscriptor: Suscriptor):
+        self._por_sede.setdefault(suscriptor.sede_id, set()).add(suscriptor)
+
+    def quitar(self, suscriptor: Suscriptor):
+        suscriptores = self._por_sede.get(suscriptor.sede_id)
+        if suscriptores is None:
+            return
+        suscriptores.discard(suscriptor)
+        if not suscriptores:
+            del self._por_sede[suscriptor.sede_id]
+
+    def publicar(self, evento: dict):
+        if evento.get("token"):
+            self._buffer.append((evento["token"], evento))
+
+        sede = evento.get("sede_id")
+        if sede is None and evento.get("documento") is None:
+            destinos = [s for grupo in self._por_sede.values() for s in grupo]
+        else:
+            destinos = self._por_sede.get(sede, ())
+
+        for suscriptor in list(destinos):
+            if suscriptor.acepta(evento):
+                suscriptor.entregar(evento)
+
+    def reenviar_desde(self, suscriptor: Suscriptor, token: str) -> bool:
+        """
+        Pone en la cola del suscriptor los eventos posteriores a `token`.
+        False si el token ya no está en el buffer (hay que hacer resync).
+        """
+        tokens = [t for t, _ in self._buffer]
+        try:
+            posicion = tokens.index(token)
+        except ValueError:
+            return False
+
+        for _, evento in list(self._buffer)[posicion + 1:]:
+            if suscriptor.acepta(evento):
+                suscriptor.entregar(evento)
+        return True
+
+    def reiniciar_buffer(self):
+        self._buffer.clear()
+
+
+# ============================================================
+# CONVERSIÓN DE EVENTOS
+# ============================================================
+
+def _token_str(resume_token: Optional[dict]) -> Optional[str]:
+    return resume_token.get("_data") if resume_token else None
+
+
+def _documento_publico(doc: dict) -> dict:
+    documento = dict(doc)
+    documento["_id"] = str(documento["_id"])
+    if isinstance(documento.get("fecha"), datetime):
+        # Mismo formato que GET /quotes/ (ver FECHA_CITA_STR)
+        documento["fecha"] = documento["fecha"].strftime("%Y-%m-%d")
+    return documento
+
+
+def convertir_cambio(cambio: dict) -> Optional[dict]:
+    """Evento del change stream → evento para los clientes (None si no aplica)."""
+    operacion = cambio.get("operationType")
+    tipo = TIPOS_POR_COLECCION.get(cambio.get("ns", {}).get("coll"))
+    if tipo is None or operacion not in ("insert", "update", "replace", "delete"):
+        return None
+
+    documento = cambio.get("fullDocument")
+    referencia = documento or cambio.get("fullDocumentBeforeChange") or {}
+
+    if operacion != "delete" and documento is None:
+        # update con updateLookup sobre un documento ya borrado: se trata como borrado
+        operacion = "delete"
+
+    return {
+        "tipo": tipo,
+        "operacion": operacion,
+        "id": str(cambio["documentKey"]["_id"]),
+        "sede_id": referencia.get("sede_id"),
+        "profesional_id": referencia.get("profesional_id"),
+        "documento": _documento_publico(documento) if documento and operacion != "delete" else None,
+        "token": _token_str(cambio.get("_id")),
+    }
+
+
+def _es_borrado_cita(cambio: dict) -> bool:
+    return cambio.get("operationType") == "delete" and cambio.get("ns", {}).get("coll") == collection_citas.name
+
+
+async def _ids_archivados(cambios) -> Set:
+    ids = [c["documentKey"]["_id"] for c in cambios if _es_borrado_cita(c)]
+    if not ids:
+        return set()
+    archivadas = await collection_citas_archivo.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)
+    return {c["_id"] for c in archivadas}
+
+
+# ============================================================
+# WATCHER (UNO POR PROCESO)
+# ============================================================
+
+class CalendarioWatcher:
+    def __init__(self, hub: HubCalendario):
+        self.hub = hub
+        self.ultimo_token: Optional[dict] = None
+        self.disponible = False
+        self._tarea: Optional[asyncio.Task] = None
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self):
+        if not self.activo:
+            self._tarea = asyncio.create_task(self._ejecutar(), name="calendario-watcher")
+
+    async def detener(self):
+        if not self.activo:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+        self.disponible = False
+
+    def _opciones_watch(self) -> dict:
+        opciones = {"full_document": "updateLookup"}
+        if PRE_IMAGENES:
+            opciones["full_document_before_change"] = "whenAvailable"
+        if self.ultimo_token:
+            opciones["resume_after"] = self.ultimo_token
+        return opciones
+
+    async def _procesar(self, stream, cambio: dict):
+        cambios = [cambio]
+        archivadas: Set = set()
+        if _es_borrado_cita(cambio):
+            # Ráfaga de borrados (el archivador): los ya disponibles se filtran juntos
+            while len(cambios) < RAFAGA_BORRADOS and _es_borrado_cita(cambios[-1]):
+                siguiente = await stream.try_next()
+                if siguiente is None:
+                    break
+                cambios.append(siguiente)
+            archivadas = await _ids_archivados(cambios)
+
+        # El token avanza al publicar: si la consulta falla se reanuda antes de la ráfaga
+        for c in cambios:
+            evento = convertir_cambio(c)
+            if evento and not (_es_borrado_cita(c) and c["documentKey"]["_id"] in archivadas):
+                self.hub.publicar(evento)
+            self.ultimo_token = c["_id"]
+
+    async def _ejecutar(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(TIPOS_POR_COLECCION)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        intentos = 0
+
+        while True:
+            try:
+                async with db.watch(pipeline, **self._opciones_watch()) as stream:
+                    self.disponible = True
+                    intentos = 0
+                    logger.info("📡 Change stream del calendario abierto")
+                    async for cambio in stream:
+                        await self._procesar(stream, cambio)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self.disponible = False
+                if e.code in _HISTORIAL_PERDIDO:
+                    # El oplog ya no tiene el token: empezar de cero y que todos resincronicen
+                    logger.warning(f"⚠️ Resume token del calendario inválido ({e.code}); se reinicia el stream")
+                    self.ultimo_token = None
+                    self.hub.reiniciar_buffer()
+                    self.hub.publicar(EVENTO_RESYNC)
+                    continue
+                logger.error(f"❌ Change stream del calendario: {e}")
+            except PyMongoError as e:
+                self.disponible = False
+                logger.error(f"❌ Change stream del calendario interrumpido: {e}")
+
+            intentos += 1
+            espera = min(REINTENTO_MAX_SEGUNDOS, 2 ** intentos)
+            logger.info(f"🔁 Reintentando change stream del calendario en {espera}s")
+            await asyncio.sleep(espera)
+
+
+hub_calendario = HubCalendario()
+watcher_calendario = CalendarioWatcher(hub_calendario)
+
+
+# ============================================================
+# API PARA LOS ENDPOINTS
+# ============================================================
+
+def suscribir(sede_id: str, profesional_id: Optional[str] = None, ultimo_token: Optional[str] = None) -> Suscriptor:
+    """
+    Registra un suscriptor (arranca el watcher si es el primero). Con
+    `ultimo_token` reenvía lo perdido o, si no es posible, encola un resync.
+    """
+    watcher_calendario.iniciar()
+
+    suscriptor = Suscriptor(sede_id, profesional_id)
+    if ultimo_token and not hub_calendario.reenviar_desde(suscriptor, ultimo_token):
+        suscriptor.entregar(EVENTO_RESYNC)
+    hub_calendario.registrar(suscriptor)
+    return suscriptor
+
+
+def desuscribir(suscriptor: Suscriptor):
+    hub_calendario.quitar(suscriptor)
+
+
+async def siguiente_evento(suscriptor: Suscriptor, espera: float = LATIDO_SEGUNDOS) -> dict:
+    """Próximo evento de la cola o un ping si no llega nada en `espera` segundos."""
+    try:
+        return await asyncio.wait_for(suscriptor.cola.get(), timeout=espera)
+    except asyncio.TimeoutError:
+        return EVENTO_PING
+
+
+async def detener_watcher():
+    await watcher_calendario.detener()
+
+
+def estado() -> Dict[str, object]:
+    return {
+        "watcher_activo": watcher_calendario.activo,
+        "change_stream_disponible": watcher_calendario.disponible,
+        "suscriptores": len(hub_calendario),
+    }
+
@@ -0,0 +1,161 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+
+from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute, dumps_bson
+from app.scheduling.submodules.live.calendar_stream import (
+    suscribir,
+    desuscribir,
+    siguiente_evento,
+    estado,
+)
+
+router = APIRouter(route_class=BSONRoute)
+
+# Código de cierre WebSocket por política (token inválido / sin permisos)
+WS_CIERRE_POLITICA = 1008
+
+
+# =========================================================
+# 🔐 Helpers de autenticación y alcance
+# =========================================================
+async def _usuario_desde_token(request_o_ws, token: Optional[str]) -> dict:
+    """
+    EventSource y WebSocket del navegador no envían cabeceras propias:
+    se acepta el JWT en `?token=` además de Authorization: Bearer.
+    """
+    if not token:
+        autorizacion = request_o_ws.headers.get("authorization", "")
+        if autorizacion.lower().startswith("bearer "):
+            token = autorizacion[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Token requerido")
+    return await get_current_user(token)
+
+
+def _alcance(current_user: dict, sede_id: Optional[str], profesional_id: Optional[str]):
+    """Misma regla que /quotes/cambios: admin_sede y estilista solo ven su sede."""
+    if current_user.get("rol") in ["admin_sede", "estilista"]:
+        sede_id = current_user.get("sede_id")
+    if not sede_id:
+        raise HTTPException(status_code=400, detail="sede_id es requerido")
+    return sede_id, profesional_id
+
+
+def _formato_sse(evento: dict) -> bytes:
+    if evento.get("tipo") == "ping":
+        return b": ping\n\n"
+    lineas = b""
+    if evento.get("token"):
+        lineas += f"id: {evento['token']}\n".encode()
+    lineas += f"event: {evento['tipo']}\n".encode()
+    return lineas + b"data: " + dumps_bson(evento) + b"\n\n"
+
+
+# =========================================================
+# 📡 SSE: /scheduling/live/stream
+# =========================================================
+@router.get("/stream")
+async def stream_calendario(
+    request: Request,
+    sede_id: Optional[str] = Query(None),
+    profesional_id: Optional[str] = Query(None, description="Solo cambios de este profesional"),
+    token: Optional[str] = Query(None, description="JWT (EventSource no admite cabeceras)"),
+    ultimo_evento: Optional[str] = Query(None, description="Resume token si no se usa Last-Event-ID")
+):
+    """
+    Server-Sent Events con los cambios de citas y bloqueos de la sede.
+    Al reconectar, EventSource manda Last-Event-ID y se reenvía lo perdido
+    (o un evento `resync` → pedir GET /scheduling/quotes/cambios).
+    """
+    current_user = await _usuario_desde_token(request, token)
+    sede_id, profesional_id = _alcance(current_user, sede_id, profesional_id)
+
+    suscriptor = suscribir(
+        sede_id,
+        profesional_id,
+        request.headers.get("last-event-id") or ultimo_evento
+    )
+
+    async def eventos():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                evento = await siguiente_evento(suscriptor)
+                if await request.is_disconnected():
+                    break
+                yield _formato_sse(evento)
+        finally:
+            desuscribir(suscriptor)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx: no acumular el stream
+            # GZipMiddleware no toca respuestas que ya declaran Content-Encoding;
+            # comprimir un stream lo retendría en el buffer del compresor
+            "Content-Encoding": "identity",
+        }
+    )
+
+
+# =========================================================
+# 🔌 WebSocket: /scheduling/live/ws
+# =========================================================
+@router.websocket("/ws")
+async def ws_calendario(
+    websocket: WebSocket,
+    sede_id: Optional[str] = None,
+    profesional_id: Optional[str] = None,
+    token: Optional[str] = None,
+    ultimo_evento: Optional[str] = None
+):
+    """
+    Mismos eventos que /stream. El cliente guarda el `token` del último
+    evento y lo manda en `?ultimo_evento=` al reconectar.
+    """
+    try:
+        current_user = await _usuario_desde_token(websocket, token)
+        sede_id, profesional_id = _alcance(current_user, sede_id, profesional_id)
+    except HTTPException as e:
+        await websocket.close(code=WS_CIERRE_POLITICA, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    suscriptor = suscribir(sede_id, profesional_id, ultimo_evento)
+
+    async def enviar():
+        while True:
+            evento = await siguiente_evento(suscriptor)
+            await websocket.send_text(dumps_bson(evento).decode())
+
+    async def recibir():
+        # Solo para detectar el cierre; los mensajes del cliente se ignoran
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tareas = [asyncio.create_task(enviar()), asyncio.create_task(recibir())]
+    try:
+        await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        desuscribir(suscriptor)
+
+
+# =========================================================
+# 🩺 Estado del push en vivo
+# =========================================================
+@router.get("/estado", response_model=dict)
+async def estado_push(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "super_admin":
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return estado()
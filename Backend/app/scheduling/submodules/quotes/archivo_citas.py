@@ -0,0 +1,264 @@
+"""
+Archivo de citas (caliente / frío)
+==================================
+
+`appointments` crece sin límite y cada agenda, churn o KPI trabaja sobre
+toda la historia. Las citas cerradas (completada, finalizada, cancelada,
+no asistió) con fecha anterior al CORTE se mueven a `appointments_archive`:
+
+- El corte (fecha "YYYY-MM-DD") se publica en `migrations` ANTES de mover
+  nada; el archivo solo contiene citas con fecha < corte. Citas antiguas
+  que sigan abiertas se quedan en caliente.
+- Lecturas: una consulta cuyo rango empieza en o después del corte solo
+  toca `appointments`; si empieza antes (o no tiene inicio), la
+  agregación añade el archivo con $unionWith (pipeline_citas()).
+  buscar_cita() busca por filtro y, si no está, en el archivo.
+- Escrituras: el archivo es de solo lectura. buscar_cita_editable()
+  responde 409 si la cita solo existe archivada (en lugar de actualizar
+  0 documentos en caliente y reportar éxito).
+- Movimiento por lotes: copia (ReplaceOne upsert, idempotente) y borra en
+  caliente solo si la cita no cambió entretanto (misma
+  ultima_actualizacion). Si se interrumpe, la siguiente ejecución
+  continúa con lo que quede.
+- Los procesos leen el corte con caché de CORTE_TTL segundos: tras
+  publicar un corte nuevo el archivador espera ese tiempo antes de mover.
+- Mientras un lote está copiado y aún no borrado, una consulta sobre el
+  archivo puede ver la cita dos veces (milisegundos).
+
+Desactivado por defecto. ARCHIVO_CITAS_DIAS=730 activa el job nocturno
+(cash/scheduler.py) con ese horizonte. Manual:
+    python -m app.scheduling.submodules.quotes.archivo_citas
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo import DeleteOne, ReplaceOne
+
+from app.database.mongo import collection_citas, collection_citas_archivo, collection_migraciones
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_DIAS = int(os.getenv("ARCHIVO_CITAS_DIAS", "0"))
+ARCHIVO_HORA = int(os.getenv("ARCHIVO_CITAS_HORA_UTC", "4"))
+ARCHIVO_LOTE = 500
+CONTROL_ID = "archivo_citas"
+CORTE_TTL = 60
+
+ESTADOS_ARCHIVABLES = ["completada", "finalizada", "finalizado", "cancelada", "no asistio", "no_asistio"]
+
+_corte_cache: Dict = {"valor": None, "leido": 0.0}
+_indices_creados = False
+
+
+# ============================================================
+# CORTE
+# ============================================================
+
+def _fecha_str(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime("%Y-%m-%d")
+    return str(valor)[:10]
+
+
+async def corte_archivo() -> Optional[str]:
+    """Fecha desde la que todo sigue en caliente (None: no hay archivo)."""
+    ahora = time.monotonic()
+    if ahora - _corte_cache["leido"] > CORTE_TTL:
+        control = await collection_migraciones.find_one({"_id": CONTROL_ID}, {"corte": 1})
+        _corte_cache["valor"] = (control or {}).get("corte")
+        _corte_cache["leido"] = ahora
+    return _corte_cache["valor"]
+
+
+async def necesita_archivo(desde=None) -> bool:
+    """¿Un rango que empieza en `desde` (None = sin inicio) puede tener citas archivadas?"""
+    corte = await corte_archivo()
+    if not corte:
+        return False
+    desde_str = _fecha_str(desde)
+    return desde_str is None or desde_str < corte
+
+
+# ============================================================
+# LECTURA
+# ============================================================
+
+def con_archivo(pipeline: List[Dict]) -> List[Dict]:
+    """Pipeline de appointments que incluye el archivo (mismo $match inicial)."""
+    if pipeline and "$match" in pipeline[0]:
+        return [
+            pipeline[0],
+            {"$unionWith": {"coll": collection_citas_archivo.name, "pipeline": [pipeline[0]]}},
+            *pipeline[1:],
+        ]
+    return [{"$unionWith": {"coll": collection_citas_archivo.name}}, *pipeline]
+
+
+async def pipeline_citas(pipeline: List[Dict], desde=None) -> List[Dict]:
+    """
+    Pipeline para collection_citas.aggregate(): añade el archivo solo si el
+    rango (que empieza en `desde`) llega a citas anteriores al corte.
+    """
+    if await necesita_archivo(desde):
+        return con_archivo(pipeline)
+    return pipeline
+
+
+async def buscar_cita(filtro: Dict, proyeccion: Optional[Dict] = None) -> Optional[Dict]:
+    """find_one en caliente y, si no está, en el archivo (solo lectura)."""
+    cita = await collection_citas.find_one(filtro, proyeccion)
+    if cita is None and await corte_archivo():
+        cita = await collection_citas_archivo.find_one(filtro, proyeccion)
+    return cita
+
+
+async def buscar_cita_editable(filtro: Dict, proyeccion: Optional[Dict] = None) -> Optional[Dict]:
+    """find_one en caliente para modificar la cita; si está archivada → 409."""
+    cita = await collection_citas.find_one(filtro, proyeccion)
+    if cita is None and await corte_archivo():
+        if await collection_citas_archivo.find_one(filtro, {"_id": 1}):
+            raise HTTPException(
+                status_code=409,
+                detail="La cita está archivada (cerrada y anterior al corte) y no se puede modificar"
+            )
+    return cita
+
+
+# ============================================================
+# ARCHIVADOR
+# ============================================================
+
+async def crear_indices_archivo():
+    global _indices_creados
+    if _indices_creados:
+        return
+    await collection_citas_archivo.create_index([("sede_id", 1), ("fecha", 1)], name="archive_sede_fecha")
+    await collection_citas_archivo.create_index([("cliente_id", 1), ("fecha", -1)], name="archive_cliente_fecha")
+    await collection_citas_archivo.create_index([("profesional_id", 1), ("fecha", 1)], name="archive_profesional_fecha")
+    await collection_citas.create_index([("estado", 1), ("fecha", 1)], name="citas_estado_fecha")
+    _indices_creados = True
+
+
+def filtro_archivable(corte: str) -> Dict:
+    """Citas cerradas con fecha < corte (texto o datetime en las antiguas)."""
+    return {
+        "estado": {"$in": ESTADOS_ARCHIVABLES},
+        "$or": [
+            {"fecha": {"$type": "string", "$lt": corte}},
+            {"fecha": {"$type": "date", "$lt": datetime.strptime(corte, "%Y-%m-%d")}},
+        ],
+    }
+
+
+async def _publicar_corte(corte: str) -> bool:
+    """Guarda el corte nuevo; True si cambió (hay que esperar a que los procesos lo lean)."""
+    control = await collection_migraciones.find_one({"_id": CONTROL_ID}) or {}
+    if control.get("corte") and control["corte"] >= corte:
+        return False
+    await collection_migraciones.update_one(
+        {"_id": CONTROL_ID},
+        {"$set": {"corte": corte, "corte_publicado_en": datetime.utcnow()}},
+        upsert=True
+    )
+    _corte_cache["leido"] = 0.0
+    return True
+
+
+async def _mover_lote(corte: str, excluir: List) -> Dict:
+    filtro = filtro_archivable(corte)
+    if excluir:
+        filtro["_id"] = {"$nin": excluir}
+    citas = await collection_citas.find(filtro).limit(ARCHIVO_LOTE).to_list(None)
+    if not citas:
+        return {"leidas": 0, "movidas": 0, "cambiadas": []}
+
+    await collection_citas_archivo.bulk_write(
+        [ReplaceOne({"_id": cita["_id"]}, cita, upsert=True) for cita in citas],
+        ordered=False
+    )
+    borrado = await collection_citas.bulk_write(
+        [DeleteOne({"_id": cita["_id"], "ultima_actualizacion": cita.get("ultima_actualizacion")}) for cita in citas],
+        ordered=False
+    )
+
+    cambiadas = []
+    if borrado.deleted_count < len(citas):
+        # Citas editadas entre la copia y el borrado: siguen en caliente, fuera del archivo
+        ids = [cita["_id"] for cita in citas]
+        siguen = await collection_citas.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)
+        cambiadas = [c["_id"] for c in siguen]
+        await collection_citas_archivo.delete_many({"_id": {"$in": cambiadas}})
+
+    return {"leidas": len(citas), "movidas": borrado.deleted_count, "cambiadas": cambiadas}
+
+
+async def archivar_citas(dias: Optional[int] = None, esperar_publicacion: bool = True) -> Dict:
+    """Mueve al archivo las citas cerradas con más de `dias` días de antigüedad."""
+    dias = dias if dias is not None else ARCHIVO_DIAS
+    if dias <= 0:
+        return {"archivo": "desactivado"}
+
+    inicio = time.monotonic()
+    await crear_indices_archivo()
+    corte = (datetime.utcnow() - timedelta(days=dias)).strftime("%Y-%m-%d")
+
+    if await _publicar_corte(corte) and esperar_publicacion:
+        logger.info(f"🗄️ Corte de archivo publicado: {corte}; esperando {CORTE_TTL + 5}s")
+        await asyncio.sleep(CORTE_TTL + 5)
+
+    corte_vigente = (await collection_migraciones.find_one({"_id": CONTROL_ID}))["corte"]
+    movidas = 0
+    excluir: List = []
+    while True:
+        lote = await _mover_lote(corte_vigente, excluir)
+        if not lote["leidas"]:
+            break
+        movidas += lote["movidas"]
+        excluir.extend(lote["cambiadas"])
+        logger.info(f"⏳ Archivo de citas: {movidas} movidas")
+
+    duracion = round(time.monotonic() - inicio, 2)
+    await collection_migraciones.update_one(
+        {"_id": CONTROL_ID},
+        {"$set": {"ultima_ejecucion": datetime.utcnow(), "ultimas_movidas": movidas}, "$inc": {"total_movidas": movidas}}
+    )
+    logger.info(f"✅ Archivo de citas: {movidas} citas anteriores a {corte_vigente} movidas en {duracion}s")
+    return {"corte": corte_vigente, "movidas": movidas, "omitidas": len(excluir), "duracion_segundos": duracion}
+
+
+async def _ejecutar_programado():
+    try:
+        await archivar_citas()
+    except Exception as e:
+        logger.error(f"❌ Error archivando citas: {e}", exc_info=True)
+
+
+def registrar_job_archivo(scheduler):
+    """Job nocturno (cash/scheduler.py); solo si ARCHIVO_CITAS_DIAS > 0."""
+    if ARCHIVO_DIAS <= 0:
+        return
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler.add_job(
+        _ejecutar_programado,
+        trigger=CronTrigger(hour=ARCHIVO_HORA, minute=30, timezone="UTC"),
+        id="archivo_citas",
+        name="Archivo de citas antiguas",
+        replace_existing=True
+    )
+    logger.info(f"✅ Job registrado: archivo de citas (> {ARCHIVO_DIAS} días) a las {ARCHIVO_HORA:02d}:30 UTC")
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    dias_cli = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(asyncio.run(archivar_citas(dias_cli)))
@@ -0,0 +1,199 @@
+"""
+Vista compacta del calendario (semana por profesional)
+======================================================
+
+GET /quotes/ devuelve la cita completa (historial_pagos, productos, correo,
+teléfono...) y la enriquece en Python. La grilla del calendario solo
+necesita id, profesional, inicio/fin, cliente, servicios, estado y estado
+de pago, así que esta vista:
+
+- proyecta en la agregación únicamente esos campos;
+- agrupa por profesional y devuelve COLUMNAS (un array por campo) en lugar
+  de un objeto por cita;
+- codifica con diccionario los textos repetidos (fechas, clientes,
+  servicios, estados): en las columnas va el índice dentro de `diccionario`;
+- inicio / fin en minutos desde medianoche ("09:30" → 570): inicio_min /
+  fin_min guardados en la cita (tiempos_cita.py); solo las citas sin
+  migrar se parsean.
+
+Formato:
+    {
+      "sede_id": "...", "desde": "2025-06-02", "hasta": "2025-06-08", "total": 412,
+      "diccionario": {"fechas": [...], "clientes": [...], "servicios": [...],
+                      "estados": [...], "estados_pago": [...]},
+      "profesionales": [
+        {"profesional_id": "P1", "nombre": "Ana",
+         "citas": {"id": [...], "fecha": [0, 0, 1], "inicio": [540, ...], "fin": [...],
+                   "cliente": [3, ...], "servicios": [[0, 2], ...],
+                   "estado": [0, ...], "estado_pago": [1, ...]}}
+      ]
+    }
+
+Reconstruir la cita i del profesional p en el cliente:
+    fecha = diccionario.fechas[p.citas.fecha[i]], etc.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Hashable, List, Optional
+
+from app.database.mongo import collection_citas, collection_servicios
+from app.scheduling.submodules.quotes.archivo_citas import pipeline_citas
+from app.scheduling.submodules.quotes.delta_sync import FECHA_CITA_STR
+from app.scheduling.submodules.quotes.tiempos_cita import hora_a_minutos
+
+MAX_DIAS_VISTA = 31
+
+COLUMNAS = ("id", "fecha", "inicio", "fin", "cliente", "servicios", "estado", "estado_pago")
+
+PROYECCION_VISTA = {
+    "_id": 1,
+    "profesional_id": 1,
+    "profesional_nombre": 1,
+    "fecha": FECHA_CITA_STR,
+    "hora_inicio": 1,
+    "hora_fin": 1,
+    "inicio_min": 1,
+    "fin_min": 1,
+    "cliente_nombre": 1,
+    "estado": 1,
+    "estado_pago": 1,
+    "servicios_ids": {"$ifNull": ["$servicios.servicio_id", []]},
+    "servicios_nombres": {"$ifNull": ["$servicios.nombre", []]},
+    "servicio_id": 1,  # estructura muy antigua (un solo servicio)
+}
+
+
+class _Diccionario:
+    """Valor → índice estable en orden de aparición."""
+
+    def __init__(self):
+        self._indices: Dict[Hashable, int] = {}
+        self.valores: List = []
+
+    def indice(self, valor) -> int:
+        posicion = self._indices.get(valor)
+        if posicion is None:
+            posicion = len(self.valores)
+            self._indices[valor] = posicion
+            self.valores.append(valor)
+        return posicion
+
+
+def _minutos(cita: dict, campo_min: str, campo_hora: str) -> Optional[int]:
+    minutos = cita.get(campo_min)
+    return minutos if minutos is not None else hora_a_minutos(cita.get(campo_hora))
+
+
+def filtro_rango(sede_id: str, desde: date, hasta: date, profesional_id: Optional[str] = None) -> Dict:
+    """
+    Citas de la sede entre desde y hasta (ambos incluidos). Las citas
+    antiguas guardan `fecha` como datetime: se cubren ambos tipos.
+    """
+    filtro = {
+        "sede_id": sede_id,
+        "$or": [
+            {"fecha": {"$gte": desde.isoformat(), "$lte": hasta.isoformat()}},
+            {"fecha": {
+                "$gte": datetime.combine(desde, time.min),
+                "$lt": datetime.combine(hasta + timedelta(days=1), time.min)
+            }},
+        ],
+    }
+    if profesional_id:
+        filtro["profesional_id"] = profesional_id
+    return filtro
+
+
+def _nombres_servicios(cita: dict, catalogo: Dict[str, str]) -> List[str]:
+    nombres = cita.get("servicios_nombres") or []
+    ids = cita.get("servicios_ids") or []
+    if ids:
+        return [
+            (nombres[i] if i < len(nombres) and nombres[i] else None) or catalogo.get(sid, "Servicio")
+            for i, sid in enumerate(ids)
+        ]
+    if cita.get("servicio_id"):
+        return [catalogo.get(cita["servicio_id"], "Sin servicio")]
+    return []
+
+
+def codificar_columnas(citas: List[dict], catalogo_servicios: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Citas proyectadas (ordenadas por profesional, fecha, hora) → estructura
+    columnar agrupada por profesional con diccionarios compartidos.
+    """
+    catalogo = catalogo_servicios or {}
+    fechas, clientes, servicios = _Diccionario(), _Diccionario(), _Diccionario()
+    estados, estados_pago = _Diccionario(), _Diccionario()
+
+    profesionales: Dict[str, Dict] = {}
+    for cita in citas:
+        profesional_id = cita.get("profesional_id")
+        grupo = profesionales.get(profesional_id)
+        if grupo is None:
+            grupo = {
+                "profesional_id": profesional_id,
+                "nombre": cita.get("profesional_nombre"),
+                "citas": {columna: [] for columna in COLUMNAS},
+            }
+            profesionales[profesional_id] = grupo
+
+        columnas = grupo["citas"]
+        columnas["id"].append(str(cita["_id"]))
+        columnas["fecha"].append(fechas.indice(cita.get("fecha")))
+        columnas["inicio"].append(_minutos(cita, "inicio_min", "hora_inicio"))
+        columnas["fin"].append(_minutos(cita, "fin_min", "hora_fin"))
+        columnas["cliente"].append(clientes.indice(cita.get("cliente_nombre")))
+        columnas["servicios"].append([servicios.indice(n) for n in _nombres_servicios(cita, catalogo)])
+        columnas["estado"].append(estados.indice(cita.get("estado")))
+        columnas["estado_pago"].append(estados_pago.indice(cita.get("estado_pago")))
+
+    return {
+        "total": len(citas),
+        "diccionario": {
+            "fechas": fechas.valores,
+            "clientes": clientes.valores,
+            "servicios": servicios.valores,
+            "estados": estados.valores,
+            "estados_pago": estados_pago.valores,
+        },
+        "profesionales": list(profesionales.values()),
+    }
+
+
+async def _catalogo_servicios_faltantes(citas: List[dict]) -> Dict[str, str]:
+    """Nombres solo de los servicios que la cita no trae embebidos (estructuras antiguas)."""
+    faltantes = set()
+    for cita in citas:
+        nombres = cita.get("servicios_nombres") or []
+        for i, sid in enumerate(cita.get("servicios_ids") or []):
+            if i >= len(nombres) or not nombres[i]:
+                faltantes.add(sid)
+        if not cita.get("servicios_ids") and cita.get("servicio_id"):
+            faltantes.add(cita["servicio_id"])
+
+    faltantes.discard(None)
+    if not faltantes:
+        return {}
+
+    servicios = await collection_servicios.find(
+        {"servicio_id": {"$in": list(faltantes)}},
+        {"_id": 0, "servicio_id": 1, "nombre": 1}
+    ).to_list(None)
+    return {s["servicio_id"]: s.get("nombre", "Servicio") for s in servicios}
+
+
+async def construir_vista_calendario(
+    sede_id: str,
+    desde: date,
+    hasta: date,
+    profesional_id: Optional[str] = None
+) -> Dict:
+    filtro = filtro_rango(sede_id, desde, hasta, profesional_id)
+    citas = await collection_citas.aggregate(await pipeline_citas([
+        {"$match": filtro},
+        {"$project": PROYECCION_VISTA},
+        {"$sort": {"profesional_id": 1, "fecha": 1, "hora_inicio": 1}},
+    ], desde)).to_list(None)
+
+    vista = codificar_columnas(citas, await _catalogo_servicios_faltantes(citas))
+    return {"sede_id": sede_id, "desde": desde.isoformat(), "hasta": hasta.isoformat(), **vista}
@@ -1,4 +1,5 @@
 import requests
+import logging
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
@@ -17,6 +18,10 @@ from io import BytesIO
 import os
 import base64
 
+from app.core.tiempos_peticion import medir_fase
+
+logger = logging.getLogger(__name__)
+
 # -----------------------
 # EMAIL (config desde env)
 # -----------------------
@@ -38,7 +43,7 @@ async def descargar_imagen(url: str) -> BytesIO:
         response.raise_for_status()
         return BytesIO(response.content)
     except Exception as e:
-        print(f"❌ Error descargando imagen {url}: {e}")
+        logger.error(f"❌ Error descargando imagen {url}: {e}")
         return None
 
 async def descargar_logo() -> BytesIO:
@@ -50,10 +55,10 @@ async def descargar_logo() -> BytesIO:
             return logo_buffer
         else:
             # Fallback al logo alternativo
-            print("⚠️ Usando logo alternativo...")
+            logger.warning("⚠️ Usando logo alternativo...")
             return await descargar_imagen(LOGO_ALTERNATIVO)
     except Exception as e:
-        print(f"❌ Error descargando logo: {e}")
+        logger.error(f"❌ Error descargando logo: {e}")
         return None
 
 def imagen_a_base64(img_buffer: BytesIO) -> str:
@@ -176,7 +181,7 @@ async def crear_cabecera(story, estilos):
                                                spaceAfter=15,
                                                spaceBefore=20)))
     except Exception as e:
-        print(f"⚠️ Error creando cabecera: {e}")
+        logger.warning(f"⚠️ Error creando cabecera: {e}")
         story.append(Paragraph("RIZOS FELICES", 
                               ParagraphStyle('LogoText', 
                                            fontName='Helvetica-Bold',
@@ -348,7 +353,7 @@ async def crear_seccion_fotos(ficha_data, estilos):
                                                            textColor=colors.gray)))
                     secciones.append(Spacer(1, 10))
             except Exception as e:
-                print(f"Error procesando imagen antes {i+1}: {e}")
+                logger.error(f"Error procesando imagen antes {i+1}: {e}")
         
         secciones.append(Spacer(1, 15))
     
@@ -371,7 +376,7 @@ async def crear_seccion_fotos(ficha_data, estilos):
                                                            textColor=colors.gray)))
                     secciones.append(Spacer(1, 10))
             except Exception as e:
-                print(f"Error procesando imagen después {i+1}: {e}")
+                logger.error(f"Error procesando imagen después {i+1}: {e}")
         
         secciones.append(Spacer(1, 20))
     
@@ -797,9 +802,7 @@ async def generar_pdf_ficha(ficha_data: dict, cita_data: dict) -> bytes:
         buffer.seek(0)
         return buffer.getvalue()
     except Exception as e:
-        print(f"❌ Error generando PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error generando PDF: {e}")
         return await generar_pdf_simple_fallback(ficha_data, cita_data)
 
 
@@ -1145,6 +1148,7 @@ def crear_html_correo_ficha(cliente_nombre: str, servicio_nombre: str, fecha: st
     </html>
     """
 
+@medir_fase("email")
 async def enviar_correo_con_pdf(
     destinatario: str, 
     asunto: str, 
@@ -1180,10 +1184,10 @@ async def enviar_correo_con_pdf(
             server.login(EMAIL_SENDER, EMAIL_PASSWORD)
             server.send_message(msg)
         
-        print(f"✅ Correo con PDF enviado a {destinatario}")
+        logger.info(f"✅ Correo con PDF enviado a {destinatario}")
         return True
         
     except Exception as e:
-        print(f"❌ Error enviando email con PDF: {e}")
+        logger.error(f"❌ Error enviando email con PDF: {e}")
         return False
     
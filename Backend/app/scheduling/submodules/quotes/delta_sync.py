@@ -0,0 +1,159 @@
+"""
+Delta-sync del calendario de citas
+==================================
+
+En lugar de re-descargar todo el rango en cada refresco, el frontend pide
+solo lo que cambió desde su última marca de agua (watermark):
+
+    1. GET /scheduling/quotes/cambios?sede_id=X          → {watermark}
+    2. Carga completa con GET /scheduling/quotes/?sede_id=X
+    3. GET /scheduling/quotes/cambios?sede_id=X&desde=<watermark>
+       → citas creadas / editadas / canceladas + eliminadas (tombstones)
+       → nuevo watermark para la siguiente llamada
+
+Reglas:
+- Toda escritura de una cita actualiza `ultima_actualizacion` con
+  marca_actualizacion() (un único reloj para comparar con el watermark).
+- Las eliminaciones físicas dejan un tombstone en appointments_tombstones
+  (registrar_eliminacion). Caducan a los CITAS_TOMBSTONE_DIAS días: un
+  watermark más antiguo responde reset=true y el cliente recarga todo.
+- El watermark devuelto se retrasa MARGEN_WATERMARK para cubrir escrituras
+  en vuelo; el cliente aplica los cambios por _id (idempotente), así que
+  recibir una cita dos veces no es un problema.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.database.mongo import collection_citas, collection_citas_eliminadas
+
+logger = logging.getLogger(__name__)
+
+MARGEN_WATERMARK = timedelta(seconds=5)
+TOMBSTONE_DIAS = int(os.getenv("CITAS_TOMBSTONE_DIAS", "30"))
+LIMITE_CAMBIOS = 500
+
+# Citas antiguas guardan `fecha` como datetime: se devuelve siempre "YYYY-MM-DD"
+FECHA_CITA_STR = {
+    "$cond": [
+        {"$eq": [{"$type": "$fecha"}, "date"]},
+        {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha"}},
+        "$fecha"
+    ]
+}
+
+_indices_listos = False
+
+
+def marca_actualizacion() -> datetime:
+    """Valor de `ultima_actualizacion` para cualquier escritura de citas."""
+    return datetime.now()
+
+
+# ============================================================
+# ÍNDICES
+# ============================================================
+
+async def crear_indices_delta_sync():
+    global _indices_listos
+
+    await collection_citas.create_index(
+        [("sede_id", 1), ("ultima_actualizacion", 1), ("_id", 1)],
+        name="citas_sede_ultima_actualizacion"
+    )
+    await collection_citas_eliminadas.create_index(
+        [("sede_id", 1), ("eliminada_en", 1)],
+        name="tombstones_sede_eliminada"
+    )
+    await collection_citas_eliminadas.create_index(
+        [("eliminada_en", 1)],
+        name="tombstones_ttl",
+        expireAfterSeconds=TOMBSTONE_DIAS * 86400
+    )
+    _indices_listos = True
+
+
+# ============================================================
+# TOMBSTONES
+# ============================================================
+
+async def registrar_eliminacion(cita: dict, motivo: str, eliminada_por: Optional[str] = None):
+    """
+    Deja constancia de una cita borrada físicamente para que los clientes
+    en delta-sync la quiten. Nunca lanza excepción.
+    """
+    try:
+        await collection_citas_eliminadas.insert_one({
+            "cita_id": str(cita.get("_id")),
+            "sede_id": cita.get("sede_id"),
+            "fecha": cita.get("fecha"),
+            "motivo": motivo,
+            "eliminada_por": eliminada_por,
+            "eliminada_en": marca_actualizacion()
+        })
+    except Exception as e:
+        logger.error(f"❌ Error registrando tombstone de cita {cita.get('_id')}: {e}")
+
+
+# ============================================================
+# CONSULTA DE CAMBIOS
+# ============================================================
+
+async def obtener_cambios(sede_id: str, desde: Optional[datetime], limite: int = LIMITE_CAMBIOS) -> Dict:
+    """
+    Citas con ultima_actualizacion >= desde (máx. `limite`, en orden) y
+    tombstones de la sede desde esa marca.
+
+    Si hay más de `limite` cambios, `hay_mas` es True y el watermark es la
+    marca de la última cita devuelta: el cliente repite la llamada con él.
+    """
+    if not _indices_listos:
+        await crear_indices_delta_sync()
+
+    inicio = marca_actualizacion()
+    watermark_base = inicio - MARGEN_WATERMARK
+
+    if desde is not None and desde.tzinfo is not None:
+        # Las marcas se guardan naive con el reloj del servidor
+        desde = desde.astimezone().replace(tzinfo=None)
+
+    if desde is None:
+        return {"reset": True, "watermark": watermark_base, "citas": [], "eliminadas": [], "hay_mas": False}
+
+    if desde < inicio - timedelta(days=TOMBSTONE_DIAS):
+        # Los tombstones de ese periodo ya caducaron: no se puede garantizar el delta
+        return {"reset": True, "watermark": watermark_base, "citas": [], "eliminadas": [], "hay_mas": False}
+
+    citas = await collection_citas.aggregate([
+        {"$match": {"sede_id": sede_id, "ultima_actualizacion": {"$gte": desde}}},
+        {"$sort": {"ultima_actualizacion": 1, "_id": 1}},
+        {"$limit": limite + 1},
+        {"$set": {"fecha": FECHA_CITA_STR}}
+    ]).to_list(limite + 1)
+
+    hay_mas = len(citas) > limite
+    citas = citas[:limite]
+    watermark = citas[-1]["ultima_actualizacion"] if hay_mas else watermark_base
+
+    if hay_mas and watermark == desde:
+        # Más de `limite` citas con la MISMA marca (escritura masiva): se
+        # devuelven todas para no quedar atascados en el mismo watermark
+        citas = await collection_citas.aggregate([
+            {"$match": {"sede_id": sede_id, "ultima_actualizacion": desde}},
+            {"$set": {"fecha": FECHA_CITA_STR}}
+        ]).to_list(None)
+        watermark = desde + timedelta(milliseconds=1)
+
+    eliminadas = await collection_citas_eliminadas.find(
+        {"sede_id": sede_id, "eliminada_en": {"$gte": desde}},
+        {"_id": 0, "cita_id": 1, "fecha": 1, "motivo": 1, "eliminada_en": 1}
+    ).to_list(None)
+
+    return {
+        "reset": False,
+        "watermark": watermark,
+        "citas": citas,
+        "eliminadas": eliminadas,
+        "hay_mas": hay_mas
+    }
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Form
-from datetime import datetime, time, timedelta
-import traceback
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Form, Request
+import logging
+from datetime import date, datetime, time, timedelta
 from typing import Optional, List
 from email.message import EmailMessage
 import smtplib, ssl, os
 from bson import ObjectId
+from bson.errors import InvalidId
 import uuid
 import boto3
 import json
@@ -29,16 +30,44 @@ from app.database.mongo import (
     collection_block,
     collection_card,
     collection_commissions,
-    collection_products
+    collection_products,
+    tiempo_max
 )
 from app.auth.routes import get_current_user
+from app.analytics.client_visit_stats import registrar_visita, recalcular_visitas_cliente
+from app.core.responses import BSONRoute
+from app.core.tiempos_peticion import medir_fase
+from app.core.etag import CACHE_CONTROL, calcular_etag, respuesta_no_modificada, respuesta_con_etag
+from app.core.pagination import asegurar_indice, ventana_keyset
+from app.core.streaming import BATCH_SIZE, parametro_formato, parametro_limite, respuesta_stream
+from app.scheduling.submodules.quotes.delta_sync import (
+    FECHA_CITA_STR,
+    marca_actualizacion,
+    obtener_cambios,
+)
+from app.scheduling.submodules.quotes.calendar_view import (
+    MAX_DIAS_VISTA,
+    construir_vista_calendario,
+    filtro_rango,
+)
+from app.scheduling.submodules.quotes.archivo_citas import buscar_cita, buscar_cita_editable, pipeline_citas
+from app.scheduling.submodules.quotes.tiempos_cita import (
+    campos_tiempo,
+    crear_indices_tiempos_cita,
+    filtro_solape,
+    hora_a_minutos,
+    minutos_a_hora,
+    zona_sede,
+)
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_REGION")
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=BSONRoute)
 
 s3_client = boto3.client(
     's3',
@@ -82,6 +111,7 @@ EMAIL_PASSWORD = os.getenv("EMAIL_CONTRASENA")
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 465
 
+@medir_fase("email")
 def enviar_correo(destinatario: str, asunto: str, mensaje: str):
     """Envía correo HTML (SSL)."""
     try:
@@ -96,41 +126,111 @@ def enviar_correo(destinatario: str, asunto: str, mensaje: str):
             server.login(EMAIL_SENDER, EMAIL_PASSWORD)
             server.send_message(msg)
 
-        print(f"📧 Correo enviado a {destinatario}")
+        logger.info(f"📧 Correo enviado a {destinatario}")
     except Exception as e:
-        print("Error enviando email:", e)
+        logger.error(f"Error enviando email: {e}")
 
 # -----------------------
 # HELPERS
 # -----------------------
-def normalize_cita_doc(doc: dict) -> dict:
-    """Convierte _id a str y normaliza fecha si viene como datetime."""
-    doc["_id"] = str(doc["_id"])
-    if isinstance(doc.get("fecha"), datetime):
-        doc["fecha"] = doc["fecha"].strftime("%Y-%m-%d")
-    return doc
+async def enriquecer_citas(citas: list) -> list:
+    """
+    Añade servicio_nombre / servicio_duracion / servicios_detalle (in place).
+    ✅ Soporta nueva estructura (servicios con nombre/precio)
+    ✅ Compatible con estructuras antiguas
+    """
+    # === Bulk fetch para enriquecer datos (solo si es necesario) ===
+    servicio_ids = set()
+    for cita in citas:
+        if "servicios" in cita:
+            for s in cita["servicios"]:
+                servicio_ids.add(s.get("servicio_id"))
+        elif "servicios_ids" in cita:
+            servicio_ids.update(cita["servicios_ids"])
+        elif "servicio_id" in cita:
+            servicio_ids.add(cita["servicio_id"])
+
+    # Solo consultar servicios si hay IDs
+    servicios_map = {}
+    if servicio_ids:
+        logger.debug(f"🔍 Buscando {len(servicio_ids)} servicios...")
+        servicios = await collection_servicios.find(
+            {"servicio_id": {"$in": list(servicio_ids)}}
+        ).to_list(None)
+        servicios_map = {s["servicio_id"]: s for s in servicios}
+        logger.debug(f"✅ Se encontraron {len(servicios)} servicios")
+
+    # === Enriquecer cada cita ===
+    for cita in citas:
+        try:
+            # ⭐ NUEVA ESTRUCTURA (con nombre y precio en servicios)
+            if "servicios" in cita and cita["servicios"] and isinstance(cita["servicios"][0], dict):
+                primer_servicio = cita["servicios"][0]
+                
+                # Detectar si es nueva estructura (tiene campo "nombre")
+                if "nombre" in primer_servicio:
+                    # Nueva estructura - nombres ya están en la cita
+                    nombres = [s.get("nombre", "Servicio") for s in cita["servicios"]]
+                    cita["servicio_nombre"] = ", ".join(nombres)
+                    
+                    # Duración: consultar solo para obtener duraciones
+                    duracion_total = 0
+                    for s in cita["servicios"]:
+                        srv = servicios_map.get(s.get("servicio_id"))
+                        if srv:
+                            duracion_total += srv.get("duracion_minutos", 0)
+                    cita["servicio_duracion"] = duracion_total
+                    
+                    # Ya no necesitas recalcular servicios_detalle, ya está en la cita
+                    cita["servicios_detalle"] = cita["servicios"]
+                else:
+                    # Estructura antigua (solo tiene servicio_id)
+                    nombres = []
+                    duracion = 0
+                    for s in cita["servicios"]:
+                        srv = servicios_map.get(s.get("servicio_id"))
+                        if srv:
+                            nombres.append(srv.get("nombre", "Servicio"))
+                            duracion += srv.get("duracion_minutos", 0)
+                    
+                    cita["servicio_nombre"] = ", ".join(nombres) if nombres else "Sin servicio"
+                    cita["servicio_duracion"] = duracion
+            
+            elif "servicio_id" in cita:
+                # Estructura muy antigua (un solo servicio)
+                srv = servicios_map.get(cita.get("servicio_id"))
+                cita["servicio_nombre"] = srv.get("nombre", "Sin servicio") if srv else "Sin servicio"
+                
+        except Exception as e:
+            logger.error(f"❌ Error enriqueciendo cita {cita.get('_id')}: {str(e)}")
+            # Continuar con las demás citas
+            continue
+
+    return citas
 
 async def resolve_cita_by_id(cita_id: str) -> Optional[dict]:
     """
     Intenta resolver una cita por:
       1) campo cita_id (string de negocio)
       2) _id (ObjectId)
-    Devuelve el documento o None.
+    Devuelve el documento o None. Es para modificarla: si está archivada
+    responde 409 (ver archivo_citas.buscar_cita_editable).
     """
-    cita = await collection_citas.find_one({"cita_id": cita_id})
+    cita = await buscar_cita_editable({"cita_id": cita_id})
     if cita:
         return cita
     try:
-        cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
-        return cita
-    except Exception:
+        object_id = ObjectId(cita_id)
+    except (InvalidId, TypeError):
         return None
+    return await buscar_cita_editable({"_id": object_id})
 
 # ============================================================
 # ENDPOINT OBTENER CITAS (con cálculos en tiempo real) con fecha
 # ============================================================
 @router.get("/", response_model=dict)
 async def obtener_citas(
+    request: Request,
     sede_id: Optional[str] = Query(None),
     profesional_id: Optional[str] = Query(None),
     fecha: Optional[str] = Query(None, description="Fecha específica (YYYY-MM-DD)"),
@@ -140,6 +240,7 @@ async def obtener_citas(
     Obtiene citas con datos enriquecidos.
     ✅ Soporta nueva estructura (servicios con nombre/precio)
     ✅ Compatible con estructuras antiguas
+    ✅ ETag / If-None-Match: si el calendario no cambió → 304 sin cuerpo
     """
     try:
         # === CONSTRUIR FILTRO ===
@@ -159,107 +260,50 @@ async def obtener_citas(
             fecha_inicio = (hoy - timedelta(days=30)).strftime("%Y-%m-%d")
             fecha_fin = (hoy + timedelta(days=60)).strftime("%Y-%m-%d")
             filtro["fecha"] = {"$gte": fecha_inicio, "$lte": fecha_fin}
-            print(f"⚠️ Filtro vacío detectado, usando rango: {fecha_inicio} a {fecha_fin}")
+            logger.warning(f"⚠️ Filtro vacío detectado, usando rango: {fecha_inicio} a {fecha_fin}")
+
+        logger.debug(f"🔍 Buscando citas con filtro: {filtro}")
 
-        print(f"🔍 Buscando citas con filtro: {filtro}")
+        # === ETag: una agregación pequeña antes de traer y enriquecer todo ===
+        await asegurar_indice(
+            collection_citas,
+            [("sede_id", 1), ("fecha", 1), ("ultima_actualizacion", 1)],
+            "citas_sede_fecha_version"
+        )
+        etag = await calcular_etag(collection_citas, filtro, "obtener_citas")
+        no_modificado = respuesta_no_modificada(request, etag)
+        if no_modificado:
+            return no_modificado
 
         # 🔥 OPCIÓN 1: Usar aggregate con allowDiskUse (solución rápida)
         pipeline = [
             {"$match": filtro},
-            {"$sort": {"fecha": 1}}
+            {"$sort": {"fecha": 1}},
+            {"$set": {"fecha": FECHA_CITA_STR}}
         ]
         
+        # Fechas anteriores al corte del archivo también leen appointments_archive
+        desde = filtro["fecha"].get("$gte") if isinstance(filtro.get("fecha"), dict) else filtro.get("fecha")
         citas = await collection_citas.aggregate(
-            pipeline,
+            await pipeline_citas(pipeline, desde),
             allowDiskUse=True  # Permite usar disco si se excede memoria
         ).to_list(None)
 
         # 🔥 ALTERNATIVA: Si prefieres usar find(), agregar límite
         # citas = await collection_citas.find(filtro).sort("fecha", 1).limit(500).to_list(500)
 
-        print(f"✅ Se encontraron {len(citas)} citas")
+        logger.debug(f"✅ Se encontraron {len(citas)} citas")
 
         if not citas:
-            return {"citas": []}
-
-        # === Bulk fetch para enriquecer datos (solo si es necesario) ===
-        servicio_ids = set()
-        for cita in citas:
-            if "servicios" in cita:
-                for s in cita["servicios"]:
-                    servicio_ids.add(s.get("servicio_id"))
-            elif "servicios_ids" in cita:
-                servicio_ids.update(cita["servicios_ids"])
-            elif "servicio_id" in cita:
-                servicio_ids.add(cita["servicio_id"])
-
-        # Solo consultar servicios si hay IDs
-        servicios_map = {}
-        if servicio_ids:
-            print(f"🔍 Buscando {len(servicio_ids)} servicios...")
-            servicios = await collection_servicios.find(
-                {"servicio_id": {"$in": list(servicio_ids)}}
-            ).to_list(None)
-            servicios_map = {s["servicio_id"]: s for s in servicios}
-            print(f"✅ Se encontraron {len(servicios)} servicios")
-
-        # === Enriquecer cada cita ===
-        for cita in citas:
-            try:
-                normalize_cita_doc(cita)
+            return respuesta_con_etag({"citas": []}, etag)
 
-                # ⭐ NUEVA ESTRUCTURA (con nombre y precio en servicios)
-                if "servicios" in cita and cita["servicios"] and isinstance(cita["servicios"][0], dict):
-                    primer_servicio = cita["servicios"][0]
-                    
-                    # Detectar si es nueva estructura (tiene campo "nombre")
-                    if "nombre" in primer_servicio:
-                        # Nueva estructura - nombres ya están en la cita
-                        nombres = [s.get("nombre", "Servicio") for s in cita["servicios"]]
-                        cita["servicio_nombre"] = ", ".join(nombres)
-                        
-                        # Duración: consultar solo para obtener duraciones
-                        duracion_total = 0
-                        for s in cita["servicios"]:
-                            srv = servicios_map.get(s.get("servicio_id"))
-                            if srv:
-                                duracion_total += srv.get("duracion_minutos", 0)
-                        cita["servicio_duracion"] = duracion_total
-                        
-                        # Ya no necesitas recalcular servicios_detalle, ya está en la cita
-                        cita["servicios_detalle"] = cita["servicios"]
-                    else:
-                        # Estructura antigua (solo tiene servicio_id)
-                        nombres = []
-                        duracion = 0
-                        for s in cita["servicios"]:
-                            srv = servicios_map.get(s.get("servicio_id"))
-                            if srv:
-                                nombres.append(srv.get("nombre", "Servicio"))
-                                duracion += srv.get("duracion_minutos", 0)
-                        
-                        cita["servicio_nombre"] = ", ".join(nombres) if nombres else "Sin servicio"
-                        cita["servicio_duracion"] = duracion
-                
-                elif "servicio_id" in cita:
-                    # Estructura muy antigua (un solo servicio)
-                    srv = servicios_map.get(cita.get("servicio_id"))
-                    cita["servicio_nombre"] = srv.get("nombre", "Sin servicio") if srv else "Sin servicio"
-                    
-            except Exception as e:
-                print(f"❌ Error enriqueciendo cita {cita.get('_id')}: {str(e)}")
-                # Continuar con las demás citas
-                continue
+        await enriquecer_citas(citas)
 
-        print(f"✅ Retornando {len(citas)} citas enriquecidas")
-        return {"citas": citas}
+        logger.debug(f"✅ Retornando {len(citas)} citas enriquecidas")
+        return respuesta_con_etag({"citas": citas}, etag)
 
     except Exception as e:
-        print(f"❌ ERROR EN OBTENER_CITAS:")
-        print(f"   Tipo: {type(e).__name__}")
-        print(f"   Mensaje: {str(e)}")
-        print(f"   Traceback:")
-        traceback.print_exc()
+        logger.exception(f"❌ ERROR EN OBTENER_CITAS: {type(e).__name__}: {e}")
         
         # Retornar error HTTP apropiado
         raise HTTPException(
@@ -272,6 +316,82 @@ async def obtener_citas(
             }
         )
 
+# ============================================================
+# 🔄 DELTA-SYNC: CAMBIOS DESDE UN WATERMARK
+# ============================================================
+@router.get("/cambios", response_model=dict)
+async def obtener_cambios_citas(
+    sede_id: Optional[str] = Query(None, description="Sede (admin_sede: siempre la propia)"),
+    desde: Optional[datetime] = Query(None, description="Watermark devuelto por la llamada anterior"),
+    limite: int = Query(500, ge=1, le=2000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Citas creadas, editadas o con cambio de estado desde `desde`, más las
+    eliminadas (tombstones), con el mismo formato que GET /.
+
+    - Sin `desde`: solo devuelve el watermark inicial (reset=true); hacer
+      la carga completa y desde ahí pedir cambios.
+    - reset=true: el watermark es demasiado antiguo → recargar todo.
+    - hay_mas=true: repetir de inmediato con el nuevo watermark.
+    """
+    if current_user.get("rol") in ["admin_sede", "estilista"]:
+        sede_id = current_user.get("sede_id")
+    if not sede_id:
+        raise HTTPException(status_code=400, detail="sede_id es requerido")
+
+    cambios = await obtener_cambios(sede_id, desde, limite)
+    await enriquecer_citas(cambios["citas"])
+    return cambios
+
+
+# ============================================================
+# 🗓️ VISTA COMPACTA DEL CALENDARIO (columnar, por profesional)
+# ============================================================
+@router.get("/vista-calendario", response_model=dict)
+async def vista_calendario(
+    request: Request,
+    desde: date = Query(..., description="Primer día (YYYY-MM-DD)"),
+    hasta: Optional[date] = Query(None, description="Último día incluido (por defecto desde + 6)"),
+    sede_id: Optional[str] = Query(None),
+    profesional_id: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Solo lo que pinta la grilla (id, profesional, inicio/fin, cliente,
+    servicios, estado, estado de pago) en columnas agrupadas por profesional
+    y con diccionario de textos repetidos. Ver calendar_view.py.
+    ✅ ETag / If-None-Match igual que GET /
+    """
+    if current_user.get("rol") in ["admin_sede", "estilista"]:
+        sede_id = current_user.get("sede_id")
+    if not sede_id:
+        raise HTTPException(status_code=400, detail="sede_id es requerido")
+
+    hasta = hasta or desde + timedelta(days=6)
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="hasta debe ser posterior a desde")
+    if (hasta - desde).days + 1 > MAX_DIAS_VISTA:
+        raise HTTPException(status_code=400, detail=f"El rango máximo es de {MAX_DIAS_VISTA} días")
+
+    await asegurar_indice(
+        collection_citas,
+        [("sede_id", 1), ("fecha", 1), ("ultima_actualizacion", 1)],
+        "citas_sede_fecha_version"
+    )
+    etag = await calcular_etag(
+        collection_citas,
+        filtro_rango(sede_id, desde, hasta, profesional_id),
+        "vista_calendario"
+    )
+    no_modificado = respuesta_no_modificada(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    vista = await construir_vista_calendario(sede_id, desde, hasta, profesional_id)
+    return respuesta_con_etag(vista, etag)
+
+
 # =============================================================
 # 🔹 CREAR CITA (ACTUALIZADA)
 # =============================================================
@@ -286,7 +406,7 @@ async def crear_cita(
     ✅ Calcula totales en tiempo real
     ✅ Compatible con estructura antigua
     """
-    print(f"🔍 crear_cita invocada por {current_user.get('email')}")
+    logger.debug(f"🔍 crear_cita invocada por {current_user.get('email')}")
 
     # Validar permisos
     if current_user.get("rol") not in ["usuario", "admin_sede", "super_admin"]:
@@ -482,6 +602,7 @@ async def crear_cita(
         "fecha": fecha_str,
         "hora_inicio": cita.hora_inicio,
         "hora_fin": cita.hora_fin,
+        **campos_tiempo(fecha_str, cita.hora_inicio, cita.hora_fin, zona_sede(sede)),
         "estado": "confirmada",
     
         # Pagos
@@ -498,12 +619,13 @@ async def crear_cita(
         "creada_por": current_user.get("email"),
         "creada_por_rol": current_user.get("rol"),
         "fecha_creacion": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "ultima_actualizacion": datetime.now()
+        "ultima_actualizacion": marca_actualizacion()
     }
 
     # Guardar en BD
     result = await collection_citas.insert_one(data)
     cita_id = str(result.inserted_id)
+    await registrar_visita(data)
 
     # === construir email HTML mejorado ===
     estilo = """
@@ -942,9 +1064,9 @@ async def crear_cita(
                 f"✅ Confirmación de cita - {fecha_str} {cita.hora_inicio}", 
                 mensaje_html
             )
-            print(f"📧 Email enviado a cliente: {cliente_email}")
+            logger.info(f"📧 Email enviado a cliente: {cliente_email}")
         except Exception as e:
-            print(f"⚠️ Error enviando email al cliente: {e}")
+            logger.warning(f"⚠️ Error enviando email al cliente: {e}")
 
     # Enviar al profesional si tiene email
     try:
@@ -953,9 +1075,9 @@ async def crear_cita(
             # Modificar ligeramente el email para el profesional
             prof_subject = f"📅 Nueva cita asignada - {fecha_str} {cita.hora_inicio} - {cliente.get('nombre')}"
             enviar_correo(prof_email, prof_subject, mensaje_html)
-            print(f"📧 Email enviado a profesional: {prof_email}")
+            logger.info(f"📧 Email enviado a profesional: {prof_email}")
     except Exception as e:
-        print(f"⚠️ Error enviando email al profesional: {e}")
+        logger.warning(f"⚠️ Error enviando email al profesional: {e}")
 
     # También enviar a admin de sede si es diferente del creador
     try:
@@ -964,7 +1086,7 @@ async def crear_cita(
             admin_subject = f"📋 Nueva cita registrada - {fecha_str} - {cliente.get('nombre')}"
             enviar_correo(admin_sede_email, admin_subject, mensaje_html)
     except Exception as e:
-        print(f"⚠️ Error enviando email a admin sede: {e}")
+        logger.warning(f"⚠️ Error enviando email a admin sede: {e}")
 
     return {
         "success": True, 
@@ -1011,18 +1133,11 @@ async def editar_cita(
     if not cita_object_id:
         raise HTTPException(status_code=500, detail="La cita no tiene _id válido")
 
-    def _hora_a_minutos(hora_str: str) -> int:
-        hora_obj = time.fromisoformat(hora_str)
-        return (hora_obj.hour * 60) + hora_obj.minute
-
-    def _minutos_a_hora(total_min: int) -> str:
-        horas = total_min // 60
-        minutos = total_min % 60
-        return f"{str(horas).zfill(2)}:{str(minutos).zfill(2)}"
-
     def _sumar_minutos_hora(hora_str: str, minutos: int) -> str:
-        inicio = _hora_a_minutos(hora_str)
-        return _minutos_a_hora(inicio + max(0, minutos))
+        inicio = hora_a_minutos(hora_str)
+        if inicio is None:
+            raise HTTPException(status_code=400, detail="Fecha u hora inválida")
+        return minutos_a_hora(inicio + max(0, minutos))
 
     def _normalizar_fecha(fecha_valor) -> str:
         if isinstance(fecha_valor, datetime):
@@ -1069,14 +1184,12 @@ async def editar_cita(
     valor_servicios = max(0, valor_servicios)
     duracion_total = int(cita_actual.get("servicio_duracion", 0) or 0)
     if duracion_total <= 0:
-        try:
-            duracion_total = max(
-                0,
-                _hora_a_minutos(str(cita_actual.get("hora_fin", "00:00"))) -
-                _hora_a_minutos(str(cita_actual.get("hora_inicio", "00:00")))
-            )
-        except Exception:
-            duracion_total = 0
+        inicio_min = cita_actual.get("inicio_min")
+        fin_min = cita_actual.get("fin_min")
+        if inicio_min is None or fin_min is None:
+            inicio_min = hora_a_minutos(cita_actual.get("hora_inicio", "00:00"))
+            fin_min = hora_a_minutos(cita_actual.get("hora_fin", "00:00"))
+        duracion_total = max(0, fin_min - inicio_min) if inicio_min is not None and fin_min is not None else 0
 
     if "servicios" in cambios:
         if not isinstance(cambios["servicios"], list) or len(cambios["servicios"]) == 0:
@@ -1321,21 +1434,21 @@ async def editar_cita(
             "fecha": fecha_final,
             "hora_inicio": {"$lt": hora_fin_final},
             "hora_fin": {"$gt": hora_inicio_final}
-        })
+        }, **tiempo_max("reserva", cursor=True))
         if bloqueo:
             raise HTTPException(
                 status_code=400,
                 detail=f"El profesional tiene un bloqueo en ese horario (Motivo: {bloqueo.get('motivo', 'No especificado')})"
             )
 
-        solape = await collection_citas.find_one({
-            "_id": {"$ne": cita_object_id},
-            "profesional_id": profesional_id_final,
-            "fecha": fecha_final,
-            "hora_inicio": {"$lt": hora_fin_final},
-            "hora_fin": {"$gt": hora_inicio_final},
-            "estado": {"$nin": ["cancelada", "no asistio", "no_asistio"]}
-        })
+        tiempos = campos_tiempo(fecha_final, hora_inicio_final, hora_fin_final, zona_sede(sede))
+        cambios.update(tiempos)
+
+        await crear_indices_tiempos_cita()
+        solape = await collection_citas.find_one(await filtro_solape(
+            profesional_id_final, fecha_final, hora_inicio_final, hora_fin_final, tiempos,
+            excluir_id=cita_object_id
+        ), **tiempo_max("reserva", cursor=True))
         if solape:
             cliente_solape = solape.get("cliente_nombre", "otro cliente")
             raise HTTPException(
@@ -1363,7 +1476,7 @@ async def editar_cita(
     # ====================================
     # ⭐ Actualizar timestamp
     # ====================================
-    cambios["ultima_actualizacion"] = datetime.now()
+    cambios["ultima_actualizacion"] = marca_actualizacion()
 
     # ====================================
     # Ejecutar actualización
@@ -1376,9 +1489,13 @@ async def editar_cita(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
+    if "fecha" in cambios or "estado" in cambios:
+        await recalcular_visitas_cliente(cita_actual.get("cliente_id"), cita_actual.get("sede_id"))
+
     # Obtener cita actualizada
     cita_actualizada = await collection_citas.find_one({"_id": cita_object_id})
-    normalize_cita_doc(cita_actualizada)
+    if isinstance(cita_actualizada.get("fecha"), datetime):
+        cita_actualizada["fecha"] = cita_actualizada["fecha"].strftime("%Y-%m-%d")
     
     return {"success": True, "cita": cita_actualizada}
 
@@ -1395,11 +1512,15 @@ async def cancelar_cita(cita_id: str, current_user: dict = Depends(get_current_u
         if cita.get("cliente_id") != current_user.get("user_id") and cita.get("cliente_id") != current_user.get("cliente_id"):
             raise HTTPException(status_code=403, detail="Solo puedes cancelar tus propias citas")
 
-    await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
+    result = await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
         "estado": "cancelada",
         "fecha_cancelacion": datetime.now(),
-        "cancelada_por": current_user.get("email")
+        "cancelada_por": current_user.get("email"),
+        "ultima_actualizacion": marca_actualizacion()
     }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    await recalcular_visitas_cliente(cita.get("cliente_id"), cita.get("sede_id"))
 
     return {"success": True, "mensaje": "Cita cancelada", "cita_id": cita_id}
 
@@ -1412,11 +1533,15 @@ async def confirmar_cita(cita_id: str, current_user: dict = Depends(get_current_
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
-    await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
+    result = await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
         "estado": "confirmada",
         "confirmada_por": current_user.get("email"),
-        "fecha_confirmacion": datetime.now()
+        "fecha_confirmacion": datetime.now(),
+        "ultima_actualizacion": marca_actualizacion()
     }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    await recalcular_visitas_cliente(cita.get("cliente_id"), cita.get("sede_id"))
 
     return {"success": True, "mensaje": "Cita confirmada", "cita_id": cita_id}
 
@@ -1429,7 +1554,7 @@ async def registrar_pago(
     data: PagoRequest,
     current_user: dict = Depends(get_current_user)
 ):
-    cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+    cita = await buscar_cita_editable({"_id": ObjectId(cita_id)})
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
@@ -1472,7 +1597,7 @@ async def registrar_pago(
     }
 
     # ⭐ ACTUALIZAR: Con historial y métodos de pago
-    await collection_citas.update_one(
+    result = await collection_citas.update_one(
         {"_id": ObjectId(cita_id)},
         {
             "$set": {
@@ -1480,13 +1605,15 @@ async def registrar_pago(
                 "saldo_pendiente": saldo_pendiente,
                 "estado_pago": estado_pago,
                 "metodo_pago_actual": data.metodo_pago,  # ⭐ NUEVO: Último método usado
-                "ultima_actualizacion": datetime.now()
+                "ultima_actualizacion": marca_actualizacion()
             },
             "$push": {
                 "historial_pagos": nuevo_pago  # ⭐ NUEVO: Agregar al historial
             }
         }
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
 
     return {
         "success": True,
@@ -1502,7 +1629,7 @@ async def registrar_pago(
 # =============================================================
 @router.get("/citas/{cita_id}/pago")
 async def obtener_estado_pago(cita_id: str):
-    cita = await collection_citas.find_one(
+    cita = await buscar_cita(
         {"_id": ObjectId(cita_id)},
         {
             "abono": 1,
@@ -1539,11 +1666,15 @@ async def completar_cita(cita_id: str, current_user: dict = Depends(get_current_
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
-    await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
+    result = await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
         "estado": "completada",
         "completada_por": current_user.get("email"),
-        "fecha_completada": datetime.now()
+        "fecha_completada": datetime.now(),
+        "ultima_actualizacion": marca_actualizacion()
     }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    await recalcular_visitas_cliente(cita.get("cliente_id"), cita.get("sede_id"))
 
     return {"success": True, "mensaje": "Cita completada", "cita_id": cita_id}
 
@@ -1556,11 +1687,15 @@ async def no_asistio(cita_id: str, current_user: dict = Depends(get_current_user
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
-    await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
+    result = await collection_citas.update_one({"_id": ObjectId(cita["_id"])}, {"$set": {
         "estado": "no_asistio",
         "marcada_no_asistio_por": current_user.get("email"),
-        "fecha_no_asistio": datetime.now()
+        "fecha_no_asistio": datetime.now(),
+        "ultima_actualizacion": marca_actualizacion()
     }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    await recalcular_visitas_cliente(cita.get("cliente_id"), cita.get("sede_id"))
 
     return {"success": True, "mensaje": "Marcada como no asistió", "cita_id": cita_id}
 
@@ -1612,27 +1747,27 @@ async def obtener_fichas_por_cliente(
     if cita_id:
         filtro["datos_especificos.cita_id"] = cita_id
         limit = 1  # Solo necesitamos una
-        print(f"🔍 Buscando ficha con cita_id: {cita_id}")
+        logger.debug(f"🔍 Buscando ficha con cita_id: {cita_id}")
     
     # 🔹 PRIORIDAD 2: Filtrar por fecha específica
     elif fecha:
         filtro["fecha_reserva"] = fecha
-        print(f"🔍 Buscando fichas con fecha: {fecha}")
+        logger.debug(f"🔍 Buscando fichas con fecha: {fecha}")
     
     # 🔹 PRIORIDAD 3: Filtrar por hoy
     elif solo_hoy:
         from datetime import datetime
         hoy = datetime.utcnow().strftime("%Y-%m-%d")
         filtro["fecha_reserva"] = hoy
-        print(f"🔍 Buscando fichas de hoy: {hoy}")
+        logger.debug(f"🔍 Buscando fichas de hoy: {hoy}")
     
     else:
-        print(f"🔍 Buscando todas las fichas del cliente: {cliente_id}")
+        logger.debug(f"🔍 Buscando todas las fichas del cliente: {cliente_id}")
 
     # -----------------------------------------
     # 3. Buscar fichas
     # -----------------------------------------
-    print(f"📋 Filtro aplicado: {filtro}")
+    logger.debug(f"📋 Filtro aplicado: {filtro}")
     
     fichas = (
         await collection_card
@@ -1642,7 +1777,7 @@ async def obtener_fichas_por_cliente(
         .to_list(None)
     )
 
-    print(f"✅ Fichas encontradas: {len(fichas)}")
+    logger.debug(f"✅ Fichas encontradas: {len(fichas)}")
 
     if not fichas:
         return {"success": True, "total": 0, "fichas": []}
@@ -1748,6 +1883,7 @@ async def obtener_fichas_por_cliente(
 
 @router.get("/citas/estilista", response_model=list)
 async def get_citas_estilista(
+    request: Request,
     current_user: dict = Depends(get_current_user),
     fecha_desde: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
     fecha_hasta: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
@@ -1768,16 +1904,21 @@ async def get_citas_estilista(
     str_desde = dt_desde.strftime("%Y-%m-%d")
     str_hasta = (dt_hasta - timedelta(days=1)).strftime("%Y-%m-%d")
 
+    filtro = {
+        "$or": [
+            {"estilista_id": profesional_id},
+            {"profesional_id": profesional_id}
+        ],
+        "fecha": {"$gte": str_desde, "$lte": str_hasta}
+    }
+
+    etag = await calcular_etag(collection_citas, filtro, "citas_estilista")
+    no_modificado = respuesta_no_modificada(request, etag)
+    if no_modificado:
+        return no_modificado
+
     pipeline = [
-        {
-            "$match": {
-                "$or": [
-                    {"estilista_id": profesional_id},
-                    {"profesional_id": profesional_id}
-                ],
-                "fecha": {"$gte": str_desde, "$lte": str_hasta}
-            }
-        },
+        {"$match": filtro},
         {"$sort": {"fecha": 1}},
         {
             "$lookup": {
@@ -1804,7 +1945,7 @@ async def get_citas_estilista(
         {"$project": {"_cliente_data": 0, "_sede_data": 0}}
     ]
 
-    citas = await collection_citas.aggregate(pipeline).to_list(None)
+    citas = await collection_citas.aggregate(await pipeline_citas(pipeline, str_desde)).to_list(None)
 
     # Pre-cargar todos los servicios necesarios en una sola query
     todos_servicio_ids = set()
@@ -1964,7 +2105,7 @@ async def get_citas_estilista(
             "tiene_precio_personalizado": any(s["precio_personalizado"] for s in servicios_data)
         })
 
-    return respuesta
+    return respuesta_con_etag(respuesta, etag)
 
 
 def parse_ficha(data: str = Form(...)):
@@ -1972,7 +2113,7 @@ def parse_ficha(data: str = Form(...)):
         parsed = json.loads(data)
         return FichaCreate(**parsed)
     except Exception as e:
-        print("Error parseando JSON de ficha:", e)
+        logger.error(f"Error parseando JSON de ficha: {e}")
         raise HTTPException(422, "Formato inválido en 'data'. Debe ser JSON válido.")   
 
 # ============================================================
@@ -1985,7 +2126,7 @@ async def crear_ficha(
     fotos_despues: Optional[List[UploadFile]] = File(None),
     current_user: dict = Depends(get_current_user)
 ):
-    print("📝 Data recibida:", data.dict())
+    logger.debug(f"📝 Data recibida: {data.dict()}")
 
     # ------------------------------
     # ⭐ COMPATIBILIDAD: Determinar servicio(s)
@@ -1997,13 +2138,13 @@ async def crear_ficha(
     if data.servicios and len(data.servicios) > 0:
         servicios_lista = data.servicios
         servicio_id_principal = data.servicios[0].servicio_id
-        print(f"✅ Usando servicios (array): {[s.servicio_id for s in servicios_lista]}")
+        logger.debug(f"✅ Usando servicios (array): {[s.servicio_id for s in servicios_lista]}")
     
     # Caso 2: Viene servicio_id único - FORMATO ANTIGUO
     elif data.servicio_id:
         servicios_lista = [ServicioEnFicha(servicio_id=data.servicio_id)]
         servicio_id_principal = data.servicio_id
-        print(f"✅ Usando servicio_id único: {servicio_id_principal}")
+        logger.debug(f"✅ Usando servicio_id único: {servicio_id_principal}")
     
     else:
         raise HTTPException(400, "Debe especificar al menos un servicio")
@@ -2143,15 +2284,21 @@ async def crear_ficha(
         "ficha": ficha
     }
 
-def fix_mongo_id(doc):
-    doc["_id"] = str(doc["_id"])
-    return doc
-
 # ============================================================
 # 📅 Obtener todas las citas de la sede del admin autenticado
 # ============================================================
 @router.get("/citas-sede", response_model=dict)
-async def get_citas_sede(current_user: dict = Depends(get_current_user)):
+async def get_citas_sede(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    limit: int = parametro_limite(),
+    formato: str = parametro_formato(),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Citas de la sede en streaming (más recientes primero, máx. `limit`).
+    Siguiente página: `cursor` = X-Next-Cursor (también en el cuerpo JSON).
+    """
     if current_user["rol"] not in ["admin_sede", "admin"]:
         raise HTTPException(
             status_code=403,
@@ -2165,16 +2312,24 @@ async def get_citas_sede(current_user: dict = Depends(get_current_user)):
             detail="El administrador no tiene asignada una sede"
         )
 
-    citas = await collection_citas.find({"sede_id": sede_id}).to_list(None)
-
-    # 🔥 Convertir todos los ObjectId a string
-    citas = [fix_mongo_id(c) for c in citas]
-
-    return {
-        "total": len(citas),
-        "sede_id": sede_id,
-        "citas": citas
-    }
+    etag = await calcular_etag(
+        collection_citas, {"sede_id": sede_id}, "citas_sede", extra=[cursor, limit, formato]
+    )
+    no_modificado = respuesta_no_modificada(request, etag)
+    if no_modificado:
+        return no_modificado
+
+    await asegurar_indice(collection_citas, [("sede_id", 1), ("_id", -1)], "citas_sede_id")
+    ventana = await ventana_keyset(collection_citas, {"sede_id": sede_id}, [("_id", -1)], limit, cursor)
+
+    return await respuesta_stream(
+        collection_citas.aggregate(ventana["pipeline"], batchSize=BATCH_SIZE),
+        formato,
+        siguiente=ventana["siguiente"],
+        envoltura={"sede_id": sede_id},
+        clave_items="citas",
+        cabeceras={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
 
 
 # ============================================================
@@ -2203,7 +2358,7 @@ async def agregar_productos_a_cita(
     profesional_id = current_user.get("profesional_id")
 
     # Buscar cita
-    cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+    cita = await buscar_cita_editable({"_id": ObjectId(cita_id)})
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
@@ -2319,7 +2474,7 @@ async def agregar_productos_a_cita(
                 "valor_total": nuevo_total,
                 "saldo_pendiente": nuevo_saldo,
                 "estado_pago": nuevo_estado_pago,
-                "ultima_actualizacion": datetime.utcnow()
+                "ultima_actualizacion": marca_actualizacion()
             }
         }
     )
@@ -2366,7 +2521,7 @@ async def eliminar_producto_de_cita(
         )
 
     # Buscar cita
-    cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+    cita = await buscar_cita_editable({"_id": ObjectId(cita_id)})
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
@@ -2421,7 +2576,7 @@ async def eliminar_producto_de_cita(
                 "valor_total": nuevo_total,
                 "saldo_pendiente": nuevo_saldo,
                 "estado_pago": nuevo_estado_pago,
-                "ultima_actualizacion": datetime.utcnow()
+                "ultima_actualizacion": marca_actualizacion()
             }
         }
     )
@@ -2460,7 +2615,7 @@ async def eliminar_todos_productos_de_cita(
         )
 
     # Buscar cita
-    cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+    cita = await buscar_cita_editable({"_id": ObjectId(cita_id)})
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
@@ -2499,7 +2654,7 @@ async def eliminar_todos_productos_de_cita(
                 "valor_total": nuevo_total,
                 "saldo_pendiente": nuevo_saldo,
                 "estado_pago": nuevo_estado_pago,
-                "ultima_actualizacion": datetime.utcnow()
+                "ultima_actualizacion": marca_actualizacion()
             }
         }
     )
@@ -2536,7 +2691,7 @@ async def finalizar_servicio_con_pdf(
         )
 
     # Verificar que la cita exista
-    cita = await collection_citas.find_one({"_id": ObjectId(cita_id)})
+    cita = await buscar_cita_editable({"_id": ObjectId(cita_id)})
     if not cita:
         raise HTTPException(
             status_code=404,
@@ -2563,6 +2718,7 @@ async def finalizar_servicio_con_pdf(
         "estado": "finalizado",
         "fecha_finalizacion": datetime.utcnow(),
         "finalizado_por": current_user.get("email"),
+        "ultima_actualizacion": marca_actualizacion(),
     }
 
     await collection_citas.update_one(
@@ -2570,6 +2726,8 @@ async def finalizar_servicio_con_pdf(
         {"$set": update_data}
     )
 
+    await recalcular_visitas_cliente(cita.get("cliente_id"), cita.get("sede_id"))
+
     # Obtener la cita actualizada con TODOS los datos
     cita_actualizada = await collection_citas.find_one({"_id": ObjectId(cita_id)})
 
@@ -2582,9 +2740,9 @@ async def finalizar_servicio_con_pdf(
     # Generar PDF con los datos de la ficha
     cliente_email = None  # Definir fuera del try para usarla en el return
     try:
-        print(f"🔍 Generando PDF para cita {cita_id}...")
-        print(f"📄 Datos financieros de la cita: valor_total={cita_actualizada.get('valor_total')}, abono={cita_actualizada.get('abono')}")
-        print(f"📄 Método de pago: actual={cita_actualizada.get('metodo_pago_actual')}, inicial={cita_actualizada.get('metodo_pago_inicial')}")
+        logger.debug(f"🔍 Generando PDF para cita {cita_id}...")
+        logger.debug(f"📄 Datos financieros de la cita: valor_total={cita_actualizada.get('valor_total')}, abono={cita_actualizada.get('abono')}")
+        logger.debug(f"📄 Método de pago: actual={cita_actualizada.get('metodo_pago_actual')}, inicial={cita_actualizada.get('metodo_pago_inicial')}")
         
         # Preparar datos de cita para el PDF
         cita_data_for_pdf = {
@@ -2605,17 +2763,17 @@ async def finalizar_servicio_con_pdf(
         
         pdf_bytes = await generar_pdf_ficha(ficha, cita_data_for_pdf)
         
-        print(f"✅ PDF generado exitosamente ({len(pdf_bytes)} bytes)")
+        logger.info(f"✅ PDF generado exitosamente ({len(pdf_bytes)} bytes)")
         
         # Preparar datos para el correo
         cliente_email = ficha.get("email")
         if not cliente_email:
             # Si no hay email en la ficha, buscar en el cliente
-            print(f"🔍 Buscando correo del cliente con ID: {ficha.get('cliente_id')}")
+            logger.debug(f"🔍 Buscando correo del cliente con ID: {ficha.get('cliente_id')}")
             cliente = await collection_clients.find_one({"cliente_id": ficha.get("cliente_id")})
             if cliente and cliente.get("correo"):
                 cliente_email = cliente.get("correo")
-                print(f"📧 Email encontrado: {cliente_email}")
+                logger.debug(f"📧 Email encontrado: {cliente_email}")
         
         if cliente_email:
             # Crear HTML del correo (SIN AWAIT - porque ahora es función normal)
@@ -2629,7 +2787,7 @@ async def finalizar_servicio_con_pdf(
             ficha_id_str = str(ficha.get('_id', ''))
             nombre_archivo = f"comprobante_servicio_{ficha_id_str[-6:] if len(ficha_id_str) >= 6 else ficha_id_str}.pdf"
             
-            print(f"📧 Enviando correo a {cliente_email}")
+            logger.debug(f"📧 Enviando correo a {cliente_email}")
             
             # Enviar correo con PDF adjunto (ESTA SÍ lleva await porque es async)
             enviado = await enviar_correo_con_pdf(
@@ -2641,11 +2799,11 @@ async def finalizar_servicio_con_pdf(
             )
             
             if enviado:
-                print(f"✅ PDF enviado a {cliente_email}")
+                logger.info(f"✅ PDF enviado a {cliente_email}")
             else:
-                print(f"⚠️ PDF generado pero no enviado")
+                logger.warning("⚠️ PDF generado pero no enviado")
         else:
-            print("⚠️ No se encontró email del cliente")
+            logger.warning("⚠️ No se encontró email del cliente")
         
         # Guardar referencia del PDF generado
         await collection_citas.update_one(
@@ -2653,14 +2811,13 @@ async def finalizar_servicio_con_pdf(
             {"$set": {
                 "pdf_generado": True,
                 "pdf_fecha_generacion": datetime.utcnow(),
-                "pdf_enviado": bool(cliente_email)
+                "pdf_enviado": bool(cliente_email),
+                "ultima_actualizacion": marca_actualizacion()
             }}
         )
         
     except Exception as e:
-        print(f"❌ Error generando/enviando PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error generando/enviando PDF: {e}")
 
     return {
         "success": True,
@@ -0,0 +1,254 @@
+"""
+Campos de tiempo canónicos de las citas
+=======================================
+
+Las citas guardan `fecha` ("YYYY-MM-DD", o datetime en las antiguas) y
+`hora_inicio` / `hora_fin` ("HH:MM") en hora local de la sede. Comparar
+esos textos obliga a parsear en Python y a rangos sobre strings. Cada cita
+guarda además (en cada alta y edición):
+
+    inicio_utc / fin_utc   datetime UTC (zona de la sede: locales.zona_horaria)
+    inicio_min / fin_min   minutos desde medianoche local ("09:30" → 570)
+
+Los campos de texto se mantienen: la API sigue devolviendo la misma forma.
+
+- Solapes: filtro_solape() → rango numérico sobre (profesional_id,
+  inicio_utc, fin_utc). Mientras queden citas sin migrar se añade el
+  filtro por textos de siempre para esas citas (migracion_completa()).
+- Vista de calendario: inicio_min / fin_min sin parsear horas.
+- Citas con fecha u hora ilegibles quedan con inicio_utc = None.
+
+Migración por lotes, reanudable (checkpoint en `migrations`):
+    python -m app.scheduling.submodules.quotes.tiempos_cita
+    python -m app.scheduling.submodules.quotes.tiempos_cita --reiniciar
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytz
+from pymongo import UpdateOne
+
+from app.database.mongo import collection_citas, collection_locales, collection_migraciones
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_TIEMPO = ("inicio_utc", "fin_utc", "inicio_min", "fin_min")
+MIGRACION_ID = "citas_tiempos_v1"
+MIGRACION_LOTE = 1000
+ZONA_DEFECTO = "UTC"
+
+ESTADOS_SIN_AGENDA = ["cancelada", "no asistio", "no_asistio"]
+
+_migracion_completa = False
+_indices_creados = False
+
+
+# ============================================================
+# CONVERSIÓN
+# ============================================================
+
+def hora_a_minutos(hora) -> Optional[int]:
+    """"09:30" / "9:30:00" → 570. None si no se puede interpretar."""
+    if not hora:
+        return None
+    try:
+        partes = str(hora).split(":")
+        horas, minutos = int(partes[0]), int(partes[1])
+    except (ValueError, IndexError):
+        return None
+    if not (0 <= horas <= 24 and 0 <= minutos < 60):
+        return None
+    return horas * 60 + minutos
+
+
+def minutos_a_hora(total_min: int) -> str:
+    """570 → "09:30"."""
+    return f"{str(total_min // 60).zfill(2)}:{str(total_min % 60).zfill(2)}"
+
+
+def _fecha_local(fecha) -> Optional[date]:
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    try:
+        return datetime.strptime(str(fecha)[:10], "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return None
+
+
+def zona_sede(sede: Optional[Dict]):
+    try:
+        return pytz.timezone((sede or {}).get("zona_horaria") or ZONA_DEFECTO)
+    except pytz.UnknownTimeZoneError:
+        return pytz.utc
+
+
+def _a_utc(dia: date, minutos: int, zona) -> datetime:
+    local = datetime.combine(dia, datetime.min.time()) + timedelta(minutes=minutos)
+    return zona.localize(local).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def campos_tiempo(fecha, hora_inicio, hora_fin, zona) -> Dict:
+    """
+    inicio_utc / fin_utc / inicio_min / fin_min de una cita. Valores None si
+    la fecha o las horas no se pueden interpretar. Una hora de fin anterior
+    a la de inicio se entiende como del día siguiente.
+    """
+    dia = _fecha_local(fecha)
+    inicio_min = hora_a_minutos(hora_inicio)
+    fin_min = hora_a_minutos(hora_fin)
+    if dia is None or inicio_min is None or fin_min is None:
+        return {campo: None for campo in CAMPOS_TIEMPO}
+
+    fin_absoluto = fin_min if fin_min >= inicio_min else fin_min + 24 * 60
+    return {
+        "inicio_utc": _a_utc(dia, inicio_min, zona),
+        "fin_utc": _a_utc(dia, fin_absoluto, zona),
+        "inicio_min": inicio_min,
+        "fin_min": fin_min,
+    }
+
+
+# ============================================================
+# CONSULTAS
+# ============================================================
+
+async def crear_indices_tiempos_cita():
+    global _indices_creados
+    if _indices_creados:
+        return
+    await collection_citas.create_index(
+        [("profesional_id", 1), ("inicio_utc", 1), ("fin_utc", 1)],
+        name="citas_profesional_inicio_fin"
+    )
+    await collection_citas.create_index(
+        [("sede_id", 1), ("inicio_utc", 1)],
+        name="citas_sede_inicio"
+    )
+    _indices_creados = True
+
+
+async def migracion_completa() -> bool:
+    """True cuando ninguna cita carece de inicio_utc (se recuerda por proceso)."""
+    global _migracion_completa
+    if not _migracion_completa:
+        pendiente = await collection_citas.find_one({"inicio_utc": {"$exists": False}}, {"_id": 1})
+        _migracion_completa = pendiente is None
+    return _migracion_completa
+
+
+async def filtro_solape(
+    profesional_id: str,
+    fecha: str,
+    hora_inicio: str,
+    hora_fin: str,
+    tiempos: Dict,
+    excluir_id=None
+) -> Dict:
+    """
+    Citas activas del profesional que se cruzan con [inicio_utc, fin_utc).
+    Las citas aún sin migrar se comparan por fecha y textos de hora.
+    """
+    filtro = {
+        "profesional_id": profesional_id,
+        "estado": {"$nin": ESTADOS_SIN_AGENDA},
+    }
+    if excluir_id is not None:
+        filtro["_id"] = {"$ne": excluir_id}
+
+    por_tiempo = {"inicio_utc": {"$lt": tiempos["fin_utc"]}, "fin_utc": {"$gt": tiempos["inicio_utc"]}}
+    if await migracion_completa():
+        filtro.update(por_tiempo)
+    else:
+        filtro["$or"] = [
+            por_tiempo,
+            {
+                "inicio_utc": {"$exists": False},
+                "fecha": fecha,
+                "hora_inicio": {"$lt": hora_fin},
+                "hora_fin": {"$gt": hora_inicio},
+            },
+        ]
+    return filtro
+
+
+# ============================================================
+# MIGRACIÓN
+# ============================================================
+
+async def _zonas_por_sede() -> Dict[str, object]:
+    locales = await collection_locales.find({}, {"_id": 0, "sede_id": 1, "zona_horaria": 1}).to_list(None)
+    return {local.get("sede_id"): zona_sede(local) for local in locales}
+
+
+async def migrar_tiempos_citas(reiniciar: bool = False, lote: int = MIGRACION_LOTE) -> Dict:
+    """
+    Rellena los campos de tiempo de todas las citas en lotes por _id.
+    Guarda el último _id procesado después de cada lote: si se interrumpe,
+    la siguiente ejecución continúa desde ahí.
+    """
+    global _migracion_completa
+    inicio = time.monotonic()
+    await crear_indices_tiempos_cita()
+
+    control = None if reiniciar else await collection_migraciones.find_one({"_id": MIGRACION_ID})
+    control = control or {"_id": MIGRACION_ID, "ultimo_id": None, "procesadas": 0, "actualizadas": 0, "invalidas": 0}
+    if control.get("completada"):
+        logger.info(f"✅ Migración {MIGRACION_ID} ya completada ({control['procesadas']} citas)")
+        return {k: v for k, v in control.items() if k != "_id"}
+
+    zonas = await _zonas_por_sede()
+    proyeccion = {"sede_id": 1, "fecha": 1, "hora_inicio": 1, "hora_fin": 1, **{c: 1 for c in CAMPOS_TIEMPO}}
+
+    while True:
+        query = {"_id": {"$gt": control["ultimo_id"]}} if control["ultimo_id"] is not None else {}
+        citas = await collection_citas.find(query, proyeccion).sort("_id", 1).limit(lote).to_list(None)
+        if not citas:
+            break
+
+        operaciones: List[UpdateOne] = []
+        for cita in citas:
+            campos = campos_tiempo(
+                cita.get("fecha"), cita.get("hora_inicio"), cita.get("hora_fin"),
+                zonas.get(cita.get("sede_id"), pytz.utc)
+            )
+            if campos["inicio_utc"] is None:
+                control["invalidas"] += 1
+            if any(cita.get(c) != campos[c] or c not in cita for c in CAMPOS_TIEMPO):
+                operaciones.append(UpdateOne({"_id": cita["_id"]}, {"$set": campos}))
+
+        if operaciones:
+            resultado = await collection_citas.bulk_write(operaciones, ordered=False)
+            control["actualizadas"] += resultado.modified_count
+        control["procesadas"] += len(citas)
+        control["ultimo_id"] = citas[-1]["_id"]
+        control["actualizado_en"] = datetime.utcnow()
+        await collection_migraciones.replace_one({"_id": MIGRACION_ID}, control, upsert=True)
+        logger.info(f"⏳ {MIGRACION_ID}: {control['procesadas']} citas revisadas")
+
+    control["completada"] = True
+    await collection_migraciones.replace_one({"_id": MIGRACION_ID}, control, upsert=True)
+    _migracion_completa = False  # se vuelve a comprobar en la próxima consulta
+
+    duracion = round(time.monotonic() - inicio, 2)
+    logger.info(
+        f"✅ {MIGRACION_ID}: {control['procesadas']} citas, {control['actualizadas']} actualizadas, "
+        f"{control['invalidas']} con fecha/hora ilegible en {duracion}s"
+    )
+    return {
+        "procesadas": control["procesadas"],
+        "actualizadas": control["actualizadas"],
+        "invalidas": control["invalidas"],
+        "duracion_segundos": duracion,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(migrar_tiempos_citas(reiniciar="--reiniciar" in sys.argv)))
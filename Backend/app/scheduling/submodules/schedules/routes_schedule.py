@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from app.scheduling.models import Horario
 from app.database.mongo import collection_horarios
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 from datetime import datetime
 from bson import ObjectId
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 # ============================================
 # 🔧 Convertir ObjectId a string
@@ -2,12 +2,13 @@ from fastapi import APIRouter, HTTPException, Depends
 from app.scheduling.models import Servicio
 from app.database.mongo import collection_servicios
 from app.auth.routes import get_current_user
+from app.core.responses import BSONRoute
 from typing import List
 from bson import ObjectId
 from datetime import datetime
 import random
 
-router = APIRouter()
+router = APIRouter(route_class=BSONRoute)
 
 
 # =========================================================
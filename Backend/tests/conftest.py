@@ -0,0 +1,86 @@
+"""
+Fixtures comunes
+================
+
+El Mongo simulado (tests/mongo_simulado.py) arranca antes de importar la
+app: app/database/mongo.py exige MONGODB_URI al importarse.
+"""
+import asyncio
+import os
+
+from tests.mongo_simulado import MongoSimulado
+
+_mongo = MongoSimulado().iniciar()
+os.environ["MONGODB_URI"] = _mongo.uri
+os.environ.setdefault("MONGODB_NAME", "appagenda_pruebas")
+os.environ.setdefault("SECRET_KEY", "clave-de-pruebas")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.core.config import app  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    # Cerrar los clientes antes que el servidor: si no, el hilo de mantenimiento de pymongo reconecta y falla
+    from app.database.mongo import cerrar_clientes
+
+    cerrar_clientes()
+    _mongo.detener()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    # Un solo loop: los clientes de Motor quedan ligados al loop donde se usan por primera vez
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def mongo_limpio():
+    yield _mongo
+    _mongo.limpiar()
+
+
+@pytest.fixture
+async def cliente():
+    """Cliente HTTP contra la app (sin lifespan: ver test_lifespan.py)."""
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as c:
+        yield c
+
+
+@pytest.fixture
+async def cabeceras_auth():
+    """Crea un usuario en auth y devuelve sus cabeceras Authorization: await cabeceras_auth("super_admin")."""
+    from app.auth.controllers import create_access_token
+    from app.database.mongo import collection_auth
+
+    async def crear(rol: str = "super_admin", **campos) -> dict:
+        correo = f"{rol}@pruebas.local"
+        await collection_auth.update_one(
+            {"correo_electronico": correo},
+            {"$set": {"correo_electronico": correo, "rol": rol, "nombre": rol, "activo": True, **campos}},
+            upsert=True,
+        )
+        return {"Authorization": f"Bearer {create_access_token({'sub': correo, 'rol': rol})}"}
+
+    return crear
+
+
+@pytest.fixture
+def presupuesto_consultas(monkeypatch):
+    """
+    Presupuesto de consultas estricto (como MONGO_PRESUPUESTO_ESTRICTO=1):
+    presupuesto_consultas("/ruta", n) y la petición que lo exceda responde 500.
+    """
+    from app.core import instrumentacion_mongo
+
+    monkeypatch.setattr(instrumentacion_mongo, "PRESUPUESTO_ESTRICTO", True)
+    monkeypatch.setattr(instrumentacion_mongo, "PRESUPUESTOS_RUTA", {})
+
+    def fijar(ruta: str, consultas: int):
+        instrumentacion_mongo.PRESUPUESTOS_RUTA[ruta] = consultas
+
+    return fijar
@@ -0,0 +1,255 @@
+"""
+Mongo simulado para las pruebas
+===============================
+
+MockupDB escucha en un puerto local y habla el protocolo de cable de
+MongoDB; cada comando se resuelve contra mongomock. Así Motor/pymongo
+envían comandos reales por socket y el CommandListener de la app
+(app/core/instrumentacion_mongo.py) los ve igual que en producción:
+las pruebas pueden contar consultas por endpoint.
+
+Cubre lo que usa la app: find, aggregate, insert, update, delete,
+findAndModify, count, distinct e índices; $unionWith y $lookup con
+let/pipeline (que mongomock no implementa) se resuelven aquí. Los cursores se devuelven en un solo lote
+(id 0), sin getMore.
+"""
+import threading
+from typing import Dict, List
+
+import mongomock
+from bson import SON
+from mockupdb import MockupDB
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+HELLO = {
+    "isWritablePrimary": True,
+    "ismaster": True,
+    "maxWireVersion": 21,
+    "minWireVersion": 0,
+    "maxBsonObjectSize": 16 * 1024 * 1024,
+    "maxMessageSizeBytes": 48000000,
+    "maxWriteBatchSize": 100000,
+    "logicalSessionTimeoutMinutes": 30,
+}
+
+
+def _sort(orden) -> List:
+    return list(orden.items()) if orden else None
+
+
+def _valor(doc, ruta):
+    """"$a.b" → doc["a"]["b"] (las variables de let son rutas simples)."""
+    for parte in ruta.lstrip("$").split("."):
+        doc = doc.get(parte) if isinstance(doc, dict) else None
+    return doc
+
+
+def _sustituir(valor, variables: Dict):
+    """Reemplaza "$$variable" por su valor en todo el sub-pipeline."""
+    if isinstance(valor, str):
+        return variables.get(valor, valor)
+    if isinstance(valor, dict):
+        return {k: _sustituir(v, variables) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_sustituir(v, variables) for v in valor]
+    return valor
+
+
+def _es_reemplazo(cambio) -> bool:
+    return isinstance(cambio, dict) and not any(k.startswith("$") for k in cambio)
+
+
+class MongoSimulado:
+    def __init__(self):
+        self.cliente = mongomock.MongoClient()
+        self._lock = threading.Lock()
+        self._servidor = MockupDB(auto_ismaster=False)
+        self._servidor.autoresponds(self._responder)
+
+    @property
+    def uri(self) -> str:
+        return self._servidor.uri
+
+    def iniciar(self) -> "MongoSimulado":
+        self._servidor.run()
+        return self
+
+    def detener(self):
+        self._servidor.stop()
+
+    def limpiar(self):
+        with self._lock:
+            for nombre in self.cliente.list_database_names():
+                self.cliente.drop_database(nombre)
+
+    # ------------------------------------------------------------
+    # Comandos
+    # ------------------------------------------------------------
+
+    def _responder(self, peticion):
+        comando = peticion.doc
+        nombre = next(iter(comando))
+        if nombre in ("hello", "ismaster", "isMaster"):
+            return peticion.ok(**HELLO)
+        if nombre in ("ping", "endSessions", "killCursors"):
+            return peticion.ok()
+        manejador = getattr(self, f"_cmd_{nombre}", None)
+        if manejador is None:
+            return peticion.command_err(errmsg=f"Comando no soportado en el simulador: {nombre}")
+        db = self.cliente[comando.get("$db", "test")]
+        try:
+            with self._lock:
+                return peticion.ok(**manejador(db, comando))
+        except Exception as e:
+            # Los errores de pymongo conservan su código (p. ej. 50 → ExecutionTimeout)
+            return peticion.command_err(code=getattr(e, "code", None) or 1, errmsg=str(e))
+
+    def _cursor(self, db, comando, documentos) -> Dict:
+        ns = f"{db.name}.{comando[next(iter(comando))]}"
+        return {"cursor": {"id": 0, "ns": ns, "firstBatch": list(documentos)}}
+
+    def _cmd_find(self, db, comando):
+        cursor = db[comando["find"]].find(comando.get("filter") or {}, comando.get("projection"))
+        if comando.get("sort"):
+            cursor = cursor.sort(_sort(comando["sort"]))
+        if comando.get("skip"):
+            cursor = cursor.skip(comando["skip"])
+        if comando.get("limit"):
+            cursor = cursor.limit(abs(comando["limit"]))
+        return self._cursor(db, comando, cursor)
+
+    def _cmd_aggregate(self, db, comando):
+        return self._cursor(db, comando, self._agregar(db, db[comando["aggregate"]], list(comando["pipeline"])))
+
+    def _agregar(self, db, coleccion, pipeline) -> List:
+        """
+        aggregate de mongomock. $unionWith y $lookup con let/pipeline (que
+        mongomock no implementa) se resuelven aquí: se junta el resultado y se
+        sigue con el resto del pipeline en una colección temporal.
+        """
+        i = next((i for i, etapa in enumerate(pipeline)
+                  if "$unionWith" in etapa or "let" in etapa.get("$lookup", {})), None)
+        if i is None:
+            return list(coleccion.aggregate(pipeline))
+        documentos = list(coleccion.aggregate(pipeline[:i])) if i else list(coleccion.find())
+        if "$unionWith" in pipeline[i]:
+            union = pipeline[i]["$unionWith"]
+            documentos += self._agregar(db, db[union["coll"]], list(union.get("pipeline") or []))
+        else:
+            lookup = pipeline[i]["$lookup"]
+            for doc in documentos:
+                variables = {f"$${nombre}": _valor(doc, ruta) for nombre, ruta in lookup["let"].items()}
+                sub = _sustituir(list(lookup["pipeline"]), variables)
+                doc[lookup["as"]] = self._agregar(db, db[lookup["from"]], sub)
+        temporal = db[f"_etapa_{id(documentos)}"]
+        try:
+            if documentos:
+                temporal.insert_many([dict(d) for d in documentos])
+            return self._agregar(db, temporal, pipeline[i + 1:])
+        finally:
+            db.drop_collection(temporal.name)
+
+    def _cmd_count(self, db, comando):
+        filtro = comando.get("query") or {}
+        n = db[comando["count"]].count_documents(filtro, skip=comando.get("skip", 0), **(
+            {"limit": comando["limit"]} if comando.get("limit") else {}
+        ))
+        return {"n": n}
+
+    def _cmd_distinct(self, db, comando):
+        return {"values": db[comando["distinct"]].distinct(comando["key"], comando.get("query") or {})}
+
+    def _cmd_insert(self, db, comando):
+        coleccion = db[comando["insert"]]
+        errores, n = [], 0
+        for i, doc in enumerate(comando["documents"]):
+            try:
+                coleccion.insert_one(doc)
+                n += 1
+            except DuplicateKeyError as e:
+                errores.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if comando.get("ordered", True):
+                    break
+        return {"n": n, **({"writeErrors": errores} if errores else {})}
+
+    def _cmd_update(self, db, comando):
+        coleccion = db[comando["update"]]
+        n = modificados = 0
+        insertados, errores = [], []
+        for i, orden in enumerate(comando["updates"]):
+            filtro, cambio = orden.get("q") or {}, orden["u"]
+            try:
+                if _es_reemplazo(cambio):
+                    r = coleccion.replace_one(filtro, cambio, upsert=orden.get("upsert", False))
+                elif orden.get("multi"):
+                    r = coleccion.update_many(filtro, cambio, upsert=orden.get("upsert", False),
+                                              array_filters=orden.get("arrayFilters"))
+                else:
+                    r = coleccion.update_one(filtro, cambio, upsert=orden.get("upsert", False),
+                                             array_filters=orden.get("arrayFilters"))
+            except DuplicateKeyError as e:
+                errores.append({"index": i, "code": 11000, "errmsg": str(e)})
+                break
+            if r.upserted_id is not None:
+                insertados.append({"index": i, "_id": r.upserted_id})
+                n += 1
+            else:
+                n += r.matched_count
+                modificados += r.modified_count
+        respuesta = {"n": n, "nModified": modificados}
+        if insertados:
+            respuesta["upserted"] = insertados
+        if errores:
+            respuesta["writeErrors"] = errores
+        return respuesta
+
+    def _cmd_delete(self, db, comando):
+        coleccion = db[comando["delete"]]
+        n = 0
+        for orden in comando["deletes"]:
+            if orden.get("limit") == 1:
+                n += coleccion.delete_one(orden.get("q") or {}).deleted_count
+            else:
+                n += coleccion.delete_many(orden.get("q") or {}).deleted_count
+        return {"n": n}
+
+    def _cmd_findAndModify(self, db, comando):
+        coleccion = db[comando["findAndModify"]]
+        filtro = comando.get("query") or {}
+        opciones = {"projection": comando.get("fields"), "sort": _sort(comando.get("sort"))}
+        if comando.get("remove"):
+            valor = coleccion.find_one_and_delete(filtro, **opciones)
+            return {"value": valor, "lastErrorObject": {"n": int(valor is not None)}}
+        devolver = ReturnDocument.AFTER if comando.get("new") else ReturnDocument.BEFORE
+        existia = coleccion.count_documents(filtro) > 0
+        if _es_reemplazo(comando["update"]):
+            valor = coleccion.find_one_and_replace(filtro, comando["update"], upsert=comando.get("upsert", False),
+                                                   return_document=devolver, **opciones)
+        else:
+            valor = coleccion.find_one_and_update(filtro, comando["update"], upsert=comando.get("upsert", False),
+                                                  return_document=devolver, array_filters=comando.get("arrayFilters"),
+                                                  **opciones)
+        ultimo = {"n": int(existia or bool(comando.get("upsert"))), "updatedExisting": existia}
+        return {"value": valor, "lastErrorObject": ultimo}
+
+    def _cmd_createIndexes(self, db, comando):
+        coleccion = db[comando["createIndexes"]]
+        for indice in comando["indexes"]:
+            opciones = {k: v for k, v in indice.items() if k in ("name", "unique", "sparse", "partialFilterExpression",
+                                                                   "expireAfterSeconds")}
+            coleccion.create_index(list(indice["key"].items()), **opciones)
+        return {"numIndexesBefore": 1, "numIndexesAfter": 1 + len(comando["indexes"])}
+
+    def _cmd_listIndexes(self, db, comando):
+        indices = [SON([("v", 2), ("key", SON(info["key"])), ("name", nombre)])
+                   for nombre, info in db[comando["listIndexes"]].index_information().items()]
+        return self._cursor(db, comando, indices)
+
+    def _cmd_listCollections(self, db, comando):
+        return {"cursor": {"id": 0, "ns": f"{db.name}.$cmd.listCollections",
+                           "firstBatch": [{"name": n, "type": "collection"} for n in db.list_collection_names()]}}
+
+    def _cmd_drop(self, db, comando):
+        db.drop_collection(comando["drop"])
+        return {}
@@ -0,0 +1,81 @@
+import pytest
+from bson import ObjectId
+
+from app.clients_service import generate_pdf, routes_clientes
+from app.database.mongo import (
+    collection_card, collection_citas, collection_citas_archivo, collection_clients, collection_migraciones,
+)
+from app.scheduling.submodules.quotes import archivo_citas
+
+CITAS = "/scheduling/quotes"
+
+
+@pytest.fixture
+async def cita_archivada(monkeypatch):
+    monkeypatch.setattr(archivo_citas, "_corte_cache", {"valor": None, "leido": 0.0})
+    await collection_migraciones.insert_one({"_id": archivo_citas.CONTROL_ID, "corte": "2024-01-01"})
+    cita = {
+        "_id": ObjectId(), "cita_id": "CT-ARCH", "fecha": "2023-05-10", "estado": "completada",
+        "sede_id": "SD-1", "cliente_id": "CL-1", "valor_total": 100.0, "abono": 100.0,
+        "saldo_pendiente": 0.0, "estado_pago": "pagado",
+    }
+    await collection_citas_archivo.insert_one(cita)
+    return cita
+
+
+async def test_modificar_cita_archivada_responde_409(cliente, cabeceras_auth, cita_archivada):
+    cabeceras = await cabeceras_auth()
+
+    cancelar = await cliente.post(f"{CITAS}/CT-ARCH/cancelar", headers=cabeceras)
+    pago = await cliente.post(f"{CITAS}/citas/{cita_archivada['_id']}/pago", headers=cabeceras,
+                              json={"monto": 10, "metodo_pago": "efectivo"})
+
+    assert cancelar.status_code == 409
+    assert pago.status_code == 409
+    archivada = await collection_citas_archivo.find_one({"cita_id": "CT-ARCH"})
+    assert archivada["estado"] == "completada"
+    assert await collection_citas.count_documents({}) == 0
+
+
+async def test_leer_cita_archivada_sigue_funcionando(cliente, cita_archivada):
+    respuesta = await cliente.get(f"{CITAS}/citas/{cita_archivada['_id']}/pago")
+
+    assert respuesta.status_code == 200
+    assert respuesta.json()["estado_pago"] == "pagado"
+
+
+async def test_modificar_cita_en_caliente(cliente, cabeceras_auth, cita_archivada):
+    await collection_citas.insert_one({"cita_id": "CT-VIVA", "fecha": "2026-10-20", "estado": "pendiente",
+                                       "sede_id": "SD-1", "cliente_id": "CL-1"})
+
+    respuesta = await cliente.post(f"{CITAS}/CT-VIVA/confirmar", headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 200
+    assert (await collection_citas.find_one({"cita_id": "CT-VIVA"}))["estado"] == "confirmada"
+
+
+async def test_historial_del_cliente_incluye_citas_archivadas(cliente, cabeceras_auth, cita_archivada, monkeypatch):
+    # mongomock no evalúa $type: las fechas de la prueba ya son texto
+    monkeypatch.setattr(routes_clientes, "FECHA_CITA_STR", "$fecha")
+    await collection_citas.insert_one({"cita_id": "CT-VIVA", "fecha": "2026-10-20", "estado": "pendiente",
+                                       "sede_id": "SD-1", "cliente_id": "CL-1"})
+
+    respuesta = await cliente.get("/clientes/CL-1/historial", headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert [c["cita_id"] for c in respuesta.json()] == ["CT-VIVA", "CT-ARCH"]
+
+
+async def test_pdf_de_cita_archivada(cliente, cabeceras_auth, cita_archivada, monkeypatch):
+    async def generar_pdf(ficha, cita):
+        return b"%PDF-1.4"
+
+    monkeypatch.setattr(generate_pdf, "generar_pdf_ficha", generar_pdf)
+    await collection_clients.insert_one({"cliente_id": "CL-1", "nombre": "Ana"})
+    await collection_card.insert_one({"cliente_id": "CL-1", "datos_especificos": {"cita_id": str(cita_archivada["_id"])}})
+
+    respuesta = await cliente.get(f"/api/pdf/generar-pdf-info/CL-1/{cita_archivada['_id']}",
+                                  headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["cita"]["id"] == str(cita_archivada["_id"])
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.core import cache
+from app.core.cache import AnalyticsCache, LRUCacheBackend
+
+
+class RedisSimulado:
+    """Mismo contrato que RedisCacheBackend, en memoria y pasando por el codificador."""
+
+    def __init__(self):
+        self.datos, self.locks = {}, set()
+
+    async def get(self, key):
+        raw = self.datos.get(key)
+        return cache._MISSING if raw is None else cache._decodificar(raw)
+
+    async def set(self, key, valor, ttl):
+        self.datos[key] = cache._codificar(valor)
+
+    async def delete(self, key):
+        self.datos.pop(key, None)
+
+    async def acquire_lock(self, key, timeout):
+        if key in self.locks:
+            return False
+        self.locks.add(key)
+        return True
+
+    async def release_lock(self, key):
+        self.locks.discard(key)
+
+
+def _calculo_bloqueado():
+    """Cálculo que espera a `liberar` y cuenta cuántas veces se ejecutó."""
+    estado = {"llamadas": 0, "liberar": asyncio.Event()}
+
+    async def calcular():
+        estado["llamadas"] += 1
+        await estado["liberar"].wait()
+        return {"total": estado["llamadas"]}
+
+    return estado, calcular
+
+
+async def test_cancelar_al_que_calcula_no_falla_a_los_que_esperan():
+    memoria = AnalyticsCache(LRUCacheBackend(10))
+    estado, calcular = _calculo_bloqueado()
+
+    lider = asyncio.create_task(memoria.get_or_compute("kpi:x", calcular))
+    await asyncio.sleep(0)
+    esperando = [asyncio.create_task(memoria.get_or_compute("kpi:x", calcular)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    lider.cancel()
+    await asyncio.sleep(0.01)
+    estado["liberar"].set()
+
+    assert await asyncio.gather(*esperando) == [{"total": 2}] * 3
+    assert estado["llamadas"] == 2  # un solo relevo para los tres
+    with pytest.raises(asyncio.CancelledError):
+        await lider
+    assert memoria.stats()["en_vuelo"] == 0
+
+
+async def test_cancelar_al_que_espera_no_cancela_el_calculo():
+    memoria = AnalyticsCache(LRUCacheBackend(10))
+    estado, calcular = _calculo_bloqueado()
+
+    lider = asyncio.create_task(memoria.get_or_compute("kpi:y", calcular))
+    await asyncio.sleep(0)
+    esperando = asyncio.create_task(memoria.get_or_compute("kpi:y", calcular))
+    await asyncio.sleep(0)
+
+    esperando.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await esperando
+    estado["liberar"].set()
+
+    assert await lider == {"total": 1}
+    assert estado["llamadas"] == 1
+
+
+async def test_valores_remotos_en_bson():
+    remoto = RedisSimulado()
+    valor = {"sede_id": ObjectId(), "fecha": datetime(2026, 3, 1, 10, 30, 0, 250000), "filas": [1, 2.5, None]}
+
+    async def calcular():
+        return valor
+
+    await AnalyticsCache(LRUCacheBackend(10), remoto).get_or_compute("ventas:z", calcular)
+    # Otro worker (LRU vacío) lo lee de Redis con los mismos tipos
+    leido = await AnalyticsCache(LRUCacheBackend(10), remoto).get_or_compute("ventas:z", calcular)
+
+    assert leido == valor
+    assert not remoto.datos["ventas:z"].startswith(b"\x80")  # no es pickle
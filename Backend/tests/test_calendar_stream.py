@@ -0,0 +1,177 @@
+"""
+Watcher del calendario con un change stream simulado: resume tokens,
+historial perdido y parada.
+"""
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from app.database.mongo import collection_citas
+from app.scheduling.submodules.live import calendar_stream
+from app.scheduling.submodules.live.calendar_stream import CalendarioWatcher, HubCalendario, Suscriptor
+from app.scheduling.submodules.quotes import archivo_citas
+
+
+def _cambio(n: int, sede: str = "SD-1") -> dict:
+    return {
+        "_id": {"_data": f"T{n}"},
+        "operationType": "insert",
+        "ns": {"db": "pruebas", "coll": "appointments"},
+        "documentKey": {"_id": ObjectId()},
+        "fullDocument": {"_id": ObjectId(), "sede_id": sede, "profesional_id": "P-1", "fecha": "2026-10-19"},
+    }
+
+
+class StreamSimulado:
+    """Entrega `cambios` y después lanza `error` (o espera hasta que cancelen)."""
+
+    def __init__(self, cambios, error=None):
+        self.cambios = list(cambios)
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.cambios:
+            return self.cambios.pop(0)
+        if self.error:
+            raise self.error
+        await asyncio.Event().wait()
+
+    async def try_next(self):
+        return self.cambios.pop(0) if self.cambios else None
+
+
+class DbSimulada:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.opciones = []
+
+    def watch(self, pipeline, **opciones):
+        self.opciones.append(opciones)
+        return self.streams.pop(0)
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    monkeypatch.setattr(calendar_stream, "REINTENTO_MAX_SEGUNDOS", 0)
+    creados = []
+
+    def crear(*streams):
+        db = DbSimulada(*streams, StreamSimulado([]))
+        monkeypatch.setattr(calendar_stream, "db", db)
+        w = CalendarioWatcher(HubCalendario())
+        creados.append(w)
+        return w, db
+
+    yield crear
+    for w in creados:
+        assert w._tarea is None or w._tarea.done()
+
+
+async def _esperar(condicion, intentos: int = 100):
+    for _ in range(intentos):
+        if condicion():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("La condición no se cumplió a tiempo")
+
+
+async def test_reabre_el_stream_con_el_ultimo_resume_token(watcher):
+    w, db = watcher(StreamSimulado([_cambio(1), _cambio(2)], AutoReconnect("conexión cerrada")))
+    suscriptor = Suscriptor("SD-1")
+    w.hub.registrar(suscriptor)
+
+    w.iniciar()
+    await _esperar(lambda: len(db.opciones) == 2 and w.disponible)
+    await w.detener()
+
+    assert "resume_after" not in db.opciones[0]
+    assert db.opciones[1]["resume_after"] == {"_data": "T2"}
+    assert [suscriptor.cola.get_nowait()["token"] for _ in range(2)] == ["T1", "T2"]
+    assert not w.activo and not w.disponible
+
+
+async def test_historial_perdido_reinicia_sin_token_y_pide_resync(watcher):
+    perdido = OperationFailure("resume point no longer in oplog", code=286)
+    w, db = watcher(StreamSimulado([_cambio(1)], perdido))
+    suscriptor = Suscriptor("SD-1")
+    w.hub.registrar(suscriptor)
+
+    w.iniciar()
+    await _esperar(lambda: len(db.opciones) == 2)
+    await w.detener()
+
+    assert "resume_after" not in db.opciones[1]
+    assert suscriptor.cola.get_nowait()["token"] == "T1"
+    assert suscriptor.cola.get_nowait() == calendar_stream.EVENTO_RESYNC
+    # El buffer se vació: el token viejo ya no sirve para reanudar
+    assert not w.hub.reenviar_desde(Suscriptor("SD-1"), "T1")
+
+
+async def test_cliente_reanuda_desde_su_token(watcher):
+    w, db = watcher(StreamSimulado([_cambio(1), _cambio(2), _cambio(3, sede="SD-2"), _cambio(4)]))
+
+    w.iniciar()
+    await _esperar(lambda: w.ultimo_token == {"_data": "T4"})
+    await w.detener()
+
+    reconectado = Suscriptor("SD-1")
+    assert w.hub.reenviar_desde(reconectado, "T1")
+    assert [reconectado.cola.get_nowait()["token"] for _ in range(reconectado.cola.qsize())] == ["T2", "T4"]
+    assert not w.hub.reenviar_desde(Suscriptor("SD-1"), "desconocido")
+
+
+async def test_detener_watcher_cancela_la_tarea(watcher, monkeypatch):
+    w, db = watcher()
+    monkeypatch.setattr(calendar_stream, "watcher_calendario", w)
+
+    w.iniciar()
+    await _esperar(lambda: w.disponible)
+    await calendar_stream.detener_watcher()
+
+    assert not w.activo
+    assert calendar_stream.estado()["watcher_activo"] is False
+
+
+def _borrado(n: int, cita_id) -> dict:
+    return {
+        "_id": {"_data": f"B{n}"},
+        "operationType": "delete",
+        "ns": {"db": "pruebas", "coll": "appointments"},
+        "documentKey": {"_id": cita_id},
+    }
+
+
+async def test_archivar_un_lote_no_inunda_a_los_suscriptores(watcher, monkeypatch):
+    monkeypatch.setattr(archivo_citas, "_corte_cache", {"valor": None, "leido": 0.0})
+    viejas = [{"_id": ObjectId(), "sede_id": "SD-1", "fecha": "2020-01-10", "estado": "completada"} for _ in range(40)]
+    await collection_citas.insert_many(viejas)
+    await archivo_citas.archivar_citas(dias=730, esperar_publicacion=False)
+    assert await collection_citas.count_documents({}) == 0
+
+    # Lo que el change stream entrega: los borrados del archivador, un borrado real y un alta
+    borrada = ObjectId()
+    cambios = [_borrado(i, cita["_id"]) for i, cita in enumerate(viejas)] + [_borrado(99, borrada), _cambio(1)]
+    w, db = watcher(StreamSimulado(cambios))
+    suscriptor = Suscriptor("SD-1", tamano_cola=8)
+    w.hub.registrar(suscriptor)
+
+    w.iniciar()
+    await _esperar(lambda: w.ultimo_token == {"_data": "T1"})
+    await w.detener()
+
+    recibidos = [suscriptor.cola.get_nowait() for _ in range(suscriptor.cola.qsize())]
+    assert [(e["operacion"], e["id"]) for e in recibidos] == [("delete", str(borrada)), ("insert", recibidos[1]["id"])]
+    assert suscriptor.desbordes == 0
+    # El buffer de reenvío tampoco guarda los borrados del archivo
+    assert [token for token, _ in w.hub._buffer] == ["B99", "T1"]
@@ -0,0 +1,28 @@
+from openpyxl import load_workbook
+
+from app.analytics import routes_churn
+
+
+def _encabezado(ruta):
+    hoja = load_workbook(ruta, read_only=True)["Clientes en Churn"]
+    return [celda.value for celda in next(hoja.iter_rows())]
+
+
+def test_excel_sin_clientes_lleva_encabezado(tmp_path):
+    ruta = str(tmp_path / "churn.xlsx")
+
+    routes_churn.escribir_excel_churn(ruta, [])
+
+    assert _encabezado(ruta) == routes_churn.COLUMNAS_CHURN
+
+
+async def test_export_sin_churn_descarga_excel(cliente, tmp_path):
+    respuesta = await cliente.get("/analytics/churn-clientes?export=true")
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.headers["content-type"].startswith(
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    ruta = tmp_path / "descarga.xlsx"
+    ruta.write_bytes(respuesta.content)
+    assert _encabezado(str(ruta)) == routes_churn.COLUMNAS_CHURN
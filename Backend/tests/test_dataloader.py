@@ -0,0 +1,50 @@
+from app.core.dataloader import Cargadores
+from app.core.instrumentacion_mongo import medir_consultas
+from app.database.mongo import collection_estilista, collection_locales, collection_servicios
+
+PROFESIONALES = "/admin/profesionales/"
+
+
+async def _sembrar(n: int):
+    await collection_locales.insert_many([{"sede_id": f"SD-{i}", "nombre": f"Sede {i}"} for i in range(3)])
+    await collection_servicios.insert_many([{"servicio_id": f"SV-{i}", "nombre": f"Servicio {i}"} for i in range(5)])
+    await collection_estilista.insert_many([
+        {"profesional_id": f"P-{i}", "rol": "estilista", "sede_id": f"SD-{i % 3}",
+         "especialidades": [f"SV-{i % 5}", f"SV-{(i + 1) % 5}"]}
+        for i in range(n)
+    ])
+
+
+async def _consultas_listado(cliente, cabeceras) -> tuple:
+    respuesta = await cliente.get(PROFESIONALES, headers=cabeceras)
+    assert respuesta.status_code == 200, respuesta.text
+    return len(respuesta.json()), int(respuesta.headers["x-mongo-consultas"])
+
+
+async def test_listado_con_las_mismas_consultas_a_dos_tamanos(cliente, cabeceras_auth):
+    cabeceras = await cabeceras_auth()
+    await _sembrar(3)
+    filas_pocas, consultas_pocas = await _consultas_listado(cliente, cabeceras)
+
+    for collection in (collection_estilista, collection_locales, collection_servicios):
+        await collection.delete_many({})
+    await _sembrar(60)
+    filas_muchas, consultas_muchas = await _consultas_listado(cliente, cabeceras)
+
+    assert (filas_pocas, filas_muchas) == (3, 60)
+    # auth + profesionales + sedes ($in) + servicios ($in), sin importar las filas
+    assert consultas_pocas == consultas_muchas == 4
+
+
+async def test_cargador_agrupa_y_memoriza():
+    await collection_locales.insert_many([{"sede_id": f"SD-{i}", "nombre": f"Sede {i}"} for i in range(3)])
+    cargadores = Cargadores()
+    sedes = cargadores.por(collection_locales, "sede_id")
+
+    with medir_consultas() as medicion:
+        primera = await sedes.cargar_varios(["SD-0", "SD-1", "SD-0", "SD-9"])
+        segunda = await sedes.cargar("SD-1")
+
+    assert [s and s["nombre"] for s in primera] == ["Sede 0", "Sede 1", "Sede 0", None]
+    assert segunda["nombre"] == "Sede 1"
+    assert medicion.consultas == cargadores.consultas == 1
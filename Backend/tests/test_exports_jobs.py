@@ -0,0 +1,72 @@
+"""
+Workers de exportación: el apagado (lifespan) los detiene y el trabajo
+interrumpido lo retoma otro proceso cuando vence su latido.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.core import config
+from app.core.config import app
+from app.database.mongo import collection_export_jobs
+from app.exports import jobs, storage
+
+USUARIO = {"email": "admin@pruebas.local", "rol": "super_admin"}
+
+
+@pytest.fixture
+def tipo_lento(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "_tipos", {})
+    monkeypatch.setattr(jobs, "_indices_listos", False)
+    monkeypatch.setattr(jobs, "EXPORT_JOB_WORKERS", 1)
+    monkeypatch.setattr(storage, "EXPORT_DIR", str(tmp_path / "exports"))
+    estado = {"iniciado": asyncio.Event(), "liberar": asyncio.Event(), "cancelado": False}
+
+    async def ejecutar(parametros, progreso):
+        estado["iniciado"].set()
+        try:
+            await estado["liberar"].wait()
+        except asyncio.CancelledError:
+            estado["cancelado"] = True
+            raise
+        ruta = tmp_path / "reporte.csv"
+        ruta.write_text("a,b\n1,2\n")
+        return str(ruta), "reporte.csv", "text/csv"
+
+    jobs.registrar_tipo("lento", lambda parametros, usuario: parametros, ejecutar)
+    yield estado
+    jobs._workers.clear()
+
+
+async def _estado(job_id: str) -> str:
+    return (await collection_export_jobs.find_one({"job_id": job_id}))["estado"]
+
+
+async def test_apagado_detiene_workers_y_el_trabajo_se_retoma(tipo_lento, monkeypatch):
+    monkeypatch.setattr(config, "cerrar_clientes", lambda: None)
+
+    async with app.router.lifespan_context(app):
+        trabajo, _ = await jobs.crear_trabajo("lento", {"mes": "2026-10"}, USUARIO)
+        await asyncio.wait_for(tipo_lento["iniciado"].wait(), timeout=2)
+        assert await _estado(trabajo["job_id"]) == jobs.EN_PROCESO
+
+    assert tipo_lento["cancelado"]
+    assert jobs._workers == []
+    # Sigue en_proceso: otro proceso lo reclama al vencer el latido
+    assert await _estado(trabajo["job_id"]) == jobs.EN_PROCESO
+
+    await collection_export_jobs.update_one(
+        {"job_id": trabajo["job_id"]}, {"$set": {"latido": datetime.utcnow() - 2 * jobs.LATIDO_VENCIDO}}
+    )
+    tipo_lento["liberar"].set()
+    jobs.iniciar_workers()
+    for _ in range(200):
+        if await _estado(trabajo["job_id"]) == jobs.COMPLETADO:
+            break
+        await asyncio.sleep(0.01)
+    await jobs.detener_workers()
+
+    final = await collection_export_jobs.find_one({"job_id": trabajo["job_id"]})
+    assert final["estado"] == jobs.COMPLETADO
+    assert final["intentos"] == 2
@@ -0,0 +1,53 @@
+import pytest
+from bson import ObjectId
+
+from app.bills import routes as facturacion
+from app.bills.numeracion import Numerador
+from app.database.mongo import (
+    collection_citas, collection_clients, collection_invoices, collection_locales, collection_sales,
+)
+
+FACTURAR = "/api/billing/quotes/facturar"
+
+
+@pytest.fixture
+async def cita_pagada(monkeypatch):
+    # Bloques en memoria de pruebas anteriores no valen con la base limpia
+    monkeypatch.setattr(facturacion, "numerador", Numerador())
+    await collection_locales.insert_one({"sede_id": "SD-1", "nombre": "Centro", "moneda": "COP"})
+    await collection_clients.insert_one({"cliente_id": "CL-1", "nombre": "Ana", "apellido": "Ruiz"})
+    cita = {
+        "_id": ObjectId(), "sede_id": "SD-1", "cliente_id": "CL-1", "estado": "confirmada",
+        "servicios": [{"servicio_id": "SV-1", "nombre": "Corte", "precio": 50000}],
+        "historial_pagos": [{"metodo": "efectivo", "monto": 50000}],
+    }
+    await collection_citas.insert_one(cita)
+    return cita
+
+
+async def test_facturar_cita(cliente, cabeceras_auth, cita_pagada):
+    respuesta = await cliente.post(f"{FACTURAR}/{cita_pagada['_id']}", headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["numero_comprobante"] == "FV-00000001"
+    factura = await collection_invoices.find_one({"origen_id": str(cita_pagada["_id"])})
+    assert factura["estado"] == "pagado"
+    assert await collection_sales.count_documents({"numero_comprobante": "FV-00000001"}) == 1
+    assert (await collection_citas.find_one({"_id": cita_pagada["_id"]}))["estado_factura"] == "facturado"
+
+
+async def test_fallo_tras_numerar_anula_la_factura(cliente, cabeceras_auth, cita_pagada, monkeypatch):
+    def fallar():
+        raise RuntimeError("Mongo no disponible")
+
+    # Falla al marcar la cita como facturada, con la factura y la venta ya escritas
+    monkeypatch.setattr(facturacion, "marca_actualizacion", fallar)
+
+    with pytest.raises(RuntimeError):
+        await cliente.post(f"{FACTURAR}/{cita_pagada['_id']}", headers=await cabeceras_auth())
+
+    factura = await collection_invoices.find_one({"origen_id": str(cita_pagada["_id"])})
+    assert factura["estado"] == "anulada"
+    assert factura["numero"] == 1  # el número no se reutiliza
+    assert await collection_sales.count_documents({}) == 0
+    assert "estado_factura" not in await collection_citas.find_one({"_id": cita_pagada["_id"]})
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from fastapi.responses import StreamingResponse
+
+from app.core import instrumentacion_mongo
+from app.core.config import app
+from app.core.instrumentacion_mongo import medir_consultas
+from app.database.mongo import collection_estilista, collection_locales, collection_servicios
+
+RUTA = "/admin/profesionales/"
+RUTA_STREAM = "/pruebas/sedes-en-streaming"
+
+
+async def _sembrar_profesionales(n: int):
+    await collection_locales.insert_one({"sede_id": "SD-1", "nombre": "Centro"})
+    await collection_servicios.insert_many([{"servicio_id": f"SV-{i}", "nombre": f"Servicio {i}"} for i in range(3)])
+    await collection_estilista.insert_many([
+        {"profesional_id": f"P-{i}", "nombre": f"Pro {i}", "rol": "estilista", "sede_id": "SD-1",
+         "especialidades": ["SV-0", "SV-1", "SV-2"], "activo": True}
+        for i in range(n)
+    ])
+
+
+async def test_medir_consultas_cuenta_comandos_reales():
+    with medir_consultas() as medicion:
+        await collection_locales.insert_one({"sede_id": "SD-1"})
+        await collection_locales.find_one({"sede_id": "SD-1"})
+
+    assert medicion.consultas == 2
+    assert medicion.resumen()["por_comando"]["find:branch"]["documentos"] == 1
+
+
+async def test_ruta_dentro_del_presupuesto(cliente, cabeceras_auth, presupuesto_consultas):
+    await _sembrar_profesionales(5)
+    # auth + profesionales + sedes + servicios
+    presupuesto_consultas(RUTA, 4)
+
+    respuesta = await cliente.get(RUTA, headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert len(respuesta.json()) == 5
+    assert respuesta.headers["x-mongo-consultas"] == "4"
+
+
+async def test_ruta_que_excede_su_presupuesto_falla(cliente, cabeceras_auth, presupuesto_consultas):
+    await _sembrar_profesionales(5)
+    presupuesto_consultas(RUTA, 3)
+
+    respuesta = await cliente.get(RUTA, headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 500
+    assert respuesta.json()["detail"] == "Presupuesto de consultas excedido: 4 > 3"
+    assert respuesta.json()["consultas"]["consultas"] == 4
+
+
+@pytest.fixture
+def ruta_en_streaming():
+    """Cuerpo en streaming que sigue consultando Mongo después de enviar las cabeceras."""
+    async def cuerpo():
+        for sede_id in ("SD-1", "SD-2"):
+            sede = await collection_locales.find_one({"sede_id": sede_id}, {"_id": 0})
+            yield (sede["sede_id"] + "\n").encode()
+            await asyncio.sleep(0.05)  # el middleware ya devolvió las cabeceras
+
+    async def listar():
+        return StreamingResponse(cuerpo(), media_type="text/plain")
+
+    app.add_api_route(RUTA_STREAM, listar)
+    yield
+    app.router.routes.pop()
+
+
+async def test_streaming_publica_las_consultas_del_cuerpo(cliente, ruta_en_streaming, monkeypatch):
+    await collection_locales.insert_many([{"sede_id": "SD-1"}, {"sede_id": "SD-2"}])
+    observadas, excedidas = [], []
+    monkeypatch.setattr(instrumentacion_mongo.CONSULTAS_PETICION, "observar",
+                        lambda etiquetas, valor: observadas.append((etiquetas, valor)))
+    monkeypatch.setattr(instrumentacion_mongo.PRESUPUESTO_EXCEDIDO, "inc", lambda etiquetas: excedidas.append(etiquetas))
+    monkeypatch.setitem(instrumentacion_mongo.PRESUPUESTOS_RUTA, RUTA_STREAM, 1)
+
+    respuesta = await cliente.get(RUTA_STREAM)
+
+    assert respuesta.text == "SD-1\nSD-2\n"
+    # La cabecera sale con el primer trozo; la métrica y el presupuesto, al terminar el cuerpo
+    assert respuesta.headers["x-mongo-consultas"] == "1"
+    assert observadas == [((RUTA_STREAM,), 2)]
+    assert excedidas == [(RUTA_STREAM,)]
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from app.analytics import services_analytics
+
+OVERVIEW = "/analytics/overview?start_date=2026-03-01&end_date=2026-03-30"
+
+
+def _fallar_con(excepcion):
+    async def calcular(*args):
+        raise excepcion
+    return calcular
+
+
+async def test_timeout_de_kpis_responde_503(cliente, cabeceras_auth, monkeypatch):
+    monkeypatch.setattr(services_analytics, "_calcular_kpi_overview", _fallar_con(ExecutionTimeout("maxTimeMS", 50)))
+
+    respuesta = await cliente.get(OVERVIEW, headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "30"
+
+
+async def test_error_de_kpis_no_devuelve_ceros(cliente, cabeceras_auth, monkeypatch):
+    monkeypatch.setattr(services_analytics, "_calcular_kpi_overview", _fallar_con(RuntimeError("Mongo no disponible")))
+
+    respuesta = await cliente.get(OVERVIEW, headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 500
+    with pytest.raises(RuntimeError):
+        await services_analytics.get_kpi_overview(datetime(2026, 3, 1), datetime(2026, 3, 7))
@@ -0,0 +1,45 @@
+"""
+El lifespan está conectado a la app (FastAPI(lifespan=...)): arranca el
+scheduler con sus jobs nocturnos y al apagar ejecuta los cierres.
+"""
+import asyncio
+
+from app.cash.scheduler import scheduler
+from app.core import config
+from app.core.config import app
+from app.scheduling.submodules.quotes import archivo_citas
+
+
+def _espiar(monkeypatch, nombre: str, llamadas: list):
+    original = getattr(config, nombre)
+
+    if nombre in ("detener_watcher", "detener_workers"):
+        async def espia():
+            llamadas.append(nombre)
+            return await original()
+    else:
+        def espia():
+            llamadas.append(nombre)
+            return original()
+
+    monkeypatch.setattr(config, nombre, espia)
+
+
+async def test_lifespan_registra_jobs_nocturnos_y_cierra_en_orden(monkeypatch):
+    monkeypatch.setattr(archivo_citas, "ARCHIVO_DIAS", 30)
+    llamadas: list = []
+    for nombre in ("detener_scheduler", "detener_watcher", "detener_workers", "detener_executor"):
+        _espiar(monkeypatch, nombre, llamadas)
+    # Los clientes de Mongo siguen en uso por el resto de la suite
+    monkeypatch.setattr(config, "cerrar_clientes", lambda: llamadas.append("cerrar_clientes"))
+
+    async with app.router.lifespan_context(app):
+        assert scheduler.running
+        jobs = {job.id for job in scheduler.get_jobs()}
+        assert {"pronostico_consumo", "archivo_citas"} <= jobs
+
+    await asyncio.sleep(0)  # AsyncIOScheduler.shutdown se ejecuta en el loop
+    assert not scheduler.running
+    assert llamadas == [
+        "detener_scheduler", "detener_watcher", "detener_workers", "detener_executor", "cerrar_clientes",
+    ]
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.bills.numeracion import Numerador
+from app.database.mongo import collection_invoice_counters, db
+
+SEDE = "SD-1"
+
+
+def _numeradores(n: int, tamano_bloque: int = 4):
+    """Varios "procesos" sobre el mismo contador."""
+    facturas = db["invoices_numeracion_pruebas"]
+    return [Numerador(collection_invoice_counters, facturas, tamano_bloque=tamano_bloque) for _ in range(n)]
+
+
+async def test_siguiente_concurrente_sin_duplicados_ni_huecos():
+    numeradores = _numeradores(3)
+
+    async def facturar(numerador):
+        numero = await numerador.siguiente(SEDE)
+        await asyncio.sleep(0)  # insert de la factura
+        numerador.confirmar(SEDE, numero)
+        return numero
+
+    entregados = await asyncio.gather(*(facturar(numeradores[i % 3]) for i in range(30)))
+    assert len(set(entregados)) == 30
+
+    # Lo no usado de cada bloque vuelve a libres y se entrega después
+    for numerador in numeradores:
+        await numerador.devolver_bloques()
+    contador = await collection_invoice_counters.find_one({"_id": f"{SEDE}:FV"})
+    assert contador["arriendos"] == {}
+    assert set(entregados).isdisjoint(contador["libres"])
+
+    otro = _numeradores(1, tamano_bloque=50)[0]
+    resto = [await otro.siguiente(SEDE) for _ in range(len(contador["libres"]))]
+    assert resto == sorted(contador["libres"])
+    assert sorted(entregados + resto) == list(range(1, contador["siguiente"]))
+
+
+async def test_numero_liberado_es_el_proximo_en_entregarse():
+    numerador = _numeradores(1)[0]
+
+    primeros = [await numerador.siguiente(SEDE) for _ in range(3)]
+    await numerador.liberar(SEDE, 2)
+
+    assert primeros == [1, 2, 3]
+    assert [await numerador.siguiente(SEDE) for _ in range(3)] == [2, 4, 5]
+
+
+async def test_numero_liberado_de_un_bloque_agotado():
+    numerador = _numeradores(1, tamano_bloque=2)[0]
+
+    assert [await numerador.siguiente(SEDE) for _ in range(3)] == [1, 2, 3]
+    await numerador.liberar(SEDE, 1)  # su bloque ya se agotó: pasa al bloque en uso
+
+    assert [await numerador.siguiente(SEDE) for _ in range(2)] == [1, 4]
+    contador = await collection_invoice_counters.find_one({"_id": f"{SEDE}:FV"})
+    assert contador["libres"] == []
@@ -0,0 +1,47 @@
+import pytest
+from bson import ObjectId
+
+from app.core.pagination import paginar_keyset
+from app.database.mongo import collection_clients
+
+NOMBRES = ["Ana", None, "Beto", "(sin campo)", "Carla", None, "Ana"]
+
+
+@pytest.fixture
+async def clientes():
+    docs = []
+    for nombre in NOMBRES:
+        doc = {"_id": ObjectId(), "sede_id": "SD-1"}
+        if nombre != "(sin campo)":
+            doc["nombre"] = nombre
+        docs.append(doc)
+    await collection_clients.insert_many(docs)
+    return [d["_id"] for d in docs]
+
+
+async def _recorrer(orden, limite=2):
+    vistos, paginas, cursor = [], [], None
+    while True:
+        pagina = await paginar_keyset(collection_clients, {"sede_id": "SD-1"}, orden, limite, cursor)
+        paginas.append(pagina)
+        vistos.extend(d["_id"] for d in pagina["items"])
+        cursor = pagina["siguiente"]
+        if not cursor:
+            return vistos, paginas
+
+
+@pytest.mark.parametrize("direccion", [1, -1])
+async def test_paginar_no_pierde_nombres_nulos(clientes, direccion):
+    orden = [("nombre", direccion), ("_id", direccion)]
+
+    vistos, paginas = await _recorrer(orden)
+
+    esperado = await collection_clients.find({}, {"_id": 1}).sort(orden).to_list(None)
+    assert vistos == [d["_id"] for d in esperado]
+    assert sorted(vistos) == sorted(clientes)
+
+    # Hacia atrás desde la última página se recuperan las anteriores
+    anterior = await paginar_keyset(
+        collection_clients, {"sede_id": "SD-1"}, orden, 2, paginas[-1]["anterior"]
+    )
+    assert [d["_id"] for d in anterior["items"]] == [d["_id"] for d in paginas[-2]["items"]]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from app.database.mongo import collection_inventarios, collection_inventory_motions, collection_salidas
+from app.inventary.submodulos.inventarios import stock
+
+
+class InventariosRegistrados:
+    """
+    mongomock no implementa $round: se registra el pipeline de
+    reposicion_sugerida y en la prueba se corre hasta el consumo del periodo.
+    """
+
+    def __init__(self):
+        self.name = collection_inventarios.name
+        self.pipeline = None
+
+    def aggregate(self, pipeline, **opciones):
+        self.pipeline = pipeline
+        return self
+
+    async def to_list(self, _):
+        return []
+
+
+async def _sin_bandera(query):
+    return query
+
+
+async def test_consumo_suma_ventas_y_salidas_internas(monkeypatch):
+    ayer = datetime.now() - timedelta(days=1)
+    await collection_inventarios.insert_one({"sede_id": "SD-1", "producto_id": "P-1", "nombre": "Tinte",
+                                             "stock_actual": 2, "stock_minimo": 5})
+    await collection_inventory_motions.insert_one({"sede_id": "SD-1", "fecha": ayer, "movimientos": [
+        {"producto_id": "P-1", "cantidad": -30}, {"producto_id": "P-1", "cantidad": 4},
+        {"producto_id": "P-2", "cantidad": -7},
+    ]})
+    await collection_salidas.insert_many([
+        {"sede_id": "SD-1", "fecha_creacion": ayer, "items": [{"producto_id": "P-1", "cantidad": 15}]},
+        {"sede_id": "SD-2", "fecha_creacion": ayer, "items": [{"producto_id": "P-1", "cantidad": 99}]},
+        {"sede_id": "SD-1", "fecha_creacion": ayer - timedelta(days=60), "items": [{"producto_id": "P-1", "cantidad": 99}]},
+    ])
+    registrados = InventariosRegistrados()
+    monkeypatch.setattr(stock, "collection_inventarios", registrados)
+    monkeypatch.setattr(stock, "filtro_stock_bajo", _sin_bandera)
+
+    await stock.reposicion_sugerida("SD-1", dias_consumo=30)
+
+    fin = next(i for i, etapa in enumerate(registrados.pipeline) if "consumo_periodo" in etapa.get("$set", {}))
+    [fila] = await collection_inventarios.aggregate(registrados.pipeline[:fin + 1]).to_list(None)
+    assert fila["consumo_periodo"] == 45
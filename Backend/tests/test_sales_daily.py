@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import pytest
+
+from app.analytics import sales_daily, sales_dashboard
+from app.database.mongo import collection_migraciones
+
+INICIO = datetime(2026, 3, 1)
+FIN = datetime(2026, 3, 7, 23, 59, 59, 999999)
+INICIO_ANTERIOR = datetime(2026, 2, 22)
+FIN_ANTERIOR = datetime(2026, 2, 28, 23, 59, 59, 999999)
+
+
+def _fila(total, cantidad, fecha="2026-03-02"):
+    return {"resumen": [{"_id": {"periodo": "actual", "moneda": "COP"}, "ventas_totales": total,
+                         "cantidad_ventas": cantidad, "ventas_servicios": total, "ventas_productos": 0,
+                         **{m: 0 for m in sales_daily.METODOS_PAGO}}],
+            "serie": [{"_id": {"moneda": "COP", "fecha": fecha}, "ventas_totales": total, "cantidad_ventas": cantidad}]}
+
+
+class AgregacionesSimuladas:
+    """
+    mongomock no implementa $reduce ni $merge (el cubo no corre en el simulador):
+    se registran las agregaciones por colección y se responden filas ya agrupadas.
+    """
+
+    def __init__(self, respuestas):
+        self.respuestas = respuestas
+        self.pipelines = []
+
+    def __call__(self, coleccion):
+        return _ColeccionSimulada(self, coleccion.name)
+
+
+class _ColeccionSimulada:
+    def __init__(self, registro, nombre):
+        self.registro, self.nombre = registro, nombre
+
+    def aggregate(self, pipeline, **opciones):
+        self.registro.pipelines.append((self.nombre, pipeline))
+        return self
+
+    async def to_list(self, _):
+        return [self.registro.respuestas[self.nombre]]
+
+
+@pytest.fixture(autouse=True)
+def cubo_limpio(monkeypatch):
+    # La caché de cobertura es por proceso; la base se limpia en cada prueba
+    monkeypatch.setattr(sales_daily, "_estado_cache", {"valor": None, "leido": 0.0})
+
+
+@pytest.fixture
+def reagregaciones(monkeypatch):
+    llamadas = []
+
+    async def reagregar(match_query, obsoletos):
+        llamadas.append(obsoletos)
+        return 0
+
+    monkeypatch.setattr(sales_daily, "_reagregar", reagregar)
+    return llamadas
+
+
+async def _metricas(monkeypatch, respuestas):
+    agregaciones = AgregacionesSimuladas(respuestas)
+    monkeypatch.setattr(sales_dashboard, "para_analitica", agregaciones)
+    metricas = await sales_dashboard.get_metricas_ventas(
+        INICIO, FIN, INICIO_ANTERIOR, FIN_ANTERIOR, "SD-1", incluir_serie=True
+    )
+    return metricas, agregaciones.pipelines
+
+
+async def test_sin_backfill_completo_lee_desde_sales(monkeypatch):
+    metricas, pipelines = await _metricas(monkeypatch, {"sales": _fila(100000, 2)})
+
+    assert [nombre for nombre, _ in pipelines] == ["sales"]
+    assert pipelines[0][1][0]["$match"] == {
+        "fecha_pago": {"$gte": INICIO_ANTERIOR, "$lte": FIN}, "sede_id": "SD-1"
+    }
+    assert metricas["actual"]["COP"]["ventas_totales"] == 100000
+
+
+async def test_dia_con_actualizacion_fallida_se_lee_desde_sales(monkeypatch, reagregaciones):
+    await sales_daily.reconstruir_ventas_diarias()
+    reagregar = sales_daily._reagregar
+
+    async def fallar(*args):
+        raise RuntimeError("Mongo no disponible")
+
+    monkeypatch.setattr(sales_daily, "_reagregar", fallar)
+    await sales_daily.actualizar_ventas_dia("SD-1", datetime(2026, 3, 2, 15))
+
+    assert await sales_daily.dias_fuera_del_cubo("SD-1", "2026-02-22", "2026-03-07") == [
+        {"sede_id": "SD-1", "fecha": "2026-03-02"}
+    ]
+    # El cubo sin ese día + ese día desde sales, sumados
+    metricas, pipelines = await _metricas(monkeypatch, {
+        "sales_daily": _fila(40000, 1), "sales": _fila(25000, 1)
+    })
+    assert pipelines[0][0] == "sales_daily"
+    assert pipelines[0][1][0]["$match"]["$nor"] == [{"sede_id": "SD-1", "fecha": "2026-03-02"}]
+    assert pipelines[1][0] == "sales"
+    assert pipelines[1][1][0]["$match"] == {"$or": [{"sede_id": "SD-1", "fecha_pago": {
+        "$gte": datetime(2026, 3, 2), "$lte": datetime(2026, 3, 2, 23, 59, 59, 999999)
+    }}]}
+    assert metricas["actual"]["COP"]["ventas_totales"] == 65000
+    assert metricas["serie"]["COP"] == [{"fecha": "2026-03-02", "ventas_totales": 65000, "cantidad_ventas": 2}]
+
+    # La siguiente actualización que funciona lo devuelve al cubo
+    monkeypatch.setattr(sales_daily, "_reagregar", reagregar)
+    await sales_daily.actualizar_ventas_dia("SD-1", datetime(2026, 3, 2, 18))
+    assert await sales_daily.dias_fuera_del_cubo("SD-1", "2026-02-22", "2026-03-07") == []
+    assert (await collection_migraciones.find_one({"_id": "sales_daily"}))["pendientes"] == []
+
+
+async def test_venta_que_cambia_de_dia_recalcula_ambos_dias(reagregaciones):
+    await sales_daily.actualizar_ventas_dia(
+        "SD-1", datetime(2026, 3, 4, 9), fecha_anterior=datetime(2026, 3, 2, 10)
+    )
+    await sales_daily.actualizar_ventas_dia(
+        "SD-2", datetime(2026, 3, 4, 9), sede_anterior="SD-1", fecha_anterior=datetime(2026, 3, 4, 8)
+    )
+    await sales_daily.actualizar_ventas_dia("SD-1", datetime(2026, 3, 4, 9), fecha_anterior=datetime(2026, 3, 4, 8))
+
+    assert reagregaciones == [
+        {"sede_id": "SD-1", "fecha": "2026-03-04"}, {"sede_id": "SD-1", "fecha": "2026-03-02"},
+        {"sede_id": "SD-2", "fecha": "2026-03-04"}, {"sede_id": "SD-1", "fecha": "2026-03-04"},
+        {"sede_id": "SD-1", "fecha": "2026-03-04"},
+    ]
@@ -0,0 +1,63 @@
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from app.core.streaming import BATCH_SIZE, FORMATO_NDJSON, respuesta_stream
+from app.database.mongo import collection_clients
+
+
+class CursorSimulado:
+    """Entrega `documentos` y después lanza `error` (si lo hay)."""
+
+    def __init__(self, documentos, error=None):
+        self.documentos, self.error = list(documentos), error
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.documentos:
+            return self.documentos.pop(0)
+        if self.error:
+            raise self.error
+        raise StopAsyncIteration
+
+
+async def _cuerpo(respuesta) -> bytes:
+    return b"".join([trozo async for trozo in respuesta.body_iterator])
+
+
+async def test_error_en_el_primer_lote_llega_a_la_ruta():
+    with pytest.raises(ExecutionTimeout):
+        await respuesta_stream(CursorSimulado([], ExecutionTimeout("operation exceeded time limit", 50)))
+
+
+@pytest.mark.parametrize("formato", ["json", FORMATO_NDJSON])
+async def test_error_a_mitad_del_cuerpo_corta_la_respuesta(formato):
+    respuesta = await respuesta_stream(CursorSimulado([{"n": 1}], ExecutionTimeout("límite", 50)), formato)
+
+    with pytest.raises(ExecutionTimeout):
+        await _cuerpo(respuesta)
+
+
+async def test_listado_vacio_sigue_siendo_json_valido():
+    respuesta = await respuesta_stream(CursorSimulado([]), envoltura={"sede_id": "SD-1"}, clave_items="citas")
+
+    assert await _cuerpo(respuesta) == b'{"sede_id":"SD-1","citas":[],"total":0,"siguiente":null}'
+
+
+async def test_timeout_del_listado_responde_503(cliente, cabeceras_auth, mongo_limpio, monkeypatch):
+    await collection_clients.insert_one({"cliente_id": "CL-1", "sede_id": "SD-1", "nombre": "Ana"})
+    agregar = mongo_limpio._cmd_aggregate
+
+    def agotar_presupuesto(db, comando):
+        # Solo el listado (batchSize del streaming); el sondeo del keyset responde
+        if comando.get("cursor", {}).get("batchSize") == BATCH_SIZE:
+            raise ExecutionTimeout("operation exceeded time limit", 50)
+        return agregar(db, comando)
+
+    monkeypatch.setattr(mongo_limpio, "_cmd_aggregate", agotar_presupuesto)
+
+    respuesta = await cliente.get("/clientes/filtrar/SD-1", headers=await cabeceras_auth())
+
+    assert respuesta.status_code == 503, respuesta.text
+    assert respuesta.headers["Retry-After"] == "30"
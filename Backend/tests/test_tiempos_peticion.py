@@ -0,0 +1,37 @@
+from app.core.tiempos_peticion import fase, medir_fase, server_timing
+
+
+async def test_health_responde_con_server_timing(cliente):
+    respuesta = await cliente.get("/health")
+
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {"status": "healthy"}
+    timing = respuesta.headers["server-timing"]
+    assert "render;dur=" in timing
+    assert timing.split(", ")[-1].startswith("total;dur=")
+    assert "x-request-id" in respuesta.headers
+
+
+async def test_metricas_registran_la_ruta(cliente):
+    await cliente.get("/health")
+    respuesta = await cliente.get("/metrics")
+
+    assert respuesta.status_code == 200
+    assert 'http_respuestas_total{ruta="/health",metodo="GET",estado="200"}' in respuesta.text
+
+
+def test_server_timing_ordena_fases_conocidas():
+    valor = server_timing({"db": 0.0184, "auth": 0.0031, "render": 0.0009}, 0.031)
+
+    assert valor == "auth;dur=3.1, db;dur=18.4, render;dur=0.9, total;dur=31.0"
+
+
+async def test_medir_fase_conserva_firma_y_resultado():
+    @medir_fase("auth")
+    async def usuario(token: str):
+        return token.upper()
+
+    assert usuario.__name__ == "usuario"
+    assert await usuario("abc") == "ABC"
+    with fase("sin-peticion"):
+        pass